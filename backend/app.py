@@ -2,28 +2,89 @@ from flask import Flask, jsonify, request, g
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
-from supabase import create_client
-from datetime import datetime, timezone
-from middleware import authenticate_user
+import io
+import csv
+import json
+import zlib
+import hashlib
+import hmac
+import uuid
+from datetime import datetime, timezone, timedelta
+from middleware import authenticate_user, get_auth_stats, rate_limited
+from db import scoped_client, public_client, get_pool_stats, run_concurrently, lazy_init_enabled, warm_up
+import applog
+import events
+import jobs
+import metrics
+from utils import receipt_signing
+from utils import ratelimit
+from utils.cache import TTLCache
+from utils.coalesce import SingleFlight
+from institution_graph import InstitutionGraphCache
+from utils.pagination import decode_cursor, encode_cursor, keyset_page, parse_limit
 from utils.student_identity import infer_student_identity
 
 # Load environment variables from .env file
 load_dotenv()
+applog.setup()
+log = applog.get_logger('app')
+if not lazy_init_enabled():
+    warm_up()
 
 app = Flask(__name__)
 # Allow CORS for the frontend origin
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
+@app.before_request
+def start_request_metrics():
+    metrics.begin_request()
+
+@app.after_request
+def finish_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    applog.log_request(log, metrics.finish_request(route, request.method, response.status_code))
+    return response
+
 def get_db():
     """
-    Returns a Supabase client authenticated as the current user.
+    Returns a PostgREST client authenticated as the current user.
     Requires @authenticate_user middleware to have run.
+    The client shares this worker's keep-alive connection pool (see db.py).
     """
-    url = os.environ.get("SUPABASE_URL")
-    key = os.environ.get("SUPABASE_KEY")
-    client = create_client(url, key)
-    client.postgrest.auth(g.token)
-    return client
+    return scoped_client(g.token)
+
+# Participant columns of the rows change_events.sql fans out on.
+PARTICIPANT_COLUMNS = ('from_user_id', 'to_user_id', 'low_id', 'high_id', 'sender_id', 'recipient_id')
+
+def _notify_participants(user_id, *rows):
+    """After a write: wakes the change feeds (events.py) of the caller and everyone on `rows` now, not at their next poll."""
+    events.notify(user_id, *(row.get(c) for row in rows if isinstance(row, dict) for c in PARTICIPANT_COLUMNS))
+
+# SQLSTATEs raised by the RPCs (receipt_claim_rpc.sql, connection_request_rpc.sql, graph_metrics.sql,
+# user_search.sql) and the HTTP status each maps to.
+RPC_ERRORS = {'P0002': 404, '42501': 403, '22023': 400}
+
+def _call_rpc(client, name, params, flagged=False):
+    """
+    Runs one RPC. Returns (data, None), or (None, error response) for a SQLSTATE in RPC_ERRORS;
+    anything else is re-raised for the route's 500 handler. flagged adds 'success': False, for
+    routes whose responses carry it.
+    """
+    from postgrest import APIError  # already loaded by the client; not imported at cold start
+    try:
+        return client.rpc(name, params).execute().data, None
+    except APIError as e:
+        if e.code not in RPC_ERRORS:
+            raise
+        body = {'success': False, 'error': e.message} if flagged else {'error': e.message}
+        return None, (jsonify(body), RPC_ERRORS[e.code])
+
+# `in_` filters are chunked so the query string stays within URL length limits.
+IN_FILTER_CHUNK = 150
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
 @app.route('/api/health', methods=['GET'])
 def health():
@@ -39,17 +100,142 @@ def me():
         'aud': g.user.aud
     })
 
+@app.route('/api/stats', methods=['GET'])
+@authenticate_user
+def stats():
+    return jsonify({
+        'success': True,
+        'auth': get_auth_stats(),
+        'db_pool': get_pool_stats(),
+        'coalescing': {'leaderboard': _leaderboard_flight.stats()},
+        'rate_limits': ratelimit.stats()
+    })
+
+LOOPBACK_ADDRS = ('127.0.0.1', '::1')
+
+def _metrics_access():
+    """
+    None if the scrape may proceed, else an error response.
+    With METRICS_TOKEN set, scrapers must send it as a bearer token. Without one the endpoint is
+    served only to loopback clients off Vercel (local development), never publicly.
+    """
+    token = os.environ.get('METRICS_TOKEN')
+    if not token:
+        if os.environ.get('VERCEL') or request.remote_addr not in LOOPBACK_ADDRS:
+            return jsonify({'error': 'Metrics are disabled: set METRICS_TOKEN'}), 403
+        return None
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return None
+
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text exposition of this worker's request, auth and upstream histograms (metrics.py)."""
+    denied = _metrics_access()
+    if denied:
+        return denied
+    auth = get_auth_stats()
+    pool = get_pool_stats()
+    extra = [
+        '# TYPE pledge_auth_cache_hits_total counter',
+        f"pledge_auth_cache_hits_total {auth['cache']['hits']}",
+        '# TYPE pledge_auth_cache_misses_total counter',
+        f"pledge_auth_cache_misses_total {auth['cache']['misses']}",
+        '# TYPE pledge_upstream_requests_total counter',
+        f"pledge_upstream_requests_total {pool.get('upstream_requests', 0) + pool.get('async', {}).get('upstream_requests', 0)}",
+        '# TYPE pledge_log_records_dropped_total counter',
+        f"pledge_log_records_dropped_total {applog.dropped_records()}",
+    ]
+    flight = _leaderboard_flight.stats()
+    extra += [
+        '# TYPE pledge_coalesced_requests_total counter',
+        f'pledge_coalesced_requests_total{{flight="leaderboard"}} {flight["followers"] + flight["shared_hits"]}',
+        '# TYPE pledge_rate_limited_total counter',
+    ]
+    extra += [f'pledge_rate_limited_total{{limiter="{name}"}} {s["limited"]}' for name, s in ratelimit.stats().items()]
+    feed = events.stats()
+    if feed is not None:
+        extra += [
+            '# TYPE pledge_event_streams gauge',
+            f"pledge_event_streams {feed['streams']}",
+            '# TYPE pledge_event_feed_polls_total counter',
+            f"pledge_event_feed_polls_total {feed['polls']}",
+            '# TYPE pledge_events_delivered_total counter',
+            f"pledge_events_delivered_total {feed['delivered']}",
+            '# TYPE pledge_event_stream_overflows_total counter',
+            f"pledge_event_stream_overflows_total {feed['overflows']}",
+        ]
+    body = metrics.render() + '\n'.join(extra) + '\n'
+    return app.response_class(body, mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/auth/verify-student', methods=['GET'])
 @authenticate_user
 def verify_student():
     try:
-        identity = infer_student_identity(g.user.email)
+        identity = infer_student_identity(g.user.email, client_factory=get_db)
         return jsonify({'success': True, 'identity': identity}), 200
     except ValueError as e:
         return jsonify({'success': False, 'error': str(e)}), 403
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _recover_orphan_receipts(client):
+    linked = client.rpc('recover_orphan_receipts', {}).execute().data or 0
+    if linked:
+        log.info('Linked orphan receipts', extra={'linked': linked})
+    return linked
+
+def _recovery_mode():
+    """RECOVERY_MODE if set; otherwise inline on Vercel (same detection as db.lazy_init_enabled), background elsewhere."""
+    return os.environ.get('RECOVERY_MODE', 'inline' if os.environ.get('VERCEL') else 'background').lower()
+
+def _queue_receipt_recovery(client):
+    """
+    RECOVERY_MODE=background queues the recovery job and returns 'queued'.
+    RECOVERY_MODE=inline runs it before responding and returns the number of linked receipts.
+    Serverless hosts freeze the process once the response is sent, so a queued job may never
+    run there: the default is inline on Vercel and background elsewhere.
+    """
+    if _recovery_mode() == 'inline':
+        linked = jobs.run_with_retry('receipt-recovery', _recover_orphan_receipts, client, retries=1)
+        return {'status': 'done' if linked is not None else 'failed', 'linked': linked}
+    jobs.submit('receipt-recovery', _recover_orphan_receipts, client)
+    return {'status': 'queued'}
+
+def _onboarding_payload(data, user):
+    """public_profiles row for /api/onboarding, or None if a required field is missing."""
+    if not data.get('first_name') or not data.get('last_name') or not data.get('institution_id'):
+        return None
+    return {
+        'user_id': user.id,
+        'email': user.email,
+        'first_name': data.get('first_name'),
+        'last_name': data.get('last_name'),
+        'institution': data.get('institution_id'), # Keep legacy field aligned for now
+        'institution_id': data.get('institution_id'),
+        'campus_code': data.get('campus_code'),
+        'batch_year': data.get('batch_year'),
+        'roll_number': data.get('roll_number'),
+        'major': data.get('major'),
+        'is_hostelite': data.get('is_hostelite', False),
+        'societies': data.get('societies', []),
+        'ghost_mode': data.get('ghost_mode', False)
+    }
+
+def _referral_connection(user_id, referrer_id):
+    """Accepted connection row for a referral link, or None if there is nothing to connect."""
+    if not referrer_id or referrer_id == user_id or referrer_id == 'null':
+        return None
+    low_id, high_id = sorted([user_id, referrer_id])
+    return {
+        'low_id': low_id,
+        'high_id': high_id,
+        'requested_by': user_id,
+        'accepted': True,
+        'accepted_at': datetime.now(timezone.utc).isoformat()
+    }
+
 @app.route('/api/onboarding', methods=['POST'])
 @authenticate_user
 def onboarding():
@@ -58,148 +244,614 @@ def onboarding():
         if not data:
              return jsonify({'error': 'Missing request body'}), 400
 
-        first_name = data.get('first_name')
-        last_name = data.get('last_name')
-        
-        # Student specific fields
-        institution_id = data.get('institution_id')
-        campus_code = data.get('campus_code')
-        batch_year = data.get('batch_year')
-        roll_number = data.get('roll_number')
-        major = data.get('major')
-        is_hostelite = data.get('is_hostelite', False)
-        societies = data.get('societies', [])
-        ghost_mode = data.get('ghost_mode', False)
-
-        if not first_name or not last_name or not institution_id:
+        payload = _onboarding_payload(data, g.user)
+        if payload is None:
             return jsonify({'error': 'Missing required fields'}), 400
 
         referrer_id = data.get('referrer_id')
 
         client = get_db()
 
-        payload = {
-            'user_id': g.user.id,
-            'email': g.user.email,
-            'first_name': first_name,
-            'last_name': last_name,
-            'institution': institution_id, # Keep legacy field aligned for now
-            'institution_id': institution_id,
-            'campus_code': campus_code,
-            'batch_year': batch_year,
-            'roll_number': roll_number,
-            'major': major,
-            'is_hostelite': is_hostelite,
-            'societies': societies,
-            'ghost_mode': ghost_mode
-        }
-
         # Perform upsert
         res = client.table('public_profiles').upsert(payload).execute()
 
         # Handle Referral
-        print(f"DEBUG: Onboarding referrer_id_raw: {referrer_id}")
-        if referrer_id and referrer_id != g.user.id and referrer_id != 'null':
+        log.debug('Onboarding referral', extra={'referrer_id': referrer_id})
+        conn_payload = _referral_connection(g.user.id, referrer_id)
+        if conn_payload:
             try:
-                low_id, high_id = sorted([g.user.id, referrer_id])
-                
-                conn_payload = {
-                    'low_id': low_id,
-                    'high_id': high_id,
-                    'requested_by': g.user.id,
-                    'accepted': True,
-                    'accepted_at': datetime.now(timezone.utc).isoformat()
-                }
                 # Optimistic insert - relying on DB constrains to reject duplicates/invalid users
                 # This reduces round-trips from 3 (Check User, Check Conn, Insert) to 1 (Insert)
                 client.table('connections').insert(conn_payload).execute()
-                print(f"DEBUG: Auto-connected referrer {referrer_id}")
+                log.debug('Auto-connected referrer', extra={'referrer_id': referrer_id})
             except Exception as e:
                 # Ignore duplicate key errors or RLS issues if they aren't critical
-                print(f"DEBUG: Referrer auto-connect failed (likely exists): {e}")
+                log.debug('Referrer auto-connect failed (likely exists)', extra={'referrer_id': referrer_id, 'error': str(e)})
 
         # --- Receipt Recovery Logic ---
-        # Check if anyone sent receipts to this email before they signed up
+        # Link receipts sent to this email before signup: one set-based RPC
+        # (receipt_recovery.sql), queued in the background unless running inline (see _recovery_mode).
+        recovery = _queue_receipt_recovery(client)
+
+        return jsonify({'success': True, 'data': res.data, 'receipt_recovery': recovery}), 200
+
+    except Exception as e:
+        log.exception('Onboarding failed')
+        return jsonify({'error': str(e)}), 500
+
+# Columns the frontend maps for related users (store.tsx)
+PROFILE_COLUMNS = 'user_id, email, first_name, last_name, institution, institution_id, campus_code, batch_year, roll_number, major'
+# Rows whose transaction was still open when we read may carry an updated_at slightly
+# before the cursor we hand out; backing the cursor off covers that (re-sent rows are idempotent).
+SYNC_CURSOR_SKEW = timedelta(seconds=float(os.environ.get('SYNC_CURSOR_SKEW', 5)))
+
+def _parse_since(value):
+    """Returns a timezone-aware datetime for a `since` cursor, or None. Raises ValueError if malformed."""
+    if not value:
+        return None
+    since = datetime.fromisoformat(value)
+    return since if since.tzinfo else since.replace(tzinfo=timezone.utc)
+
+def _related_user_ids(uid, receipts, connections):
+    """Other users referenced by these rows, de-duplicated and sorted (my own profile comes from `me`)."""
+    related = set()
+    for c in connections:
+        related.update((c['low_id'], c['high_id']))
+    for r in receipts:
+        related.add(r['from_user_id'])
+        if r.get('to_user_id'):
+            related.add(r['to_user_id'])
+    related.discard(uid)
+    return sorted(related)
+
+def _bootstrap_body(uid, cursor, since, me, receipts, connections, profiles, unread, tombstones):
+    me = me[0] if me else None
+    if me:
+        profiles[uid] = me
+
+    deleted = {'receipts': [], 'connections': []}
+    for t in tombstones:
+        deleted.setdefault(t['table_name'], []).append(t['row_id'])
+
+    return {
+        'success': True,
+        'cursor': cursor,
+        'delta': since is not None,
+        'me': me,
+        'receipts': receipts,
+        'connections': connections,
+        'profiles': profiles,
+        'unread_counts': {row['sender_id']: row['count'] for row in unread},
+        'deleted': deleted
+    }
+
+@app.route('/api/bootstrap', methods=['GET'])
+@authenticate_user
+def bootstrap():
+    """
+    Everything the app shell needs on load, in one response:
+    {me, receipts, connections, profiles: {user_id: profile}, unread_counts, cursor, deleted}
+    Independent queries run concurrently. Pass the returned `cursor` back as `since`
+    to get only receipts/connections changed after it (plus tombstones for deletes).
+    """
+    try:
         try:
-            # Find orphaned receipts
-            receipts_query = client.table('receipts').select('id, from_user_id').ilike('recipient_email', g.user.email).is_('to_user_id', 'null').execute()
-            
-            if receipts_query.data:
-                print(f"DEBUG: Found {len(receipts_query.data)} orphan receipts for {g.user.email}")
-                
-                # Group by sender to minimize connection logic
-                sender_ids = set(r['from_user_id'] for r in receipts_query.data)
-
-                for sender_id in sender_ids:
-                    # 1. Ensure Connection Exists
-                    # We can reuse the same logic: try insert, ignore if exists, or fetch.
-                    # Since we need the connection_id for the receipt, we MUST fetch or upsert-and-return.
-                    
-                    low_id, high_id = sorted([g.user.id, sender_id])
-                    connection_id = None
-
-                    # Try fetching existing first (could be the referrer from above, or existing)
-                    existing_conn = client.table('connections').select('id').eq('low_id', low_id).eq('high_id', high_id).maybe_single().execute()
-                    
-                    if existing_conn.data:
-                        connection_id = existing_conn.data['id']
-                    else:
-                        # Create new connection
-                        new_conn_payload = {
-                            'low_id': low_id,
-                            'high_id': high_id,
-                            'requested_by': g.user.id, # New user "accepts" the implicit invite
-                            'accepted': True,
-                            'accepted_at': datetime.now(timezone.utc).isoformat()
-                        }
-                        try:
-                            # Using upsert to be safe and get data back
-                            create_res = client.table('connections').upsert(new_conn_payload).execute()
-                            if create_res.data:
-                                connection_id = create_res.data[0]['id']
-                        except Exception as conn_err:
-                            print(f"DEBUG: Failed to create connection for receipt recovery: {conn_err}")
-                            continue # Skip linking receipts if connection failed
-
-                    if connection_id:
-                        # 2. Update Receipts
-                        # Update all receipts from this sender to this user
-                        update_payload = {
-                            'to_user_id': g.user.id,
-                            'connection_id': connection_id,
-                            'status': 'AWAITING_ACCEPTANCE'
-                        }
-                        client.table('receipts').update(update_payload).eq('recipient_email', g.user.email).is_('to_user_id', 'null').eq('from_user_id', sender_id).execute()
-                        print(f"DEBUG: Linked receipts from {sender_id} to {g.user.id}")
-
-        except Exception as e:
-            print(f"DEBUG: Receipt recovery error: {e}")
-        
-        return jsonify({'success': True, 'data': res.data}), 200
+            since = _parse_since(request.args.get('since'))
+        except ValueError:
+            return jsonify({'error': 'Invalid since cursor'}), 400
+
+        client = get_db()
+        uid = g.user.id
+        email = (g.user.email or '').lower()
+        cursor = (datetime.now(timezone.utc) - SYNC_CURSOR_SKEW).isoformat()
+
+        def fetch_me():
+            return client.table('public_profiles').select('*').eq('user_id', uid).execute().data
+
+        def fetch_receipts():
+            query = client.table('receipts').select('*').or_(
+                f"from_user_id.eq.{uid},to_user_id.eq.{uid},recipient_email.eq.{email}"
+            )
+            if since:
+                query = query.gt('updated_at', since.isoformat())
+            return query.order('created_at', desc=True).execute().data or []
+
+        def fetch_connections():
+            query = client.table('connections').select('*').or_(f"low_id.eq.{uid},high_id.eq.{uid}")
+            if since:
+                query = query.gt('updated_at', since.isoformat())
+            return query.execute().data or []
+
+        def fetch_unread():
+            return client.rpc('get_unread_counts', {}).execute().data or []
+
+        def fetch_tombstones():
+            if not since:
+                return []
+            return client.table('sync_tombstones').select('table_name, row_id') \
+                .contains('user_ids', [uid]).gt('deleted_at', since.isoformat()).execute().data or []
+
+        me, receipts, connections, unread, tombstones = run_concurrently(
+            fetch_me, fetch_receipts, fetch_connections, fetch_unread, fetch_tombstones
+        )
+
+        profiles = {}
+        for chunk in _chunks(_related_user_ids(uid, receipts, connections), IN_FILTER_CHUNK):
+            for p in client.table('public_profiles').select(PROFILE_COLUMNS).in_('user_id', chunk).execute().data or []:
+                profiles[p['user_id']] = p
+
+        return jsonify(_bootstrap_body(uid, cursor, since, me, receipts, connections, profiles, unread, tombstones)), 200
 
     except Exception as e:
-        print(f"Onboarding Error: {str(e)}")
+        log.exception('Bootstrap failed')
         return jsonify({'error': str(e)}), 500
 
+# Projections for the list endpoints: only the columns clients render.
+CONNECTION_COLUMNS = 'id, low_id, high_id, requested_by, accepted, requested_at, accepted_at, created_at, updated_at'
+RECEIPT_COLUMNS = 'id, from_user_id, to_user_id, recipient_email, connection_id, tags, description, is_public, status, created_at, accepted_at, updated_at'
+
+def _list_page(client, table, query, args):
+    """
+    Shared paging for the list endpoints (indexes in pagination_indexes.sql).
+    - Default: newest first, keyset on (created_at, id).
+    - updated_since=<iso>: delta mode, oldest change first, keyset on (updated_at, id);
+      the first page also carries ids deleted since then (sync_tombstones).
+    """
+    limit = parse_limit(args.get('limit'))
+    cursor = args.get('cursor')
+    since = _parse_since(args.get('updated_since'))
+
+    deleted = None
+    if since:
+        query = query.gt('updated_at', since.isoformat())
+        rows, next_cursor = keyset_page(query, 'updated_at', cursor, limit, desc=False)
+        if not cursor:
+            tombstones = client.table('sync_tombstones').select('row_id').eq('table_name', table) \
+                .contains('user_ids', [g.user.id]).gt('deleted_at', since.isoformat()).execute().data or []
+            deleted = [t['row_id'] for t in tombstones]
+    else:
+        rows, next_cursor = keyset_page(query, 'created_at', cursor, limit, desc=True)
+
+    body = {'success': True, 'data': rows, 'next_cursor': next_cursor}
+    if deleted is not None:
+        body['deleted'] = deleted
+    return jsonify(body), 200
+
 @app.route('/api/connections', methods=['GET'])
 @authenticate_user
 def get_connections():
+    """
+    Without query params: every connection of the user (original contract).
+    With limit / cursor / updated_since: one keyset page, see _list_page.
+    """
     try:
         client = get_db()
         uid = g.user.id
-        
-        # Fetch connections where user is involved
-        res = client.table('connections').select('*').or_(f"low_id.eq.{uid},high_id.eq.{uid}").execute()
-        
-        return jsonify({'success': True, 'data': res.data}), 200
 
+        if not any(k in request.args for k in ('limit', 'cursor', 'updated_since')):
+            # Fetch connections where user is involved
+            res = client.table('connections').select('*').or_(f"low_id.eq.{uid},high_id.eq.{uid}").execute()
+            return jsonify({'success': True, 'data': res.data}), 200
+
+        query = client.table('connections').select(CONNECTION_COLUMNS).or_(f"low_id.eq.{uid},high_id.eq.{uid}")
+        return _list_page(client, 'connections', query, request.args)
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.exception('Get Connections failed')
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/receipts', methods=['GET'])
+@authenticate_user
+def list_receipts():
+    """
+    Receipts the user sent or received, one keyset page at a time.
+    Query params: limit (default 50, max 200), cursor, updated_since, role=all|sent|received.
+    """
+    try:
+        client = get_db()
+        uid = g.user.id
+        email = (g.user.email or '').lower()
+        role = request.args.get('role', 'all')
+
+        query = client.table('receipts').select(RECEIPT_COLUMNS)
+        if role == 'sent':
+            query = query.eq('from_user_id', uid)
+        elif role == 'received':
+            query = query.or_(f"to_user_id.eq.{uid},recipient_email.eq.{email}")
+        elif role == 'all':
+            query = query.or_(f"from_user_id.eq.{uid},to_user_id.eq.{uid},recipient_email.eq.{email}")
+        else:
+            return jsonify({'error': 'role must be one of all, sent, received'}), 400
+
+        return _list_page(client, 'receipts', query, request.args)
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"Get Connections Error: {str(e)}")
+        log.exception('List Receipts failed')
         return jsonify({'error': str(e)}), 500
 
+# --- Export ---
+# GET /api/export streams a user's receipts and connections, joined with the other party's
+# profile, without holding the account in memory: one keyset page is fetched, written out and
+# dropped before the next. Profiles are looked up per page through a small bounded cache.
+
+EXPORT_PAGE_SIZE = int(os.environ.get('EXPORT_PAGE_SIZE', 500))
+EXPORT_PROFILE_CACHE = 2000
+EXPORT_PROFILE_COLUMNS = 'user_id, email, first_name, last_name, institution'
+EXPORT_FIELDS = {
+    'receipt': ['id', 'direction', 'status', 'tags', 'description', 'is_public', 'created_at', 'accepted_at',
+                 'from_user_id', 'from_name', 'from_institution', 'to_user_id', 'to_name', 'to_institution',
+                 'recipient_email'],
+    'connection': ['id', 'user_id', 'first_name', 'last_name', 'email', 'institution', 'accepted',
+                    'requested_by_me', 'requested_at', 'accepted_at'],
+}
+EXPORT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+def _export_pages(make_query):
+    """Yields keyset pages, newest first. make_query() builds a fresh query each time (builders keep filters)."""
+    cursor = None
+    while True:
+        rows, cursor = keyset_page(make_query(), 'created_at', cursor, EXPORT_PAGE_SIZE, desc=True)
+        if rows:
+            yield rows
+        if cursor is None:
+            return
+
+def _export_profiles(client, cache, user_ids):
+    """user_id -> profile for this page, fetching only ids the cache does not hold."""
+    missing = sorted({u for u in user_ids if u and cache.get(u) is None})
+    for chunk in _chunks(missing, IN_FILTER_CHUNK):
+        for p in client.table('public_profiles').select(EXPORT_PROFILE_COLUMNS).in_('user_id', chunk).execute().data or []:
+            cache.set(p['user_id'], p)
+    return {u: cache.get(u) or {} for u in user_ids if u}
+
+def _full_name(profile):
+    return ' '.join(filter(None, (profile.get('first_name'), profile.get('last_name')))) or None
+
+def _export_receipts(client, uid, email, role, status):
+    cache = TTLCache(maxsize=EXPORT_PROFILE_CACHE, ttl=3600)
+
+    def make_query():
+        query = client.table('receipts').select(RECEIPT_COLUMNS)
+        if role == 'sent':
+            query = query.eq('from_user_id', uid)
+        elif role == 'received':
+            query = query.or_(f"to_user_id.eq.{uid},recipient_email.eq.{email}")
+        else:
+            query = query.or_(f"from_user_id.eq.{uid},to_user_id.eq.{uid},recipient_email.eq.{email}")
+        return query.eq('status', status) if status else query
+
+    for rows in _export_pages(make_query):
+        profiles = _export_profiles(client, cache, [u for r in rows for u in (r['from_user_id'], r.get('to_user_id'))])
+        for r in rows:
+            sender, recipient = profiles.get(r['from_user_id'], {}), profiles.get(r.get('to_user_id'), {})
+            yield {
+                'id': r['id'], 'direction': 'sent' if r['from_user_id'] == uid else 'received',
+                'status': r['status'], 'tags': r.get('tags') or [], 'description': r.get('description'),
+                'is_public': r.get('is_public'), 'created_at': r['created_at'], 'accepted_at': r.get('accepted_at'),
+                'from_user_id': r['from_user_id'], 'from_name': _full_name(sender), 'from_institution': sender.get('institution'),
+                'to_user_id': r.get('to_user_id'), 'to_name': _full_name(recipient), 'to_institution': recipient.get('institution'),
+                'recipient_email': r.get('recipient_email'),
+            }
+
+def _export_connections(client, uid):
+    cache = TTLCache(maxsize=EXPORT_PROFILE_CACHE, ttl=3600)
+
+    def make_query():
+        return client.table('connections').select(CONNECTION_COLUMNS).or_(f"low_id.eq.{uid},high_id.eq.{uid}")
+
+    for rows in _export_pages(make_query):
+        others = [c['high_id'] if c['low_id'] == uid else c['low_id'] for c in rows]
+        profiles = _export_profiles(client, cache, others)
+        for c, other in zip(rows, others):
+            p = profiles.get(other, {})
+            yield {
+                'id': c['id'], 'user_id': other, 'first_name': p.get('first_name'), 'last_name': p.get('last_name'),
+                'email': p.get('email'), 'institution': p.get('institution'), 'accepted': c.get('accepted'),
+                'requested_by_me': c.get('requested_by') == uid, 'requested_at': c.get('requested_at'),
+                'accepted_at': c.get('accepted_at'),
+            }
+
+def _ndjson_chunks(datasets):
+    """One JSON object per line, tagged with its dataset; a closing summary line lets clients detect truncation."""
+    rows = 0
+    try:
+        for record_type, records in datasets:
+            lines = []
+            for record in records:
+                lines.append(json.dumps({'type': record_type, **record}, separators=(',', ':')))
+                rows += 1
+                if len(lines) == EXPORT_PAGE_SIZE:
+                    yield '\n'.join(lines) + '\n'
+                    lines = []
+            if lines:
+                yield '\n'.join(lines) + '\n'
+        yield json.dumps({'type': 'summary', 'rows': rows}) + '\n'
+    except Exception as e:
+        # Headers are already sent; end the stream with an error line instead of a summary.
+        log.exception('Export failed')
+        yield json.dumps({'type': 'error', 'error': str(e), 'rows': rows}) + '\n'
+
+def _csv_chunks(record_type, records):
+    """A header row, then EXPORT_FIELDS[record_type] per record; tags are joined with ';'."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS[record_type], extrasaction='ignore')
+    writer.writeheader()
+    try:
+        for i, record in enumerate(records, 1):
+            if isinstance(record.get('tags'), list):
+                record['tags'] = ';'.join(record['tags'])
+            writer.writerow(record)
+            if i % EXPORT_PAGE_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    except Exception:
+        # A CSV has no room for an error row. Re-raising aborts the chunked response, so the
+        # client sees a broken transfer instead of a short file that looks complete.
+        log.exception('Export failed')
+        raise
+    yield buffer.getvalue()
+
+def _gzip_chunks(chunks):
+    """Compresses on the fly; each chunk is flushed so the client keeps receiving data as pages arrive."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route('/api/export', methods=['GET'])
+@authenticate_user
+@rate_limited('export')
+def export_data():
+    """
+    Streams the caller's data as a download.
+    Query params:
+    - dataset: receipts (default), connections, or all (NDJSON only: receipts, then connections).
+    - format: ndjson (default) or csv.
+    - role: all | sent | received and status (e.g. ACCEPTED) narrow the receipts.
+    Rows carry the other party's name and institution. gzip-encoded when the client accepts it.
+    """
+    dataset = request.args.get('dataset', 'receipts')
+    fmt = request.args.get('format', 'ndjson')
+    role = request.args.get('role', 'all')
+    status = request.args.get('status') or None
+    if dataset not in ('receipts', 'connections', 'all'):
+        return jsonify({'error': 'dataset must be one of receipts, connections, all'}), 400
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    if fmt == 'csv' and dataset == 'all':
+        return jsonify({'error': 'CSV exports one dataset at a time'}), 400
+    if role not in ('all', 'sent', 'received'):
+        return jsonify({'error': 'role must be one of all, sent, received'}), 400
+
+    # The generators run after this function returns, so they must not touch `g`.
+    client, uid, email = get_db(), g.user.id, (g.user.email or '').lower()
+    datasets = []
+    if dataset in ('receipts', 'all'):
+        datasets.append(('receipt', _export_receipts(client, uid, email, role, status)))
+    if dataset in ('connections', 'all'):
+        datasets.append(('connection', _export_connections(client, uid)))
+    chunks = _ndjson_chunks(datasets) if fmt == 'ndjson' else _csv_chunks(*datasets[0])
+
+    compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+    response = app.response_class(_gzip_chunks(chunks) if compress else (c.encode() for c in chunks),
+                                  mimetype=EXPORT_MIMETYPES[fmt])
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    filename = f"pledge-{dataset}-{datetime.now(timezone.utc):%Y%m%d}.{fmt}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'private, no-store'
+    response.headers['X-Accel-Buffering'] = 'no'  # let proxies pass chunks through as they are produced
+    return response
+
+PUBLIC_PROFILE_COLUMNS = PROFILE_COLUMNS + ', is_hostelite, societies, ghost_mode, created_at'
+PUBLIC_RECEIPT_COLUMNS = 'id, from_user_id, to_user_id, tags, created_at, accepted_at'
+PROFILE_TOP_TAGS = 6
+
+@app.route('/api/users/<user_id>/profile', methods=['GET'])
+@authenticate_user
+def get_user_profile(user_id):
+    """
+    Everything UserProfilePage needs in one response: profile, aggregate stats, the first page of
+    public receipts and the caller's last interaction with this user.
+    Stats come from profile_receipt_stats (kept by trigger, profile_stats.sql), so no receipts are scanned.
+    Query params: limit, cursor. With a cursor only the next receipts page is returned.
+    """
+    try:
+        try:
+            user_id = str(uuid.UUID(user_id))
+        except ValueError:
+            return jsonify({'error': 'Invalid user id'}), 400
+        limit = parse_limit(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+        client = get_db()
+        viewer = g.user.id
+
+        def receipts_page():
+            query = client.table('public_receipts').select(PUBLIC_RECEIPT_COLUMNS).eq('to_user_id', user_id)
+            return keyset_page(query, 'created_at', cursor, limit, desc=True)
+
+        if cursor:
+            rows, next_cursor = receipts_page()
+            return jsonify({'success': True, 'receipts': rows, 'next_cursor': next_cursor}), 200
+
+        def last_interaction():
+            if viewer == user_id:
+                return None
+            res = client.table('receipts').select('created_at').or_(
+                f"and(from_user_id.eq.{viewer},to_user_id.eq.{user_id}),and(from_user_id.eq.{user_id},to_user_id.eq.{viewer})"
+            ).order('created_at', desc=True).limit(1).execute()
+            return res.data[0]['created_at'] if res.data else None
+
+        profile_res, stats_res, (rows, next_cursor), last_seen = run_concurrently(
+            lambda: client.table('public_profiles').select(PUBLIC_PROFILE_COLUMNS).eq('user_id', user_id).execute(),
+            lambda: client.table('profile_receipt_stats').select('public_received_count, tag_counts').eq('user_id', user_id).execute(),
+            receipts_page,
+            last_interaction
+        )
+        if not profile_res.data:
+            return jsonify({'error': 'User not found'}), 404
+
+        stats = stats_res.data[0] if stats_res.data else {'public_received_count': 0, 'tag_counts': {}}
+        tag_counts = stats.get('tag_counts') or {}
+        top_tags = sorted(tag_counts.items(), key=lambda item: (-item[1], item[0]))[:PROFILE_TOP_TAGS]
+
+        return jsonify({
+            'success': True,
+            'profile': profile_res.data[0],
+            'stats': {
+                'public_received_count': stats['public_received_count'],
+                'tag_counts': tag_counts,
+                'top_tags': [{'tag': tag, 'count': count} for tag, count in top_tags]
+            },
+            'receipts': rows,
+            'next_cursor': next_cursor,
+            'last_interaction': last_seen
+        }), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.exception('User Profile failed')
+        return jsonify({'error': str(e)}), 500
+
+# Chat (chat_unread_counters.sql): thread pages, trigger-maintained unread counters.
+MESSAGE_COLUMNS = 'id, sender_id, recipient_id, content, created_at, read_at, message_type, attachment_id'
+MESSAGE_PROOF_COLUMNS = 'proof_data:receipts(id, description, tags, status)'
+
+def _parse_user_id(value):
+    """Canonical uuid string. Raises ValueError, which the routes turn into a 400."""
+    try:
+        return str(uuid.UUID(value))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid user id')
+
+@app.route('/api/messages/unread', methods=['GET'])
+@authenticate_user
+def get_unread_messages():
+    """Unread message counts per sender: {unread_counts: {sender_id: count}, total}."""
+    try:
+        rows = get_db().rpc('get_unread_counts', {}).execute().data or []
+        counts = {row['sender_id']: row['count'] for row in rows}
+        return jsonify({'success': True, 'unread_counts': counts, 'total': sum(counts.values())}), 200
+
+    except Exception as e:
+        log.exception('Unread Messages failed')
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/messages/<other_id>', methods=['GET'])
+@authenticate_user
+def get_thread(other_id):
+    """
+    Messages between the caller and other_id, newest first, one keyset page at a time.
+    Query params: limit (default 50, max 200), cursor. Clients reverse each page for display.
+    """
+    try:
+        other_id = _parse_user_id(other_id)
+        limit = parse_limit(request.args.get('limit'))
+        uid = g.user.id
+
+        query = get_db().table('messages').select(f'{MESSAGE_COLUMNS}, {MESSAGE_PROOF_COLUMNS}').or_(
+            f"and(sender_id.eq.{uid},recipient_id.eq.{other_id}),and(sender_id.eq.{other_id},recipient_id.eq.{uid})"
+        )
+        rows, next_cursor = keyset_page(query, 'created_at', request.args.get('cursor'), limit, desc=True)
+        return jsonify({'success': True, 'data': rows, 'next_cursor': next_cursor}), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.exception('Get Thread failed')
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/messages/<other_id>/read', methods=['POST'])
+@authenticate_user
+def mark_thread_read(other_id):
+    """Marks everything other_id sent the caller as read; a no-op probe when nothing is unread."""
+    try:
+        get_db().rpc('mark_thread_read', {'other_user_id': _parse_user_id(other_id)}).execute()
+        return jsonify({'success': True}), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.exception('Mark Thread Read failed')
+        return jsonify({'error': str(e)}), 500
+
+# Answers for a request to someone the caller already has an edge with.
+CONNECTION_STATE_ERRORS = {
+    'connected': 'Already connected',
+    'pending_outgoing': 'Request already sent',
+    'pending_incoming': 'They already sent you a request',
+}
+
+def connection_write_mode():
+    """
+    'rpc' (default): a connection request is one call to request_connection_rpc (connection_request_rpc.sql).
+    'legacy': the original lookup, edge check and insert, kept for benchmarking and rollback.
+    """
+    return os.environ.get('CONNECTION_WRITE_MODE', 'rpc').lower()
+
+def _request_connection_rpc(client, target_email):
+    """Single round-trip: email lookup, edge check and insert in one statement. Returns (state, row) or (None, error)."""
+    data, error = _call_rpc(client, 'request_connection_rpc', {'p_email': target_email})
+    if error:
+        return None, error
+    return (data['state'], data['connection']), None
+
+def _request_connection_legacy(client, target_email):
+    """Three round-trips: profile lookup, existing edge, insert."""
+    # 1. Find Target User
+    # Note: public_profiles is viewable by all, so this is safe
+    target_res = client.table('public_profiles').select('user_id').eq('email', target_email).execute()
+
+    # Check if we got data
+    if not target_res.data or len(target_res.data) == 0:
+        return None, (jsonify({'error': 'User not found. They must sign up for Pledge first.'}), 404)
+
+    target_id = target_res.data[0]['user_id']
+
+    if target_id == g.user.id:
+        return None, (jsonify({'error': 'Cannot connect to self'}), 400)
+
+    # 2. Check Existing
+    low_id, high_id = sorted([g.user.id, target_id])
+
+    # Check for existing connection between these two
+    existing_res = client.table('connections').select('*').eq('low_id', low_id).eq('high_id', high_id).execute()
+
+    if existing_res.data and len(existing_res.data) > 0:
+        existing = existing_res.data[0]
+        if existing['accepted']:
+            return ('connected', existing), None
+        if existing['requested_by'] == g.user.id:
+            return ('pending_outgoing', existing), None
+        return ('pending_incoming', existing), None
+
+    # 3. Create Connection
+    payload = {
+        'low_id': low_id,
+        'high_id': high_id,
+        'requested_by': g.user.id,
+        'accepted': False
+    }
+    res = client.table('connections').insert(payload).execute()
+    return ('requested', res.data[0] if res.data else payload), None
+
 @app.route('/api/connections/request', methods=['POST'])
 @authenticate_user
+@rate_limited('connections_request')
 def request_connection():
+    """
+    Emails are matched case-insensitively: stored emails are normalized to lower(trim()) by
+    trigger (connection_request_rpc.sql), so the input is normalized the same way.
+    """
     try:
         data = request.get_json()
         target_email = data.get('email', '').strip().lower()
@@ -208,46 +860,22 @@ def request_connection():
 
         client = get_db()
 
-        # 1. Find Target User
-        # Note: public_profiles is viewable by all, so this is safe
-        target_res = client.table('public_profiles').select('user_id').eq('email', target_email).execute()
-        
-        # Check if we got data
-        if not target_res.data or len(target_res.data) == 0:
-            return jsonify({'error': 'User not found. They must sign up for Pledge first.'}), 404
-        
-        target_id = target_res.data[0]['user_id']
-        
-        if target_id == g.user.id:
-            return jsonify({'error': 'Cannot connect to self'}), 400
+        if connection_write_mode() == 'legacy':
+            result, error = _request_connection_legacy(client, target_email)
+        else:
+            result, error = _request_connection_rpc(client, target_email)
+        if error:
+            return error
+
+        state, connection = result
+        if state in CONNECTION_STATE_ERRORS:
+            return jsonify({'error': CONNECTION_STATE_ERRORS[state]}), 400
+        _notify_participants(g.user.id, connection)
 
-        # 2. Check Existing
-        low_id, high_id = sorted([g.user.id, target_id])
-        
-        # Check for existing connection between these two
-        existing_res = client.table('connections').select('*').eq('low_id', low_id).eq('high_id', high_id).execute()
-        
-        if existing_res.data and len(existing_res.data) > 0:
-            existing = existing_res.data[0]
-            if existing['accepted']:
-                 return jsonify({'error': 'Already connected'}), 400
-            if existing['requested_by'] == g.user.id:
-                 return jsonify({'error': 'Request already sent'}), 400
-            return jsonify({'error': 'They already sent you a request'}), 400
-
-        # 3. Create Connection
-        payload = {
-            'low_id': low_id,
-            'high_id': high_id,
-            'requested_by': g.user.id,
-            'accepted': False
-        }
-        res = client.table('connections').insert(payload).execute()
-        
         return jsonify({'success': True, 'message': 'Request sent'}), 200
 
     except Exception as e:
-        print(f"Connection Request Error: {str(e)}")
+        log.exception('Connection Request failed')
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/connections/remove', methods=['POST'])
@@ -263,11 +891,12 @@ def remove_connection():
 
         # Delete (RLS will enforce permissions)
         res = client.table('connections').delete().eq('id', connection_id).execute()
-        
+        _notify_participants(g.user.id, *(res.data or []))
+
         return jsonify({'success': True}), 200
 
     except Exception as e:
-        print(f"Remove Connection Error: {str(e)}")
+        log.exception('Remove Connection failed')
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/connections/accept', methods=['POST'])
@@ -286,15 +915,83 @@ def accept_connection():
             'accepted': True,
             'accepted_at': datetime.now(timezone.utc).isoformat()
         }).eq('id', connection_id).execute()
-        
+        _notify_participants(g.user.id, *(res.data or []))
+
         return jsonify({'success': True}), 200
 
     except Exception as e:
-        print(f"Accept Connection Error: {str(e)}")
+        log.exception('Accept Connection failed')
         return jsonify({'error': str(e)}), 500
 
+def receipt_write_mode():
+    """
+    'rpc' (default): receipt writes go through one Postgres function call (receipt_rpc.sql).
+    'legacy': the original multi-call path, kept for benchmarking and rollback.
+    """
+    return os.environ.get('RECEIPT_WRITE_MODE', 'rpc').lower()
+
+def _create_receipt_rpc(client, recipient_email, tags, description, is_public):
+    """Single round-trip: recipient lookup, status decision and insert happen in one transaction."""
+    # 22023 = invalid_parameter_value, raised for self-receipts
+    return _call_rpc(client, 'create_receipt_rpc', {
+        'p_recipient_email': recipient_email,
+        'p_tags': tags,
+        'p_description': description,
+        'p_is_public': is_public
+    }, flagged=True)
+
+def _create_receipt_legacy(client, recipient_email, tags, description, is_public):
+    """Three round-trips: profile lookup, connection lookup, insert."""
+    from_user_id = g.user.id
+
+    # Default State
+    status = 'AWAITING_SIGNUP'
+    to_user_id = None
+    connection_id = None
+
+    # 1. Check if recipient exists
+    # Using .execute() directly avoids potential NoneType issues with maybe_single() on some client versions
+    recipient_query = client.table('public_profiles').select('user_id').eq('email', recipient_email.strip().lower()).execute()
+
+    if recipient_query.data and len(recipient_query.data) > 0:
+        to_user_id = recipient_query.data[0]['user_id']
+
+        # Prevent self-receipts
+        if to_user_id == from_user_id:
+             return None, (jsonify({'success': False, 'error': 'Cannot send receipt to yourself'}), 400)
+
+        # 2. Check Connection
+        low_id, high_id = sorted([from_user_id, to_user_id])
+        conn_query = client.table('connections').select('id, accepted').eq('low_id', low_id).eq('high_id', high_id).execute()
+
+        if conn_query.data and len(conn_query.data) > 0 and conn_query.data[0]['accepted']:
+            status = 'AWAITING_ACCEPTANCE'
+            connection_id = conn_query.data[0]['id']
+        else:
+            status = 'AWAITING_CONNECTION'
+
+    # 3. Insert Receipt
+    payload = {
+        'from_user_id': from_user_id,
+        'to_user_id': to_user_id,
+        'recipient_email': recipient_email,
+        'tags': tags,
+        'description': description,
+        'is_public': is_public,
+        'status': status,
+        'connection_id': connection_id,
+        'created_at': datetime.now(timezone.utc).isoformat()
+    }
+
+    res = client.table('receipts').insert(payload).execute()
+
+    if not res.data:
+        raise Exception("Failed to insert receipt")
+    return res.data[0], None
+
 @app.route('/api/receipts/create', methods=['POST'])
 @authenticate_user
+@rate_limited('receipts_create')
 def create_receipt():
     try:
         data = request.json
@@ -307,64 +1004,228 @@ def create_receipt():
             return jsonify({'success': False, 'error': 'Recipient email is required'}), 400
 
         client = get_db()
-        from_user_id = g.user.id
-        
-        # Default State
-        status = 'AWAITING_SIGNUP'
-        to_user_id = None
-        connection_id = None
-
-        # 1. Check if recipient exists
-        # Using .execute() directly avoids potential NoneType issues with maybe_single() on some client versions
-        recipient_query = client.table('public_profiles').select('user_id').ilike('email', recipient_email).execute()
-        
-        if recipient_query.data and len(recipient_query.data) > 0:
-            to_user_id = recipient_query.data[0]['user_id']
-            
-            # Prevent self-receipts
-            if to_user_id == from_user_id:
-                 return jsonify({'success': False, 'error': 'Cannot send receipt to yourself'}), 400
 
-            # 2. Check Connection
-            low_id, high_id = sorted([from_user_id, to_user_id])
-            conn_query = client.table('connections').select('id, accepted').eq('low_id', low_id).eq('high_id', high_id).execute()
+        if receipt_write_mode() == 'legacy':
+            receipt, error = _create_receipt_legacy(client, recipient_email, tags, description, is_public)
+        else:
+            receipt, error = _create_receipt_rpc(client, recipient_email, tags, description, is_public)
+        if error:
+            return error
+        _notify_participants(g.user.id, receipt)
 
-            if conn_query.data and len(conn_query.data) > 0 and conn_query.data[0]['accepted']:
+        return jsonify({'success': True, 'receipt': receipt}), 200
+
+    except Exception as e:
+        log.exception('Create Receipt failed')
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Bulk issuing (events, societies).
+RECEIPT_BATCH_LIMIT = int(os.environ.get('RECEIPT_BATCH_LIMIT', 500))
+
+def _batch_cost():
+    """A batch spends one rate-limit token per recipient."""
+    recipients = (request.get_json(silent=True) or {}).get('recipients')
+    return len(recipients) if isinstance(recipients, list) and recipients else 1
+
+@app.route('/api/receipts/batch', methods=['POST'])
+@authenticate_user
+@rate_limited('receipts_batch', cost=_batch_cost)
+def create_receipts_batch():
+    """
+    Issues the same receipt (tags/description/is_public) to many recipients.
+    Body: {"recipients": ["a@x.com", ...], "tags": [...], "description": "...", "is_public": false}
+    Returns one result per recipient, in request order; failures do not abort the batch.
+    """
+    try:
+        data = request.json or {}
+        recipients = data.get('recipients') or []
+        tags = data.get('tags', [])
+        description = data.get('description', '')
+        is_public = data.get('is_public', False)
+
+        if not isinstance(recipients, list) or not recipients:
+            return jsonify({'success': False, 'error': 'Recipients list is required'}), 400
+        if len(recipients) > RECEIPT_BATCH_LIMIT:
+            return jsonify({'success': False, 'error': f'At most {RECEIPT_BATCH_LIMIT} recipients per batch'}), 400
+
+        client = get_db()
+        from_user_id = g.user.id
+        my_email = (g.user.email or '').lower()
+
+        # 1. Validate & de-duplicate
+        results = []
+        pending = {}  # normalized email -> index into results
+        for raw in recipients:
+            email = (raw.get('email') if isinstance(raw, dict) else raw) or ''
+            email = str(email).strip().lower()
+            result = {'email': email, 'success': False}
+            results.append(result)
+            if '@' not in email:
+                result['error'] = 'Invalid email'
+            elif email == my_email:
+                result['error'] = 'Cannot send receipt to yourself'
+            elif email in pending:
+                result['error'] = 'Duplicate recipient in batch'
+            else:
+                pending[email] = len(results) - 1
+
+        # 2. Resolve every recipient in one `in_` query (per chunk)
+        emails = list(pending)
+        user_by_email = {}
+        for chunk in _chunks(emails, IN_FILTER_CHUNK):
+            res = client.table('public_profiles').select('user_id, email').in_('email', chunk).execute()
+            for p in res.data or []:
+                user_by_email[p['email'].lower()] = p['user_id']
+
+        # 3. Fetch every relevant connection in one query (per chunk)
+        user_ids = [uid for uid in user_by_email.values() if uid != from_user_id]
+        accepted_conn = {}  # other user id -> connection id
+        for chunk in _chunks(user_ids, IN_FILTER_CHUNK):
+            id_list = ','.join(chunk)
+            res = client.table('connections').select('id, low_id, high_id, accepted').or_(
+                f"and(low_id.eq.{from_user_id},high_id.in.({id_list})),"
+                f"and(high_id.eq.{from_user_id},low_id.in.({id_list}))"
+            ).execute()
+            for c in res.data or []:
+                if c['accepted']:
+                    other = c['high_id'] if c['low_id'] == from_user_id else c['low_id']
+                    accepted_conn[other] = c['id']
+
+        # 4. Build payloads
+        now = datetime.now(timezone.utc).isoformat()
+        payloads, owners = [], []
+        for email, index in pending.items():
+            to_user_id = user_by_email.get(email)
+            if to_user_id == from_user_id:
+                results[index]['error'] = 'Cannot send receipt to yourself'
+                continue
+            connection_id = accepted_conn.get(to_user_id)
+            if to_user_id is None:
+                status = 'AWAITING_SIGNUP'
+            elif connection_id:
                 status = 'AWAITING_ACCEPTANCE'
-                connection_id = conn_query.data[0]['id']
             else:
                 status = 'AWAITING_CONNECTION'
-        
-        # 3. Insert Receipt
-        payload = {
-            'from_user_id': from_user_id,
-            'to_user_id': to_user_id,
-            'recipient_email': recipient_email,
-            'tags': tags,
-            'description': description,
-            'is_public': is_public,
-            'status': status,
-            'connection_id': connection_id,
-            'created_at': datetime.now(timezone.utc).isoformat()
-        }
-
-        res = client.table('receipts').insert(payload).execute()
-        
-        if not res.data:
-            raise Exception("Failed to insert receipt")
+            payloads.append({
+                'from_user_id': from_user_id,
+                'to_user_id': to_user_id,
+                'recipient_email': email,
+                'tags': tags,
+                'description': description,
+                'is_public': is_public,
+                'status': status,
+                'connection_id': connection_id,
+                'created_at': now
+            })
+            owners.append(index)
 
-        return jsonify({'success': True, 'receipt': res.data[0]}), 200
+        # 5. Single multi-row insert. If the batch is rejected as a whole,
+        # retry row by row so one bad row doesn't fail everyone else.
+        if payloads:
+            try:
+                inserted = client.table('receipts').insert(payloads).execute().data or []
+                rows = list(zip(owners, inserted))
+            except Exception as e:
+                log.warning('Batch receipt insert failed, retrying per row', extra={'rows': len(payloads), 'error': str(e)})
+                rows = []
+                for index, payload in zip(owners, payloads):
+                    try:
+                        res = client.table('receipts').insert(payload).execute()
+                        rows.append((index, res.data[0]))
+                    except Exception as row_err:
+                        results[index]['error'] = str(row_err)
+
+            for index, receipt in rows:
+                results[index].update({'success': True, 'receipt_id': receipt['id'], 'status': receipt['status']})
+            _notify_participants(g.user.id, *(receipt for _, receipt in rows))
+
+        created = sum(1 for r in results if r['success'])
+        return jsonify({
+            'success': True,
+            'created': created,
+            'failed': len(results) - created,
+            'results': results
+        }), 200
 
     except Exception as e:
-        print(f"Create Receipt Error: {str(e)}")
-        # Print traceback for deeper debugging
-        import traceback
-        traceback.print_exc()
+        log.exception('Batch Receipt failed')
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _receipt_rpc(client, name, receipt_id):
+    """Calls claim_receipt_rpc / reject_receipt_rpc. Returns (final row, None) or (None, error response)."""
+    return _call_rpc(client, name, {'p_receipt_id': receipt_id}, flagged=True)
+
+def _claim_receipt_legacy(client, receipt_id):
+    """Up to four round-trips: fetch, connection upsert, link, status update."""
+    # 1. Fetch Receipt
+    receipt_query = client.table('receipts').select('*').eq('id', receipt_id).execute()
+    
+    if not receipt_query.data or len(receipt_query.data) == 0:
+        return None, (jsonify({'success': False, 'error': 'Receipt not found'}), 404)
+        
+    receipt = receipt_query.data[0]
+    
+    log.debug('Claiming receipt', extra={'receipt_id': receipt_id, 'owner': receipt.get('to_user_id'), 'user_id': g.user.id})
+
+    # 2. Authorization & Late Binding Logic
+    # Allow claim if:
+    # a) User is the assigned recipient
+    # b) User is NOT assigned (None) BUT matches the email (Late Binding)
+    
+    is_assigned = receipt['to_user_id'] == g.user.id
+    is_email_match = (receipt['to_user_id'] is None) and (receipt['recipient_email'].lower() == g.user.email.lower())
+
+    if not (is_assigned or is_email_match):
+         return None, (jsonify({'success': False, 'error': 'Not authorized to claim this receipt'}), 403)
+
+    # 3. Handle Late Linking / Connection Check
+    # If we just linked by email, or if connection is missing for some reason, ensure it exists now.
+    if is_email_match or not receipt.get('connection_id'):
+        # Ensure connection exists
+        low_id, high_id = sorted([g.user.id, receipt['from_user_id']])
+        
+        # Upsert connection to be safe
+        conn_payload = {
+            'low_id': low_id,
+            'high_id': high_id,
+            'requested_by': g.user.id, # Accepting receipt implies requesting/accepting connection
+            'accepted': True,
+            'accepted_at': datetime.now(timezone.utc).isoformat()
+        }
+        conn_res = client.table('connections').upsert(conn_payload).execute()
+        
+        # If we just created/fetched it, update the receipt with the link
+        if conn_res.data and len(conn_res.data) > 0:
+             client.table('receipts').update({
+                 'to_user_id': g.user.id,
+                 'connection_id': conn_res.data[0]['id']
+             }).eq('id', receipt_id).execute()
+
+    # 4. Status Check
+    # We allow claiming AWAITING_SIGNUP if we just did late binding
+    allowed_statuses = ['AWAITING_ACCEPTANCE', 'AWAITING_SIGNUP', 'AWAITING_CONNECTION']
+    if receipt['status'] not in allowed_statuses and not is_email_match:
+         # Logic tweak: If it was AWAITING_SIGNUP and we matched email, we allow it.
+         # If it was already linked but in weird state, block it?
+         # Let's be permissive if it's not already ACCEPTED/REJECTED
+         if receipt['status'] in ['ACCEPTED', 'REJECTED']:
+              return None, (jsonify({'success': False, 'error': f"Receipt already {receipt['status']}"}), 400)
+
+    # 5. Update Status
+    res = client.table('receipts').update({
+        'status': 'ACCEPTED'
+    }).eq('id', receipt_id).execute()
+
+    return (res.data[0] if res.data else None), None
+
 @app.route('/api/receipts/claim', methods=['POST'])
 @authenticate_user
+@rate_limited('receipts_claim')
 def claim_receipt():
+    """
+    RECEIPT_WRITE_MODE=rpc (default): one transactional call to claim_receipt_rpc (receipt_claim_rpc.sql).
+    Either way the response carries the final receipt row.
+    """
     try:
         data = request.json
         receipt_id = data.get('receipt_id')
@@ -372,74 +1233,43 @@ def claim_receipt():
              return jsonify({'success': False, 'error': 'Receipt ID required'}), 400
 
         client = get_db()
-        
-        # 1. Fetch Receipt
-        receipt_query = client.table('receipts').select('*').eq('id', receipt_id).execute()
-        
-        if not receipt_query.data or len(receipt_query.data) == 0:
-            return jsonify({'success': False, 'error': 'Receipt not found'}), 404
-            
-        receipt = receipt_query.data[0]
-        
-        print(f"DEBUG: Claiming receipt {receipt_id}. Owner: {receipt.get('to_user_id')}, User: {g.user.id}, Email: {receipt.get('recipient_email')}")
 
-        # 2. Authorization & Late Binding Logic
-        # Allow claim if:
-        # a) User is the assigned recipient
-        # b) User is NOT assigned (None) BUT matches the email (Late Binding)
-        
-        is_assigned = receipt['to_user_id'] == g.user.id
-        is_email_match = (receipt['to_user_id'] is None) and (receipt['recipient_email'].lower() == g.user.email.lower())
-
-        if not (is_assigned or is_email_match):
-             return jsonify({'success': False, 'error': 'Not authorized to claim this receipt'}), 403
-
-        # 3. Handle Late Linking / Connection Check
-        # If we just linked by email, or if connection is missing for some reason, ensure it exists now.
-        if is_email_match or not receipt.get('connection_id'):
-            # Ensure connection exists
-            low_id, high_id = sorted([g.user.id, receipt['from_user_id']])
-            
-            # Upsert connection to be safe
-            conn_payload = {
-                'low_id': low_id,
-                'high_id': high_id,
-                'requested_by': g.user.id, # Accepting receipt implies requesting/accepting connection
-                'accepted': True,
-                'accepted_at': datetime.now(timezone.utc).isoformat()
-            }
-            conn_res = client.table('connections').upsert(conn_payload).execute()
-            
-            # If we just created/fetched it, update the receipt with the link
-            if conn_res.data and len(conn_res.data) > 0:
-                 client.table('receipts').update({
-                     'to_user_id': g.user.id,
-                     'connection_id': conn_res.data[0]['id']
-                 }).eq('id', receipt_id).execute()
-
-        # 4. Status Check
-        # We allow claiming AWAITING_SIGNUP if we just did late binding
-        allowed_statuses = ['AWAITING_ACCEPTANCE', 'AWAITING_SIGNUP', 'AWAITING_CONNECTION']
-        if receipt['status'] not in allowed_statuses and not is_email_match:
-             # Logic tweak: If it was AWAITING_SIGNUP and we matched email, we allow it.
-             # If it was already linked but in weird state, block it?
-             # Let's be permissive if it's not already ACCEPTED/REJECTED
-             if receipt['status'] in ['ACCEPTED', 'REJECTED']:
-                  return jsonify({'success': False, 'error': f"Receipt already {receipt['status']}"}), 400
-
-        # 5. Update Status
-        res = client.table('receipts').update({
-            'status': 'ACCEPTED'
-        }).eq('id', receipt_id).execute()
+        if receipt_write_mode() == 'legacy':
+            receipt, error = _claim_receipt_legacy(client, receipt_id)
+        else:
+            receipt, error = _receipt_rpc(client, 'claim_receipt_rpc', receipt_id)
+        if error:
+            return error
+        _invalidate_verification(receipt_id)
+        _notify_participants(g.user.id, receipt)
 
-        return jsonify({'success': True}), 200
+        return jsonify({'success': True, 'receipt': receipt}), 200
 
     except Exception as e:
-        print(f"Claim Receipt Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception('Claim Receipt failed')
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _reject_receipt_legacy(client, receipt_id):
+    """Two round-trips: fetch, then update."""
+    # 1. Fetch Receipt
+    receipt_query = client.table('receipts').select('*').eq('id', receipt_id).execute()
+    
+    if not receipt_query.data or len(receipt_query.data) == 0:
+        return None, (jsonify({'success': False, 'error': 'Receipt not found'}), 404)
+        
+    receipt = receipt_query.data[0]
+
+    # 2. Authorization
+    if receipt['to_user_id'] != g.user.id:
+         return None, (jsonify({'success': False, 'error': 'Not authorized to reject this receipt'}), 403)
+    
+    # 3. Update
+    res = client.table('receipts').update({
+        'status': 'REJECTED'
+    }).eq('id', receipt_id).execute()
+
+    return (res.data[0] if res.data else None), None
+
 @app.route('/api/receipts/reject', methods=['POST'])
 @authenticate_user
 def reject_receipt():
@@ -450,129 +1280,388 @@ def reject_receipt():
              return jsonify({'success': False, 'error': 'Receipt ID required'}), 400
 
         client = get_db()
-        
-        # 1. Fetch Receipt
-        receipt_query = client.table('receipts').select('*').eq('id', receipt_id).execute()
-        
-        if not receipt_query.data or len(receipt_query.data) == 0:
-            return jsonify({'success': False, 'error': 'Receipt not found'}), 404
-            
-        receipt = receipt_query.data[0]
-
-        # 2. Authorization
-        if receipt['to_user_id'] != g.user.id:
-             return jsonify({'success': False, 'error': 'Not authorized to reject this receipt'}), 403
-        
-        # 3. Update
-        res = client.table('receipts').update({
-            'status': 'REJECTED'
-        }).eq('id', receipt_id).execute()
 
-        return jsonify({'success': True}), 200
+        if receipt_write_mode() == 'legacy':
+            receipt, error = _reject_receipt_legacy(client, receipt_id)
+        else:
+            receipt, error = _receipt_rpc(client, 'reject_receipt_rpc', receipt_id)
+        if error:
+            return error
+        _invalidate_verification(receipt_id)
+        _notify_participants(g.user.id, receipt)
+
+        return jsonify({'success': True, 'receipt': receipt}), 200
 
     except Exception as e:
-        print(f"Reject Receipt Error: {str(e)}")
+        log.exception('Reject Receipt failed')
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/leaderboard', methods=['GET'])
-@authenticate_user
-def get_leaderboard():
+# Public verification payloads keyed by receipt id: (body, etag), or False for "not verifiable".
+# Claim/reject in this worker invalidate their entry. Rejects and deletes that the web app writes
+# straight to Supabase are not seen here, so both this TTL and the browser/CDN max-age are kept
+# short: a withdrawn receipt stops verifying within minutes, not a day.
+_verify_cache = TTLCache(maxsize=int(os.environ.get('VERIFY_CACHE_SIZE', 10000)),
+                         ttl=float(os.environ.get('VERIFY_CACHE_TTL', 300)))
+VERIFY_NEGATIVE_TTL = 60
+VERIFY_MAX_AGE = int(os.environ.get('VERIFY_MAX_AGE', 300))
+SIGNING_KEY_MAX_AGE = 86400
+
+def _invalidate_verification(receipt_id):
+    _verify_cache.invalidate(str(receipt_id))
+
+def _build_verification(receipt_id):
+    """One anon RPC (receipt_verification.sql); None unless the receipt is ACCEPTED and public."""
+    rows = public_client().rpc('verify_receipt', {'p_receipt_id': receipt_id}).execute().data or []
+    if not rows:
+        return None
+    receipt = rows[0]
+    digest = receipt_signing.content_hash(receipt)
+    body = json.dumps({
+        'success': True,
+        'receipt': receipt,
+        'content_hash': f'sha256:{digest}',
+        'signature': receipt_signing.sign(receipt_id, digest)
+    }, sort_keys=True, separators=(',', ':')).encode()
+    return body, hashlib.sha256(body).hexdigest()
+
+@app.route('/api/receipts/<receipt_id>/verify', methods=['GET'])
+def verify_receipt(receipt_id):
+    """
+    Public (no auth): minimal projection of an accepted, public receipt for shared verification links.
+    Served from an in-process LRU; responses are publicly cacheable with an ETag (304 on If-None-Match).
+    content_hash/signature let a verifier check the receipt offline (utils/receipt_signing.py).
+    """
     try:
-        client = get_db()
-        
-        # 1. Fetch Aggregated Stats (Optimized)
-        stats_res = client.table('leaderboard_stats').select('*').execute()
-        
-        if not stats_res.data:
-             return jsonify({'success': True, 'top_givers': [], 'top_receivers': []}), 200
+        try:
+            receipt_id = str(uuid.UUID(receipt_id))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid receipt id'}), 400
+
+        cached = _verify_cache.get(receipt_id)
+        if cached is None:
+            cached = _build_verification(receipt_id) or False
+            _verify_cache.set(receipt_id, cached, ttl=None if cached else VERIFY_NEGATIVE_TTL)
+
+        if cached is False:
+            response = jsonify({'success': False, 'error': 'Receipt not found or not publicly verifiable'})
+            response.status_code = 404
+            response.headers['Cache-Control'] = f'public, max-age={VERIFY_NEGATIVE_TTL}'
+            return response
+
+        body, etag = cached
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f'public, max-age={VERIFY_MAX_AGE}'
+        return response.make_conditional(request)
+
+    except Exception as e:
+        log.exception('Verify Receipt failed')
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-        # 2. Fetch User Profiles (Batch)
-        # Only fetch profiles for users who are in the leaderboard stats
-        user_ids = [r['user_id'] for r in stats_res.data]
+@app.route('/api/receipts/signing-key', methods=['GET'])
+def receipt_signing_key():
+    """JWK set for checking verification signatures offline; 404 when signing is not configured."""
+    jwk = receipt_signing.public_jwk()
+    if jwk is None:
+        return jsonify({'error': 'Receipt signing is not configured'}), 404
+    response = jsonify({'keys': [jwk]})
+    response.headers['Cache-Control'] = f'public, max-age={SIGNING_KEY_MAX_AGE}'
+    return response
+
+LEADERBOARD_LIMIT = 50
+LEADERBOARD_WINDOWS = ('all', 'week', 'month', 'semester')
+# Rendered boards, keyed on (window, institution, max(last_updated)).
+_leaderboard_cache = TTLCache(maxsize=256, ttl=float(os.environ.get('LEADERBOARD_CACHE_TTL', 30)))
+# max(last_updated) itself, so polling clients don't cost a round-trip every time.
+_leaderboard_version = TTLCache(maxsize=1, ttl=float(os.environ.get('LEADERBOARD_VERSION_TTL', 5)))
+# Cache misses are coalesced: a burst of identical requests runs one probe and one build
+# (across workers too when REDIS_URL is set).
+_leaderboard_flight = SingleFlight('leaderboard', shared_ttl=_leaderboard_cache.ttl)
+
+def _window_start(window):
+    """Start of a leaderboard window in UTC, or None for all-time. Semesters: Spring from Jan 1, Fall from Aug 1."""
+    now = datetime.now(timezone.utc)
+    if window == 'week':
+        return now - timedelta(days=7)
+    if window == 'month':
+        return now - timedelta(days=30)
+    if window == 'semester':
+        return now.replace(month=8 if now.month >= 8 else 1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    return None
+
+def _leaderboard_data_version(client):
+    version = _leaderboard_version.get('max_last_updated')
+    if version is None:
+        def probe():
+            res = client.table('leaderboard_stats').select('last_updated').order('last_updated', desc=True).limit(1).execute()
+            return res.data[0]['last_updated'] if res.data else ''
+        version = _leaderboard_flight.do('version', probe, encode=str.encode, decode=bytes.decode,
+                                         ttl=_leaderboard_version.ttl)
+        _leaderboard_version.set('max_last_updated', version)
+    return version
+
+def _format_leaderboard_entry(user_id, profile, count):
+    return {
+        'user_id': user_id,
+        'name': f"{profile.get('first_name') or ''} {profile.get('last_name') or ''}".strip() or 'Unknown User',
+        'institution': profile.get('institution') or 'Unknown',
+        'count': count
+    }
+
+def _build_global_leaderboard(client):
+    """All-time board: two indexed top-N reads on leaderboard_stats plus one profile fetch for those ids."""
+    givers = client.table('leaderboard_stats').select('user_id, given_count').gt('given_count', 0) \
+        .order('given_count', desc=True).limit(LEADERBOARD_LIMIT).execute().data or []
+    receivers = client.table('leaderboard_stats').select('user_id, received_count').gt('received_count', 0) \
+        .order('received_count', desc=True).limit(LEADERBOARD_LIMIT).execute().data or []
+
+    user_ids = list({r['user_id'] for r in givers + receivers})
+    profiles_map = {}
+    if user_ids:
         profiles_res = client.table('public_profiles').select('user_id, first_name, last_name, institution').in_('user_id', user_ids).execute()
         profiles_map = {p['user_id']: p for p in profiles_res.data}
 
-        # 3. Format & Sort
-        def format_entry(stat, type_key):
-            uid = stat['user_id']
-            profile = profiles_map.get(uid, {})
-            return {
-                'user_id': uid,
-                'name': f"{profile.get('first_name', '')} {profile.get('last_name', '')}".strip() or 'Unknown User',
-                'institution': profile.get('institution', 'Unknown'),
-                'count': stat.get(type_key, 0)
-            }
+    return (
+        [_format_leaderboard_entry(r['user_id'], profiles_map.get(r['user_id'], {}), r['given_count']) for r in givers],
+        [_format_leaderboard_entry(r['user_id'], profiles_map.get(r['user_id'], {}), r['received_count']) for r in receivers]
+    )
+
+def _build_windowed_leaderboard(client, since, institution):
+    """Weekly/semester and per-institution boards are aggregated server-side (leaderboard_windows.sql)."""
+    rows = client.rpc('get_leaderboard_window', {
+        'p_since': since.isoformat() if since else None,
+        'p_institution': institution,
+        'p_limit': LEADERBOARD_LIMIT
+    }).execute().data or []
+    boards = {'givers': [], 'receivers': []}
+    for r in rows:
+        boards[r['board']].append(_format_leaderboard_entry(r['user_id'], r, r['count']))
+    return boards['givers'], boards['receivers']
 
-        # Python-side sorting is fine for <10k users. 
-        # For larger scales, we would query the DB with .order().limit() separately for givers/receivers.
-        
-        top_givers = sorted(
-            [format_entry(s, 'given_count') for s in stats_res.data if s.get('given_count', 0) > 0],
-            key=lambda x: x['count'], 
-            reverse=True
-        )[:50]
-
-        top_receivers = sorted(
-            [format_entry(s, 'received_count') for s in stats_res.data if s.get('received_count', 0) > 0],
-            key=lambda x: x['count'], 
-            reverse=True
-        )[:50]
+@app.route('/api/leaderboard', methods=['GET'])
+@authenticate_user
+def get_leaderboard():
+    """
+    Query params: window=all|week|month|semester (default all), institution=<institution_id>.
+    Responses carry an ETag; a matching If-None-Match gets an empty 304.
+    """
+    try:
+        window = request.args.get('window', 'all')
+        institution = request.args.get('institution') or None
+        if window not in LEADERBOARD_WINDOWS:
+            return jsonify({'error': f"window must be one of {', '.join(LEADERBOARD_WINDOWS)}"}), 400
 
-        return jsonify({
-            'success': True, 
-            'top_givers': top_givers, 
-            'top_receivers': top_receivers
-        }), 200
+        client = get_db()
+        cache_key = (window, institution, _leaderboard_data_version(client))
+        cached = _leaderboard_cache.get(cache_key)
+
+        if cached is None:
+            def build():
+                since = _window_start(window)
+                if since is None and institution is None:
+                    top_givers, top_receivers = _build_global_leaderboard(client)
+                else:
+                    top_givers, top_receivers = _build_windowed_leaderboard(client, since, institution)
+                return json.dumps({
+                    'success': True,
+                    'window': window,
+                    'institution': institution,
+                    'top_givers': top_givers,
+                    'top_receivers': top_receivers
+                }).encode()
+
+            body = _leaderboard_flight.do(cache_key, build, encode=bytes, decode=bytes)
+            cached = (body, hashlib.sha1(body).hexdigest())
+            _leaderboard_cache.set(cache_key, cached)
+
+        body, etag = cached
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
 
     except Exception as e:
-        print(f"Leaderboard Error: {str(e)}")
+        log.exception('Leaderboard failed')
         return jsonify({'error': str(e)}), 500
 
+_institution_graph = InstitutionGraphCache()
+
 @app.route('/api/institutions/graph', methods=['GET'])
 @authenticate_user
 def get_institution_graph():
+    """
+    Query params (optional pruning for large graphs):
+    - min_weight: drop links with fewer exchanges than this
+    - top_k: keep only each institution's k heaviest links
+    The payload is pre-serialized, gzip-encoded when accepted, and sent with an ETag.
+    """
     try:
-        client = get_db()
-        
-        # Fetch relationships
-        rels_res = client.table('institution_relationships').select('*').gt('exchange_count', 0).execute()
-        rels = rels_res.data or []
-
-        # Extract unique nodes and calculate stats
-        institutions = {} # Map id -> {id, label, stats: {given: 0, received: 0}}
-        links = []
-
-        for r in rels:
-            src = r['from_institution']
-            tgt = r['to_institution']
-            count = r['exchange_count']
-            
-            # Ensure nodes exist in map
-            if src not in institutions:
-                institutions[src] = {'id': src, 'label': src, 'stats': {'given': 0, 'received': 0}}
-            if tgt not in institutions:
-                institutions[tgt] = {'id': tgt, 'label': tgt, 'stats': {'given': 0, 'received': 0}}
-            
-            # Update Stats
-            institutions[src]['stats']['given'] += count
-            institutions[tgt]['stats']['received'] += count
-            
-            links.append({
-                'source': src,
-                'target': tgt,
-                'value': count
-            })
+        min_weight = max(int(request.args.get('min_weight', 1)), 1)
+        top_k = int(request.args['top_k']) if request.args.get('top_k') else None
+        if top_k is not None and top_k < 1:
+            return jsonify({'error': 'top_k must be positive'}), 400
+
+        _institution_graph.refresh(get_db())
+        body, gzipped, etag = _institution_graph.render(min_weight, top_k)
+
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = app.response_class(gzipped, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+            etag = f"{etag}-gzip"
+        else:
+            response = app.response_class(body, mimetype='application/json')
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.set_etag(etag)
+        return response.make_conditional(request)
+
+    except ValueError:
+        return jsonify({'error': 'min_weight and top_k must be integers'}), 400
+    except Exception as e:
+        log.exception('Institution Graph failed')
+        return jsonify({'error': str(e)}), 500
 
-        nodes = list(institutions.values())
+# User graph (graph_metrics.sql): ego networks walked in Postgres, metrics written by graph_engine.py.
+EGO_MAX_DEPTH = 3
+EGO_MAX_NODES = int(os.environ.get('EGO_MAX_NODES', 500))
+# Metrics only move when graph_engine.py runs, so clients may reuse them this long.
+GRAPH_METRICS_MAX_AGE = int(os.environ.get('GRAPH_METRICS_MAX_AGE', 60))
 
-        return jsonify({
-            'success': True,
-            'nodes': nodes,
-            'links': links
-        }), 200
+def _graph_rpc(name, params):
+    """Returns (data, None) or (None, error response) for the graph and search RPCs."""
+    return _call_rpc(get_db(), name, params)
+
+@app.route('/api/graph/ego', methods=['GET'])
+@authenticate_user
+def get_ego_graph():
+    """
+    The caller's neighbourhood of accepted connections, `depth` hops out (1-3, default 2), in one RPC.
+    - nodes: id, depth (0 = caller), name (hidden beyond the first hop in ghost mode), institution,
+      stored metrics, and mutual_connections with the caller.
+    - edges: source, target, weight (accepted receipts on the connection).
+    - truncated: the max_nodes budget (default EGO_MAX_NODES) cut off the outer hop;
+      the highest trust scores are kept.
+    Sent with an ETag, so an unchanged network costs a 304.
+    """
+    try:
+        depth = int(request.args.get('depth', 2))
+        if not 1 <= depth <= EGO_MAX_DEPTH:
+            return jsonify({'error': f'depth must be between 1 and {EGO_MAX_DEPTH}'}), 400
+        max_nodes = parse_limit(request.args.get('max_nodes'), default=EGO_MAX_NODES, maximum=EGO_MAX_NODES)
+
+        data, error = _graph_rpc('get_ego_network', {'p_depth': depth, 'p_max_nodes': max_nodes})
+        if error:
+            return error
+        nodes, edges = data['nodes'], data['edges']
+
+        # Mutual connections with the caller = a node's edges into the caller's first hop.
+        first_hop = {n['id'] for n in nodes if n['depth'] == 1}
+        mutual = {}
+        for e in edges:
+            for node, other in ((e['source'], e['target']), (e['target'], e['source'])):
+                if other in first_hop:
+                    mutual[node] = mutual.get(node, 0) + 1
+        for n in nodes:
+            n['mutual_connections'] = mutual.get(n['id'], 0) if n['depth'] else None
+
+        # Stable order, so the same network always yields the same ETag.
+        nodes.sort(key=lambda n: (n['depth'], -n['trust_score'], n['id']))
+        edges.sort(key=lambda e: (e['source'], e['target']))
+        body = json.dumps({'success': True, 'depth': depth, 'nodes': nodes, 'edges': edges,
+                           'truncated': data['truncated']}, separators=(',', ':')).encode()
+
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag(hashlib.sha1(body).hexdigest())
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+
+    except ValueError:
+        return jsonify({'error': 'depth and max_nodes must be integers'}), 400
+    except Exception as e:
+        log.exception('Ego Graph failed')
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/graph/metrics', methods=['GET'])
+@authenticate_user
+def get_graph_metrics():
+    """
+    Stored graph metrics for `user_id` (default: the caller): degree, weighted_degree,
+    trust_score (PageRank, 1.0 = average), trust_rank, computed_at, plus mutual_connections
+    with the caller. Users the engine has not scored yet read as zeros.
+    """
+    try:
+        user_id = _parse_user_id(request.args.get('user_id') or g.user.id)
+        data, error = _graph_rpc('get_graph_metrics', {'p_user_id': user_id})
+        if error:
+            return error
+        response = jsonify({'success': True, 'metrics': data})
+        response.headers['Cache-Control'] = f'private, max-age={GRAPH_METRICS_MAX_AGE}'
+        return response, 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.exception('Graph Metrics failed')
+        return jsonify({'error': str(e)}), 500
+
+# --- People search ---
+# search_users (user_search.sql) filters on indexed columns and ranks by connection proximity
+# in one RPC; the API only adds validation and opaque cursors.
 
+SEARCH_MIN_QUERY = 2
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+SEARCH_FILTERS = ('institution_id', 'batch_year', 'major', 'society')
+
+@app.route('/api/search/users', methods=['GET'])
+@authenticate_user
+def search_users():
+    """
+    People search. `q` matches names by prefix, substring or typo-tolerant similarity;
+    `institution_id`, `batch_year`, `major` and `society` filter exactly. Needs a `q` of at least
+    SEARCH_MIN_QUERY characters or one filter.
+    Results are ordered by proximity (1 = connected, 2 = friend of a connection,
+    3 = same institution, 4 = anyone else), then match score. Ghost-mode profiles are only
+    found by their connections. Paginate with `limit` (max SEARCH_MAX_PAGE_SIZE) and `next_cursor`.
+    """
+    try:
+        query = (request.args.get('q') or '').strip()
+        filters = {name: (request.args.get(name) or '').strip() or None for name in SEARCH_FILTERS}
+        if len(query) < SEARCH_MIN_QUERY and not any(filters.values()):
+            return jsonify({'error': f'Provide q (at least {SEARCH_MIN_QUERY} characters) or a filter'}), 400
+        if filters['batch_year'] is not None:
+            if not filters['batch_year'].isdigit():
+                return jsonify({'error': 'batch_year must be an integer'}), 400
+            filters['batch_year'] = int(filters['batch_year'])
+        limit = parse_limit(request.args.get('limit'), default=SEARCH_PAGE_SIZE, maximum=SEARCH_MAX_PAGE_SIZE)
+
+        params = {
+            'p_query': query or None, 'p_institution_id': filters['institution_id'],
+            'p_batch_year': filters['batch_year'], 'p_major': filters['major'], 'p_society': filters['society'],
+            'p_limit': limit + 1,
+        }
+        cursor = request.args.get('cursor')
+        if cursor:
+            position, after_id = decode_cursor(cursor)
+            if not (isinstance(position, list) and len(position) == 2):
+                raise ValueError('Invalid cursor')
+            proximity, score = position
+            params.update(p_after_proximity=proximity, p_after_score=score, p_after_id=_parse_user_id(after_id))
+
+        rows, error = _graph_rpc('search_users', params)
+        if error:
+            return error
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor([last['proximity'], last['score']], last['user_id'])
+        return jsonify({'success': True, 'users': rows, 'next_cursor': next_cursor}), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"Institution Graph Error: {str(e)}")
+        log.exception('User Search failed')
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
@@ -0,0 +1,120 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+# Structured logs: one JSON object per line on stdout, written off the request path.
+# - Callers only enqueue (QueueHandler); a QueueListener thread formats and writes.
+#   The queue is bounded: if stdout stalls, records are dropped and counted, never waited on.
+# - LOG_LEVEL (default INFO) is the threshold. DEBUG/INFO records are kept with probability
+#   LOG_SAMPLE_RATE (default 0.1); WARNING and above are always kept.
+# - Extra fields go through the standard `extra=` argument and become JSON keys.
+
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+_setup_lock = threading.Lock()
+_listener = None
+_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full."""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only resolve the message and traceback here; JSON formatting happens on the listener thread.
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+            record.exc_text = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup():
+    """
+    Installs the queue handler on the 'pledge' logger tree (idempotent).
+    Called by app.py once .env is loaded, since the settings come from the environment.
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return
+    with _setup_lock:
+        if _listener is not None:
+            return
+        q = queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', 10000)))
+        _handler = DroppingQueueHandler(q)
+        _handler.addFilter(SamplingFilter(float(os.environ.get('LOG_SAMPLE_RATE', 0.1))))
+
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JsonFormatter())
+
+        root = logging.getLogger('pledge')
+        root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+        root.addHandler(_handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(q, stream, respect_handler_level=False)
+        _listener.start()
+        atexit.register(_listener.stop)  # flush what is still queued
+
+
+def get_logger(name):
+    return logging.getLogger(f'pledge.{name}')
+
+
+def dropped_records():
+    return _handler.dropped if _handler is not None else 0
+
+
+def log_request(logger, summary, slow_ms=None):
+    """One line per request: ERROR for 5xx, WARNING when slower than LOG_SLOW_REQUEST_MS, INFO (sampled) otherwise."""
+    if summary is None:
+        return
+    slow_ms = float(os.environ.get('LOG_SLOW_REQUEST_MS', 1000)) if slow_ms is None else slow_ms
+    if summary['status'] >= 500:
+        level = logging.ERROR
+    elif summary['duration_ms'] >= slow_ms:
+        level = logging.WARNING
+    else:
+        level = logging.INFO
+    if logger.isEnabledFor(level):
+        logger.log(level, 'request', extra=summary)
@@ -0,0 +1,436 @@
+"""
+ASGI serving mode:  uvicorn asgi:app --workers <cores>
+
+The routes that spend most of their time waiting on PostgREST are served natively async:
+upstream calls go through one httpx.AsyncClient per worker (db.AsyncClientPool) and
+independent calls are awaited together, so a slow round-trip no longer pins a worker thread.
+Every other route is delegated to the Flask app unchanged, so both modes expose the same API
+and the same JSON bodies (responses are serialized with Flask's own JSON provider).
+"""
+import asyncio
+import contextlib
+import os
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from a2wsgi import WSGIMiddleware
+from postgrest import APIError
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+import app as flask_module
+import applog
+import events
+import metrics
+from app import (
+    IN_FILTER_CHUNK, PROFILE_COLUMNS, RPC_ERRORS, SYNC_CURSOR_SKEW,
+    _bootstrap_body, _chunks, _invalidate_verification, _notify_participants, _onboarding_payload, _parse_since,
+    _queue_receipt_recovery, _referral_connection, _related_user_ids, receipt_write_mode
+)
+from db import async_scoped_client, close_async_pool, scoped_client
+from middleware import cached_user, verify_token
+from utils import ratelimit
+from utils.redis_backend import get_redis
+
+flask_app = flask_module.app
+log = applog.get_logger('asgi')
+
+
+def json_response(body, status=200):
+    # Same serialization as flask.jsonify outside debug mode (sorted keys, compact, trailing newline).
+    content = f"{flask_app.json.dumps(body, separators=(',', ':'))}\n"
+    return Response(content, status_code=status, media_type='application/json')
+
+
+def authenticated(handler):
+    """Async twin of middleware.authenticate_user: same checks, same error bodies."""
+    @wraps(handler)
+    async def wrapper(request):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header:
+            return json_response({'error': 'Missing Authorization Header'}, 401)
+
+        started = time.perf_counter()
+        try:
+            if not os.environ.get("SUPABASE_URL") or not os.environ.get("SUPABASE_KEY"):
+                log.error('Missing Supabase credentials in .env')
+                return json_response({'error': 'Server misconfiguration: Missing Supabase credentials'}, 500)
+
+            parts = auth_header.split(" ")
+            if len(parts) != 2 or parts[0].lower() != "bearer":
+                log.info('Invalid Authorization header format')
+                return json_response({'error': 'Invalid Authorization Header format'}, 401)
+
+            token = parts[1]
+            # Cache hits stay on the loop; a miss may fetch JWKS or call Supabase Auth, so it runs in a thread.
+            user = cached_user(token) or await run_in_threadpool(verify_token, token)
+            metrics.record_auth(time.perf_counter() - started, 'ok' if user is not None else 'rejected')
+            if user is None:
+                return json_response({'error': 'Invalid or expired token'}, 401)
+
+            request.state.user = user
+            request.state.token = token
+
+        except Exception as e:
+            metrics.record_auth(time.perf_counter() - started, 'error')
+            log.exception('Authentication failed')
+            return json_response({'error': f'Authentication failed: {str(e)}'}, 401)
+
+        return await handler(request)
+    return wrapper
+
+
+def rate_limited(name):
+    """Async twin of middleware.rate_limited; goes below @authenticated."""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            user_id = request.state.user.id
+            # In-process buckets are a dict lookup; only the shared (Redis) ones block on I/O.
+            if get_redis() is None:
+                allowed, retry_after = ratelimit.check(name, user_id)
+            else:
+                allowed, retry_after = await run_in_threadpool(ratelimit.check, name, user_id)
+            if not allowed:
+                log.info('Rate limited', extra={'limiter': name, 'user_id': user_id, 'retry_after': retry_after})
+                response = json_response({'success': False, 'error': 'Too many requests. Please try again shortly.'}, 429)
+                response.headers['Retry-After'] = str(retry_after)
+                return response
+            return await handler(request)
+        return wrapper
+    return decorator
+
+
+def get_db(request):
+    return async_scoped_client(request.state.token)
+
+
+async def health(request):
+    return json_response({'status': 'ok', 'message': 'Pledge Backend is running'})
+
+
+@authenticated
+async def me(request):
+    user = request.state.user
+    return json_response({
+        'message': 'Authenticated successfully',
+        'user_id': user.id,
+        'email': user.email,
+        'aud': user.aud
+    })
+
+
+@authenticated
+async def onboarding(request):
+    try:
+        data = await request.json()
+        if not data:
+            return json_response({'error': 'Missing request body'}, 400)
+
+        user = request.state.user
+        payload = _onboarding_payload(data, user)
+        if payload is None:
+            return json_response({'error': 'Missing required fields'}, 400)
+
+        referrer_id = data.get('referrer_id')
+        client = get_db(request)
+
+        async def connect_referrer(conn_payload):
+            try:
+                await client.table('connections').insert(conn_payload).execute()
+                log.debug('Auto-connected referrer', extra={'referrer_id': referrer_id})
+            except Exception as e:
+                log.debug('Referrer auto-connect failed (likely exists)', extra={'referrer_id': referrer_id, 'error': str(e)})
+
+        # The profile upsert and the referral edge are independent writes.
+        conn_payload = _referral_connection(user.id, referrer_id)
+        calls = [client.table('public_profiles').upsert(payload).execute()]
+        if conn_payload:
+            calls.append(connect_referrer(conn_payload))
+        res, *_ = await asyncio.gather(*calls)
+
+        # The recovery job runs on the shared job pool (sync client), exactly as in the Flask app.
+        recovery = await run_in_threadpool(_queue_receipt_recovery, scoped_client(request.state.token))
+
+        return json_response({'success': True, 'data': res.data, 'receipt_recovery': recovery})
+
+    except Exception as e:
+        log.exception('Onboarding failed')
+        return json_response({'error': str(e)}, 500)
+
+
+@authenticated
+async def bootstrap(request):
+    try:
+        try:
+            since = _parse_since(request.query_params.get('since'))
+        except ValueError:
+            return json_response({'error': 'Invalid since cursor'}, 400)
+
+        client = get_db(request)
+        uid = request.state.user.id
+        email = (request.state.user.email or '').lower()
+        cursor = (datetime.now(timezone.utc) - SYNC_CURSOR_SKEW).isoformat()
+
+        async def rows(query):
+            return (await query.execute()).data or []
+
+        receipts_q = client.table('receipts').select('*').or_(
+            f"from_user_id.eq.{uid},to_user_id.eq.{uid},recipient_email.eq.{email}"
+        )
+        connections_q = client.table('connections').select('*').or_(f"low_id.eq.{uid},high_id.eq.{uid}")
+        if since:
+            receipts_q = receipts_q.gt('updated_at', since.isoformat())
+            connections_q = connections_q.gt('updated_at', since.isoformat())
+
+        async def tombstones():
+            if not since:
+                return []
+            return await rows(client.table('sync_tombstones').select('table_name, row_id')
+                              .contains('user_ids', [uid]).gt('deleted_at', since.isoformat()))
+
+        me, receipts, connections, unread, deleted = await asyncio.gather(
+            rows(client.table('public_profiles').select('*').eq('user_id', uid)),
+            rows(receipts_q.order('created_at', desc=True)),
+            rows(connections_q),
+            rows(client.rpc('get_unread_counts', {})),
+            tombstones()
+        )
+
+        chunks = await asyncio.gather(*(
+            rows(client.table('public_profiles').select(PROFILE_COLUMNS).in_('user_id', chunk))
+            for chunk in _chunks(_related_user_ids(uid, receipts, connections), IN_FILTER_CHUNK)
+        ))
+        profiles = {p['user_id']: p for chunk in chunks for p in chunk}
+
+        return json_response(_bootstrap_body(uid, cursor, since, me, receipts, connections, profiles, unread, deleted))
+
+    except Exception as e:
+        log.exception('Bootstrap failed')
+        return json_response({'error': str(e)}, 500)
+
+
+async def _create_receipt_legacy(client, from_user_id, recipient_email, tags, description, is_public):
+    status, to_user_id, connection_id = 'AWAITING_SIGNUP', None, None
+
+    recipient = (await client.table('public_profiles').select('user_id').eq('email', recipient_email.strip().lower()).execute()).data
+    if recipient:
+        to_user_id = recipient[0]['user_id']
+        if to_user_id == from_user_id:
+            return None, json_response({'success': False, 'error': 'Cannot send receipt to yourself'}, 400)
+
+        low_id, high_id = sorted([from_user_id, to_user_id])
+        conn = (await client.table('connections').select('id, accepted').eq('low_id', low_id).eq('high_id', high_id).execute()).data
+        if conn and conn[0]['accepted']:
+            status, connection_id = 'AWAITING_ACCEPTANCE', conn[0]['id']
+        else:
+            status = 'AWAITING_CONNECTION'
+
+    res = await client.table('receipts').insert({
+        'from_user_id': from_user_id,
+        'to_user_id': to_user_id,
+        'recipient_email': recipient_email,
+        'tags': tags,
+        'description': description,
+        'is_public': is_public,
+        'status': status,
+        'connection_id': connection_id,
+        'created_at': datetime.now(timezone.utc).isoformat()
+    }).execute()
+    if not res.data:
+        raise Exception("Failed to insert receipt")
+    return res.data[0], None
+
+
+@authenticated
+@rate_limited('receipts_create')
+async def create_receipt(request):
+    try:
+        data = await request.json()
+        recipient_email = data.get('email')
+        tags = data.get('tags', [])
+        description = data.get('description', '')
+        is_public = data.get('is_public', False)
+
+        if not recipient_email:
+            return json_response({'success': False, 'error': 'Recipient email is required'}, 400)
+
+        client = get_db(request)
+
+        if receipt_write_mode() == 'legacy':
+            receipt, error = await _create_receipt_legacy(
+                client, request.state.user.id, recipient_email, tags, description, is_public)
+            if error:
+                return error
+        else:
+            try:
+                receipt = (await client.rpc('create_receipt_rpc', {
+                    'p_recipient_email': recipient_email,
+                    'p_tags': tags,
+                    'p_description': description,
+                    'p_is_public': is_public
+                }).execute()).data
+            except APIError as e:
+                if e.code == '22023':
+                    return json_response({'success': False, 'error': e.message}, 400)
+                raise
+        _notify_participants(request.state.user.id, receipt)
+
+        return json_response({'success': True, 'receipt': receipt})
+
+    except Exception as e:
+        log.exception('Create Receipt failed')
+        return json_response({'success': False, 'error': str(e)}, 500)
+
+
+async def _claim_receipt_legacy(client, user, receipt_id):
+    found = (await client.table('receipts').select('*').eq('id', receipt_id).execute()).data
+    if not found:
+        return None, json_response({'success': False, 'error': 'Receipt not found'}, 404)
+    receipt = found[0]
+
+    is_assigned = receipt['to_user_id'] == user.id
+    is_email_match = (receipt['to_user_id'] is None) and (receipt['recipient_email'].lower() == user.email.lower())
+    if not (is_assigned or is_email_match):
+        return None, json_response({'success': False, 'error': 'Not authorized to claim this receipt'}, 403)
+
+    link = None
+    if is_email_match or not receipt.get('connection_id'):
+        low_id, high_id = sorted([user.id, receipt['from_user_id']])
+        conn = (await client.table('connections').upsert({
+            'low_id': low_id,
+            'high_id': high_id,
+            'requested_by': user.id,
+            'accepted': True,
+            'accepted_at': datetime.now(timezone.utc).isoformat()
+        }).execute()).data
+        if conn:
+            link = client.table('receipts').update({
+                'to_user_id': user.id,
+                'connection_id': conn[0]['id']
+            }).eq('id', receipt_id).execute()
+
+    if not is_email_match and receipt['status'] in ['ACCEPTED', 'REJECTED']:
+        if link:
+            await link
+        return None, json_response({'success': False, 'error': f"Receipt already {receipt['status']}"}, 400)
+
+    # The link and the status flip touch different columns of the same row; send them together.
+    accept = client.table('receipts').update({'status': 'ACCEPTED'}).eq('id', receipt_id).execute()
+    *_, res = await asyncio.gather(*([link, accept] if link else [accept]))
+    return (res.data[0] if res.data else None), None
+
+
+@authenticated
+@rate_limited('receipts_claim')
+async def claim_receipt(request):
+    try:
+        data = await request.json()
+        receipt_id = data.get('receipt_id')
+        if not receipt_id:
+            return json_response({'success': False, 'error': 'Receipt ID required'}, 400)
+
+        client = get_db(request)
+
+        if receipt_write_mode() == 'legacy':
+            receipt, error = await _claim_receipt_legacy(client, request.state.user, receipt_id)
+            if error:
+                return error
+        else:
+            try:
+                receipt = (await client.rpc('claim_receipt_rpc', {'p_receipt_id': receipt_id}).execute()).data
+            except APIError as e:
+                if e.code in RPC_ERRORS:
+                    return json_response({'success': False, 'error': e.message}, RPC_ERRORS[e.code])
+                raise
+        _invalidate_verification(receipt_id)
+        _notify_participants(request.state.user.id, receipt)
+
+        return json_response({'success': True, 'receipt': receipt})
+
+    except Exception as e:
+        log.exception('Claim Receipt failed')
+        return json_response({'success': False, 'error': str(e)}, 500)
+
+
+@authenticated
+async def event_stream(request):
+    """
+    Server-sent events for the caller's changes (events.py). Starts with `ready`; each change
+    is `event: change` with the change_events row as data. A final `reset` or `reconnect`
+    event tells the client why the stream ended; it re-syncs via /api/bootstrap?since= and
+    opens a new stream either way.
+    """
+    try:
+        sub = await events.get_hub().subscribe(request.state.user.id, request.state.token)
+    except events.FeedAuthError:
+        return json_response({'error': 'Invalid or expired token'}, 401)
+    except Exception as e:
+        log.exception('Event stream failed')
+        return json_response({'error': str(e)}, 500)
+
+    return StreamingResponse(sub.stream(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # stop nginx-style proxies from buffering the stream
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    yield
+    await close_async_pool()
+
+
+native = Starlette(
+    routes=[
+        Route('/api/health', health, methods=['GET']),
+        Route('/api/me', me, methods=['GET']),
+        Route('/api/onboarding', onboarding, methods=['POST']),
+        Route('/api/bootstrap', bootstrap, methods=['GET']),
+        Route('/api/receipts/create', create_receipt, methods=['POST']),
+        Route('/api/receipts/claim', claim_receipt, methods=['POST']),
+        Route('/api/events', event_stream, methods=['GET']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
+NATIVE_PATHS = {route.path for route in native.routes}
+# Long-lived responses: their duration is the stream's lifetime, not a slow request.
+STREAMING_PATHS = {'/api/events'}
+
+# Flask runs on a2wsgi's thread pool; flask-cors already handles CORS for these routes.
+fallback = WSGIMiddleware(flask_app, workers=int(os.environ.get('ASGI_WSGI_THREADS', 10)))
+
+
+async def instrumented(scope, receive, send):
+    """Native routes get the same request metrics and request log line as the Flask hooks."""
+    metrics.begin_request()
+    status = 500
+
+    async def send_wrapper(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        await send(message)
+
+    try:
+        await native(scope, receive, send_wrapper)
+    finally:
+        slow_ms = float('inf') if scope['path'] in STREAMING_PATHS else None
+        applog.log_request(log, metrics.finish_request(scope['path'], scope['method'], status), slow_ms)
+
+
+async def app(scope, receive, send):
+    if scope['type'] != 'http':
+        # Lifespan events go to Starlette so the async pool is closed on shutdown.
+        await native(scope, receive, send)
+    elif scope['path'] not in NATIVE_PATHS:
+        # Flask's before/after_request hooks do the instrumentation here.
+        await fallback(scope, receive, send)
+    else:
+        await instrumented(scope, receive, send)
@@ -0,0 +1,254 @@
+"""
+Load test: the Flask (WSGI) app vs the ASGI app (asgi.py), one server process each,
+against the in-memory Supabase stub.
+
+    cd backend && python -m bench.bench_asgi --latency-ms 20 --concurrency 64 --duration 10
+
+Each mode runs as a single-worker subprocess:
+- wsgi: Flask on a thread-pooled WSGI server (--threads, like gunicorn's gthread worker)
+- asgi: uvicorn asgi:app
+The stub runs in its own process too. Requests/sec per core is completed requests divided
+by the server process's CPU seconds (user + system, from /proc), so it is not skewed by the
+load generator or the stub. Upstream calls per request come from the server's /api/stats.
+
+Scenarios: bootstrap (6 upstream calls, 5 of them independent), onboarding (profile upsert +
+referral insert), claim (fetch, connection upsert, link + status update). Claims stop early
+when the seeded receipts run out; raise --receipts for long runs.
+"""
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import httpx
+
+from bench.common import make_token, percentile, point_env_at, print_table
+from bench.stub_rpcs import install
+from bench.stub_supabase import StubSupabase
+
+SCENARIOS = ('bootstrap', 'onboarding', 'claim')
+
+
+def serve(mode, port, threads):
+    """Runs one server in this process (invoked as a subprocess by main)."""
+    if mode == 'asgi':
+        import uvicorn
+        uvicorn.run('asgi:app', host='127.0.0.1', port=port, workers=1, log_level='warning', access_log=False)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    from socketserver import ThreadingMixIn
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+    from app import app
+
+    class OneShotHandler(WSGIRequestHandler):
+        # Close after each response; an idle keep-alive connection would otherwise pin a pool thread.
+        protocol_version = 'HTTP/1.0'
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    class PooledWSGIServer(ThreadingMixIn, BaseWSGIServer):
+        multithread = True
+        executor = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.executor.submit(self.process_request_thread, request, client_address)
+
+    PooledWSGIServer('127.0.0.1', port, app, handler=OneShotHandler).serve_forever()
+
+
+def cpu_seconds(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    # utime and stime are fields 14 and 15 of stat(5); fields[0] here is field 3.
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'nothing listening on port {port}')
+
+
+def start_stub(stub):
+    """Serves an already-seeded stub from a forked process; returns (process, url)."""
+    port = free_port()
+
+    def run():
+        stub.start(port)
+        threading.Event().wait()
+
+    proc = multiprocessing.get_context('fork').Process(target=run, daemon=True)
+    proc.start()
+    wait_until_up(port)
+    return proc, f'http://127.0.0.1:{port}'
+
+
+def upstream_requests(url, token):
+    pool = httpx.get(f'{url}/api/stats', headers={'Authorization': f'Bearer {token}'}).json()['db_pool']
+    return pool.get('upstream_requests', 0) + pool.get('async', {}).get('upstream_requests', 0)
+
+
+def seed(stub, users, receipts_per_user):
+    ids = [str(uuid.uuid4()) for _ in range(users)]
+    for i, uid in enumerate(ids):
+        stub.insert('public_profiles', {'user_id': uid, 'email': f'user{i}@lums.edu.pk',
+                                        'first_name': f'User{i}', 'last_name': 'Bench', 'institution': 'LUMS'})
+    for i in range(1, users, 2):
+        low, high = sorted([ids[0], ids[i]])
+        stub.insert('connections', {'low_id': low, 'high_id': high, 'requested_by': ids[0], 'accepted': True})
+    claims = []
+    for i in range(1, users):
+        for _ in range(receipts_per_user):
+            r = stub.insert('receipts', {'from_user_id': ids[0], 'to_user_id': ids[i], 'recipient_email': f'user{i}@lums.edu.pk',
+                                         'tags': ['bench'], 'description': 'benchmark receipt', 'status': 'AWAITING_CONNECTION'})
+            claims.append((i, r['id']))
+    return ids, claims
+
+
+def build_requests(scenario, ids, claims):
+    """Returns a zero-argument factory yielding (method, path, user index, json body) or None when exhausted."""
+    users = itertools.cycle(range(1, len(ids)))
+    if scenario == 'bootstrap':
+        return lambda: ('GET', '/api/bootstrap', next(users), None)
+    if scenario == 'onboarding':
+        def onboarding():
+            i = next(users)
+            return ('POST', '/api/onboarding', i, {'first_name': f'User{i}', 'last_name': 'Bench',
+                                                   'institution_id': 'LUMS', 'referrer_id': ids[0]})
+        return onboarding
+    pending = iter(claims)
+    def claim():
+        item = next(pending, None)
+        return item and ('POST', '/api/receipts/claim', item[0], {'receipt_id': item[1]})
+    return claim
+
+
+async def drive(url, tokens, next_request, concurrency, duration):
+    samples, errors = [], 0
+    deadline = time.perf_counter() + duration
+    # One connection per in-flight request, reused for the whole run.
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                req = next_request()
+                if req is None:
+                    return
+                method, path, user, body = req
+                t0 = time.perf_counter()
+                try:
+                    res = await client.request(method, path, json=body, headers={'Authorization': f'Bearer {tokens[user]}'})
+                    ok = res.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    samples.append(time.perf_counter() - t0)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return samples, errors, time.perf_counter() - start
+
+
+def run_mode(mode, scenario, ids, claims, tokens, args):
+    port = free_port()
+    env = dict(os.environ, RECOVERY_MODE='background')
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'bench.bench_asgi', '--serve', mode, '--port', str(port), '--threads', str(args.threads)],
+        env=env
+    )
+    url = f'http://127.0.0.1:{port}'
+    try:
+        wait_until_up(port)
+        # Warm-up: token cache, connection pools, imports.
+        asyncio.run(drive(url, tokens, build_requests('bootstrap', ids, claims), 4, 1))
+        upstream_before = upstream_requests(url, tokens[0])
+        cpu_before = cpu_seconds(proc.pid)
+        samples, errors, elapsed = asyncio.run(
+            drive(url, tokens, build_requests(scenario, ids, claims), args.concurrency, args.duration))
+        cpu = cpu_seconds(proc.pid) - cpu_before
+        # Background recovery jobs may still be in flight; they are counted if they already started.
+        upstream = upstream_requests(url, tokens[0]) - upstream_before
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    n = len(samples)
+    return {
+        'scenario': scenario,
+        'mode': mode,
+        'ok': n,
+        'errors': errors,
+        'rps': round(n / elapsed, 1),
+        'cpu_s': round(cpu, 2),
+        'rps/core': round(n / cpu, 1) if cpu else '-',
+        'p50_ms': round(percentile(samples, 50) * 1000, 1),
+        'p99_ms': round(percentile(samples, 99) * 1000, 1),
+        'upstream/req': round(upstream / max(n + errors, 1), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serve', choices=('wsgi', 'asgi'), help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all')
+    parser.add_argument('--modes', default='wsgi,asgi')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--receipts', type=int, default=10, help='pending receipts per user, consumed by the claim scenario')
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.threads)
+        return
+
+    scenarios = SCENARIOS if args.scenario == 'all' else (args.scenario,)
+
+    rows = []
+    for scenario in scenarios:
+        for mode in args.modes.split(','):
+            # Fresh stub per run so both modes claim the same receipts.
+            stub = install(StubSupabase(latency=args.latency_ms / 1000))
+            ids, claims = seed(stub, args.users, args.receipts)
+            tokens = [make_token(uid, f'user{i}@lums.edu.pk') for i, uid in enumerate(ids)]
+            stub_proc, stub_url = start_stub(stub)
+            point_env_at(SimpleNamespace(url=stub_url))
+            try:
+                rows.append(run_mode(mode, scenario, ids, claims, tokens, args))
+            finally:
+                stub_proc.terminate()
+
+    print(f"latency={args.latency_ms}ms concurrency={args.concurrency} wsgi_threads={args.threads} duration={args.duration}s")
+    print_table(rows, ['scenario', 'mode', 'ok', 'errors', 'rps', 'cpu_s', 'rps/core', 'p50_ms', 'p99_ms', 'upstream/req'])
+
+
+if __name__ == '__main__':
+    main()
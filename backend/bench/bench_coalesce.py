@@ -0,0 +1,110 @@
+"""
+Hot reads under a burst, with and without request coalescing, and the write rate limiter.
+
+    cd backend && python -m bench.bench_coalesce --burst 200 --latency-ms 50
+
+Coalescing: --burst threads hit GET /api/leaderboard at the same instant right after the
+board's caches expire (the moment a viral link costs the most), once with SINGLE_FLIGHT=off
+and once on, for the all-time and a windowed board. Reported: upstream calls for the whole
+burst and latency percentiles.
+
+Rate limiting: one user fires --writes POST /api/receipts/create as fast as it can for
+--write-seconds; the report shows how many got through vs the bucket's capacity + refill.
+"""
+import argparse
+import os
+import threading
+import time
+
+from bench.common import make_token, percentile, point_env_at, print_table
+from bench.seed import generate
+from bench.stub_rpcs import install
+from bench.stub_supabase import StubSupabase
+
+
+def burst(app_module, stub, data, path, size):
+    """`size` identical concurrent requests released together; returns (latencies, upstream calls, statuses)."""
+    app_module._leaderboard_cache.clear()
+    app_module._leaderboard_version.clear()
+    gate = threading.Barrier(size)
+    samples, statuses, lock = [], {}, threading.Lock()
+
+    def one(i):
+        client = app_module.app.test_client()
+        headers = {'Authorization': f'Bearer {data.token(data.users[i % len(data.users)])}'}
+        gate.wait()
+        t0 = time.perf_counter()
+        res = client.get(path, headers=headers)
+        with lock:
+            samples.append(time.perf_counter() - t0)
+            statuses[res.status_code] = statuses.get(res.status_code, 0) + 1
+
+    threads = [threading.Thread(target=one, args=(i,)) for i in range(size)]
+    stub.reset_counters()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, stub.requests, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--burst', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--writes', type=int, default=200)
+    parser.add_argument('--write-seconds', type=float, default=5.0)
+    parser.add_argument('--limit', default='30/60', help='RATE_LIMIT_RECEIPTS_CREATE for the write test')
+    args = parser.parse_args()
+
+    stub = install(StubSupabase(latency=args.latency_ms / 1000)).start()
+    point_env_at(stub)
+    data = generate(stub, users=args.users)
+    os.environ['INSTITUTIONS_FILE'] = data.institutions_file
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['RATE_LIMITS'] = 'on'
+    os.environ['RATE_LIMIT_RECEIPTS_CREATE'] = args.limit
+
+    import app
+    rows = []
+    for path in ('/api/leaderboard', '/api/leaderboard?window=week'):
+        for mode in ('off', 'on'):
+            os.environ['SINGLE_FLIGHT'] = mode
+            samples, upstream, statuses = burst(app, stub, data, path, args.burst)
+            rows.append({'request': path, 'single_flight': mode, 'burst': args.burst, 'upstream_calls': upstream,
+                         'p50_ms': round(percentile(samples, 50) * 1000, 1),
+                         'p99_ms': round(percentile(samples, 99) * 1000, 1),
+                         'statuses': ' '.join(f'{k}x{v}' for k, v in sorted(statuses.items()))})
+    print(f"latency={args.latency_ms}ms users={args.users}")
+    print_table(rows, ['request', 'single_flight', 'burst', 'upstream_calls', 'p50_ms', 'p99_ms', 'statuses'])
+
+    # Rate limiting: one user, as fast as possible.
+    client = app.app.test_client()
+    sender, recipient = data.users[0], data.users[1]
+    headers = {'Authorization': f"Bearer {make_token(sender['id'], sender['email'])}"}
+    counts, retry_after = {}, set()
+    started = time.perf_counter()
+    interval = args.write_seconds / args.writes
+    for i in range(args.writes):
+        res = client.post('/api/receipts/create', headers=headers,
+                          json={'email': recipient['email'], 'tags': ['bench'], 'description': 'rate limit bench'})
+        counts[res.status_code] = counts.get(res.status_code, 0) + 1
+        if res.status_code == 429:
+            retry_after.add(res.headers.get('Retry-After'))
+        time.sleep(max(0.0, started + (i + 1) * interval - time.perf_counter()))
+    elapsed = time.perf_counter() - started
+    capacity, _, period = args.limit.partition('/')
+    expected = float(capacity) + float(capacity) / float(period) * elapsed
+    print(f"\nrate limit {args.limit} (capacity/seconds): {args.writes} creates in {elapsed:.1f}s from one user")
+    print_table([{'allowed': counts.get(200, 0), 'limited_429': counts.get(429, 0),
+                  'other': sum(v for k, v in counts.items() if k not in (200, 429)),
+                  'bucket_allows_at_most': int(expected), 'retry_after_s': ','.join(sorted(retry_after))}],
+                ['allowed', 'limited_429', 'other', 'bucket_allows_at_most', 'retry_after_s'])
+
+    stub.stop()
+    os.unlink(data.institutions_file)
+
+
+if __name__ == '__main__':
+    main()
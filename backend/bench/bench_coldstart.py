@@ -0,0 +1,104 @@
+"""
+Cold-start benchmark: what a fresh serverless instance of app.py pays before it can answer.
+
+    cd backend && python -m bench.bench_coldstart --runs 10 --connect-ms 50
+
+Every run is a new interpreter (LAZY_INIT=1 and LAZY_INIT=0, see db.lazy_init_enabled)
+that imports app and serves, in order:
+- GET /api/health              (no auth, no upstream)
+- GET /api/me                  (first authenticated response: token verification only)
+- GET /api/receipts            (first authenticated response that reaches PostgREST)
+- GET /api/receipts again      (warm: clients are reused, nothing is constructed)
+Columns are milliseconds since the child started importing app, except `warm_ms`
+(latency of the repeat request) and `process_ms` (spawn to exit, as seen by the parent).
+--connect-ms is the simulated TCP/TLS handshake to Supabase, paid on the first upstream call.
+"""
+import json
+import os
+import sys
+import time
+
+
+def child():
+    # Only the stdlib is imported before `app`, so import_ms is the app's own import cost.
+    t0 = time.perf_counter()
+    import app
+    marks = {'import_ms': time.perf_counter() - t0}
+
+    client = app.app.test_client()
+    headers = {'Authorization': f"Bearer {os.environ['BENCH_TOKEN']}"}
+    steps = (
+        ('health_ms', '/api/health', {}),
+        ('me_ms', '/api/me', headers),
+        ('receipts_ms', '/api/receipts', headers),
+    )
+    for name, path, h in steps:
+        res = client.get(path, headers=h)
+        if res.status_code != 200:
+            raise SystemExit(f'{path} returned {res.status_code}: {res.data[:200]!r}')
+        marks[name] = time.perf_counter() - t0
+
+    t1 = time.perf_counter()
+    client.get('/api/receipts', headers=headers)
+    marks['warm_ms'] = time.perf_counter() - t1
+
+    print(json.dumps({k: round(v * 1000, 1) for k, v in marks.items()}))
+
+
+def main():
+    import argparse
+    import statistics
+    import subprocess
+    import uuid
+
+    from bench.common import make_token, point_env_at, print_table
+    from bench.stub_supabase import StubSupabase
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--modes', default='lazy,eager')
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--connect-ms', type=float, default=50.0)
+    args = parser.parse_args()
+
+    stub = StubSupabase(latency=args.latency_ms / 1000, connect_latency=args.connect_ms / 1000).start()
+    point_env_at(stub)
+    uid = str(uuid.uuid4())
+    stub.insert('public_profiles', {'user_id': uid, 'email': 'bench@lums.edu.pk',
+                                    'first_name': 'Bench', 'last_name': 'User', 'institution': 'LUMS'})
+    for _ in range(20):
+        stub.insert('receipts', {'from_user_id': uid, 'recipient_email': 'peer@lums.edu.pk', 'tags': ['bench'],
+                                 'description': 'benchmark receipt', 'status': 'AWAITING_SIGNUP'})
+    env = dict(os.environ, BENCH_TOKEN=make_token(uid, 'bench@lums.edu.pk'), RECOVERY_MODE='background',
+               LOG_LEVEL='WARNING')  # keep request log lines off the child's stdout
+    env.pop('VERCEL', None)
+
+    rows = []
+    columns = ['import_ms', 'health_ms', 'me_ms', 'receipts_ms', 'warm_ms', 'process_ms']
+    try:
+        for mode in args.modes.split(','):
+            env['LAZY_INIT'] = '1' if mode == 'lazy' else '0'
+            runs = []
+            for _ in range(args.runs):
+                t0 = time.perf_counter()
+                out = subprocess.run([sys.executable, '-m', 'bench.bench_coldstart', '--child'],
+                                     env=env, capture_output=True, text=True, check=True).stdout
+                marks = json.loads(out.strip().splitlines()[-1])
+                marks['process_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+                runs.append(marks)
+            row = {'mode': mode}
+            row.update({c: round(statistics.median(r[c] for r in runs), 1) for c in columns})
+            rows.append(row)
+    finally:
+        stub.stop()
+
+    print(f"runs={args.runs} (medians) latency={args.latency_ms}ms connect={args.connect_ms}ms")
+    print_table(rows, ['mode'] + columns)
+
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        child()
+    else:
+        main()
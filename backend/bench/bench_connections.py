@@ -0,0 +1,130 @@
+"""
+Connection requests: the email lookup on its own, then POST /api/connections/request end to end.
+
+    cd backend && python -m bench.bench_connections --profiles 100000 --latency-ms 5
+
+Lookup: --profiles rows in an in-memory SQLite public_profiles, queried by email the old way
+(case-insensitive LIKE, the ILIKE the legacy paths sent, over mixed-case stored emails) and
+the new way (emails stored lower(trim()), lower(email) = ? served by an expression index),
+as in connection_request_rpc.sql. SQLite stands in for Postgres so this runs anywhere; the
+plans are the same shape (full scan vs index search) and are printed next to the timings.
+
+Endpoint: --requests connection requests from one user to seeded profiles, half of them new
+and half repeats of a pending request, with CONNECTION_WRITE_MODE=legacy (profile lookup,
+edge check, insert) vs rpc (request_connection_rpc). --latency-ms is the simulated per-call
+upstream round-trip time.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import uuid
+
+from bench.common import make_token, point_env_at, print_table, summarize, timed
+from bench.stub_rpcs import install
+from bench.stub_supabase import StubSupabase
+
+
+def _mixed_case(rng, email):
+    return ''.join(c.upper() if rng.random() < 0.3 else c for c in email)
+
+
+def lookup_rows(profiles, lookups, seed=7):
+    rng = random.Random(seed)
+    emails = [f'{rng.choice([21, 22, 23, 24, 25])}10{i:06d}@lums.edu.pk' for i in range(profiles)]
+    stored = [_mixed_case(rng, e) for e in emails]
+    # What users type: any case, sometimes with stray whitespace.
+    probes = [_mixed_case(rng, emails[rng.randrange(profiles)]) + rng.choice(['', ' ']) for _ in range(lookups)]
+
+    before = sqlite3.connect(':memory:')
+    before.execute('CREATE TABLE public_profiles (user_id TEXT PRIMARY KEY, email TEXT NOT NULL)')
+    before.executemany('INSERT INTO public_profiles VALUES (?, ?)', ((str(uuid.UUID(int=i)), e) for i, e in enumerate(stored)))
+
+    after = sqlite3.connect(':memory:')
+    after.execute('CREATE TABLE public_profiles (user_id TEXT PRIMARY KEY, email TEXT NOT NULL)')
+    after.executemany('INSERT INTO public_profiles VALUES (?, lower(trim(?)))', ((str(uuid.UUID(int=i)), e) for i, e in enumerate(stored)))
+    after.execute('CREATE INDEX idx_public_profiles_email_lower ON public_profiles (lower(email))')
+    after.execute('ANALYZE')
+
+    cases = (
+        ('ilike scan', before, 'SELECT user_id FROM public_profiles WHERE email LIKE ?', lambda p: p.strip()),
+        ('lower(email) index', after, 'SELECT user_id FROM public_profiles WHERE lower(email) = lower(trim(?)) LIMIT 1', lambda p: p),
+    )
+    rows = []
+    for name, db, sql, arg in cases:
+        plan = ' / '.join(r[-1] for r in db.execute('EXPLAIN QUERY PLAN ' + sql, (arg(probes[0]),)))
+        probe_iter = iter(probes)
+        found = 0
+
+        def one():
+            nonlocal found
+            found += db.execute(sql, (arg(next(probe_iter)),)).fetchone() is not None
+
+        samples, elapsed = timed(one, lookups)
+        rows.append({'lookup': name, **summarize(samples, elapsed), 'found': f'{found}/{lookups}', 'plan': plan})
+    return rows
+
+
+def seed(stub, users):
+    ids = [str(uuid.uuid4()) for _ in range(users)]
+    for i, uid in enumerate(ids):
+        # Stored normalized, as the normalize_profile_email trigger leaves them.
+        stub.insert('public_profiles', {'user_id': uid, 'email': f'user{i}@lums.edu.pk',
+                                        'first_name': f'User{i}', 'last_name': 'Bench', 'institution': 'LUMS'})
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profiles', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f'email lookup, {args.profiles} profiles (sqlite)')
+    print_table(lookup_rows(args.profiles, args.lookups),
+                ['lookup', 'n', 'mean_ms', 'p50_ms', 'p99_ms', 'rps', 'found', 'plan'])
+
+    stub = install(StubSupabase(latency=args.latency_ms / 1000)).start()
+    point_env_at(stub)
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    ids = seed(stub, args.users)
+
+    import app
+    client = app.app.test_client()
+    headers = {'Authorization': f"Bearer {make_token(ids[0], 'user0@lums.edu.pk')}"}
+    rng = random.Random(7)
+
+    rows = []
+    for mode in ('legacy', 'rpc'):
+        os.environ['CONNECTION_WRITE_MODE'] = mode
+        stub.tables['connections'].clear()
+        targets = iter(rng.sample(range(1, args.users), min(args.users - 1, args.requests)))
+        sent, statuses = [], {}
+
+        def request():
+            # Mixed-case input: matched either way now that stored emails are normalized.
+            if sent and rng.random() < 0.5:
+                n = rng.choice(sent)
+            else:
+                n = next(targets, None) or rng.choice(sent)
+                sent.append(n)
+            email = _mixed_case(rng, f'User{n}@LUMS.edu.pk')
+            res = client.post('/api/connections/request', headers=headers, json={'email': email})
+            statuses[res.status_code] = statuses.get(res.status_code, 0) + 1
+
+        stub.reset_counters()
+        samples, elapsed = timed(request, args.requests)
+        rows.append({'mode': mode, **summarize(samples, elapsed),
+                     'upstream_calls/req': round(stub.requests / args.requests, 2),
+                     'statuses': ' '.join(f'{k}x{v}' for k, v in sorted(statuses.items()))})
+
+    print(f'\nPOST /api/connections/request, latency={args.latency_ms}ms users={args.users}')
+    print_table(rows, ['mode', 'n', 'mean_ms', 'p50_ms', 'p99_ms', 'rps', 'upstream_calls/req', 'statuses'])
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
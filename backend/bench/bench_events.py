@@ -0,0 +1,216 @@
+"""
+Change feed (GET /api/events): delivery latency and upstream cost vs. refetching on change.
+
+    cd backend && python -m bench.bench_events --users 50 --streams-per-user 2 --rate 200 --duration 10
+    cd backend && python -m bench.bench_events --source stub
+
+Serves asgi:app with uvicorn in this process and holds SSE streams open with httpx.
+Event sources:
+- fake (default): FakeChangeSource, an in-memory change queue. --late of the events are
+  committed out of order (their id is taken, then they become visible 0.2-2s later, after
+  higher ids), which exercises the settle window.
+- stub: the real PostgrestChangeSource reading the Supabase stub, where events come from
+  message inserts recorded by the stub's change_events trigger emulation.
+Every event must reach every stream of its user exactly once. The baseline column is what
+the same changes cost when each affected tab re-runs /api/bootstrap (6 upstream calls).
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+import httpx
+
+from bench.bench_asgi import free_port, wait_until_up
+from bench.common import make_token, percentile, point_env_at, print_table
+from bench.stub_rpcs import install
+from bench.stub_supabase import StubSupabase
+
+BOOTSTRAP_UPSTREAM_CALLS = 6
+
+
+class FakeChangeSource:
+    """In-memory change_events: ids are allocated first and become visible on commit, like a sequence."""
+
+    def __init__(self):
+        self.rows = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.reads = 0
+
+    def allocate(self):
+        with self.lock:
+            return next(self.ids)
+
+    def commit(self, user_id, event_id):
+        row = {'id': event_id, 'kind': 'message', 'op': 'INSERT', 'row_id': str(uuid.uuid4()),
+               'data': {'visible_at': time.perf_counter()}, 'created_at': None}
+        with self.lock:
+            rows = self.rows.setdefault(user_id, [])
+            rows.insert(bisect.bisect([r['id'] for r in rows], event_id), row)
+
+    async def head(self, user_id, token):
+        self.reads += 1
+        with self.lock:
+            rows = self.rows.get(user_id) or []
+            return rows[-1]['id'] if rows else 0
+
+    async def fetch(self, user_id, token, after, limit):
+        self.reads += 1
+        with self.lock:
+            rows = self.rows.get(user_id) or []
+            start = bisect.bisect([r['id'] for r in rows], after)
+            return rows[start:start + limit]
+
+
+def serve_in_thread(port):
+    import uvicorn
+    import asgi
+    config = uvicorn.Config(asgi.app, host='127.0.0.1', port=port, log_level='warning', access_log=False)
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    wait_until_up(port)
+    return server
+
+
+async def listen(url, token, stream_key, received, ready, stop):
+    """One SSE client: records (stream_key, event id) -> latency for every change it sees."""
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        async with client.stream('GET', '/api/events', headers={'Authorization': f'Bearer {token}'}) as res:
+            event = None
+            async for line in res.aiter_lines():
+                if stop.is_set():
+                    return
+                if line.startswith('event: '):
+                    event = line[7:]
+                elif line.startswith('data: '):
+                    data = json.loads(line[6:])
+                    if event == 'ready':
+                        ready.release()
+                    elif event == 'change':
+                        visible_at = data['data'].get('visible_at') or float(data['data'].get('content', 0))
+                        key = (stream_key, data['id'])
+                        received[key] = received.get(key, 0) + 1
+                        received.setdefault('_latency', []).append(time.perf_counter() - visible_at)
+                    elif event in ('reset', 'reconnect'):
+                        received.setdefault('_ended', []).append(event)
+                        return
+
+
+def produce(args, source, stub, users, stop, committed):
+    """Commits --rate events/s across users; with the fake source a share of them commit late."""
+    rng = random.Random(args.seed)
+    late = []
+    interval = 1 / args.rate
+    next_at = time.perf_counter()
+    while not stop.is_set():
+        user = rng.choice(users)
+        if source is not None:
+            event_id = source.allocate()
+            if rng.random() < args.late:
+                late.append((time.perf_counter() + rng.uniform(0.2, 2.0), user, event_id))
+            else:
+                source.commit(user, event_id)
+                committed.append((user, event_id))
+        else:
+            sender = rng.choice([u for u in users if u != user])
+            with stub.lock:
+                stub.insert('messages', {'sender_id': sender, 'recipient_id': user, 'content': repr(time.perf_counter())})
+        now = time.perf_counter()
+        for item in [item for item in late if item[0] <= now]:
+            late.remove(item)
+            source.commit(item[1], item[2])
+            committed.append((item[1], item[2]))
+        next_at += interval
+        time.sleep(max(0.0, next_at - time.perf_counter()))
+    for _, user, event_id in late:
+        source.commit(user, event_id)
+        committed.append((user, event_id))
+
+
+async def run(args):
+    stub = install(StubSupabase()).start()
+    point_env_at(stub)
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['EVENTS_POLL_INTERVAL'] = str(args.poll_interval)
+
+    import events
+    source = FakeChangeSource() if args.source == 'fake' else None
+    if source is not None:
+        events.use_source(source)
+
+    users = [str(uuid.uuid4()) for _ in range(args.users)]
+    tokens = {u: make_token(u, f'{i}@lums.edu.pk') for i, u in enumerate(users)}
+    port = free_port()
+    serve_in_thread(port)
+    url = f'http://127.0.0.1:{port}'
+
+    received, stop = {}, asyncio.Event()
+    ready = asyncio.Semaphore(0)
+    streams = [(u, s) for u in users for s in range(args.streams_per_user)]
+    tasks = [asyncio.create_task(listen(url, tokens[u], (u, s), received, ready, stop)) for u, s in streams]
+    for _ in streams:
+        await ready.acquire()
+
+    reads_before = source.reads if source else stub.calls.get('GET /rest/v1/change_events', 0)
+    producer_stop, committed = threading.Event(), []
+    producer = threading.Thread(target=produce, args=(args, source, stub, users, producer_stop, committed))
+    started = time.perf_counter()
+    producer.start()
+    await asyncio.sleep(args.duration)
+    producer_stop.set()
+    producer.join()
+    elapsed = time.perf_counter() - started
+    # Let the last (late) commits settle and drain.
+    await asyncio.sleep(args.poll_interval * 2 + 0.5)
+    reads = (source.reads if source else stub.calls.get('GET /rest/v1/change_events', 0)) - reads_before
+
+    if source is None:
+        committed = [(e['user_id'], e['id']) for e in stub.tables['change_events']
+                     if e['kind'] == 'message' and e['user_id'] in tokens]
+        # Both sender and recipient get an event per message.
+    expected = {((u, s), event_id) for u, event_id in committed for s in range(args.streams_per_user)}
+    got = {k for k in received if isinstance(k, tuple)}
+    duplicates = sum(n - 1 for k, n in received.items() if isinstance(k, tuple) and n > 1)
+    stop.set()
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    stub.stop()
+
+    latency = received.get('_latency', [])
+    print(f"source={args.source} users={args.users} streams={len(streams)} events={len(committed)} "
+          f"({len(committed) / elapsed:.0f}/s) late={args.late if source else 0} poll_interval={args.poll_interval}s")
+    print_table([{
+        'delivered': len(got & expected), 'expected': len(expected), 'missing': len(expected - got),
+        'duplicates': duplicates, 'ended_early': len(received.get('_ended', [])),
+        'p50_ms': round(percentile(latency, 50) * 1000, 1), 'p99_ms': round(percentile(latency, 99) * 1000, 1),
+        'feed_reads/s': round(reads / elapsed, 1),
+        'refetch_baseline_calls/s': round(len(expected) * BOOTSTRAP_UPSTREAM_CALLS / elapsed, 1),
+    }], ['delivered', 'expected', 'missing', 'duplicates', 'ended_early', 'p50_ms', 'p99_ms',
+         'feed_reads/s', 'refetch_baseline_calls/s'])
+    if expected - got or duplicates:
+        raise SystemExit('change feed lost or duplicated events')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', choices=('fake', 'stub'), default='fake')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--streams-per-user', type=int, default=2)
+    parser.add_argument('--rate', type=float, default=200, help='changes committed per second')
+    parser.add_argument('--late', type=float, default=0.05, help='share of fake events committed out of order')
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=7)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+GET /api/export on accounts of growing size: does memory stay flat while the export streams?
+
+    cd backend && python -m bench.bench_export --sizes 1000 10000 50000 --latency-ms 2
+
+For each size, one user gets that many receipts (half sent, half received, spread over --peers
+connections) and an export is streamed for each dataset / format / encoding. Reported per run:
+time to first chunk, total time, rows, bytes on the wire, upstream calls, and the peak Python
+memory allocated while streaming (tracemalloc around the export only). The seeded stub is
+served from a forked process, so its tables and per-request work are not in that figure.
+NDJSON runs also check the closing summary line against the rows received.
+"""
+import argparse
+import json
+import os
+import random
+import time
+import tracemalloc
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from types import SimpleNamespace
+
+from bench.bench_asgi import start_stub
+from bench.common import make_token, point_env_at, print_table
+from bench.stub_rpcs import install
+from bench.stub_supabase import StubSupabase
+
+RUNS = (
+    ('receipts', 'ndjson', False),
+    ('receipts', 'ndjson', True),
+    ('receipts', 'csv', False),
+    ('all', 'ndjson', True),
+)
+
+
+def seed(stub, size, peers, rng):
+    """One exporting user with `size` receipts and `peers` connections; returns their token."""
+    ids = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(peers + 1)]
+    me, others = ids[0], ids[1:]
+    for i, uid in enumerate(ids):
+        stub.insert('public_profiles', {'user_id': uid, 'email': f'peer{i}.{size}@lums.edu.pk', 'first_name': f'Peer{i}',
+                                        'last_name': 'Bench', 'institution': 'LUMS'})
+    for other in others:
+        low, high = sorted([me, other])
+        stub.insert('connections', {'low_id': low, 'high_id': high, 'requested_by': me, 'accepted': True})
+    now = datetime.now(timezone.utc)
+    for i in range(size):
+        other = rng.choice(others)
+        sender, recipient = (me, other) if i % 2 else (other, me)
+        stub.insert('receipts', {
+            'from_user_id': sender, 'to_user_id': recipient, 'recipient_email': 'peer@lums.edu.pk',
+            'tags': rng.sample(['mentorship', 'notes', 'tutoring', 'rides'], 2),
+            'description': 'Helped me prepare for the midterm and shared notes.', 'is_public': True,
+            'status': 'ACCEPTED', 'created_at': (now - timedelta(seconds=i)).isoformat(),
+        })
+    return make_token(me, f'peer0.{size}@lums.edu.pk')
+
+
+def export(client, token, dataset, fmt, compressed):
+    """Streams one export. Returns (first chunk s, total s, wire bytes, lines, last line, peak bytes)."""
+    headers = {'Authorization': f'Bearer {token}'}
+    if compressed:
+        headers['Accept-Encoding'] = 'gzip'
+    decoder = zlib.decompressobj(31) if compressed else None
+    first, wire, lines, tail = None, 0, 0, b''
+    tracemalloc.start()
+    started = time.perf_counter()
+    res = client.get('/api/export', headers=headers, query_string={'dataset': dataset, 'format': fmt}, buffered=False)
+    assert res.status_code == 200, res.get_data()
+    for chunk in res.response:
+        if first is None:
+            first = time.perf_counter() - started
+        wire += len(chunk)
+        data = decoder.decompress(chunk) if decoder else chunk
+        lines += data.count(b'\n')
+        tail = (tail + data)[-4096:]
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    res.close()
+    return first, elapsed, wire, lines, tail.rstrip(b'\n').rsplit(b'\n', 1)[-1], peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--peers', type=int, default=300)
+    parser.add_argument('--latency-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    stub = install(StubSupabase(latency=args.latency_ms / 1000))
+    tokens = {size: seed(stub, size, args.peers, random.Random(size)) for size in args.sizes}
+    stub_proc, stub_url = start_stub(stub)
+    point_env_at(SimpleNamespace(url=stub_url))
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import app
+    from db import get_pool_stats
+    client = app.app.test_client()
+    rows = []
+    for size in args.sizes:
+        for dataset, fmt, compressed in RUNS:
+            calls = get_pool_stats().get('upstream_requests', 0)
+            first, elapsed, wire, lines, last, peak = export(client, tokens[size], dataset, fmt, compressed)
+            exported = lines - 1  # NDJSON summary line / CSV header
+            if fmt == 'ndjson':
+                summary = json.loads(last)
+                assert summary == {'type': 'summary', 'rows': exported}, summary
+            rows.append({'receipts': size, 'dataset': dataset, 'format': fmt + (' +gzip' if compressed else ''),
+                         'first_chunk_ms': round(first * 1000, 1), 'seconds': round(elapsed, 2), 'rows': exported,
+                         'wire_kb': round(wire / 1024), 'upstream_calls': get_pool_stats()['upstream_requests'] - calls,
+                         'peak_kb': round(peak / 1024)})
+
+    print(f'GET /api/export, latency={args.latency_ms}ms page={app.EXPORT_PAGE_SIZE}')
+    print_table(rows, ['receipts', 'dataset', 'format', 'first_chunk_ms', 'seconds', 'rows', 'wire_kb',
+                       'upstream_calls', 'peak_kb'])
+    stub_proc.terminate()
+
+
+if __name__ == '__main__':
+    main()
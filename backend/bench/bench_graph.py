@@ -0,0 +1,103 @@
+"""
+The graph metrics engine (graph_engine.py) and GET /api/graph/ego on a seeded dataset.
+
+    cd backend && python -m bench.bench_graph --users 2000 --latency-ms 2
+
+Engine: a full pass (load every edge, PageRank from uniform, write every row), then
+--changes edge updates (receipt weights moved, a few connections deleted) followed by an
+incremental pass in the same engine, and a cold full pass over the same data for comparison.
+Reported per pass: wall time, PageRank iterations, upstream calls, edges changed, rows written.
+
+Ego: --requests GET /api/graph/ego per depth from random users; latency percentiles,
+upstream calls per request, nodes/edges and payload size.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+from bench.common import make_token, percentile, point_env_at, print_table
+from bench.seed import generate
+from bench.stub_rpcs import install
+from bench.stub_supabase import StubSupabase
+
+
+def engine_pass(engine, client, stub, label):
+    stub.reset_counters()
+    engine.sync(client)
+    return {'pass': label, **engine.last_pass, 'upstream_calls': stub.requests}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--connections-per-user', type=int, default=8)
+    parser.add_argument('--changes', type=int, default=25)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--latency-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    stub = install(StubSupabase(latency=args.latency_ms / 1000)).start()
+    point_env_at(stub)
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['SUPABASE_SERVICE_ROLE_KEY'] = make_token('service', 'service@bench')
+    data = generate(stub, users=args.users, connections_per_user=args.connections_per_user,
+                    receipts_per_connection=2, pending_per_user=0, newcomers=0)
+    os.environ['INSTITUTIONS_FILE'] = data.institutions_file
+
+    from db import service_client
+    from graph_engine import GraphEngine
+    client = service_client()
+    rng = random.Random(11)
+
+    engine = GraphEngine()
+    rows = [engine_pass(engine, client, stub, 'full (first run)')]
+    rows.append(engine_pass(engine, client, stub, 'incremental, no changes'))
+
+    accepted = [c for c in stub.tables['connections'] if c['accepted']]
+    with stub.lock:
+        for conn in rng.sample(accepted, args.changes):
+            stub.update('connections', conn, {'receipt_weight': conn['receipt_weight'] + rng.randint(1, 3)})
+        for conn in rng.sample(accepted, max(1, args.changes // 5)):
+            if conn in stub.tables['connections']:
+                stub.delete('connections', conn)
+    rows.append(engine_pass(engine, client, stub, f'incremental, {args.changes} edges moved'))
+    rows.append(engine_pass(GraphEngine(), client, stub, 'full (cold, same data)'))
+
+    scores = [m['trust_score'] for m in stub.tables['user_graph_metrics'] if m['degree']]
+    print(f"graph: users={args.users} accepted edges={len(engine.edges)} latency={args.latency_ms}ms "
+          f"trust_score mean={statistics.fmean(scores):.3f} max={max(scores):.3f}")
+    print_table(rows, ['pass', 'seconds', 'compute_seconds', 'iterations', 'edges_changed', 'rows_written',
+                       'upstream_calls'])
+
+    import app
+    test_client = app.app.test_client()
+    ego_rows = []
+    for depth in (1, 2, 3):
+        samples, sizes, nodes, edges = [], [], [], []
+        stub.reset_counters()
+        for _ in range(args.requests):
+            person = rng.choice(data.users)
+            t0 = time.perf_counter()
+            res = test_client.get(f'/api/graph/ego?depth={depth}', headers={'Authorization': f'Bearer {data.token(person)}'})
+            samples.append(time.perf_counter() - t0)
+            assert res.status_code == 200, res.get_json()
+            body = res.get_json()
+            sizes.append(len(res.data))
+            nodes.append(len(body['nodes']))
+            edges.append(len(body['edges']))
+        ego_rows.append({'depth': depth, 'n': args.requests, 'p50_ms': round(percentile(samples, 50) * 1000, 1),
+                         'p99_ms': round(percentile(samples, 99) * 1000, 1),
+                         'upstream_calls/req': round(stub.requests / args.requests, 2),
+                         'nodes_avg': round(statistics.fmean(nodes), 1), 'edges_avg': round(statistics.fmean(edges), 1),
+                         'kb_avg': round(statistics.fmean(sizes) / 1024, 1)})
+    print('\nGET /api/graph/ego')
+    print_table(ego_rows, ['depth', 'n', 'p50_ms', 'p99_ms', 'upstream_calls/req', 'nodes_avg', 'edges_avg', 'kb_avg'])
+
+    stub.stop()
+    os.unlink(data.institutions_file)
+
+
+if __name__ == '__main__':
+    main()
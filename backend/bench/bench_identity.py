@@ -0,0 +1,155 @@
+"""
+Micro-benchmark: institution resolution with a large registry.
+
+    cd backend && python -m bench.bench_identity --institutions 150 --emails 50000
+
+Generates a synthetic registry (some institutions with several domains, some accepting
+subdomains with per-campus codes) and a stream of emails drawn from it plus non-student
+domains, then compares:
+- if-chain: a linear scan over every institution/domain with endswith() and re.match()
+  on pattern strings, i.e. what growing the original hardcoded check would turn into
+- trie: utils.student_identity.InstitutionResolver with memoization disabled
+- trie+memo: the resolver as deployed (domain lookups memoized)
+- bulk csv: classify_csv over the same emails, end to end (CSV parse + write included)
+All variants must agree on every email.
+"""
+import argparse
+import csv
+import io
+import random
+import re
+import time
+
+from bench.common import print_table
+from utils.student_identity import InstitutionResolver, REJECTION, classify_csv
+
+NON_STUDENT = ['gmail.com', 'yahoo.com', 'outlook.com', 'hotmail.com', 'example.org', 'company.com.pk']
+
+
+def make_registry(n, rng):
+    registry = []
+    for i in range(n):
+        inst_id = f'UNI{i:03d}'
+        entry = {
+            'id': inst_id,
+            'domains': [f'uni{i:03d}.edu.pk'] + ([f'uni{i:03d}.pk'] if i % 4 == 0 else []),
+            'roll_patterns': [r'^(?P<year>\d{2})\d{6}$', r'^(?P<campus>[a-z])(?P<year>\d{2})(?P<roll>\d{4})$'],
+            'batch_year': {'group': 'year', 'base': 2000, 'offset': 4 if i % 2 else 0},
+            'default_campus': f'{inst_id}-MAIN',
+        }
+        if i % 3 == 0:
+            entry['include_subdomains'] = True
+            entry['campus_codes'] = {c: f'{inst_id}-{c.upper()}' for c in ('lhr', 'khi', 'isb', 'l', 'k', 'i')}
+        registry.append(entry)
+    return registry
+
+
+def make_emails(registry, count, rng):
+    emails = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.1:
+            emails.append(f'someone{rng.randint(0, 999)}@{rng.choice(NON_STUDENT)}')
+            continue
+        entry = rng.choice(registry)
+        domain = rng.choice(entry['domains'])
+        if entry.get('include_subdomains') and roll < 0.4:
+            domain = f"{rng.choice(['lhr', 'khi', 'isb'])}.{domain}"
+        if roll < 0.7:
+            handle = f'{rng.randint(18, 26)}{rng.randint(100000, 999999)}'
+        else:
+            handle = f"{rng.choice('lki')}{rng.randint(18, 26)}{rng.randint(1000, 9999)}"
+        emails.append(f'{handle}@{domain}')
+    return emails
+
+
+def if_chain(registry):
+    """Linear reference implementation with the same semantics as InstitutionResolver."""
+    def resolve(email):
+        handle, _, domain = email.lower().strip().rpartition('@')
+        best = None
+        for entry in registry:
+            for d in entry['domains']:
+                if domain == d or (entry.get('include_subdomains') and domain.endswith('.' + d)):
+                    if best is None or len(d) > len(best[1]):
+                        best = (entry, d)
+        if best is None:
+            return None, REJECTION
+        entry, d = best
+        subdomain = domain[:-len(d) - 1] if domain != d else ''
+        groups = {}
+        for pattern in entry['roll_patterns']:
+            match = re.match(pattern, handle)
+            if match:
+                groups = match.groupdict()
+                break
+        rule = entry.get('batch_year') or {}
+        year = groups.get(rule.get('group', 'year'))
+        batch_year = None
+        if year and year.isdigit():
+            batch_year = int(year) + (rule.get('base', 2000) if len(year) <= 2 else 0) + rule.get('offset', 0)
+        codes = entry.get('campus_codes') or {}
+        return {
+            'institution_id': entry['id'],
+            'batch_year': batch_year,
+            'roll_number': groups.get('roll') or handle,
+            'campus_code': codes.get((groups.get('campus') or subdomain).lower(), entry.get('default_campus')),
+        }, None
+    return resolve
+
+
+def run(fn, emails):
+    start = time.perf_counter()
+    results = [fn(e) for e in emails]
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--institutions', type=int, default=150)
+    parser.add_argument('--emails', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    registry = make_registry(args.institutions, rng)
+    emails = make_emails(registry, args.emails, rng)
+
+    started = time.perf_counter()
+    InstitutionResolver(registry)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    variants = [
+        ('if-chain', if_chain(registry)),
+        ('trie', InstitutionResolver(registry, memo_size=0).classify),
+        ('trie+memo', InstitutionResolver(registry).classify),
+    ]
+    rows, reference = [], None
+    for name, fn in variants:
+        results, elapsed = run(fn, emails)
+        if reference is None:
+            reference = results
+        elif results != reference:
+            raise SystemExit(f'{name} disagrees with the if-chain')
+        rows.append({'variant': name, 'emails': len(emails), 'total_ms': round(elapsed * 1000, 1),
+                     'us/email': round(elapsed / len(emails) * 1e6, 2), 'emails/s': round(len(emails) / elapsed)})
+
+    source = io.StringIO()
+    writer = csv.writer(source)
+    writer.writerow(['email'])
+    writer.writerows([e] for e in emails)
+    source.seek(0)
+    started = time.perf_counter()
+    count, matched = classify_csv(source, io.StringIO(), resolver=InstitutionResolver(registry))
+    elapsed = time.perf_counter() - started
+    rows.append({'variant': 'bulk csv', 'emails': count, 'total_ms': round(elapsed * 1000, 1),
+                 'us/email': round(elapsed / count * 1e6, 2), 'emails/s': round(count / elapsed)})
+
+    matched_ref = sum(1 for identity, _ in reference if identity)
+    print(f'institutions={args.institutions} emails={args.emails} matched={matched_ref} '
+          f'(bulk matched={matched}) resolver build={build_ms:.1f}ms')
+    print_table(rows, ['variant', 'emails', 'total_ms', 'us/email', 'emails/s'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Compares a Supabase client built per request (the old get_db) against the
+pooled ScopedClient from db.py, using the local stub PostgREST server.
+
+    cd backend && python -m bench.bench_pool --requests 200 --connect-ms 20
+
+--connect-ms simulates the TCP/TLS handshake cost paid on every new connection.
+"""
+import argparse
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from supabase import create_client
+
+import db
+from bench.common import make_token, point_env_at, print_table, summarize, timed
+from bench.stub_supabase import StubSupabase
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--connect-ms', type=float, default=20.0)
+    parser.add_argument('--latency-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    stub = StubSupabase(latency=args.latency_ms / 1000, connect_latency=args.connect_ms / 1000).start()
+    point_env_at(stub)
+    uid = str(uuid.uuid4())
+    token = make_token(uid, 'bench@lums.edu.pk')
+    for _ in range(20):
+        peer = str(uuid.uuid4())
+        low, high = sorted([uid, peer])
+        stub.insert('connections', {'low_id': low, 'high_id': high, 'requested_by': uid, 'accepted': True})
+
+    def per_request_client():
+        client = create_client(stub.url, os.environ['SUPABASE_KEY'])
+        client.postgrest.auth(token)
+        client.table('connections').select('*').or_(f"low_id.eq.{uid},high_id.eq.{uid}").execute()
+
+    def pooled_client():
+        db.scoped_client(token).table('connections').select('*').or_(f"low_id.eq.{uid},high_id.eq.{uid}").execute()
+
+    rows = []
+    for name, fn in (('create_client per request', per_request_client), ('pooled scoped client', pooled_client)):
+        fn()  # warm up imports / first connection
+        stub.reset_counters()
+        samples, elapsed = timed(fn, args.requests)
+        rows.append({'mode': name, 'threads': 1, **summarize(samples, elapsed), 'connections': stub.connections_opened})
+
+        stub.reset_counters()
+        with ThreadPoolExecutor(args.threads) as pool:
+            results = list(pool.map(lambda _: timed(fn, args.requests // args.threads), range(args.threads)))
+        samples = [s for chunk, _ in results for s in chunk]
+        elapsed = max(e for _, e in results)
+        rows.append({'mode': name, 'threads': args.threads, **summarize(samples, elapsed),
+                     'connections': stub.connections_opened})
+
+    print_table(rows, ['mode', 'threads', 'n', 'mean_ms', 'p50_ms', 'p99_ms', 'rps', 'connections'])
+    print('pool stats:', db.get_pool_stats())
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+p50/p99 of POST /api/receipts/create and /api/receipts/claim for the multi-call paths vs the single RPCs.
+
+    cd backend && python -m bench.bench_receipts --requests 300 --latency-ms 5
+
+--latency-ms is the simulated per-call upstream round-trip time.
+"""
+import argparse
+import os
+import random
+import uuid
+
+from bench.common import make_token, point_env_at, print_table, summarize, timed
+from bench.stub_rpcs import install
+from bench.stub_supabase import StubSupabase
+
+
+def seed(stub, users):
+    ids = [str(uuid.uuid4()) for _ in range(users)]
+    for i, uid in enumerate(ids):
+        stub.insert('public_profiles', {'user_id': uid, 'email': f'user{i}@lums.edu.pk',
+                                        'first_name': f'User{i}', 'last_name': 'Bench', 'institution': 'LUMS'})
+    for i in range(1, users):
+        if i % 2:
+            low, high = sorted([ids[0], ids[i]])
+            stub.insert('connections', {'low_id': low, 'high_id': high, 'requested_by': ids[0], 'accepted': True})
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    stub = install(StubSupabase(latency=args.latency_ms / 1000)).start()
+    point_env_at(stub)
+    ids = seed(stub, args.users)
+
+    import app
+    client = app.app.test_client()
+    headers = {'Authorization': f"Bearer {make_token(ids[0], 'user0@lums.edu.pk')}"}
+    rng = random.Random(7)
+
+    def create():
+        # Mix of connected, unconnected and not-yet-signed-up recipients.
+        n = rng.randrange(1, args.users + args.users // 4)
+        email = f'user{n}@lums.edu.pk' if n < args.users else f'newcomer{n}@lums.edu.pk'
+        res = client.post('/api/receipts/create', headers=headers,
+                          json={'email': email, 'tags': ['bench'], 'description': 'benchmark receipt'})
+        assert res.status_code == 200, res.get_json()
+
+    # Pending receipts addressed to user0, half of them not yet bound to a connection.
+    pending = iter([
+        stub.insert('receipts', {'from_user_id': ids[i % (args.users - 1) + 1], 'to_user_id': ids[0],
+                                 'recipient_email': 'user0@lums.edu.pk', 'tags': ['bench'],
+                                 'status': 'AWAITING_ACCEPTANCE' if i % 2 else 'AWAITING_CONNECTION'})['id']
+        for i in range(2 * (args.requests + 1))
+    ])
+
+    def claim():
+        res = client.post('/api/receipts/claim', headers=headers, json={'receipt_id': next(pending)})
+        assert res.status_code == 200, res.get_json()
+
+    rows = []
+    for op, fn in (('create', create), ('claim', claim)):
+        for mode in ('legacy', 'rpc'):
+            os.environ['RECEIPT_WRITE_MODE'] = mode
+            fn()
+            stub.reset_counters()
+            samples, elapsed = timed(fn, args.requests)
+            rows.append({'op': op, 'mode': mode, **summarize(samples, elapsed),
+                         'upstream_calls/req': round(stub.requests / args.requests, 2)})
+
+    print_table(rows, ['op', 'mode', 'n', 'mean_ms', 'p50_ms', 'p99_ms', 'rps', 'upstream_calls/req'])
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+People search: the indexed query on its own over a large profile set, then GET /api/search/users end to end.
+
+    cd backend && python -m bench.bench_search --profiles 200000 --latency-ms 5
+
+Index: --profiles synthetic profiles (and ~4 accepted connections each) in an in-memory SQLite,
+searched with the same query shape as search_users (user_search.sql): name match and filters,
+ranked by proximity (connected, friend of a connection, same institution, anyone else), top 21.
+Run once without the profile indexes (LIKE '%q%' and filters over a full scan) and once with
+them. SQLite stands in for Postgres so this runs anywhere: an FTS5 trigram table plays the
+pg_trgm GIN index, a (society, profile) table plays the jsonb_path_ops GIN index on societies,
+and the btree indexes are the same. Name scores are prefix 1.0 / substring 0.5, as SQLite has
+no word_similarity.
+
+Endpoint: --requests searches from random seeded users (5% of profiles in ghost mode), first
+pages and follow-up pages via next_cursor, against the stub. Reports latency, upstream calls
+per request, and checks that no ghost-mode stranger is returned and pages do not overlap.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import uuid
+
+from bench.common import make_token, point_env_at, print_table, summarize, timed
+from bench.seed import MAJORS, SOCIETIES, generate
+from bench.stub_rpcs import install
+from bench.stub_supabase import StubSupabase
+
+SYLLABLES = ['al', 'an', 'ar', 'ba', 'da', 'fa', 'ha', 'im', 'ja', 'ka', 'la', 'ma', 'na', 'ra', 'sa',
+             'ta', 'ur', 'za', 'ee', 'ish', 'oon', 'eer', 'qa', 'ya', 'bi', 'mi', 'ri', 'su', 'zo', 'he']
+PAGE = 20
+
+RANKED = """
+WITH friends AS MATERIALIZED (
+    SELECT high_id AS id FROM connections WHERE low_id = :me
+    UNION SELECT low_id FROM connections WHERE high_id = :me
+),
+second_hop AS MATERIALIZED (
+    SELECT c.high_id AS id FROM friends f CROSS JOIN connections c ON c.low_id = f.id
+    UNION SELECT c.low_id FROM friends f CROSS JOIN connections c ON c.high_id = f.id
+)
+SELECT user_id, proximity, score FROM (
+    SELECT p.user_id, p.ghost_mode,
+           CASE WHEN p.user_id IN (SELECT id FROM friends) THEN 1
+                WHEN p.user_id IN (SELECT id FROM second_hop) THEN 2
+                WHEN p.institution_id = :my_institution THEN 3 ELSE 4 END AS proximity,
+           CASE WHEN :q IS NULL THEN 0 WHEN p.search_name LIKE :q || '%' THEN 1.0 ELSE 0.5 END AS score
+    FROM profiles p
+    WHERE p.user_id <> :me AND {where}
+)
+WHERE NOT ghost_mode OR proximity = 1
+ORDER BY proximity, score DESC, user_id
+LIMIT {limit}
+"""
+
+
+def _name(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def build(profiles, seed):
+    rng = random.Random(seed)
+    institutions = [f'INST{i:02d}' for i in range(20)]
+    first_names = [_name(rng) for _ in range(3000)]
+    last_names = [_name(rng) for _ in range(5000)]
+    people = []
+    for i in range(profiles):
+        people.append((str(uuid.UUID(int=rng.getrandbits(128), version=4)), rng.choice(first_names), rng.choice(last_names),
+                       rng.choice(institutions), rng.choice(range(2021, 2026)), rng.choice(MAJORS),
+                       rng.sample(SOCIETIES, rng.randint(0, 3)), rng.random() < 0.05))
+    edges = set()
+    for _ in range(profiles * 2):
+        a, b = sorted((rng.randrange(profiles), rng.randrange(profiles)))
+        if a != b:
+            edges.add((people[a][0], people[b][0]) if people[a][0] < people[b][0] else (people[b][0], people[a][0]))
+    return people, sorted(edges)
+
+
+def load(people, edges, indexed):
+    db = sqlite3.connect(':memory:')
+    db.execute("""CREATE TABLE profiles (user_id TEXT PRIMARY KEY, first_name TEXT, last_name TEXT, search_name TEXT,
+                  institution_id TEXT, batch_year INTEGER, major TEXT, societies TEXT, ghost_mode INTEGER)""")
+    db.executemany('INSERT INTO profiles VALUES (?, ?, ?, lower(? || \' \' || ?), ?, ?, ?, ?, ?)',
+                   ((u, f, l, f, l, inst, year, major, json.dumps(soc), ghost)
+                    for u, f, l, inst, year, major, soc, ghost in people))
+    # Connections are indexed either way (their primary key and the reverse lookup already exist).
+    db.execute('CREATE TABLE connections (low_id TEXT, high_id TEXT, PRIMARY KEY (low_id, high_id))')
+    db.executemany('INSERT INTO connections VALUES (?, ?)', edges)
+    db.execute('CREATE INDEX idx_connections_high ON connections (high_id)')
+    if indexed:
+        db.execute("CREATE VIRTUAL TABLE profile_names USING fts5(search_name, content='profiles', tokenize='trigram')")
+        db.execute("INSERT INTO profile_names(profile_names) VALUES ('rebuild')")
+        db.execute('CREATE INDEX idx_profiles_institution_batch ON profiles (institution_id, batch_year)')
+        db.execute('CREATE INDEX idx_profiles_major_lower ON profiles (lower(major))')
+        db.execute('CREATE TABLE profile_societies (society TEXT, profile_rowid INTEGER, PRIMARY KEY (society, profile_rowid))')
+        db.execute('INSERT INTO profile_societies SELECT j.value, p.rowid FROM profiles p, json_each(p.societies) j')
+    db.execute('ANALYZE')
+    return db
+
+
+def where_clause(search, indexed):
+    parts = []
+    if search.get('q'):
+        parts.append('p.rowid IN (SELECT rowid FROM profile_names WHERE search_name LIKE :q_like)' if indexed
+                     else 'p.search_name LIKE :q_like')
+    if search.get('institution_id'):
+        parts.append('p.institution_id = :institution_id')
+    if search.get('batch_year'):
+        parts.append('p.batch_year = :batch_year')
+    if search.get('major'):
+        parts.append('lower(p.major) = lower(:major)')
+    if search.get('society'):
+        parts.append('p.rowid IN (SELECT profile_rowid FROM profile_societies WHERE society = :society)' if indexed
+                     else 'EXISTS (SELECT 1 FROM json_each(p.societies) WHERE value = :society)')
+    return ' AND '.join(parts)
+
+
+def searches(people, count, seed):
+    rng = random.Random(seed)
+    kinds = {
+        'name substring': lambda p: {'q': p[2].lower()[1:4]},
+        'name prefix': lambda p: {'q': f'{p[1]} {p[2][:2]}'.lower()},
+        'name + institution': lambda p: {'q': p[1].lower()[:3], 'institution_id': p[3]},
+        'institution + batch': lambda p: {'institution_id': p[3], 'batch_year': p[4]},
+        'major + society': lambda p: {'major': p[5], 'society': rng.choice(SOCIETIES)},
+    }
+    return {kind: [(rng.choice(people), make(rng.choice(people))) for _ in range(count)] for kind, make in kinds.items()}
+
+
+def index_rows(profiles, count, seed=7):
+    people, edges = build(profiles, seed)
+    workload = searches(people, count, seed)
+    rows = []
+    for indexed in (False, True):
+        db = load(people, edges, indexed)
+        for kind, cases in workload.items():
+            it = iter(cases)
+            returned = 0
+
+            def one():
+                nonlocal returned
+                me, search = next(it)
+                q = search.get('q')
+                params = {'me': me[0], 'my_institution': me[3], 'q': q, 'q_like': f'%{q}%' if q else None,
+                          'institution_id': search.get('institution_id'), 'batch_year': search.get('batch_year'),
+                          'major': search.get('major'), 'society': search.get('society')}
+                returned += len(db.execute(RANKED.format(where=where_clause(search, indexed), limit=PAGE + 1), params).fetchall())
+
+            samples, elapsed = timed(one, len(cases))
+            rows.append({'indexes': 'yes' if indexed else 'no', 'search': kind, **summarize(samples, elapsed),
+                         'rows/page': round(returned / len(cases), 1)})
+        db.close()
+    return rows, len(edges)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profiles', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--users', type=int, default=3000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    rows, edges = index_rows(args.profiles, args.queries)
+    print(f'search query, {args.profiles} profiles, {edges} connections (sqlite)')
+    print_table(rows, ['indexes', 'search', 'n', 'mean_ms', 'p50_ms', 'p99_ms', 'rps', 'rows/page'])
+
+    stub = install(StubSupabase(latency=args.latency_ms / 1000)).start()
+    point_env_at(stub)
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    data = generate(stub, users=args.users, connections_per_user=6, receipts_per_connection=0,
+                    pending_per_user=0, newcomers=0, ghost_share=0.05)
+    os.environ['INSTITUTIONS_FILE'] = data.institutions_file
+    profiles = {p['user_id']: p for p in stub.tables['public_profiles']}
+    connected = {(c['low_id'], c['high_id']) for c in stub.tables['connections'] if c['accepted']}
+
+    import app
+    client = app.app.test_client()
+    rng = random.Random(7)
+    kinds = {
+        'name': lambda p: {'q': rng.choice([p['first_name'], p['last_name']])[:3].lower()},
+        'name + batch': lambda p: {'q': p['last_name'][:4], 'batch_year': p['batch_year']},
+        'institution + society': lambda p: {'institution_id': p['institution_id'], 'society': rng.choice(SOCIETIES)},
+    }
+    rows, leaks, overlaps = [], 0, 0
+    for kind, make in kinds.items():
+        for page in ('first page', 'next page'):
+            stub.reset_counters()
+            requests = 0
+
+            def one():
+                nonlocal requests, leaks, overlaps
+                me = rng.choice(data.users)
+                headers = {'Authorization': f'Bearer {data.token(me)}'}
+                params = make(profiles[rng.choice(data.users)['id']])
+                res = client.get('/api/search/users', headers=headers, query_string=params)
+                assert res.status_code == 200, res.get_json()
+                body = res.get_json()
+                requests += 1
+                seen = {u['user_id'] for u in body['users']}
+                if page == 'next page' and body['next_cursor']:
+                    res = client.get('/api/search/users', headers=headers,
+                                     query_string={**params, 'cursor': body['next_cursor']})
+                    assert res.status_code == 200, res.get_json()
+                    body = res.get_json()
+                    requests += 1
+                    overlaps += len(seen & {u['user_id'] for u in body['users']})
+                for u in body['users']:
+                    if profiles[u['user_id']]['ghost_mode'] and tuple(sorted((me['id'], u['user_id']))) not in connected:
+                        leaks += 1
+
+            samples, elapsed = timed(one, args.requests)
+            rows.append({'search': kind, 'pages': page, **summarize(samples, elapsed),
+                         'upstream_calls/req': round(stub.requests / requests, 2)})
+
+    print(f'\nGET /api/search/users, latency={args.latency_ms}ms users={args.users}')
+    print_table(rows, ['search', 'pages', 'n', 'mean_ms', 'p50_ms', 'p99_ms', 'rps', 'upstream_calls/req'])
+    print(f'ghost-mode strangers returned: {leaks}; results repeated across pages: {overlaps}')
+    stub.stop()
+    os.unlink(data.institutions_file)
+
+
+if __name__ == '__main__':
+    main()
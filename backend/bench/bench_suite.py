@@ -0,0 +1,245 @@
+"""
+Benchmark suite: throughput, latency percentiles and upstream calls per endpoint for the
+main user flows, against the in-memory Supabase stub seeded with synthetic data (bench/seed.py).
+
+    cd backend && python -m bench.bench_suite
+    cd backend && python -m bench.bench_suite --users 2000 --requests 500 --concurrency 16 --json after.json
+    cd backend && python -m bench.bench_suite --baseline before.json   # exits 1 on regressions
+
+Scenarios (--scenario, default all):
+- onboarding: GET /api/auth/verify-student then POST /api/onboarding for not-yet-onboarded emails
+  (receipt recovery runs inline, so its RPC is counted)
+- create: POST /api/receipts/create to existing users and to not-yet-signed-up emails
+- claim: POST /api/receipts/claim on seeded pending receipts (stops when they run out)
+- bootstrap: GET /api/bootstrap
+- leaderboard: GET /api/leaderboard over every window, globally and per institution
+- graph: GET /api/institutions/graph with and without pruning and gzip
+Requests run in this process through Flask's test client on --concurrency threads, so the
+numbers cover the app and the upstream round-trips (--latency-ms each) but not HTTP parsing.
+The stub is seeded here and then served from a forked process, so its table scans do not
+compete with the app for the GIL.
+Upstream calls come from the backend's own metrics: upstream/req per endpoint
+(pledge_request_upstream_calls), and the upstream/step column breaks one scenario step down
+by table or RPC (pledge_upstream_duration_seconds). Both are deterministic for a given seed,
+which is what --baseline gates on.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from bench.bench_asgi import start_stub
+from bench.common import percentile, point_env_at, print_table
+from bench.seed import generate
+from bench.stub_rpcs import install
+from bench.stub_supabase import StubSupabase
+
+SCENARIOS = ('onboarding', 'create', 'claim', 'bootstrap', 'leaderboard', 'graph')
+LEADERBOARD_WINDOWS = ('all', 'week', 'month', 'semester')
+UPSTREAM_SLACK = 0.05
+COLUMNS = ['scenario', 'endpoint', 'ok', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'upstream/req', 'upstream/step']
+
+
+def build_requests(scenario, data, rng):
+    """
+    Returns a zero-argument factory of request steps, or None once the scenario's data runs out.
+    A step is a list of (method, path, person, json body, headers) sent in order by one worker.
+    """
+    users = data.users
+    if scenario == 'onboarding':
+        newcomers = itertools.cycle(data.newcomers)
+        def onboarding():
+            p = next(newcomers)
+            return [('GET', '/api/auth/verify-student', p, None, None),
+                    ('POST', '/api/onboarding', p, {'first_name': p['first_name'], 'last_name': p['last_name'],
+                                                    'institution_id': p['institution_id'],
+                                                    'referrer_id': rng.choice(users)['id']}, None)]
+        return onboarding
+    if scenario == 'create':
+        def create():
+            sender = rng.choice(users)
+            recipient = rng.choice(users + data.newcomers[:len(users) // 4])
+            return [('POST', '/api/receipts/create', sender, {'email': recipient['email'], 'tags': ['bench'],
+                                                             'description': 'benchmark receipt'}, None)]
+        return create
+    if scenario == 'claim':
+        pending = iter([(users[i], rid) for i, ids in sorted(data.pending.items()) for rid in ids])
+        lock = threading.Lock()
+        def claim():
+            with lock:
+                item = next(pending, None)
+            return item and [('POST', '/api/receipts/claim', item[0], {'receipt_id': item[1]}, None)]
+        return claim
+    if scenario == 'bootstrap':
+        return lambda: [('GET', '/api/bootstrap', rng.choice(users), None, None)]
+    if scenario == 'leaderboard':
+        variants = itertools.cycle([f'window={w}' + (f'&institution={i}' if i else '')
+                                    for w in LEADERBOARD_WINDOWS
+                                    for i in [None] + [inst['id'] for inst in data.institutions]])
+        return lambda: [('GET', f'/api/leaderboard?{next(variants)}', rng.choice(users), None, None)]
+    variants = itertools.cycle([('', {}), ('?min_weight=2', {}), ('?top_k=3', {}), ('', {'Accept-Encoding': 'gzip'})])
+    def graph():
+        query, headers = next(variants)
+        return [('GET', f'/api/institutions/graph{query}', rng.choice(users), None, headers)]
+    return graph
+
+
+def upstream_counts():
+    """({route: (calls, requests)}, {'METHOD target': calls}) so far, from the backend's metrics."""
+    import metrics
+    by_route = {labels[0]: totals for labels, totals in metrics.UPSTREAM_CALLS.totals().items()}
+    by_target = {}
+    for (target, method, _), (_, n) in metrics.UPSTREAM_SECONDS.totals().items():
+        key = f'{method}:{target}'
+        by_target[key] = by_target.get(key, 0) + n
+    return by_route, by_target
+
+
+def run_scenario(app, data, scenario, args):
+    rng = random.Random(args.seed)
+    next_step = build_requests(scenario, data, rng)
+    step_lock = threading.Lock()
+    issued = itertools.count()
+    samples, errors = {}, {}
+    steps = []
+    local = threading.local()
+
+    def worker():
+        client = getattr(local, 'client', None) or app.test_client()
+        local.client = client
+        while True:
+            with step_lock:
+                if next(issued) >= args.requests:
+                    return
+                step = next_step()
+            if step is None:
+                return
+            steps.append(1)
+            for method, path, person, body, headers in step:
+                endpoint = path.split('?', 1)[0]
+                t0 = time.perf_counter()
+                res = client.open(path, method=method, json=body,
+                                  headers={'Authorization': f'Bearer {data.token(person)}', **(headers or {})})
+                elapsed = time.perf_counter() - t0
+                with step_lock:
+                    if res.status_code in (200, 304):
+                        samples.setdefault(endpoint, []).append(elapsed)
+                    else:
+                        errors[endpoint] = errors.get(endpoint, 0) + 1
+                        if errors[endpoint] == 1:
+                            print(f'  {scenario}: {method} {path} -> {res.status_code} {res.get_data(as_text=True)[:200]}',
+                                  file=sys.stderr)
+
+    routes_before, targets_before = upstream_counts()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        for f in [pool.submit(worker) for _ in range(args.concurrency)]:
+            f.result()
+    elapsed = time.perf_counter() - started
+    routes_after, targets_after = upstream_counts()
+    upstream = {route: (calls - routes_before.get(route, (0, 0))[0], n - routes_before.get(route, (0, 0))[1])
+                for route, (calls, n) in routes_after.items()}
+    per_step = {k: (n - targets_before.get(k, 0)) / max(len(steps), 1) for k, n in targets_after.items()}
+    breakdown = ' '.join(f'{k}x{round(n, 2)}' for k, n in sorted(per_step.items(), key=lambda kv: -kv[1]) if n)
+
+    endpoints = sorted(set(samples) | set(errors))
+    rows = []
+    for endpoint in endpoints:
+        ok, failed = samples.get(endpoint, []), errors.get(endpoint, 0)
+        calls_total, requests = upstream.get(endpoint, (0, 0))
+        rows.append({
+            'scenario': scenario, 'endpoint': endpoint, 'ok': len(ok), 'errors': failed,
+            'rps': round(len(ok) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(ok, 50) * 1000, 2),
+            'p95_ms': round(percentile(ok, 95) * 1000, 2),
+            'p99_ms': round(percentile(ok, 99) * 1000, 2),
+            'upstream/req': round(calls_total / requests, 2) if requests else 0.0,
+            'upstream/step': breakdown,
+        })
+    return rows
+
+
+def compare(rows, baseline, tolerance, min_delta_ms):
+    """
+    Regressions against a previous --json report: more upstream calls or errors, or a p50 that
+    is both `tolerance` (relative) and `min_delta_ms` slower, so sub-millisecond cache hits do not flap.
+    Cached endpoints can miss concurrently, so upstream/req may drift by a hair between runs.
+    """
+    before = {(r['scenario'], r['endpoint']): r for r in baseline['results']}
+    problems = []
+    for r in rows:
+        old = before.get((r['scenario'], r['endpoint']))
+        if old is None:
+            continue
+        if r['upstream/req'] > old['upstream/req'] + UPSTREAM_SLACK:
+            problems.append(f"{r['scenario']} {r['endpoint']}: upstream/req {old['upstream/req']} -> {r['upstream/req']}")
+        if r['p50_ms'] > old['p50_ms'] * (1 + tolerance) and r['p50_ms'] - old['p50_ms'] > min_delta_ms:
+            problems.append(f"{r['scenario']} {r['endpoint']}: p50 {old['p50_ms']}ms -> {r['p50_ms']}ms")
+        if r['errors'] > old['errors']:
+            problems.append(f"{r['scenario']} {r['endpoint']}: errors {old['errors']} -> {r['errors']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all')
+    parser.add_argument('--requests', type=int, default=300, help='request steps per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='simulated upstream round-trip')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--institutions', type=int, default=6)
+    parser.add_argument('--newcomers', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help='write the report here')
+    parser.add_argument('--baseline', help='previous --json report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative p50 slowdown vs the baseline')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='p50 slowdowns smaller than this are noise')
+    args = parser.parse_args()
+
+    stub = install(StubSupabase(latency=args.latency_ms / 1000))
+    data = generate(stub, users=args.users, institutions=args.institutions, newcomers=args.newcomers, seed=args.seed)
+    stub_proc, stub_url = start_stub(stub)
+    point_env_at(SimpleNamespace(url=stub_url))
+    os.environ['INSTITUTIONS_FILE'] = data.institutions_file
+    os.environ['RECOVERY_MODE'] = 'inline'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import app
+    scenarios = SCENARIOS if args.scenario == 'all' else (args.scenario,)
+    rows = []
+    try:
+        for scenario in scenarios:
+            rows.extend(run_scenario(app.app, data, scenario, args))
+    finally:
+        stub_proc.terminate()
+        os.unlink(data.institutions_file)
+
+    print(f"users={args.users} institutions={args.institutions} seed={args.seed} requests={args.requests} "
+          f"concurrency={args.concurrency} latency={args.latency_ms}ms")
+    print_table(rows, COLUMNS)
+
+    settings = {k: getattr(args, k) for k in ('users', 'institutions', 'newcomers', 'seed', 'requests',
+                                              'concurrency', 'latency_ms')}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'settings': settings, 'results': rows}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('settings') != settings:
+            print(f"note: baseline settings differ: {baseline.get('settings')}")
+        problems = compare(rows, baseline, args.tolerance, args.min_delta_ms)
+        for p in problems:
+            print(f'REGRESSION {p}')
+        if problems:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
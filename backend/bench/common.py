@@ -0,0 +1,66 @@
+"""Shared helpers for the benchmark scripts: tokens, timing and reporting."""
+import os
+import statistics
+import time
+import jwt
+
+BENCH_JWT_SECRET = 'bench-secret-bench-secret-bench-secret'
+# Anything JWT-shaped satisfies create_client's key check; the stub never validates it.
+BENCH_ANON_KEY = jwt.encode({'role': 'anon', 'iss': 'bench'}, BENCH_JWT_SECRET)
+
+
+def make_token(user_id, email, ttl=3600):
+    return jwt.encode({
+        'sub': user_id,
+        'email': email,
+        'aud': 'authenticated',
+        'role': 'authenticated',
+        'exp': int(time.time()) + ttl,
+    }, BENCH_JWT_SECRET)
+
+
+def point_env_at(stub):
+    """Points the backend's Supabase settings at a running stub."""
+    os.environ['SUPABASE_URL'] = stub.url
+    os.environ['SUPABASE_KEY'] = BENCH_ANON_KEY
+    os.environ['SUPABASE_JWT_SECRET'] = BENCH_JWT_SECRET
+    # Load generators write far faster than any person; benchmarks of the limiter turn it back on.
+    os.environ.setdefault('RATE_LIMITS', 'off')
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples, elapsed=None):
+    """Latency samples are in seconds; the summary is in milliseconds."""
+    summary = {
+        'n': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 2) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 2),
+        'p99_ms': round(percentile(samples, 99) * 1000, 2),
+    }
+    if elapsed:
+        summary['rps'] = round(len(samples) / elapsed, 1)
+    return summary
+
+
+def timed(fn, iterations):
+    samples = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples, time.perf_counter() - start
+
+
+def print_table(rows, columns):
+    widths = [max(len(str(c)), *(len(str(r.get(c, ''))) for r in rows)) for c in columns]
+    print('  '.join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    for r in rows:
+        print('  '.join(str(r.get(c, '')).ljust(w) for c, w in zip(columns, widths)))
@@ -0,0 +1,177 @@
+"""
+Seeded synthetic datasets for the benchmarks: institutions, users (with majors and
+societies), connections, receipts.
+
+    dataset = generate(stub, users=500, institutions=6, seed=7)
+
+The same seed always yields the same ids, emails and graph, so two runs of a benchmark
+(e.g. before and after a change) exercise identical data. Rows the database derives with
+triggers (leaderboard_stats, institution_relationships, connections.receipt_weight) are
+filled in here, since the stub does not run triggers.
+"""
+import json
+import os
+import random
+import tempfile
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from bench.common import make_token
+
+TAGS = ['mentorship', 'notes', 'tutoring', 'career-advice', 'event-help', 'code-review', 'rides', 'moral-support']
+FIRST_NAMES = ['Ayesha', 'Bilal', 'Fatima', 'Hamza', 'Hira', 'Omar', 'Sana', 'Usman', 'Zainab', 'Ali']
+LAST_NAMES = ['Khan', 'Malik', 'Qureshi', 'Sheikh', 'Butt', 'Raza', 'Siddiqui', 'Chaudhry']
+MAJORS = ['Computer Science', 'Economics', 'Accounting & Finance', 'Law', 'Biology', 'Physics',
+          'Political Science', 'Electrical Engineering', 'Mathematics', 'Anthropology']
+SOCIETIES = ['Debating', 'Dramatics', 'Music', 'Photography', 'Robotics', 'Entrepreneurship',
+             'Model UN', 'Literary', 'Sports', 'Community Service']
+
+
+class Dataset:
+    """What generate() seeded, for scenarios to pick requests from."""
+
+    def __init__(self, institutions, users, pending, newcomers, institutions_file):
+        self.institutions = institutions            # registry entries (institutions.json shape)
+        self.users = users                          # [{'id', 'email', 'institution_id', ...}]
+        self.pending = pending                      # user index -> [receipt id] they can claim
+        self.newcomers = newcomers                  # [{'id', 'email', ...}] not yet onboarded
+        self.institutions_file = institutions_file  # registry written for INSTITUTIONS_FILE
+        self._tokens = {}
+
+    def token(self, person):
+        key = person['id']
+        if key not in self._tokens:
+            self._tokens[key] = make_token(person['id'], person['email'])
+        return self._tokens[key]
+
+
+def institution_registry(count):
+    """`count` registry entries: LUMS (as in institutions.json) plus synthetic ones of the same shape."""
+    entries = []
+    for i in range(count):
+        inst_id, domain = ('LUMS', 'lums.edu.pk') if i == 0 else (f'INST{i:02d}', f'inst{i:02d}.edu.pk')
+        entries.append({
+            'id': inst_id,
+            'name': inst_id if i else 'Lahore University of Management Sciences',
+            'domains': [domain],
+            'include_subdomains': False,
+            'roll_patterns': ['^(?P<year>\\d{2})'],
+            'batch_year': {'group': 'year', 'base': 2000, 'offset': 0},
+            'campus_codes': {},
+            'default_campus': f'{inst_id}-MAIN',
+        })
+    return entries
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _person(rng, index, institution):
+    year = rng.choice([21, 22, 23, 24, 25])
+    roll = f'{year}10{index:04d}'
+    return {
+        'id': _uuid(rng),
+        'email': f"{roll}@{institution['domains'][0]}",
+        'first_name': rng.choice(FIRST_NAMES),
+        'last_name': rng.choice(LAST_NAMES),
+        'institution_id': institution['id'],
+        'campus_code': institution['default_campus'],
+        'batch_year': 2000 + year,
+        'roll_number': roll,
+    }
+
+
+def generate(stub, users=200, institutions=4, connections_per_user=4, receipts_per_connection=2,
+             pending_per_user=3, newcomers=50, seed=7, days=200, ghost_share=0.0):
+    """
+    Seeds `stub` and returns a Dataset.
+    - profiles: a major, 0-3 societies, and ghost mode for a ghost_share of users.
+    - connections: each user links to ~connections_per_user random others; 85% are accepted.
+    - receipts: ACCEPTED history along accepted connections, spread over the last `days`;
+      pending_per_user claimable receipts per user (AWAITING_ACCEPTANCE from connected senders,
+      AWAITING_CONNECTION otherwise); one AWAITING_SIGNUP receipt per newcomer email.
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    registry = institution_registry(institutions)
+    people = [_person(rng, i, rng.choice(registry)) for i in range(users)]
+    pending_people = [_person(rng, users + i, rng.choice(registry)) for i in range(newcomers)]
+
+    # Profile traits draw from their own stream, so adding them left ids and the graph unchanged.
+    traits = random.Random(seed + 1)
+    for p in people:
+        stub.insert('public_profiles', {
+            'user_id': p['id'], 'email': p['email'], 'first_name': p['first_name'], 'last_name': p['last_name'],
+            'institution': p['institution_id'], 'institution_id': p['institution_id'],
+            'campus_code': p['campus_code'], 'batch_year': p['batch_year'], 'roll_number': p['roll_number'],
+            'major': traits.choice(MAJORS), 'societies': traits.sample(SOCIETIES, traits.randint(0, 3)),
+            'ghost_mode': traits.random() < ghost_share,
+        })
+
+    edges = {}  # (low index, high index) -> connection row
+    for a in range(users):
+        for _ in range(connections_per_user // 2 + rng.randrange(2)):
+            b = rng.randrange(users)
+            key = (min(a, b), max(a, b))
+            if a == b or key in edges:
+                continue
+            low, high = sorted([people[a]['id'], people[b]['id']])
+            accepted = rng.random() < 0.85
+            edges[key] = stub.insert('connections', {
+                'id': _uuid(rng), 'low_id': low, 'high_id': high, 'requested_by': people[a]['id'],
+                'accepted': accepted, 'accepted_at': now.isoformat() if accepted else None,
+            })
+
+    def receipt(sender, recipient, status, connection=None, when=None):
+        created = (when or now).isoformat()
+        return stub.insert('receipts', {
+            'id': _uuid(rng), 'from_user_id': sender['id'], 'to_user_id': recipient.get('user_id'),
+            'recipient_email': recipient['email'], 'connection_id': connection and connection['id'],
+            'tags': rng.sample(TAGS, rng.randint(1, 3)), 'description': 'synthetic receipt',
+            'is_public': rng.random() < 0.5, 'status': status, 'created_at': created,
+            'accepted_at': created if status == 'ACCEPTED' else None,
+        })
+
+    given, received, exchanges = Counter(), Counter(), Counter()
+    for (a, b), conn in edges.items():
+        if not conn['accepted']:
+            continue
+        for _ in range(receipts_per_connection):
+            sender, recipient = (people[a], people[b]) if rng.random() < 0.5 else (people[b], people[a])
+            when = now - timedelta(days=rng.uniform(0, days))
+            receipt(sender, {'user_id': recipient['id'], 'email': recipient['email']}, 'ACCEPTED', conn, when)
+            conn['receipt_weight'] += 1
+            given[sender['id']] += 1
+            received[recipient['id']] += 1
+            exchanges[(sender['institution_id'], recipient['institution_id'])] += 1
+
+    pending = {}
+    for i, p in enumerate(people):
+        for _ in range(pending_per_user):
+            j = rng.randrange(users)
+            if j == i:
+                continue
+            conn = edges.get((min(i, j), max(i, j)))
+            connected = conn is not None and conn['accepted']
+            r = receipt(people[j], {'user_id': p['id'], 'email': p['email']},
+                        'AWAITING_ACCEPTANCE' if connected else 'AWAITING_CONNECTION', conn if connected else None)
+            pending.setdefault(i, []).append(r['id'])
+
+    for p in pending_people:
+        receipt(rng.choice(people), {'email': p['email']}, 'AWAITING_SIGNUP')
+
+    stamp = now.isoformat()
+    for p in people:
+        if given[p['id']] or received[p['id']]:
+            stub.insert('leaderboard_stats', {'user_id': p['id'], 'given_count': given[p['id']],
+                                              'received_count': received[p['id']], 'last_updated': stamp})
+    for (src, tgt), count in exchanges.items():
+        stub.insert('institution_relationships', {'from_institution': src, 'to_institution': tgt,
+                                                  'exchange_count': count, 'last_updated': stamp})
+
+    fd, path = tempfile.mkstemp(prefix='bench-institutions-', suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(registry, f)
+    return Dataset(registry, people, pending, pending_people, path)
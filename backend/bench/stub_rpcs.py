@@ -0,0 +1,400 @@
+"""
+Python equivalents of the SQL functions and views in the repo root (*.sql), registered on
+a StubSupabase so the RPC code paths in app.py can run against the stub.
+They run under the stub's lock, so each call is atomic like the real transaction.
+"""
+from bench.stub_supabase import PgError, now_iso
+
+
+def _find(rows, **match):
+    return next((r for r in rows if all(r.get(k) == v for k, v in match.items())), None)
+
+
+def _claims_email(stub, uid):
+    # The SQL reads auth.jwt() ->> 'email'; the stub has no JWT here, so use the profile.
+    profile = _find(stub.tables['public_profiles'], user_id=uid)
+    return profile.get('email') if profile else None
+
+
+def install(stub):
+
+    @stub.rpc('create_receipt_rpc')
+    def create_receipt_rpc(stub, params, uid):
+        # receipt_rpc.sql
+        if uid is None:
+            raise PgError('42501', 'Not authenticated', 401)
+        email = params['p_recipient_email'].strip().lower()  # normalize_recipient_email trigger
+        profile = next((p for p in stub.tables['public_profiles'] if (p.get('email') or '').lower() == email), None)
+        status, to_user_id, conn_id = 'AWAITING_SIGNUP', None, None
+        if profile:
+            to_user_id = profile['user_id']
+            if to_user_id == uid:
+                raise PgError('22023', 'Cannot send receipt to yourself')
+            low, high = sorted([uid, to_user_id])
+            conn = _find(stub.tables['connections'], low_id=low, high_id=high)
+            if conn and conn.get('accepted'):
+                status, conn_id = 'AWAITING_ACCEPTANCE', conn['id']
+            else:
+                status = 'AWAITING_CONNECTION'
+        return stub.insert('receipts', {
+            'from_user_id': uid, 'to_user_id': to_user_id, 'recipient_email': email,
+            'tags': params.get('p_tags') or [], 'description': params.get('p_description') or '',
+            'is_public': bool(params.get('p_is_public')), 'status': status, 'connection_id': conn_id,
+        })
+
+    @stub.rpc('claim_receipt_rpc')
+    def claim_receipt_rpc(stub, params, uid):
+        # receipt_claim_rpc.sql
+        if uid is None:
+            raise PgError('42501', 'Not authenticated', 401)
+        r = _find(stub.tables['receipts'], id=params['p_receipt_id'])
+        if r is None:
+            raise PgError('P0002', 'Receipt not found', 404)
+        is_email_match = r['to_user_id'] is None and r['recipient_email'].lower() == (_claims_email(stub, uid) or '').lower()
+        if r['to_user_id'] != uid and not is_email_match:
+            raise PgError('42501', 'Not authorized to claim this receipt', 403)
+        if not is_email_match and r['status'] in ('ACCEPTED', 'REJECTED'):
+            raise PgError('22023', f"Receipt already {r['status']}")
+        conn_id = r.get('connection_id')
+        if is_email_match or conn_id is None:
+            low, high = sorted([uid, r['from_user_id']])
+            conn = _find(stub.tables['connections'], low_id=low, high_id=high)
+            if conn is None:
+                conn = stub.insert('connections', {'low_id': low, 'high_id': high, 'requested_by': uid,
+                                                   'accepted': True, 'accepted_at': now_iso()})
+            else:
+                stub.update('connections', conn, {'accepted': True, 'accepted_at': conn.get('accepted_at') or now_iso()})
+            conn_id = conn['id']
+        r = stub.update('receipts', r, {'to_user_id': uid, 'connection_id': conn_id, 'status': 'ACCEPTED'})
+        # graph_metrics.sql: trg_connection_weight
+        conn = _find(stub.tables['connections'], id=conn_id)
+        weight = sum(1 for x in stub.tables['receipts'] if x.get('connection_id') == conn_id and x['status'] == 'ACCEPTED')
+        if conn is not None and conn.get('receipt_weight') != weight:
+            stub.update('connections', conn, {'receipt_weight': weight})
+        return r
+
+    @stub.rpc('reject_receipt_rpc')
+    def reject_receipt_rpc(stub, params, uid):
+        # receipt_claim_rpc.sql
+        if uid is None:
+            raise PgError('42501', 'Not authenticated', 401)
+        r = _find(stub.tables['receipts'], id=params['p_receipt_id'])
+        if r is None:
+            raise PgError('P0002', 'Receipt not found', 404)
+        if r['to_user_id'] != uid:
+            raise PgError('42501', 'Not authorized to reject this receipt', 403)
+        return stub.update('receipts', r, {'status': 'REJECTED'})
+
+    @stub.rpc('request_connection_rpc')
+    def request_connection_rpc(stub, params, uid):
+        # connection_request_rpc.sql
+        if uid is None:
+            raise PgError('42501', 'Not authenticated', 401)
+        email = params['p_email'].strip().lower()
+        profile = next((p for p in stub.tables['public_profiles'] if (p.get('email') or '').lower() == email), None)
+        if profile is None:
+            raise PgError('P0002', 'User not found. They must sign up for Pledge first.', 404)
+        if profile['user_id'] == uid:
+            raise PgError('22023', 'Cannot connect to self')
+        low, high = sorted([uid, profile['user_id']])
+        conn = _find(stub.tables['connections'], low_id=low, high_id=high)
+        if conn is None:
+            conn = stub.insert('connections', {'low_id': low, 'high_id': high, 'requested_by': uid, 'accepted': False})
+            return {'state': 'requested', 'connection': conn}
+        if conn.get('accepted'):
+            state = 'connected'
+        elif conn['requested_by'] == uid:
+            state = 'pending_outgoing'
+        else:
+            state = 'pending_incoming'
+        return {'state': state, 'connection': conn}
+
+    @stub.rpc('recover_orphan_receipts')
+    def recover_orphan_receipts(stub, params, uid):
+        # receipt_recovery.sql
+        email = (_claims_email(stub, uid) or '').lower()
+        if uid is None or not email:
+            return 0
+        orphans = [r for r in stub.tables['receipts']
+                   if r['recipient_email'].lower() == email and r['to_user_id'] is None and r['from_user_id'] != uid]
+        edges = {}
+        for sender in {r['from_user_id'] for r in orphans}:
+            low, high = sorted([uid, sender])
+            conn = _find(stub.tables['connections'], low_id=low, high_id=high) or stub.insert('connections', {
+                'low_id': low, 'high_id': high, 'requested_by': uid, 'accepted': True, 'accepted_at': now_iso()})
+            edges[sender] = conn['id']
+        for r in orphans:
+            r.update({'to_user_id': uid, 'connection_id': edges[r['from_user_id']], 'status': 'AWAITING_ACCEPTANCE'})
+        return len(orphans)
+
+    @stub.rpc('get_leaderboard_window')
+    def get_leaderboard_window(stub, params, uid):
+        # leaderboard_windows.sql
+        since, institution, limit = params.get('p_since'), params.get('p_institution'), params.get('p_limit') or 50
+        profiles = {p['user_id']: p for p in stub.tables['public_profiles']}
+        totals = {'givers': {}, 'receivers': {}}
+        for r in stub.tables['receipts']:
+            if r['status'] != 'ACCEPTED' or (since and (r.get('accepted_at') or r['created_at']) < since):
+                continue
+            totals['givers'][r['from_user_id']] = totals['givers'].get(r['from_user_id'], 0) + 1
+            if r['to_user_id']:
+                totals['receivers'][r['to_user_id']] = totals['receivers'].get(r['to_user_id'], 0) + 1
+        rows = []
+        for board, counts in totals.items():
+            ranked = sorted(((c, u) for u, c in counts.items()
+                             if u in profiles and (institution is None or profiles[u].get('institution_id') == institution)),
+                            key=lambda x: (-x[0], x[1]))[:limit]
+            for count, user_id in ranked:
+                p = profiles[user_id]
+                rows.append({'board': board, 'user_id': user_id, 'first_name': p.get('first_name'),
+                             'last_name': p.get('last_name'), 'institution': p.get('institution'), 'count': count})
+        return rows
+
+    def drift_report(stored, expected, id_columns, counts):
+        # stored / expected: key -> {count column: value}; counts: [(stored name, expected name, column)]
+        drift = []
+        for key in stored.keys() | expected.keys():
+            have, want = stored.get(key), expected.get(key, {})
+            row = dict(zip(id_columns, key))
+            for stored_name, expected_name, column in counts:
+                row[stored_name] = have.get(column) if have else None
+                row[expected_name] = want.get(column, 0)
+            if any(row[s] != row[e] for s, e, _ in counts):
+                row['missing'] = have is None
+                drift.append(row)
+        size = lambda r: sum(abs((r[s] or 0) - r[e]) for s, e, _ in counts)
+        drift.sort(key=lambda r: (-size(r), *(r[c] for c in id_columns)))
+        return drift, {
+            'checked': len(stored) + sum(1 for r in drift if r['missing']), 'drifted': len(drift),
+            'missing': sum(1 for r in drift if r['missing']),
+            'negative': sum(1 for r in drift if any((r[s] or 0) < 0 for s, _, _ in counts)),
+            'count_drift': sum(size(r) for r in drift),
+            'sample': [{k: v for k, v in r.items() if k != 'missing'} for r in drift[:20]],
+        }
+
+    @stub.rpc('reconcile_receipt_aggregates')
+    def reconcile_receipt_aggregates(stub, params, uid):
+        # receipt_aggregates.sql
+        accepted = [r for r in stub.tables['receipts'] if r['status'] == 'ACCEPTED']
+        institution = {p['user_id']: p.get('institution') for p in stub.tables['public_profiles']}
+        users, pairs = {}, {}
+        for r in accepted:
+            users.setdefault((r['from_user_id'],), {'given_count': 0, 'received_count': 0})['given_count'] += 1
+            if r['to_user_id']:
+                users.setdefault((r['to_user_id'],), {'given_count': 0, 'received_count': 0})['received_count'] += 1
+                src, tgt = institution.get(r['from_user_id']), institution.get(r['to_user_id'])
+                if src and tgt:
+                    pairs.setdefault((src, tgt), {'exchange_count': 0})['exchange_count'] += 1
+        stored_users = {(s['user_id'],): s for s in stub.tables['leaderboard_stats']}
+        stored_pairs = {(s['from_institution'], s['to_institution']): s for s in stub.tables['institution_relationships']}
+        user_drift, leaderboard = drift_report(stored_users, users, ('user_id',),
+                                               [('stored_given', 'given', 'given_count'),
+                                                ('stored_received', 'received', 'received_count')])
+        pair_drift, institutions = drift_report(stored_pairs, pairs, ('from_institution', 'to_institution'),
+                                                [('stored_count', 'exchange_count', 'exchange_count')])
+        if params.get('p_apply'):
+            for r in user_drift:
+                values = {'given_count': r['given'], 'received_count': r['received'], 'last_updated': now_iso()}
+                row = stored_users.get((r['user_id'],))
+                if row:
+                    stub.update('leaderboard_stats', row, values)
+                else:
+                    stub.insert('leaderboard_stats', {'user_id': r['user_id'], **values})
+            for r in pair_drift:
+                values = {'exchange_count': r['exchange_count'], 'last_updated': now_iso()}
+                row = stored_pairs.get((r['from_institution'], r['to_institution']))
+                if row:
+                    stub.update('institution_relationships', row, values)
+                else:
+                    stub.insert('institution_relationships', {'from_institution': r['from_institution'],
+                                                              'to_institution': r['to_institution'], **values})
+        return {'leaderboard': leaderboard, 'institutions': institutions, 'applied': bool(params.get('p_apply'))}
+
+    @stub.rpc('verify_receipt')
+    def verify_receipt(stub, params, uid):
+        # receipt_verification.sql (callable without a user)
+        r = _find(stub.tables['receipts'], id=params['p_receipt_id'])
+        if r is None or r['status'] != 'ACCEPTED' or not r.get('is_public'):
+            return []
+        profiles = {p['user_id']: p for p in stub.tables['public_profiles']}
+
+        def party(user_id):
+            p = profiles.get(user_id) or {}
+            name = ' '.join(filter(None, [p.get('first_name'), p.get('last_name')])).strip() or None
+            return (None if p.get('ghost_mode') else name), p.get('institution')
+
+        issuer_name, issuer_institution = party(r['from_user_id'])
+        recipient_name, recipient_institution = party(r['to_user_id'])
+        return [{'id': r['id'], 'tags': r.get('tags') or [], 'created_at': r['created_at'],
+                 'accepted_at': r.get('accepted_at'), 'issuer_id': r['from_user_id'], 'issuer_name': issuer_name,
+                 'issuer_institution': issuer_institution, 'recipient_id': r['to_user_id'],
+                 'recipient_name': recipient_name, 'recipient_institution': recipient_institution}]
+
+    def accepted_neighbours(stub):
+        adjacency = {}
+        for c in stub.tables['connections']:
+            if c.get('accepted'):
+                adjacency.setdefault(c['low_id'], set()).add(c['high_id'])
+                adjacency.setdefault(c['high_id'], set()).add(c['low_id'])
+        return adjacency
+
+    @stub.rpc('get_ego_network')
+    def get_ego_network(stub, params, uid):
+        # graph_metrics.sql
+        if uid is None:
+            raise PgError('42501', 'Not authenticated', 401)
+        max_depth = min(max(params.get('p_depth') or 2, 1), 3)
+        budget = min(max(params.get('p_max_nodes') or 500, 1), 2000)
+        adjacency = accepted_neighbours(stub)
+        metrics = {m['user_id']: m for m in stub.tables.get('user_graph_metrics', [])}
+        hops, frontier, truncated = {uid: 0}, [uid], False
+        for d in range(1, max_depth + 1):
+            candidates = {n for f in frontier for n in adjacency.get(f, ())} - hops.keys()
+            level = sorted(candidates, key=lambda n: (-(metrics.get(n) or {}).get('trust_score', float('-inf')), n))
+            if len(hops) + len(level) > budget:
+                level, truncated = level[:budget - len(hops)], True
+            if not level:
+                break
+            hops.update((n, d) for n in level)
+            frontier = level
+            if truncated:
+                break
+        profiles = {p['user_id']: p for p in stub.tables['public_profiles']}
+        nodes = []
+        for n, d in hops.items():
+            p, m = profiles.get(n) or {}, metrics.get(n) or {}
+            hidden = d > 1 and p.get('ghost_mode')
+            nodes.append({'id': n, 'depth': d, 'first_name': None if hidden else p.get('first_name'),
+                          'last_name': None if hidden else p.get('last_name'), 'institution': p.get('institution'),
+                          'degree': m.get('degree', 0), 'weighted_degree': m.get('weighted_degree', 0),
+                          'trust_score': m.get('trust_score', 0)})
+        edges = [{'source': c['low_id'], 'target': c['high_id'], 'weight': c.get('receipt_weight', 0)}
+                 for c in stub.tables['connections'] if c.get('accepted') and c['low_id'] in hops and c['high_id'] in hops]
+        return {'nodes': nodes, 'edges': edges, 'truncated': truncated}
+
+    @stub.rpc('get_graph_metrics')
+    def get_graph_metrics(stub, params, uid):
+        # graph_metrics.sql
+        if uid is None:
+            raise PgError('42501', 'Not authenticated', 401)
+        target = params['p_user_id']
+        if _find(stub.tables['public_profiles'], user_id=target) is None:
+            raise PgError('P0002', 'User not found', 404)
+        m = _find(stub.tables.get('user_graph_metrics', []), user_id=target) or {}
+        adjacency = accepted_neighbours(stub)
+        return {'user_id': target, 'degree': m.get('degree', 0), 'weighted_degree': m.get('weighted_degree', 0),
+                'trust_score': m.get('trust_score', 0),
+                'trust_rank': 1 + sum(1 for o in stub.tables['user_graph_metrics'] if o['trust_score'] > m['trust_score'])
+                if m.get('degree') else None,
+                'computed_at': m.get('computed_at'),
+                'mutual_connections': None if target == uid
+                else len(adjacency.get(uid, set()) & adjacency.get(target, set()))}
+
+    def trigrams(text):
+        # pg_trgm: each word padded with two spaces in front and one behind.
+        return {f'  {w} '[i:i + 3] for w in text.split() for i in range(len(w) + 1)}
+
+    @stub.rpc('search_users')
+    def search_users(stub, params, uid):
+        # user_search.sql; word_similarity is approximated by the share of the query's trigrams found.
+        if uid is None:
+            raise PgError('42501', 'Not authenticated', 401)
+        q = (params.get('p_query') or '').strip().lower() or None
+        q_grams = trigrams(q) if q else set()
+        major = (params.get('p_major') or '').strip().lower() or None
+        society = (params.get('p_society') or '').strip() or None
+        adjacency = accepted_neighbours(stub)
+        friends = adjacency.get(uid, set())
+        second_hop = {n for f in friends for n in adjacency.get(f, ())}
+        me = _find(stub.tables['public_profiles'], user_id=uid) or {}
+        after = None
+        if params.get('p_after_id') is not None:
+            after = (params['p_after_proximity'], -params['p_after_score'], params['p_after_id'])
+
+        rows = []
+        for p in stub.tables['public_profiles']:
+            if p['user_id'] == uid:
+                continue
+            if params.get('p_institution_id') is not None and p.get('institution_id') != params['p_institution_id']:
+                continue
+            if params.get('p_batch_year') is not None and p.get('batch_year') != params['p_batch_year']:
+                continue
+            if major is not None and (p.get('major') or '').lower() != major:
+                continue
+            if society is not None and society not in (p.get('societies') or []):
+                continue
+            score = 0
+            if q:
+                name = f"{p.get('first_name') or ''} {p.get('last_name') or ''}".strip().lower()
+                similarity = len(q_grams & trigrams(name)) / len(q_grams)
+                if q not in name and similarity < 0.6:
+                    continue
+                score = round(max(1.0 if name.startswith(q) else 0.0, similarity), 4)
+            if p['user_id'] in friends:
+                proximity = 1
+            elif p['user_id'] in second_hop:
+                proximity = 2
+            elif p.get('institution_id') == me.get('institution_id'):
+                proximity = 3
+            else:
+                proximity = 4
+            if p.get('ghost_mode') and proximity != 1:
+                continue
+            if after is not None and (proximity, -score, p['user_id']) <= after:
+                continue
+            rows.append({'user_id': p['user_id'], 'first_name': p.get('first_name'), 'last_name': p.get('last_name'),
+                         'institution': p.get('institution'), 'institution_id': p.get('institution_id'),
+                         'batch_year': p.get('batch_year'), 'major': p.get('major'),
+                         'societies': p.get('societies') or [], 'proximity': proximity, 'score': score})
+        rows.sort(key=lambda r: (r['proximity'], -r['score'], r['user_id']))
+        return rows[:min(max(params.get('p_limit') or 20, 1), 101)]
+
+    def public_receipt_rows(stub):
+        return [r for r in stub.tables['receipts'] if r['status'] == 'ACCEPTED' and r.get('is_public')]
+
+    @stub.view('public_receipts')
+    def public_receipts(stub):
+        # profile_stats.sql
+        columns = ('id', 'from_user_id', 'to_user_id', 'tags', 'created_at', 'accepted_at')
+        return [{c: r.get(c) for c in columns} for r in public_receipt_rows(stub)]
+
+    @stub.view('profile_receipt_stats')
+    def profile_receipt_stats(stub):
+        # profile_stats.sql keeps this table current with a trigger; the stub derives it on read.
+        stats = {}
+        for r in public_receipt_rows(stub):
+            if not r.get('to_user_id'):
+                continue
+            entry = stats.setdefault(r['to_user_id'], {'user_id': r['to_user_id'], 'public_received_count': 0,
+                                                       'tag_counts': {}, 'last_updated': r['updated_at']})
+            entry['public_received_count'] += 1
+            entry['last_updated'] = max(entry['last_updated'], r['updated_at'])
+            for tag in r.get('tags') or []:
+                entry['tag_counts'][tag] = entry['tag_counts'].get(tag, 0) + 1
+        return list(stats.values())
+
+    @stub.view('unread_counters')
+    def unread_counters(stub):
+        # chat_unread_counters.sql keeps this table current with triggers; the stub derives it on read.
+        counts = {}
+        for m in stub.tables['messages']:
+            if m['read_at'] is None:
+                key = (m['recipient_id'], m['sender_id'])
+                counts[key] = counts.get(key, 0) + 1
+        return [{'user_id': u, 'sender_id': s, 'unread_count': c} for (u, s), c in counts.items()]
+
+    @stub.rpc('get_unread_counts')
+    def get_unread_counts(stub, params, uid):
+        # chat_unread_counters.sql
+        return [{'sender_id': row['sender_id'], 'count': row['unread_count']}
+                for row in unread_counters(stub) if row['user_id'] == uid]
+
+    @stub.rpc('mark_thread_read')
+    def mark_thread_read(stub, params, uid):
+        # chat_unread_counters.sql
+        for m in stub.tables['messages']:
+            if m['recipient_id'] == uid and m['sender_id'] == params['other_user_id'] and m['read_at'] is None:
+                stub.update('messages', m, {'read_at': now_iso()})
+        return None
+
+    return stub
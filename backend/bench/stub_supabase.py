@@ -0,0 +1,508 @@
+"""
+In-memory stand-in for the Supabase endpoints the backend talks to.
+Implements enough of PostgREST (filters, or/and trees, order, limit, upsert,
+Prefer: return=...) and Auth (GET /auth/v1/user) to drive app.py locally.
+
+- latency: seconds slept per request, simulating upstream query time.
+- connect_latency: seconds slept when a new TCP connection is accepted,
+  simulating the TCP + TLS handshake that keep-alive pooling avoids.
+
+RLS is not modelled: every request sees every row. RPCs are plain Python
+callables registered with `stub.rpc(name)` and receive (stub, params, uid).
+Read-only relations (views, trigger-maintained aggregates) are registered with
+`stub.view(name)` as callables returning the current rows; filters apply as usual.
+"""
+import base64
+import fnmatch
+import itertools
+import json
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+
+class PgError(Exception):
+    """Raised by stub RPCs to mimic a Postgres error surfaced through PostgREST."""
+
+    def __init__(self, code, message, status=400):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+# Primary keys / conflict targets and column defaults for the tables app.py touches.
+TABLES = {
+    'public_profiles': {'pk': ('user_id',), 'defaults': {'created_at': now_iso, 'updated_at': now_iso}},
+    'connections': {'pk': ('low_id', 'high_id'), 'defaults': {'id': lambda: str(uuid.uuid4()), 'accepted': lambda: False,
+                                                              'created_at': now_iso, 'updated_at': now_iso,
+                                                              'requested_at': now_iso, 'accepted_at': lambda: None,
+                                                              'receipt_weight': lambda: 0}},
+    'receipts': {'pk': ('id',), 'defaults': {'id': lambda: str(uuid.uuid4()), 'status': lambda: 'AWAITING_SIGNUP',
+                                             'is_public': lambda: False, 'created_at': now_iso, 'updated_at': now_iso,
+                                             'to_user_id': lambda: None, 'connection_id': lambda: None,
+                                             'accepted_at': lambda: None}},
+    'leaderboard_stats': {'pk': ('user_id',), 'defaults': {'given_count': lambda: 0, 'received_count': lambda: 0,
+                                                           'last_updated': now_iso}},
+    'institution_relationships': {'pk': ('from_institution', 'to_institution'),
+                                  'defaults': {'exchange_count': lambda: 0, 'last_updated': now_iso}},
+    'sync_tombstones': {'pk': ('id',), 'defaults': {'id': itertools.count(1).__next__, 'deleted_at': now_iso}},
+    'messages': {'pk': ('id',), 'defaults': {'id': lambda: str(uuid.uuid4()), 'created_at': now_iso, 'read_at': lambda: None,
+                                             'message_type': lambda: 'text', 'attachment_id': lambda: None}},
+    'change_events': {'pk': ('id',), 'defaults': {'created_at': now_iso}},
+    'user_graph_metrics': {'pk': ('user_id',), 'defaults': {'computed_at': now_iso}},
+}
+
+# change_events.sql: which rows fan out to which users' change feeds.
+CHANGE_FEED = {
+    'receipts': ('receipt', ('from_user_id', 'to_user_id')),
+    'connections': ('connection', ('low_id', 'high_id')),
+    'messages': ('message', ('sender_id', 'recipient_id')),
+}
+
+# To-one embeds (`select=*,alias:target(cols)`): (table, target) -> foreign key column on table.
+EMBEDS = {('messages', 'receipts'): 'attachment_id'}
+
+
+def split_top_level(text, sep=','):
+    """Splits on `sep` outside parentheses and double quotes."""
+    parts, depth, quoted, current = [], 0, False, []
+    for ch in text:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == '(':
+            depth += 1
+        elif not quoted and ch == ')':
+            depth -= 1
+        if ch == sep and depth == 0 and not quoted:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(ch)
+    if current:
+        parts.append(''.join(current))
+    return parts
+
+
+def _unquote(value):
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        return value[1:-1]
+    return value
+
+
+def _coerce(raw, sample):
+    """Converts a filter literal to the type of the stored value it is compared with."""
+    if raw == 'null':
+        return None
+    if isinstance(sample, bool):
+        return raw == 'true'
+    if isinstance(sample, int):
+        return int(raw)
+    if isinstance(sample, float):
+        return float(raw)
+    return raw
+
+
+def _like(value, pattern, ignore_case):
+    if value is None:
+        return False
+    pattern = pattern.replace('*', '%')
+    glob = pattern.replace('%', '*').replace('_', '?')
+    if ignore_case:
+        return fnmatch.fnmatchcase(str(value).lower(), glob.lower())
+    return fnmatch.fnmatchcase(str(value), glob)
+
+
+def _parse_list(op, raw):
+    """Option list of an in/cs/ov literal, parsed once per filter rather than per row."""
+    if op == 'in':
+        return [_unquote(v) for v in split_top_level(raw.strip('()'))]
+    if op == 'cs':
+        return json.loads(raw) if raw.startswith('[') else [_unquote(v) for v in split_top_level(raw.strip('{}'))]
+    return [_unquote(v) for v in split_top_level(raw.strip('{}()'))]
+
+
+def _compare(value, op, raw, options=None):
+    if op in ('in', 'cs', 'ov') and options is None:
+        options = _parse_list(op, raw)
+    if op == 'is':
+        if raw == 'null':
+            return value is None
+        return value is (raw == 'true')
+    if op in ('like', 'ilike'):
+        return _like(value, raw, op == 'ilike')
+    if op == 'in':
+        if isinstance(value, str):
+            return value in options
+        return any(value == _coerce(o, value) for o in options)
+    if op == 'cs':
+        return value is not None and all(w in value for w in options)
+    if op == 'ov':
+        return value is not None and any(w in value for w in options)
+    target = _coerce(_unquote(raw), value)
+    if value is None or target is None:
+        return op == 'neq' and value != target
+    if op == 'eq':
+        return value == target
+    if op == 'neq':
+        return value != target
+    if op == 'gt':
+        return value > target
+    if op == 'gte':
+        return value >= target
+    if op == 'lt':
+        return value < target
+    if op == 'lte':
+        return value <= target
+    raise ValueError(f'unsupported operator {op}')
+
+
+def _column_predicate(column, expr):
+    negate = False
+    op, _, raw = expr.partition('.')
+    if op == 'not':
+        negate = True
+        op, _, raw = raw.partition('.')
+    options = _parse_list(op, raw) if op in ('in', 'cs', 'ov') else None
+
+    def predicate(row):
+        result = _compare(row.get(column), op, raw, options)
+        return not result if negate else result
+    return predicate
+
+
+def _logic_predicate(kind, body):
+    """Parses `or=(a.eq.1,and(b.gt.2,c.is.null))` style trees."""
+    children = []
+    for term in split_top_level(body.strip()[1:-1]):
+        term = term.strip()
+        if term.startswith(('or(', 'and(', 'not.or(', 'not.and(')):
+            negate = term.startswith('not.')
+            inner_kind, _, inner = term[4 if negate else 0:].partition('(')
+            child = _logic_predicate(inner_kind, '(' + inner)
+            children.append((lambda c: (lambda row: not c(row)))(child) if negate else child)
+        else:
+            column, _, expr = term.partition('.')
+            children.append(_column_predicate(column, expr))
+    combine = any if kind == 'or' else all
+    return lambda row: combine(c(row) for c in children)
+
+
+def _project(row, select, embed=None):
+    """Applies a select list. `alias:table(cols)` terms are resolved by embed(table, row, cols)."""
+    if not select or select == '*':
+        return dict(row)
+    out = {}
+    for column in (c.strip() for c in split_top_level(select)):
+        if column == '*':
+            out.update(row)
+        elif column.endswith(')') and embed is not None:
+            name, _, inner = column[:-1].partition('(')
+            alias, _, target = name.rpartition(':')
+            out[alias or target] = embed(target, row, inner)
+        else:
+            out[column] = row.get(column)
+    return out
+
+
+class StubSupabase:
+    def __init__(self, latency=0.0, connect_latency=0.0):
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.tables = {name: [] for name in TABLES}
+        self.rpcs = {}
+        self.views = {}
+        self.lock = threading.RLock()
+        self.connections_opened = 0
+        self.requests = 0
+        self.calls = {}  # "METHOD path" -> count
+        self._server = None
+        self._thread = None
+        self._change_ids = itertools.count(1)
+
+    # --- data ---------------------------------------------------------------
+
+    def insert(self, table, row):
+        spec = TABLES.get(table, {'pk': ('id',), 'defaults': {}})
+        full = {k: factory() for k, factory in spec['defaults'].items()}
+        full.update(row)
+        self.tables.setdefault(table, []).append(full)
+        self._record_change(table, 'INSERT', full)
+        return full
+
+    def update(self, table, row, changes):
+        """Applies changes to a stored row, mimicking the touch_updated_at and change feed triggers."""
+        before = dict(row)
+        row.update(changes)
+        if 'updated_at' in row and 'updated_at' not in changes:
+            row['updated_at'] = now_iso()
+        self._record_change(table, 'UPDATE', row, before)
+        return row
+
+    def _record_change(self, table, op, row, before=None):
+        """change_events.sql: one event per affected user; updated_at-only touches are skipped."""
+        if table not in CHANGE_FEED:
+            return
+        strip = lambda r: {k: v for k, v in r.items() if k != 'updated_at'}
+        if before is not None and strip(before) == strip(row):
+            return
+        kind, columns = CHANGE_FEED[table]
+        users = {row.get(c) for c in columns} | ({before.get('to_user_id')} if before and table == 'receipts' else set())
+        for user_id in sorted(u for u in users if u):
+            self.insert('change_events', {'id': next(self._change_ids), 'user_id': user_id, 'kind': kind, 'op': op,
+                                          'row_id': row['id'], 'data': None if op == 'DELETE' else dict(row)})
+
+    def delete(self, table, row):
+        """Removes a stored row, mimicking the sync tombstone trigger."""
+        self.tables[table] = [r for r in self.tables[table] if r is not row]
+        self._record_change(table, 'DELETE', row)
+        if table == 'connections':
+            self.insert('sync_tombstones', {'table_name': table, 'row_id': row['id'],
+                                            'user_ids': [row['low_id'], row['high_id']]})
+        elif table == 'receipts':
+            self.insert('sync_tombstones', {'table_name': table, 'row_id': row['id'],
+                                            'user_ids': [u for u in (row['from_user_id'], row.get('to_user_id')) if u]})
+
+    def rpc(self, name):
+        def register(fn):
+            self.rpcs[name] = fn
+            return fn
+        return register
+
+    def view(self, name):
+        def register(fn):
+            self.views[name] = fn
+            return fn
+        return register
+
+    def reset_counters(self):
+        with self.lock:
+            self.connections_opened = 0
+            self.requests = 0
+            self.calls = {}
+
+    # --- PostgREST semantics -------------------------------------------------
+
+    def _filter_rows(self, table, params):
+        rows = self.views[table](self) if table in self.views else self.tables.setdefault(table, [])
+        predicates = []
+        for key, value in params:
+            if key in ('select', 'order', 'limit', 'offset', 'on_conflict', 'columns'):
+                continue
+            if key in ('or', 'and', 'not.or', 'not.and'):
+                negate = key.startswith('not.')
+                pred = _logic_predicate(key.split('.')[-1], value)
+                predicates.append((lambda p: (lambda row: not p(row)))(pred) if negate else pred)
+            else:
+                predicates.append(_column_predicate(key, value))
+        return [r for r in rows if all(p(r) for p in predicates)]
+
+    def _embed(self, table):
+        def resolve(target, row, select):
+            fk = row.get(EMBEDS[(table, target)])
+            match = next((r for r in self.tables.get(target, []) if r.get('id') == fk), None) if fk else None
+            return _project(match, select) if match else None
+        return resolve
+
+    @staticmethod
+    def _order_and_page(rows, params):
+        params = dict(params)
+        if 'order' in params:
+            for term in reversed(split_top_level(params['order'])):
+                bits = term.split('.')
+                column, desc = bits[0], 'desc' in bits[1:]
+                nulls_first = 'nullsfirst' in bits[1:] or ('nullslast' not in bits[1:] and desc)
+                present = [r for r in rows if r.get(column) is not None]
+                missing = [r for r in rows if r.get(column) is None]
+                present.sort(key=lambda r: r[column], reverse=desc)
+                rows = missing + present if nulls_first else present + missing
+        offset = int(params.get('offset', 0))
+        if 'limit' in params:
+            rows = rows[offset:offset + int(params['limit'])]
+        elif offset:
+            rows = rows[offset:]
+        return rows
+
+    def handle_table(self, method, table, params, body, prefer):
+        select = dict(params).get('select')
+        with self.lock:
+            if method in ('GET', 'HEAD'):
+                rows = self._order_and_page(self._filter_rows(table, params), params)
+                return 200, [_project(r, select, self._embed(table)) for r in rows]
+
+            if method == 'POST':
+                items = body if isinstance(body, list) else [body]
+                spec = TABLES.get(table, {'pk': ('id',)})
+                conflict = dict(params).get('on_conflict')
+                keys = tuple(conflict.split(',')) if conflict else spec['pk']
+                upsert = 'resolution=' in prefer
+                out = []
+                for item in items:
+                    existing = None
+                    if all(k in item for k in keys):
+                        existing = next((r for r in self.tables.setdefault(table, [])
+                                         if all(r.get(k) == item[k] for k in keys)), None)
+                    if existing is not None:
+                        if not upsert:
+                            return 409, {'code': '23505', 'message': 'duplicate key value violates unique constraint',
+                                         'details': None, 'hint': None}
+                        if 'ignore-duplicates' not in prefer:
+                            self.update(table, existing, item)
+                            out.append(existing)
+                        continue
+                    out.append(self.insert(table, item))
+                return 201, [_project(r, select, self._embed(table)) for r in out]
+
+            if method == 'PATCH':
+                rows = self._filter_rows(table, params)
+                for r in rows:
+                    self.update(table, r, body)
+                return 200, [_project(r, select, self._embed(table)) for r in rows]
+
+            if method == 'DELETE':
+                rows = self._filter_rows(table, params)
+                for r in rows:
+                    self.delete(table, r)
+                return 200, [_project(r, select, self._embed(table)) for r in rows]
+
+        return 405, {'message': 'method not allowed'}
+
+    # --- server ---------------------------------------------------------------
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self, port=0):
+        stub = self
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 256
+
+            def get_request(self):
+                conn = super().get_request()
+                with stub.lock:
+                    stub.connections_opened += 1
+                return conn
+
+        self._server = Server(('127.0.0.1', port), _make_handler(self))
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start() if self._server is None else self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _claims_from(headers):
+    """Reads (without verifying) the JWT claims from the Authorization header."""
+    auth = headers.get('Authorization', '')
+    token = auth.split(' ', 1)[1] if ' ' in auth else ''
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except (IndexError, ValueError):
+        return {}
+
+
+def _make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            # Headers and body go out in separate writes; without this Nagle adds ~40ms per response.
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if stub.connect_latency:
+                time.sleep(stub.connect_latency)
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload, extra_headers=None):
+            body = b'' if payload is None else json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for k, v in (extra_headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def _dispatch(self):
+            parts = urlsplit(self.path)
+            params = parse_qsl(parts.query, keep_blank_values=True)
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+            body = json.loads(raw) if raw else {}
+            prefer = self.headers.get('Prefer', '')
+
+            with stub.lock:
+                stub.requests += 1
+                key = f'{self.command} {parts.path}'
+                stub.calls[key] = stub.calls.get(key, 0) + 1
+            if stub.latency:
+                time.sleep(stub.latency)
+
+            path = parts.path
+            if path == '/auth/v1/user':
+                claims = _claims_from(self.headers)
+                if not claims.get('sub'):
+                    return self._send(401, {'msg': 'invalid JWT'})
+                return self._send(200, {'id': claims['sub'], 'email': claims.get('email'),
+                                        'aud': claims.get('aud', 'authenticated'), 'app_metadata': {},
+                                        'user_metadata': {}, 'created_at': now_iso()})
+
+            if path.startswith('/rest/v1/rpc/'):
+                name = path.rsplit('/', 1)[1]
+                fn = stub.rpcs.get(name)
+                if fn is None:
+                    return self._send(404, {'code': 'PGRST202', 'message': f'function {name} not found',
+                                            'details': None, 'hint': None})
+                args = dict(params) if self.command in ('GET', 'HEAD') else body
+                try:
+                    with stub.lock:
+                        result = fn(stub, args, _claims_from(self.headers).get('sub'))
+                except PgError as e:
+                    return self._send(e.status, {'code': e.code, 'message': e.message, 'details': None, 'hint': None})
+                return self._send(200, result)
+
+            if path.startswith('/rest/v1/'):
+                table = path[len('/rest/v1/'):]
+                status, payload = stub.handle_table(self.command, table, params, body, prefer)
+                if status < 300 and 'return=minimal' in prefer:
+                    return self._send(204 if self.command != 'POST' else 201, None)
+                if status < 300 and 'vnd.pgrst.object' in self.headers.get('Accept', ''):
+                    if len(payload) != 1:
+                        return self._send(406, {'code': 'PGRST116', 'details': f'The result contains {len(payload)} rows',
+                                                'hint': None, 'message': 'JSON object requested, multiple (or no) rows returned'})
+                    payload = payload[0]
+                return self._send(status, payload, {'Content-Range': f'0-{max(len(payload) - 1, 0)}/*'}
+                                  if isinstance(payload, list) else None)
+
+            return self._send(404, {'message': 'not found'})
+
+        do_GET = do_POST = do_PATCH = do_DELETE = do_HEAD = _dispatch
+
+    return Handler
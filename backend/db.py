@@ -0,0 +1,304 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from httpx import Headers
+import metrics
+
+# One keep-alive HTTP transport per worker process, shared by every request.
+# Per-request identity is applied by ScopedClient, which only copies headers.
+#
+# postgrest and supabase are imported where they are first needed: together they are about
+# half of the cold-start import time, and /api/health or a cached-token /api/me need neither.
+# supabase is only used for remote token verification (middleware.py).
+
+_pool = None
+_pool_lock = threading.Lock()
+_auth_client = None
+_fanout = None
+_async_pool = None
+
+
+def _session_options(key, size):
+    """httpx settings shared by the sync and async pools."""
+    return {
+        'headers': {'apikey': key, 'Authorization': f'Bearer {key}'},
+        'limits': httpx.Limits(
+            max_connections=size,
+            max_keepalive_connections=size,
+            keepalive_expiry=float(os.environ.get('SUPABASE_POOL_KEEPALIVE', 60))
+        ),
+        'timeout': float(os.environ.get('SUPABASE_HTTP_TIMEOUT', 30)),
+        'follow_redirects': True,
+    }
+
+
+class ClientPool:
+    """
+    Process-wide PostgREST client backed by a single httpx connection pool.
+    - SUPABASE_POOL_SIZE caps concurrent connections (and keep-alive slots).
+    - SUPABASE_POOL_KEEPALIVE is how long an idle connection is kept open (seconds).
+    """
+
+    def __init__(self, url, key):
+        from postgrest import SyncPostgrestClient
+
+        self.pid = os.getpid()
+        self.size = int(os.environ.get('SUPABASE_POOL_SIZE', 20))
+        self.created_at = time.time()
+        self.scoped_clients = 0
+        self.upstream_requests = 0
+        self._stats_lock = threading.Lock()
+
+        session = httpx.Client(
+            base_url=f"{url.rstrip('/')}/rest/v1",
+            event_hooks={'request': [self._on_request], 'response': [metrics.on_upstream_response]},
+            **_session_options(key, self.size)
+        )
+        self.client = SyncPostgrestClient(
+            f"{url.rstrip('/')}/rest/v1",
+            headers={'apikey': key, 'Authorization': f'Bearer {key}'},
+            http_client=session
+        )
+
+    def _on_request(self, request):
+        with self._stats_lock:
+            self.upstream_requests += 1
+        metrics.on_upstream_request(request)
+
+    def scoped(self, token):
+        with self._stats_lock:
+            self.scoped_clients += 1
+        return ScopedClient(self.client, token)
+
+    def open_connections(self):
+        # httpx does not expose pool state publicly; report it when the transport allows.
+        pool = getattr(getattr(self.client.session, '_transport', None), '_pool', None)
+        connections = getattr(pool, 'connections', None)
+        return len(connections) if connections is not None else None
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'pid': self.pid,
+                'pool_size': self.size,
+                'open_connections': self.open_connections(),
+                'scoped_clients': self.scoped_clients,
+                'upstream_requests': self.upstream_requests,
+                'uptime_seconds': round(time.time() - self.created_at, 1),
+            }
+
+    def close(self):
+        self.client.session.close()
+
+
+class ScopedClient:
+    """
+    Per-request view of the shared client: same connection pool, caller's JWT.
+    Constructing one costs a header copy, so get_db() can hand out a fresh one per request.
+    """
+
+    def __init__(self, base, token):
+        # Reuse PostgREST's own builders (sync or async, per base client);
+        # they only read session/base_url/headers/basic_auth.
+        self._builders = type(base)
+        self.session = base.session
+        self.base_url = base.base_url
+        self.basic_auth = None
+        self.headers = Headers(base.headers)
+        self.headers['Authorization'] = f'Bearer {token}'
+
+    def from_(self, table):
+        return self._builders.from_(self, table)
+
+    def table(self, table):
+        return self._builders.table(self, table)
+
+    def rpc(self, *args, **kwargs):
+        return self._builders.rpc(self, *args, **kwargs)
+
+
+class _BoundedAsyncClient(httpx.AsyncClient):
+    """
+    httpx.AsyncClient that admits at most `max_in_flight` requests at once.
+    httpcore rescans its whole wait queue against every connection each time a connection
+    frees up, which gets expensive when hundreds of coroutines queue on a small pool;
+    waiting on a semaphore instead keeps that queue empty.
+    """
+
+    def __init__(self, *args, max_in_flight, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+    async def send(self, request, **kwargs):
+        async with self._slots:
+            return await super().send(request, **kwargs)
+
+
+class AsyncClientPool:
+    """
+    ASGI counterpart of ClientPool (see asgi.py): one httpx.AsyncClient per worker process.
+    SUPABASE_ASYNC_POOL_SIZE caps connections and in-flight requests (callers beyond it wait). httpx async clients are bound to the event loop that created them,
+    so the pool is rebuilt if it is reached from a different loop (or after a fork).
+    """
+
+    def __init__(self, url, key):
+        from postgrest import AsyncPostgrestClient
+
+        self.pid = os.getpid()
+        self.loop = asyncio.get_running_loop()
+        # Smaller than the sync default: httpcore's per-request bookkeeping grows with the
+        # square of open connections, and one event loop rarely needs more than this in flight.
+        self.size = int(os.environ.get('SUPABASE_ASYNC_POOL_SIZE', 16))
+        self.created_at = time.time()
+        self.scoped_clients = 0
+        self.upstream_requests = 0
+
+        session = _BoundedAsyncClient(
+            base_url=f"{url.rstrip('/')}/rest/v1",
+            max_in_flight=self.size,
+            event_hooks={'request': [self._on_request], 'response': [self._on_response]},
+            **_session_options(key, self.size)
+        )
+        self.client = AsyncPostgrestClient(
+            f"{url.rstrip('/')}/rest/v1",
+            headers={'apikey': key, 'Authorization': f'Bearer {key}'},
+            http_client=session
+        )
+
+    async def _on_request(self, request):
+        # Single-threaded event loop: no lock needed.
+        self.upstream_requests += 1
+        metrics.on_upstream_request(request)
+
+    async def _on_response(self, response):
+        metrics.on_upstream_response(response)
+
+    def scoped(self, token):
+        self.scoped_clients += 1
+        # Builders return awaitable requests, since the base client is async.
+        return ScopedClient(self.client, token)
+
+    def stats(self):
+        return {
+            'pid': self.pid,
+            'pool_size': self.size,
+            'scoped_clients': self.scoped_clients,
+            'upstream_requests': self.upstream_requests,
+            'uptime_seconds': round(time.time() - self.created_at, 1),
+        }
+
+    async def aclose(self):
+        await self.client.session.aclose()
+
+
+def get_pool():
+    """Returns this worker's pool, rebuilding it after a fork (e.g. gunicorn --preload)."""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ClientPool(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+        return _pool
+
+
+def scoped_client(token):
+    return get_pool().scoped(token)
+
+
+def public_client():
+    """The pool's own client: anon key, no user JWT. For RPCs granted to anon (public pages)."""
+    return get_pool().client
+
+
+def service_client():
+    """
+    The pool with the service-role key (bypasses RLS), for batch jobs such as graph_engine.py;
+    never for request handling. None when SUPABASE_SERVICE_ROLE_KEY is not set.
+    """
+    key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
+    return get_pool().scoped(key) if key else None
+
+
+def get_async_pool():
+    """This worker's async pool; must be called from inside the server's event loop."""
+    global _async_pool
+    if _async_pool is None or _async_pool.pid != os.getpid() or _async_pool.loop is not asyncio.get_running_loop():
+        _async_pool = AsyncClientPool(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+    return _async_pool
+
+
+def async_scoped_client(token):
+    return get_async_pool().scoped(token)
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.aclose()
+        _async_pool = None
+
+
+def get_auth_client():
+    """Shared Supabase client for auth calls (get_user takes the JWT explicitly, so it is stateless)."""
+    global _auth_client
+    if _auth_client is None:
+        with _pool_lock:
+            if _auth_client is None:
+                from supabase import create_client
+                _auth_client = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+    return _auth_client
+
+
+def lazy_init_enabled():
+    """
+    LAZY_INIT=1 leaves client construction (and the postgrest import) to the first request
+    that needs it, which is what a serverless cold start wants. LAZY_INIT=0 builds the pool
+    when the app is imported, so a long-lived worker's first request does not pay for it.
+    Unset: lazy on Vercel (VERCEL is set in its runtime), eager elsewhere.
+    """
+    value = os.environ.get('LAZY_INIT')
+    if value is None:
+        return bool(os.environ.get('VERCEL'))
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def warm_up():
+    """Eager mode: builds this worker's pool up front. Skipped if Supabase is not configured."""
+    if os.environ.get("SUPABASE_URL") and os.environ.get("SUPABASE_KEY"):
+        get_pool()
+
+
+def get_pool_stats():
+    stats = _pool.stats() if _pool is not None else {}
+    stats['initialized'] = _pool is not None
+    if _async_pool is not None:
+        stats['async'] = _async_pool.stats()
+    return stats
+
+
+def run_concurrently(*calls):
+    """
+    Runs independent upstream calls (zero-argument callables) in parallel on a shared
+    thread pool and returns their results in order. The first exception is re-raised.
+    Callables run outside the Flask request context, so they must not touch `g`;
+    they do inherit contextvars, so their upstream calls are attributed to the request (metrics.py).
+    """
+    global _fanout
+    if len(calls) == 1:
+        return [calls[0]()]
+    if _fanout is None:
+        with _pool_lock:
+            if _fanout is None:
+                _fanout = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get('UPSTREAM_FANOUT_WORKERS', 16)),
+                    thread_name_prefix='pledge-upstream'
+                )
+    # One context copy per call: a Context cannot be entered by two threads at once.
+    futures = [_fanout.submit(contextvars.copy_context().run, call) for call in calls]
+    return [f.result() for f in futures]
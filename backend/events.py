@@ -0,0 +1,291 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+import applog
+
+# Per-user change feed behind GET /api/events (server-sent events, served natively by asgi.py).
+#
+# change_events.sql appends one row per affected user for every receipt, connection and
+# message change. Each worker keeps one UserFeed per connected user, however many tabs that
+# user has open: it polls the user's queue for rows after the last id it delivered and fans
+# them out to the user's streams. A poll is one small indexed read, and it is skipped
+# entirely for users who are not connected. Local writes call notify() so the poll runs
+# immediately instead of at the next tick.
+#
+# Sequence ids are not handed out in commit order, so a feed re-reads ids it delivered in the
+# last EVENTS_SETTLE seconds (deduplicated) before moving its floor past them.
+
+log = applog.get_logger('events')
+
+EVENT_COLUMNS = 'id, kind, op, row_id, data, created_at'
+
+# Queue sentinels: the stream ends after telling the client why.
+RESET = 'reset'          # the client fell behind; it re-syncs through /api/bootstrap?since=
+RECONNECT = 'reconnect'  # token expired or the stream hit its maximum age
+
+
+def _setting(name, default):
+    return float(os.environ.get(name, default))
+
+
+class FeedAuthError(Exception):
+    """The subscriber's JWT was rejected upstream; its streams must reconnect with a fresh one."""
+
+
+class PostgrestChangeSource:
+    """Reads change_events through PostgREST with the subscriber's own JWT (RLS limits it to their rows)."""
+
+    @staticmethod
+    def _query(token):
+        from db import async_scoped_client
+        return async_scoped_client(token).table('change_events')
+
+    async def _execute(self, query):
+        from postgrest import APIError
+        try:
+            return (await query.execute()).data or []
+        except APIError as e:
+            if str(e.code or '').startswith('PGRST3'):
+                raise FeedAuthError(e.message)
+            raise
+
+    async def head(self, user_id, token):
+        rows = await self._execute(self._query(token).select('id').eq('user_id', user_id).order('id', desc=True).limit(1))
+        return rows[0]['id'] if rows else 0
+
+    async def fetch(self, user_id, token, after, limit):
+        return await self._execute(
+            self._query(token).select(EVENT_COLUMNS).eq('user_id', user_id).gt('id', after).order('id').limit(limit)
+        )
+
+
+def format_sse(event, data=None, event_id=None, retry_ms=None):
+    lines = []
+    if retry_ms is not None:
+        lines.append(f'retry: {int(retry_ms)}')
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f"data: {json.dumps(data if data is not None else {}, separators=(',', ':'), default=str)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """One open stream. Events are buffered in a bounded queue; overflowing it ends the stream with RESET."""
+
+    def __init__(self, hub, user_id, maxsize):
+        self.hub = hub
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize)
+        self.closed = False
+
+    def push(self, item):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.close(RESET)
+            self.hub.overflows += 1
+
+    def close(self, reason):
+        """Ends the stream with `reason`, dropping whatever it had not sent yet."""
+        if self.closed:
+            return
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(reason)
+        self.hub.unsubscribe(self)
+
+    async def stream(self):
+        """Yields the SSE body: `ready`, then `change` events, keep-alive comments, and a final reason."""
+        hub = self.hub
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + hub.max_stream_age
+        try:
+            yield format_sse('ready', {'poll_interval': hub.poll_interval}, retry_ms=hub.retry_ms)
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    yield format_sse(RECONNECT)
+                    return
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), min(hub.keepalive, remaining))
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                if item in (RESET, RECONNECT):
+                    yield format_sse(item)
+                    return
+                yield format_sse('change', item, event_id=item['id'])
+        finally:
+            self.closed = True
+            hub.unsubscribe(self)
+
+
+class UserFeed:
+    """The poller shared by one user's streams."""
+
+    def __init__(self, hub, user_id, token, head):
+        self.hub = hub
+        self.user_id = user_id
+        self.token = token
+        self.subscribers = set()
+        self.wake = asyncio.Event()
+        self.floor = head   # every id <= floor is delivered and settled
+        self.recent = {}    # id -> monotonic time first delivered, for ids above the floor
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        failures = 0
+        while self.subscribers:
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.hub.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            if not self.subscribers:
+                break
+            try:
+                await self.poll()
+                failures = 0
+            except FeedAuthError:
+                log.info('Change feed token rejected, closing streams', extra={'user_id': self.user_id})
+                for sub in list(self.subscribers):
+                    sub.close(RECONNECT)
+            except Exception as e:
+                failures += 1
+                self.hub.poll_errors += 1
+                log.warning('Change feed poll failed', extra={'user_id': self.user_id, 'error': str(e)})
+                await asyncio.sleep(min(self.hub.poll_interval * 2 ** failures, 30))
+        self.hub.drop_feed(self)
+
+    async def poll(self):
+        hub = self.hub
+        hub.polls += 1
+        limit = hub.batch_size + len(self.recent)
+        rows = await hub.source.fetch(self.user_id, self.token, self.floor, limit)
+        now = time.monotonic()
+        for row in rows:
+            if row['id'] in self.recent:
+                continue
+            self.recent[row['id']] = now
+            hub.delivered += 1
+            for sub in list(self.subscribers):
+                sub.push(row)
+
+        # Ids visible for longer than the settle window are final: nothing below them can still commit.
+        settled = [i for i, seen in self.recent.items() if now - seen >= hub.settle]
+        if settled:
+            self.floor = max(self.floor, max(settled))
+            self.recent = {i: seen for i, seen in self.recent.items() if i > self.floor}
+        if len(rows) >= limit:
+            self.wake.set()  # more queued than one batch; keep draining
+
+
+class ChangeHub:
+    """All feeds of one worker. Bound to the event loop that created it (see get_hub)."""
+
+    def __init__(self, source=None):
+        self.source = source or _source or PostgrestChangeSource()
+        self.loop = asyncio.get_running_loop()
+        self.poll_interval = _setting('EVENTS_POLL_INTERVAL', 2)
+        self.settle = _setting('EVENTS_SETTLE', 5)
+        self.keepalive = _setting('EVENTS_KEEPALIVE', 15)
+        self.max_stream_age = _setting('EVENTS_MAX_STREAM_AGE', 600)
+        self.retry_ms = _setting('EVENTS_RETRY_MS', 3000)
+        self.batch_size = int(_setting('EVENTS_BATCH_SIZE', 100))
+        self.queue_size = int(_setting('EVENTS_QUEUE_SIZE', 256))
+        self.feeds = {}
+        self.polls = 0
+        self.poll_errors = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    async def subscribe(self, user_id, token):
+        feed = self.feeds.get(user_id)
+        if feed is None:
+            head = await self.source.head(user_id, token)
+            # Another stream for the same user may have created the feed while we awaited.
+            feed = self.feeds.get(user_id)
+            if feed is None:
+                feed = self.feeds[user_id] = UserFeed(self, user_id, token, head)
+                feed.start()
+        feed.token = token  # the newest stream carries the freshest JWT
+        sub = Subscription(self, user_id, self.queue_size)
+        feed.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        feed = self.feeds.get(sub.user_id)
+        if feed is not None:
+            feed.subscribers.discard(sub)
+            if not feed.subscribers:
+                feed.wake.set()  # lets the poller notice and exit
+
+    def drop_feed(self, feed):
+        if self.feeds.get(feed.user_id) is feed:
+            del self.feeds[feed.user_id]
+
+    def nudge(self, *user_ids):
+        for user_id in user_ids:
+            feed = self.feeds.get(user_id)
+            if feed is not None:
+                feed.wake.set()
+
+    def stats(self):
+        return {
+            'users': len(self.feeds),
+            'streams': sum(len(f.subscribers) for f in self.feeds.values()),
+            'polls': self.polls,
+            'poll_errors': self.poll_errors,
+            'delivered': self.delivered,
+            'overflows': self.overflows,
+        }
+
+
+_hub = None
+_hub_lock = threading.Lock()
+_source = None
+
+
+def use_source(source):
+    """Reads changes from `source` instead of PostgREST in hubs created after this call (benchmarks)."""
+    global _source
+    _source = source
+
+
+def get_hub(source=None):
+    """This worker's hub; must be called from inside the server's event loop."""
+    global _hub
+    loop = asyncio.get_running_loop()
+    with _hub_lock:
+        if _hub is None or _hub.loop is not loop:
+            _hub = ChangeHub(source)
+        return _hub
+
+
+def notify(*user_ids):
+    """
+    Wakes the feeds of these users now instead of at their next poll. Safe to call from any
+    thread (Flask routes run on a2wsgi's pool in ASGI mode); a no-op when no hub is running.
+    """
+    hub = _hub
+    user_ids = [u for u in user_ids if u]
+    if hub is None or not user_ids or hub.loop.is_closed():
+        return
+    try:
+        hub.loop.call_soon_threadsafe(hub.nudge, *user_ids)
+    except RuntimeError:
+        pass  # loop shut down between the check and the call
+
+
+def stats():
+    return _hub.stats() if _hub is not None else None
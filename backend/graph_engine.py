@@ -0,0 +1,297 @@
+"""
+Batch engine for user_graph_metrics (graph_metrics.sql): degree, weighted degree and a
+PageRank "trust score" over the accepted-connection graph.
+
+    cd backend && python -m graph_engine              # one full pass
+    cd backend && python -m graph_engine --watch 60   # full pass, then a refresh every 60s
+
+Needs SUPABASE_SERVICE_ROLE_KEY: it reads every accepted connection and writes metrics rows.
+
+The first pass loads all edges; later passes in the same process read only connections whose
+updated_at moved (receipt_weight changes touch the edge) and new connection tombstones, warm-
+start PageRank from the previous scores, and upsert only rows whose metrics changed.
+
+updated_at is NOW() at transaction start and tombstone ids come from a sequence, so neither is
+in commit order. Connections are re-read from SYNC_CURSOR_SKEW behind the watermark, and
+tombstones seen in the last SYNC_CURSOR_SKEW seconds are re-read before the mark moves past
+them (as the change feed settles ids in events.py). Re-applying either is idempotent.
+"""
+import argparse
+import os
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from operator import mul
+
+import applog
+from utils.pagination import keyset_page, rewind
+
+log = applog.get_logger('graph_engine')
+
+PAGE_SIZE = 1000       # PostgREST's default max rows per response
+WRITE_CHUNK = 500
+SCORE_DIGITS = 4
+# PageRank is global: one new edge nudges every score a little. Stored scores are rewritten only
+# when they move at least this much (the average user scores 1.0), so an incremental pass writes
+# the neighbourhood of the change rather than the whole table.
+SCORE_TOLERANCE = 0.005
+METRIC_COLUMNS = ('degree', 'weighted_degree', 'trust_score')
+
+
+class CSRGraph:
+    """
+    Undirected weighted graph in compressed sparse row form. Node i's neighbours are
+    indices[indptr[i]:indptr[i + 1]], with the matching edge weights in weights[...].
+    Each undirected edge is stored twice, once per endpoint.
+    """
+
+    __slots__ = ('size', 'indptr', 'indices', 'weights')
+
+    def __init__(self, size, edges):
+        """edges: list of (i, j, weight) with i != j, each undirected edge once."""
+        counts = [0] * (size + 1)
+        for i, j, _ in edges:
+            counts[i + 1] += 1
+            counts[j + 1] += 1
+        for i in range(size):
+            counts[i + 1] += counts[i]
+        self.size = size
+        self.indptr = array('q', counts)
+        self.indices = array('q', bytes(8 * counts[size]))
+        self.weights = array('d', bytes(8 * counts[size]))
+        fill = counts[:size]
+        for i, j, w in edges:
+            for a, b in ((i, j), (j, i)):
+                k = fill[a]
+                self.indices[k] = b
+                self.weights[k] = w
+                fill[a] = k + 1
+
+    def degree(self, i):
+        return self.indptr[i + 1] - self.indptr[i]
+
+    def strength(self, i):
+        return sum(self.weights[self.indptr[i]:self.indptr[i + 1]])
+
+    def pagerank(self, damping=0.85, tolerance=1e-6, max_iterations=100, start=None):
+        """
+        Weighted PageRank: each node splits its rank across its edges in proportion to weight.
+        `start` warm-starts from a previous vector. Returns (ranks summing to 1, iterations run).
+        """
+        n = self.size
+        if n == 0:
+            return [], 0
+        ranks = list(start) if start is not None else [1.0 / n] * n
+        total = sum(ranks)
+        ranks = [r / total for r in ranks]
+        strengths = [self.strength(i) for i in range(n)]
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        base = (1.0 - damping) / n
+        iteration = 0
+        for iteration in range(1, max_iterations + 1):
+            share = [r / s if s else 0.0 for r, s in zip(ranks, strengths)]
+            leaked = base + damping * sum(r for r, s in zip(ranks, strengths) if not s) / n
+            pick = share.__getitem__
+            updated = [
+                leaked + damping * sum(map(mul, map(pick, indices[indptr[i]:indptr[i + 1]]), weights[indptr[i]:indptr[i + 1]]))
+                for i in range(n)
+            ]
+            delta = sum(abs(a - b) for a, b in zip(updated, ranks))
+            ranks = updated
+            if delta < tolerance:
+                break
+        return ranks, iteration
+
+
+def _differs(stored, fresh):
+    if stored is None:
+        return True
+    return (stored['degree'] != fresh['degree'] or stored['weighted_degree'] != fresh['weighted_degree']
+            or abs(stored['trust_score'] - fresh['trust_score']) >= SCORE_TOLERANCE)
+
+
+class GraphEngine:
+    """
+    Keeps the accepted-connection graph in memory between refreshes and writes metrics to
+    user_graph_metrics. An edge weighs 1 for the connection plus its accepted receipts
+    (connections.receipt_weight).
+    """
+
+    def __init__(self, damping=0.85, tolerance=1e-6, max_iterations=100, skew=None):
+        self.damping = damping
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        # How long a writing transaction may stay open; see the module docstring.
+        self.skew = skew if skew is not None else float(os.environ.get('SYNC_CURSOR_SKEW', 5))
+        self.edges = {}             # (low_id, high_id) -> receipt_weight, accepted edges only
+        self.edge_keys = {}         # connection id -> (low_id, high_id), to resolve tombstones
+        self.watermark = None       # max connections.updated_at applied
+        self.tombstone_mark = None  # every sync_tombstones.id <= this is applied and settled
+        self.recent_tombstones = {}  # id -> monotonic time first applied, for ids above the mark
+        self.ranks = {}             # user_id -> PageRank from the previous pass (warm start)
+        self.written = None         # user_id -> metrics as stored; None until read
+        self.last_pass = {}         # timings and counts of the latest sync(), for logs and benchmarks
+
+    # --- reading --------------------------------------------------------------
+
+    def _apply(self, rows):
+        changed = 0
+        for r in rows:
+            key = (r['low_id'], r['high_id'])
+            if r.get('accepted'):
+                weight = r.get('receipt_weight') or 0
+                if self.edges.get(key) != weight:
+                    self.edges[key] = weight
+                    changed += 1
+                self.edge_keys[r['id']] = key
+            elif self.edges.pop(key, None) is not None:
+                changed += 1
+            if self.watermark is None or r['updated_at'] > self.watermark:
+                self.watermark = r['updated_at']
+        return changed
+
+    def _apply_tombstones(self, client):
+        changed, last = 0, self.tombstone_mark
+        now = time.monotonic()
+        while True:
+            rows = (client.table('sync_tombstones').select('id, row_id').eq('table_name', 'connections')
+                    .gt('id', last).order('id').limit(PAGE_SIZE).execute().data or [])
+            for r in rows:
+                last = r['id']
+                if r['id'] in self.recent_tombstones:
+                    continue
+                self.recent_tombstones[r['id']] = now
+                key = self.edge_keys.pop(r['row_id'], None)
+                if key is not None and self.edges.pop(key, None) is not None:
+                    changed += 1
+            if len(rows) < PAGE_SIZE:
+                break
+        # Ids visible for longer than the skew are final: nothing below them can still commit.
+        settled = [i for i, seen in self.recent_tombstones.items() if now - seen >= self.skew]
+        if settled:
+            self.tombstone_mark = max(self.tombstone_mark, max(settled))
+            self.recent_tombstones = {i: seen for i, seen in self.recent_tombstones.items() if i > self.tombstone_mark}
+        return changed
+
+    def refresh(self, client):
+        """Pulls edges changed since the last call (all of them on the first). Returns how many changed."""
+        if self.tombstone_mark is None:
+            # Connections deleted before the first load are simply absent from it. Tombstones from
+            # the last few seconds are left above the mark: a delete still in flight may take a
+            # lower id, and re-applying one that the load already reflects is a no-op.
+            cutoff = (datetime.now(timezone.utc) - timedelta(seconds=self.skew)).isoformat()
+            last = (client.table('sync_tombstones').select('id').lt('deleted_at', cutoff)
+                    .order('id', desc=True).limit(1).execute().data)
+            self.tombstone_mark = last[0]['id'] if last else 0
+        watermark = self.watermark
+        changed, cursor = 0, None
+        while True:
+            # Query builders collect filters in place, so each page starts from a fresh one.
+            query = client.table('connections').select('id, low_id, high_id, accepted, receipt_weight, updated_at')
+            if watermark is not None:
+                # Rows a transaction committed late carry an older stamp; re-applying the rest is idempotent.
+                query = query.gte('updated_at', rewind(watermark, timedelta(seconds=self.skew)))
+            rows, cursor = keyset_page(query, 'updated_at', cursor, PAGE_SIZE, desc=False)
+            changed += self._apply(rows)
+            if cursor is None:
+                break
+        return changed + self._apply_tombstones(client)
+
+    def _read_written(self, client):
+        """The stored metrics, so a restarted engine only rewrites rows that differ."""
+        self.written, last = {}, None
+        while True:
+            query = client.table('user_graph_metrics').select('user_id, ' + ', '.join(METRIC_COLUMNS))
+            if last is not None:
+                query = query.gt('user_id', last)
+            rows = query.order('user_id').limit(PAGE_SIZE).execute().data or []
+            for r in rows:
+                self.written[r['user_id']] = {c: r[c] for c in METRIC_COLUMNS}
+                last = r['user_id']
+            if len(rows) < PAGE_SIZE:
+                return
+
+    # --- computing ------------------------------------------------------------
+
+    def compute(self):
+        """user_id -> metrics for every user with at least one accepted connection."""
+        users = sorted({u for key in self.edges for u in key})
+        index = {u: i for i, u in enumerate(users)}
+        graph = CSRGraph(len(users), [(index[a], index[b], 1.0 + w) for (a, b), w in self.edges.items()])
+
+        start = None
+        if self.ranks and users:
+            known = [self.ranks.get(u) for u in users]
+            fallback = 1.0 / len(users)
+            start = [r if r is not None else fallback for r in known]
+        ranks, self.last_pass['iterations'] = graph.pagerank(self.damping, self.tolerance, self.max_iterations, start)
+        self.ranks = dict(zip(users, ranks))
+
+        metrics = {
+            u: {
+                'degree': graph.degree(i),
+                'weighted_degree': int(round(graph.strength(i))) - graph.degree(i),
+                'trust_score': round(ranks[i] * len(users), SCORE_DIGITS),  # average user = 1.0
+            }
+            for u, i in index.items()
+        }
+        return metrics
+
+    def sync(self, client):
+        """One pass: refresh edges, recompute if anything changed, write changed rows. Returns rows written."""
+        started = time.perf_counter()
+        self.last_pass = {'edges_changed': self.refresh(client), 'iterations': 0, 'rows_written': 0}
+        if self.written is None:
+            self._read_written(client)
+        elif not self.last_pass['edges_changed']:
+            self.last_pass['seconds'] = round(time.perf_counter() - started, 3)
+            return 0
+        read = time.perf_counter()
+        metrics = self.compute()
+        self.last_pass['compute_seconds'] = round(time.perf_counter() - read, 3)
+        # Users who lost their last connection drop back to zero.
+        for user_id in self.written.keys() - metrics.keys():
+            metrics[user_id] = {'degree': 0, 'weighted_degree': 0, 'trust_score': 0}
+
+        stamp = datetime.now(timezone.utc).isoformat()
+        rows = [{'user_id': u, **m, 'computed_at': stamp} for u, m in metrics.items() if _differs(self.written.get(u), m)]
+        for i in range(0, len(rows), WRITE_CHUNK):
+            client.table('user_graph_metrics').upsert(rows[i:i + WRITE_CHUNK], on_conflict='user_id').execute()
+        for r in rows:
+            self.written[r['user_id']] = {c: r[c] for c in METRIC_COLUMNS}
+        self.last_pass.update(users=len(metrics), edges=len(self.edges), rows_written=len(rows),
+                              seconds=round(time.perf_counter() - started, 3))
+        log.info('Graph metrics written', extra=self.last_pass)
+        return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute user_graph_metrics')
+    parser.add_argument('--watch', type=float, default=0, help='keep running, refreshing every N seconds')
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    # One summary line per pass: keep every INFO record rather than sampling like a web worker.
+    os.environ.setdefault('LOG_SAMPLE_RATE', '1')
+    applog.setup()
+    from db import service_client
+    client = service_client()
+    if client is None:
+        raise SystemExit('SUPABASE_SERVICE_ROLE_KEY is not set')
+
+    engine = GraphEngine()
+    while True:
+        try:
+            engine.sync(client)
+        except Exception:
+            if not args.watch:
+                raise
+            log.exception('Graph metrics pass failed')
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    main()
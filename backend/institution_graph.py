@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from datetime import timedelta
+from utils.cache import TTLCache
+from utils.pagination import rewind
+
+
+class InstitutionGraphCache:
+    """
+    Keeps the institution exchange graph in memory and serves pre-serialized payloads.
+    - The edge map is refreshed incrementally: only institution_relationships rows whose
+      last_updated advanced since the previous refresh (less SYNC_CURSOR_SKEW, for upserts
+      whose transaction committed late) are fetched and merged.
+    - Node stats (given/received) are adjusted by each edge's delta, never recomputed from scratch.
+    - Rendered JSON (plain + gzip) is memoized per pruning variant until the data changes.
+    """
+
+    def __init__(self):
+        self.version = None         # max(last_updated) seen so far
+        self.edges = {}             # (from_institution, to_institution) -> exchange_count
+        self.nodes = {}             # institution -> {'id', 'label', 'stats': {'given', 'received'}}
+        self._lock = threading.Lock()
+        self._renders = {}          # (min_weight, top_k) -> (body, gzipped, etag)
+        # How often the upstream version is probed; between probes the cached graph is served as-is.
+        self._probe = TTLCache(maxsize=1, ttl=float(os.environ.get('GRAPH_VERSION_TTL', 5)))
+        # last_updated is NOW() at transaction start: an upsert committing after a later-stamped
+        # one carries a stamp below self.version. Each refresh re-reads this far back.
+        self.skew = timedelta(seconds=float(os.environ.get('SYNC_CURSOR_SKEW', 5)))
+
+    def _apply(self, rows):
+        for r in rows:
+            key = (r['from_institution'], r['to_institution'])
+            count = max(r.get('exchange_count') or 0, 0)
+            delta = count - self.edges.get(key, 0)
+            if count > 0:
+                self.edges[key] = count
+            else:
+                self.edges.pop(key, None)
+            if delta:
+                src, tgt = key
+                for inst in key:
+                    if inst not in self.nodes:
+                        self.nodes[inst] = {'id': inst, 'label': inst, 'stats': {'given': 0, 'received': 0}}
+                self.nodes[src]['stats']['given'] += delta
+                self.nodes[tgt]['stats']['received'] += delta
+            if r.get('last_updated') and (self.version is None or r['last_updated'] > self.version):
+                self.version = r['last_updated']
+
+    def refresh(self, client):
+        """Pulls changed rows if the upstream version advanced. Returns True if the graph changed."""
+        if self._probe.get('fresh'):
+            return False
+        with self._lock:
+            if self._probe.get('fresh'):
+                return False
+            query = client.table('institution_relationships').select('from_institution, to_institution, exchange_count, last_updated')
+            if self.version is not None:
+                # Rows re-read inside the skew window are re-applied, which is idempotent (counts are absolute).
+                query = query.gte('last_updated', rewind(self.version, self.skew))
+            rows = query.execute().data or []
+            before = dict(self.edges)
+            self._apply(rows)
+            changed = self.edges != before
+            if changed:
+                self._renders = {}
+            self._probe.set('fresh', True)
+            return changed
+
+    def _links(self, min_weight, top_k):
+        links = [(src, tgt, count) for (src, tgt), count in self.edges.items() if count >= min_weight]
+        if top_k:
+            # Keep an edge if it is among the top_k heaviest edges of either endpoint.
+            per_node = {}
+            for link in links:
+                per_node.setdefault(link[0], []).append(link)
+                per_node.setdefault(link[1], []).append(link)
+            keep = set()
+            for node_links in per_node.values():
+                node_links.sort(key=lambda l: l[2], reverse=True)
+                keep.update(node_links[:top_k])
+            links = [l for l in links if l in keep]
+        return links
+
+    def render(self, min_weight=1, top_k=None):
+        """Returns (json_bytes, gzip_bytes, etag) for the requested pruning."""
+        key = (min_weight, top_k)
+        with self._lock:
+            cached = self._renders.get(key)
+            if cached is not None:
+                return cached
+
+            links = self._links(min_weight, top_k)
+            if min_weight > 1 or top_k:
+                used = {inst for src, tgt, _ in links for inst in (src, tgt)}
+                nodes = [n for inst, n in self.nodes.items() if inst in used]
+            else:
+                nodes = [n for n in self.nodes.values() if n['stats']['given'] or n['stats']['received']]
+
+            body = json.dumps({
+                'success': True,
+                'nodes': nodes,
+                'links': [{'source': src, 'target': tgt, 'value': count} for src, tgt, count in links]
+            }, separators=(',', ':')).encode()
+            cached = (body, gzip.compress(body, compresslevel=6), hashlib.sha1(body).hexdigest())
+            self._renders[key] = cached
+            return cached
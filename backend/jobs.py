@@ -0,0 +1,39 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from applog import get_logger
+
+log = get_logger('jobs')
+
+# Small in-process job runner for work that should not hold up the HTTP response.
+# Jobs must be idempotent: a failed attempt is simply run again (with backoff).
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get('JOB_WORKERS', 2)),
+            thread_name_prefix='pledge-job'
+        )
+    return _executor
+
+
+def run_with_retry(name, fn, *args, retries=3, backoff=0.5):
+    """Runs fn(*args), retrying with exponential backoff. Returns its result, or None if every attempt failed."""
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt == retries:
+                log.exception('Job failed', extra={'job': name, 'attempts': retries + 1})
+                return None
+            log.warning('Job attempt failed, retrying', extra={'job': name, 'attempt': attempt + 1, 'error': str(e)})
+            time.sleep(backoff * (2 ** attempt))
+
+
+def submit(name, fn, *args, retries=3, backoff=0.5):
+    """Queues fn(*args) on the background pool. Returns the Future."""
+    return _get_executor().submit(run_with_retry, name, fn, *args, retries=retries, backoff=backoff)
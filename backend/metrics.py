@@ -0,0 +1,170 @@
+import bisect
+import contextvars
+import threading
+import time
+
+# In-process request instrumentation, rendered in the Prometheus text format by /api/metrics.
+# Every worker process keeps its own registry; scrape each worker (or sum in the query).
+#
+# Per request we track total latency, time spent verifying the token (auth) and, through the
+# httpx event hooks in db.py, the number and duration of PostgREST calls made on its behalf.
+# The per-request tally lives in a ContextVar, so it follows the request into
+# db.run_concurrently threads and asyncio tasks; background jobs are not attributed to it.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a fixed tuple of label names."""
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def totals(self):
+        """{label values: (sum, count)} for every series observed so far."""
+        with self._lock:
+            return {k: (v[-2], v[-1]) for k, v in self._series.items()}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = sorted((k, list(v)) for k, v in self._series.items())
+        for label_values, series in snapshot:
+            base = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            sep = ',' if base else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {series[-1]}')
+            suffix = f'{{{base}}}' if base else ''
+            lines.append(f'{self.name}_sum{suffix} {series[-2]:.6f}')
+            lines.append(f'{self.name}_count{suffix} {series[-1]}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    'pledge_request_duration_seconds', 'End-to-end request latency.', ('route', 'method', 'code'))
+HANDLER_SECONDS = Histogram(
+    'pledge_handler_duration_seconds', 'Request latency excluding token verification.', ('route', 'method'))
+AUTH_SECONDS = Histogram(
+    'pledge_auth_duration_seconds', 'Time spent resolving the bearer token.', ('result',))
+UPSTREAM_SECONDS = Histogram(
+    'pledge_upstream_duration_seconds', 'Duration of each PostgREST call (until response headers).',
+    ('target', 'method', 'code'))
+UPSTREAM_CALLS = Histogram(
+    'pledge_request_upstream_calls', 'PostgREST calls made while serving one request.', ('route',), COUNT_BUCKETS)
+UPSTREAM_TIME = Histogram(
+    'pledge_request_upstream_seconds', 'Summed PostgREST call time within one request.', ('route',))
+
+REGISTRY = (REQUEST_SECONDS, HANDLER_SECONDS, AUTH_SECONDS, UPSTREAM_SECONDS, UPSTREAM_CALLS, UPSTREAM_TIME)
+
+
+class RequestStats:
+    __slots__ = ('started', 'auth_seconds', 'upstream_calls', 'upstream_seconds', '_lock')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.auth_seconds = 0.0
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_upstream(self, seconds):
+        # Concurrent fan-out threads report into the same request.
+        with self._lock:
+            self.upstream_calls += 1
+            self.upstream_seconds += seconds
+
+
+_current = contextvars.ContextVar('pledge_request_stats', default=None)
+
+
+def begin_request():
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def current():
+    return _current.get()
+
+
+def finish_request(route, method, status):
+    """Records the request's histograms and returns a summary dict (for the request log), or None."""
+    stats = _current.get()
+    if stats is None:
+        return None
+    _current.set(None)
+    total = time.perf_counter() - stats.started
+    REQUEST_SECONDS.observe(total, route, method, str(status))
+    HANDLER_SECONDS.observe(max(total - stats.auth_seconds, 0.0), route, method)
+    UPSTREAM_CALLS.observe(stats.upstream_calls, route)
+    UPSTREAM_TIME.observe(stats.upstream_seconds, route)
+    return {
+        'route': route,
+        'method': method,
+        'status': status,
+        'duration_ms': round(total * 1000, 2),
+        'auth_ms': round(stats.auth_seconds * 1000, 2),
+        'upstream_calls': stats.upstream_calls,
+        'upstream_ms': round(stats.upstream_seconds * 1000, 2),
+    }
+
+
+def record_auth(seconds, result):
+    AUTH_SECONDS.observe(seconds, result)
+    stats = _current.get()
+    if stats is not None:
+        stats.auth_seconds += seconds
+
+
+def upstream_target(path):
+    """'/rest/v1/receipts' -> 'receipts', '/rest/v1/rpc/claim_receipt_rpc' -> 'rpc/claim_receipt_rpc'."""
+    return path.split('/rest/v1/', 1)[-1].strip('/') or '/'
+
+
+# httpx event hooks (db.py). The start time rides on the request's extensions dict.
+
+def on_upstream_request(request):
+    request.extensions['pledge_started'] = time.perf_counter()
+
+
+def on_upstream_response(response):
+    started = response.request.extensions.get('pledge_started')
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    request = response.request
+    UPSTREAM_SECONDS.observe(seconds, upstream_target(request.url.path), request.method, str(response.status_code))
+    stats = _current.get()
+    if stats is not None:
+        stats.add_upstream(seconds)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
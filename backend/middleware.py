@@ -1,7 +1,184 @@
 from functools import wraps
 from flask import request, jsonify, g
-from supabase import create_client, Client
+import hashlib
 import os
+import threading
+import time
+import jwt
+from utils.cache import TTLCache
+from utils import ratelimit
+from db import get_auth_client
+from applog import get_logger
+import metrics
+
+log = get_logger('auth')
+
+# Settings are read lazily because app.py loads .env after importing this module.
+# AUTH_VERIFY_MODE:
+# - 'local'  : verify the JWT signature in-process (SUPABASE_JWT_SECRET or the project JWKS)
+# - 'remote' : ask Supabase Auth via get_user() on every cache miss (previous behaviour)
+# - 'auto'   : local when key material is available, remote otherwise
+def _auth_mode():
+    return os.environ.get('AUTH_VERIFY_MODE', 'auto').lower()
+
+# Verified tokens, keyed by sha256(token). Entries never outlive the token's own `exp`.
+_token_cache = None
+_stats = {'local_verifications': 0, 'remote_verifications': 0, 'rejected': 0}
+_stats_lock = threading.Lock()
+_jwks_client = None
+
+# Algorithms accepted per key source: the shared secret signs HS256 only, the JWKS holds asymmetric keys.
+HMAC_ALGORITHMS = ['HS256']
+JWKS_ALGORITHMS = ['RS256', 'ES256']
+
+
+class AuthUser:
+    """
+    Minimal stand-in for the Supabase `User` object, built from verified JWT claims.
+    Exposes the attributes the routes rely on (id, email, aud).
+    """
+
+    def __init__(self, claims):
+        self.id = claims['sub']
+        self.email = claims.get('email') or ''
+        self.aud = claims.get('aud')
+        self.role = claims.get('role')
+        self.app_metadata = claims.get('app_metadata') or {}
+        self.user_metadata = claims.get('user_metadata') or {}
+
+
+def _get_token_cache():
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = TTLCache(
+            maxsize=int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000)),
+            ttl=float(os.environ.get('AUTH_TOKEN_CACHE_TTL', 300))
+        )
+    return _token_cache
+
+
+def _bump(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def get_auth_stats():
+    """Token cache hit/miss counters plus how many verifications ran locally vs remotely."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['mode'] = _auth_mode()
+    stats['cache'] = _get_token_cache().stats()
+    return stats
+
+
+def _get_jwks_client():
+    global _jwks_client
+    if _jwks_client is None:
+        url = os.environ.get("SUPABASE_URL")
+        if not url:
+            return None
+        # PyJWKClient caches the key set itself; lifespan bounds how often it refetches.
+        _jwks_client = jwt.PyJWKClient(
+            f"{url.rstrip('/')}/auth/v1/.well-known/jwks.json",
+            cache_keys=True,
+            lifespan=int(os.environ.get('AUTH_JWKS_TTL', 600))
+        )
+    return _jwks_client
+
+
+def _verify_locally(token):
+    """
+    Verifies signature, expiry and audience without leaving the process.
+    Returns (user, exp), or None when no key material is available for this token.
+    Raises jwt.InvalidTokenError if the token is bad.
+    The accepted algorithms are pinned per key source; the token header only picks the source.
+    """
+    alg = jwt.get_unverified_header(token).get('alg')
+
+    if alg in HMAC_ALGORITHMS:
+        algorithms = HMAC_ALGORITHMS
+        key = os.environ.get('SUPABASE_JWT_SECRET')
+        if not key:
+            return None
+    elif alg in JWKS_ALGORITHMS:
+        algorithms = JWKS_ALGORITHMS
+        jwks_client = _get_jwks_client()
+        if jwks_client is None:
+            return None
+        try:
+            key = jwks_client.get_signing_key_from_jwt(token).key
+        except jwt.PyJWKClientError as e:
+            log.warning('JWKS unavailable, falling back to remote check', extra={'error': str(e)})
+            return None
+    else:
+        raise jwt.InvalidAlgorithmError(f'Algorithm not allowed: {alg}')
+
+    claims = jwt.decode(
+        token,
+        key,
+        algorithms=algorithms,
+        audience=os.environ.get('SUPABASE_JWT_AUDIENCE', 'authenticated'),
+        options={'require': ['exp', 'sub']}
+    )
+    _bump('local_verifications')
+    return AuthUser(claims), claims['exp']
+
+
+def _verify_remotely(token):
+    """Original path: one Supabase Auth round-trip. Returns (user, exp) or None."""
+    res = get_auth_client().auth.get_user(token)
+    _bump('remote_verifications')
+    if not res or not res.user:
+        return None
+
+    # Supabase already vouched for the token; read exp only to bound the cache entry.
+    exp = jwt.decode(token, options={'verify_signature': False}).get('exp')
+    return res.user, exp
+
+
+def _cache_key(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def cached_user(token):
+    """Cache-only lookup that never blocks; lets async callers skip the thread hop on a hit."""
+    return _get_token_cache().get(_cache_key(token))
+
+
+def verify_token(token):
+    """
+    Resolves a bearer token to a user, consulting the verified-token cache first.
+    Returns the user, or None if the token is invalid or expired.
+    """
+    mode = _auth_mode()
+    token_cache = _get_token_cache()
+    cache_key = _cache_key(token)
+    user = token_cache.get(cache_key)
+    if user is not None:
+        return user
+
+    result = None
+    if mode != 'remote':
+        try:
+            result = _verify_locally(token)
+        except jwt.InvalidTokenError as e:
+            log.info('Token rejected', extra={'error': str(e)})
+            _bump('rejected')
+            return None
+        if result is None and mode == 'local':
+            raise RuntimeError('AUTH_VERIFY_MODE=local but no JWT secret or JWKS is configured')
+
+    if result is None:
+        result = _verify_remotely(token)
+        if result is None:
+            _bump('rejected')
+            return None
+
+    user, exp = result
+    if exp:
+        token_cache.set(cache_key, user, ttl=exp - time.time())
+    return user
+
 
 def authenticate_user(f):
     @wraps(f)
@@ -10,45 +187,58 @@ def authenticate_user(f):
         if not auth_header:
             return jsonify({'error': 'Missing Authorization Header'}), 401
 
+        started = time.perf_counter()
         try:
-            # Initialize Supabase client
             url = os.environ.get("SUPABASE_URL")
             key = os.environ.get("SUPABASE_KEY")
-            
-            print(f"Debug: URL set? {bool(url)}, Key set? {bool(key)}")
 
             if not url or not key:
-                print("Error: Missing credentials in .env")
+                log.error('Missing Supabase credentials in .env')
                 return jsonify({'error': 'Server misconfiguration: Missing Supabase credentials'}), 500
 
-            supabase: Client = create_client(url, key)
-
             # Extract token
             parts = auth_header.split(" ")
             if len(parts) != 2 or parts[0].lower() != "bearer":
-                print(f"Error: Invalid Header Format: {auth_header}")
+                log.info('Invalid Authorization header format')
                 return jsonify({'error': 'Invalid Authorization Header format'}), 401
-            
+
             token = parts[1]
-            # print(f"Debug: Verifying token: {token[:10]}...") 
-            
-            # Verify token via Supabase Auth
-            res = supabase.auth.get_user(token)
-            
-            if not res or not res.user:
-                 print("Error: Supabase returned no user for token.")
+
+            user = verify_token(token)
+            metrics.record_auth(time.perf_counter() - started, 'ok' if user is not None else 'rejected')
+            if user is None:
                  return jsonify({'error': 'Invalid or expired token'}), 401
-            
-            print(f"Debug: User verified: {res.user.id}")
+
             # Store user info in flask global context
-            g.user = res.user
-            g.token = token 
+            g.user = user
+            g.token = token
 
         except Exception as e:
-            print(f"Auth Exception: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            metrics.record_auth(time.perf_counter() - started, 'error')
+            log.exception('Authentication failed')
             return jsonify({'error': f'Authentication failed: {str(e)}'}), 401
-            
+
         return f(*args, **kwargs)
     return decorated_function
+
+
+def rate_limited(name, cost=None):
+    """
+    Per-user token bucket for a write route or an expensive read such as /api/export
+    (utils/ratelimit.py); goes below @authenticate_user.
+    `cost` is an optional callable returning how many tokens the current request spends.
+    Refused requests get 429 with Retry-After.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            allowed, retry_after = ratelimit.check(name, g.user.id, cost() if cost else 1)
+            if not allowed:
+                log.info('Rate limited', extra={'limiter': name, 'user_id': g.user.id, 'retry_after': retry_after})
+                response = jsonify({'success': False, 'error': 'Too many requests. Please try again shortly.'})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(retry_after)
+                return response
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
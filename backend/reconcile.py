@@ -0,0 +1,76 @@
+"""
+Recomputes leaderboard_stats and institution_relationships from receipts and reports drift
+against what the triggers maintained (reconcile_receipt_aggregates, receipt_aggregates.sql).
+
+    cd backend && python -m reconcile            # report only
+    cd backend && python -m reconcile --apply    # report, then write the expected counts
+    cd backend && python -m reconcile --json     # the raw report, e.g. for a cron alert
+
+Needs SUPABASE_SERVICE_ROLE_KEY. Exits 1 when drift was found and not applied.
+"""
+import argparse
+import json
+import os
+import sys
+
+import applog
+
+log = applog.get_logger('reconcile')
+
+TABLES = (
+    ('leaderboard', 'leaderboard_stats', ('user_id',), (('stored_given', 'given'), ('stored_received', 'received'))),
+    ('institutions', 'institution_relationships', ('from_institution', 'to_institution'),
+     (('stored_count', 'exchange_count'),)),
+)
+
+
+def reconcile(client, apply=False):
+    """Runs the reconciliation RPC; returns its report."""
+    report = client.rpc('reconcile_receipt_aggregates', {'p_apply': apply}).execute().data
+    for key, table, _, _ in TABLES:
+        summary = {k: v for k, v in report[key].items() if k != 'sample'}
+        log.info('Aggregate drift', extra={'table': table, 'applied': apply, **summary})
+    return report
+
+
+def format_report(report):
+    lines = []
+    for key, table, id_columns, counts in TABLES:
+        part = report[key]
+        lines.append(f"{table}: {part['checked']} rows checked, {part['drifted']} drifted "
+                     f"({part['missing']} missing, {part['negative']} negative), total count drift {part['count_drift']}")
+        for row in part['sample']:
+            ident = ' -> '.join(str(row[c]) for c in id_columns)
+            values = ', '.join(f"{expected} {'(none)' if row[stored] is None else row[stored]} -> {row[expected]}"
+                               for stored, expected in counts)
+            lines.append(f'  {ident}: {values}')
+    if report['applied']:
+        lines.append('expected counts written')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Recompute receipt aggregates and report drift')
+    parser.add_argument('--apply', action='store_true', help='write the expected counts to drifted rows')
+    parser.add_argument('--json', action='store_true', help='print the raw report as JSON')
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    # Two drift lines per run: keep every INFO record rather than sampling like a web worker.
+    os.environ.setdefault('LOG_SAMPLE_RATE', '1')
+    applog.setup()
+    from db import service_client
+    client = service_client()
+    if client is None:
+        raise SystemExit('SUPABASE_SERVICE_ROLE_KEY is not set')
+
+    report = reconcile(client, apply=args.apply)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    drifted = any(report[key]['drifted'] for key, _, _, _ in TABLES)
+    if drifted and not args.apply:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""GraphEngine incremental refreshes: rows and tombstones that commit out of order."""
+from datetime import datetime, timedelta, timezone
+
+from graph_engine import GraphEngine
+
+T0 = datetime.now(timezone.utc) - timedelta(minutes=5)
+
+
+def _connection(stub, low, high, seconds, accepted=True):
+    return stub.insert('connections', {'low_id': low, 'high_id': high, 'requested_by': low, 'accepted': accepted,
+                                       'receipt_weight': 0, 'updated_at': (T0 + timedelta(seconds=seconds)).isoformat()})
+
+
+def _delete(stub, connection, tombstone_id):
+    """Removes a connection the way the sync tombstone trigger records it, with a chosen sequence id."""
+    stub.tables['connections'].remove(connection)
+    stub.insert('sync_tombstones', {'id': tombstone_id, 'table_name': 'connections', 'row_id': connection['id'],
+                                    'user_ids': [connection['low_id'], connection['high_id']]})
+
+
+def test_picks_up_a_connection_that_commits_after_a_later_stamped_one(stub, service):
+    engine = GraphEngine()
+    _connection(stub, 'a', 'b', seconds=10)
+    engine.refresh(service)
+
+    # Accepted in a transaction that started at +8s and committed after the +10s row was read.
+    _connection(stub, 'a', 'c', seconds=8)
+    assert engine.refresh(service) == 1
+    assert set(engine.edges) == {('a', 'b'), ('a', 'c')}
+    assert engine.refresh(service) == 0  # re-reading the skew window changes nothing
+
+
+def test_applies_a_tombstone_that_commits_with_a_lower_id(stub, service):
+    engine = GraphEngine(skew=60)
+    ab, ac, ad = (_connection(stub, 'a', other, seconds=i) for i, other in enumerate('bcd'))
+    engine.refresh(service)
+
+    _delete(stub, ab, tombstone_id=10)
+    assert engine.refresh(service) == 1
+    # Id 7 was taken before id 10 but its transaction committed later.
+    _delete(stub, ac, tombstone_id=7)
+    assert engine.refresh(service) == 1
+    assert set(engine.edges) == {('a', 'd')}
+    assert engine.refresh(service) == 0
+
+
+def test_tombstone_mark_moves_past_settled_ids(stub, service):
+    engine = GraphEngine(skew=0)
+    ab = _connection(stub, 'a', 'b', seconds=0)
+    engine.refresh(service)
+    _delete(stub, ab, tombstone_id=3)
+    assert engine.refresh(service) == 1
+    assert engine.tombstone_mark == 3 and not engine.recent_tombstones
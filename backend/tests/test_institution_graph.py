@@ -0,0 +1,40 @@
+"""InstitutionGraphCache: incremental refreshes over institution_relationships."""
+from datetime import datetime, timedelta, timezone
+
+from institution_graph import InstitutionGraphCache
+
+T0 = datetime.now(timezone.utc) - timedelta(minutes=5)
+
+
+def _edge(stub, src, tgt, count, seconds):
+    return stub.insert('institution_relationships', {'from_institution': src, 'to_institution': tgt, 'exchange_count': count,
+                                                     'last_updated': (T0 + timedelta(seconds=seconds)).isoformat()})
+
+
+def _refresh(cache, service):
+    cache._probe.invalidate('fresh')
+    return cache.refresh(service)
+
+
+def test_merges_a_row_that_commits_after_a_later_stamped_one(stub, service):
+    cache = InstitutionGraphCache()
+    _edge(stub, 'LUMS', 'NUST', 3, seconds=10)
+    assert _refresh(cache, service)
+
+    # A longer transaction started at +8s commits now, after the +10s row was already read.
+    _edge(stub, 'LUMS', 'FAST', 2, seconds=8)
+    assert _refresh(cache, service)
+    assert cache.edges == {('LUMS', 'NUST'): 3, ('LUMS', 'FAST'): 2}
+    assert cache.nodes['LUMS']['stats']['given'] == 5
+
+
+def test_rereading_the_skew_window_is_idempotent(stub, service):
+    cache = InstitutionGraphCache()
+    row = _edge(stub, 'LUMS', 'NUST', 3, seconds=10)
+    _refresh(cache, service)
+    assert not _refresh(cache, service)
+    assert cache.nodes['NUST']['stats']['received'] == 3
+
+    stub.update('institution_relationships', row, {'exchange_count': 4, 'last_updated': (T0 + timedelta(seconds=11)).isoformat()})
+    assert _refresh(cache, service)
+    assert cache.nodes['NUST']['stats']['received'] == 4
@@ -0,0 +1,26 @@
+"""GET /api/metrics access: bearer METRICS_TOKEN, or loopback-only local development without one."""
+import pytest
+
+REMOTE = {'REMOTE_ADDR': '203.0.113.7'}
+
+
+@pytest.fixture
+def no_token(monkeypatch):
+    monkeypatch.delenv('METRICS_TOKEN', raising=False)
+    monkeypatch.delenv('VERCEL', raising=False)
+
+
+def test_without_token_only_local_dev_is_served(client, no_token, monkeypatch):
+    assert client.get('/api/metrics').status_code == 200
+    assert client.get('/api/metrics', environ_base=REMOTE).status_code == 403
+    monkeypatch.setenv('VERCEL', '1')
+    assert client.get('/api/metrics').status_code == 403
+
+
+def test_token_is_required_when_set(client, no_token, monkeypatch):
+    monkeypatch.setenv('METRICS_TOKEN', 's3cret')
+    assert client.get('/api/metrics').status_code == 401
+    assert client.get('/api/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    res = client.get('/api/metrics', headers={'Authorization': 'Bearer s3cret'}, environ_base=REMOTE)
+    assert res.status_code == 200
+    assert b'pledge_upstream_requests_total' in res.data
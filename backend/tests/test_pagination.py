@@ -0,0 +1,89 @@
+"""Keyset cursors (utils/pagination.py) and the paged list endpoints built on them (_list_page)."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from utils.pagination import decode_cursor, encode_cursor
+
+T0 = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+def _receipts(stub, sender, recipient, count, same_second=False):
+    """Seeds receipts, newest last; with same_second they all share one created_at (ties broken by id)."""
+    return [stub.insert('receipts', {
+        'from_user_id': sender, 'to_user_id': recipient, 'recipient_email': 'recipient@lums.edu.pk',
+        'status': 'ACCEPTED', 'created_at': (T0 + timedelta(seconds=0 if same_second else i)).isoformat(),
+    }) for i in range(count)]
+
+
+def _pages(client, headers, path, **params):
+    pages, cursor = [], None
+    while True:
+        res = client.get(path, headers=headers, query_string={**params, **({'cursor': cursor} if cursor else {})})
+        assert res.status_code == 200, res.get_json()
+        body = res.get_json()
+        pages.append(body)
+        cursor = body['next_cursor']
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor('2026-03-01T00:00:00+00:00', 'b5a3c1e0-0000-4000-8000-000000000001')
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == ('2026-03-01T00:00:00+00:00', 'b5a3c1e0-0000-4000-8000-000000000001')
+    assert decode_cursor(encode_cursor([1, 0.75], 'x')) == ([1, 0.75], 'x')
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', 'e30', encode_cursor('a', 'b') + 'xx'])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize('same_second', [False, True])
+def test_receipts_pages_cover_every_row_once(client, stub, make_user, same_second):
+    me, _, headers = make_user('me@lums.edu.pk')
+    other, _, _ = make_user('other@lums.edu.pk')
+    seeded = _receipts(stub, me, other, 7, same_second)
+
+    pages = _pages(client, headers, '/api/receipts', limit=3)
+    assert [len(p['data']) for p in pages] == [3, 3, 1]
+    ids = [r['id'] for p in pages for r in p['data']]
+    expected = sorted(seeded, key=lambda r: (r['created_at'], r['id']), reverse=True)
+    assert ids == [r['id'] for r in expected]
+
+
+def test_bad_cursor_and_limit_are_400(client, make_user):
+    _, _, headers = make_user('me@lums.edu.pk')
+    assert client.get('/api/receipts', headers=headers, query_string={'cursor': 'garbage'}).status_code == 400
+    assert client.get('/api/receipts', headers=headers, query_string={'limit': 'ten'}).status_code == 400
+
+
+def test_delta_mode_pages_oldest_change_first_and_reports_deletes(client, stub, make_user):
+    me, _, headers = make_user('me@lums.edu.pk')
+    other, _, _ = make_user('other@lums.edu.pk')
+    since = datetime.now(timezone.utc) - timedelta(minutes=1)
+    seeded = _receipts(stub, me, other, 4)
+    stub.delete('receipts', seeded[0])
+
+    pages = _pages(client, headers, '/api/receipts', limit=2, updated_since=since.isoformat())
+    assert pages[0]['deleted'] == [seeded[0]['id']]
+    assert all('deleted' not in p for p in pages[1:])
+    changed = [r for p in pages for r in p['data']]
+    assert sorted(r['id'] for r in changed) == sorted(r['id'] for r in seeded[1:])
+    assert [(r['updated_at'], r['id']) for r in changed] == sorted((r['updated_at'], r['id']) for r in changed)
+
+
+def test_connections_pages(client, stub, make_user):
+    me, _, headers = make_user('me@lums.edu.pk')
+    for i in range(5):
+        other, _, _ = make_user(f'peer{i}@lums.edu.pk')
+        low, high = sorted([me, other])
+        stub.insert('connections', {'low_id': low, 'high_id': high, 'requested_by': me, 'accepted': True,
+                                    'created_at': (T0 + timedelta(seconds=i)).isoformat()})
+
+    pages = _pages(client, headers, '/api/connections', limit=2)
+    assert [len(p['data']) for p in pages] == [2, 2, 1]
+    created = [c['created_at'] for p in pages for c in p['data']]
+    assert created == sorted(created, reverse=True) and len(set(created)) == 5
@@ -0,0 +1,81 @@
+"""POST /api/receipts/batch: validation, de-duplication, chunked lookups and the per-row fallback."""
+
+
+def _connect(stub, a, b, accepted=True):
+    low, high = sorted([a, b])
+    return stub.insert('connections', {'low_id': low, 'high_id': high, 'requested_by': a, 'accepted': accepted})
+
+
+def _batch(client, headers, recipients):
+    return client.post('/api/receipts/batch', headers=headers,
+                       json={'recipients': recipients, 'tags': ['notes'], 'description': 'Shared notes'})
+
+
+def test_rejects_empty_or_malformed_recipients(client, make_user):
+    _, _, headers = make_user('issuer@lums.edu.pk')
+    for recipients in ([], None, 'someone@lums.edu.pk'):
+        res = _batch(client, headers, recipients)
+        assert res.status_code == 400
+        assert res.get_json()['error'] == 'Recipients list is required'
+
+
+def test_rejects_oversize_batch(client, make_user, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'RECEIPT_BATCH_LIMIT', 3)
+    _, _, headers = make_user('issuer@lums.edu.pk')
+    res = _batch(client, headers, [f'r{i}@lums.edu.pk' for i in range(4)])
+    assert res.status_code == 400
+    assert 'At most 3' in res.get_json()['error']
+
+
+def test_validates_and_dedupes_in_request_order(client, stub, make_user):
+    me, my_email, headers = make_user('issuer@lums.edu.pk')
+    friend, _, _ = make_user('friend@lums.edu.pk')
+    make_user('stranger@lums.edu.pk')
+    _connect(stub, me, friend)
+
+    res = _batch(client, headers, ['Friend@LUMS.edu.pk', ' friend@lums.edu.pk', {'email': 'stranger@lums.edu.pk'},
+                                   'not-an-email', my_email.upper(), 'newcomer@lums.edu.pk'])
+    body = res.get_json()
+    assert res.status_code == 200
+    assert [r['email'] for r in body['results']] == [
+        'friend@lums.edu.pk', 'friend@lums.edu.pk', 'stranger@lums.edu.pk',
+        'not-an-email', my_email, 'newcomer@lums.edu.pk']
+    assert [r.get('status') or r['error'] for r in body['results']] == [
+        'AWAITING_ACCEPTANCE', 'Duplicate recipient in batch', 'AWAITING_CONNECTION',
+        'Invalid email', 'Cannot send receipt to yourself', 'AWAITING_SIGNUP']
+    assert (body['created'], body['failed']) == (3, 3)
+    assert len(stub.tables['receipts']) == 3
+    assert all(r['from_user_id'] == me for r in stub.tables['receipts'])
+
+
+def test_resolves_recipients_in_chunked_in_queries(client, stub, make_user, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'IN_FILTER_CHUNK', 2)
+    _, _, headers = make_user('issuer@lums.edu.pk')
+    emails = [make_user(f'r{i}@lums.edu.pk')[1] for i in range(5)]
+    stub.reset_counters()
+
+    body = _batch(client, headers, emails).get_json()
+    assert body['created'] == 5
+    assert all(r['status'] == 'AWAITING_CONNECTION' for r in body['results'])
+    # 5 recipients in chunks of 2: three profile lookups, one multi-row insert.
+    assert stub.calls['GET /rest/v1/public_profiles'] == 3
+    assert stub.calls['POST /rest/v1/receipts'] == 1
+
+
+def test_falls_back_to_per_row_inserts(client, stub, make_user, monkeypatch):
+    _, _, headers = make_user('issuer@lums.edu.pk')
+    handle_table = stub.handle_table
+
+    def failing(method, table, params, body, prefer):
+        # The multi-row insert is rejected as a whole; so is the single row for bad@.
+        if method == 'POST' and table == 'receipts':
+            if isinstance(body, list) or body.get('recipient_email') == 'bad@lums.edu.pk':
+                return 400, {'code': '23514', 'message': 'check constraint violated', 'details': None, 'hint': None}
+        return handle_table(method, table, params, body, prefer)
+
+    monkeypatch.setattr(stub, 'handle_table', failing)
+    body = _batch(client, headers, ['a@lums.edu.pk', 'bad@lums.edu.pk', 'b@lums.edu.pk']).get_json()
+    assert (body['created'], body['failed']) == (2, 1)
+    assert [r['success'] for r in body['results']] == [True, False, True]
+    assert 'check constraint' in body['results'][1]['error']
+    assert sorted(r['recipient_email'] for r in stub.tables['receipts']) == ['a@lums.edu.pk', 'b@lums.edu.pk']
@@ -0,0 +1,29 @@
+"""SQLSTATEs raised by the write and graph RPCs map to HTTP statuses through app._call_rpc."""
+import uuid
+
+
+def test_receipt_rpcs(client, make_user):
+    _, my_email, headers = make_user('me@lums.edu.pk')
+    res = client.post('/api/receipts/create', headers=headers, json={'email': my_email, 'tags': ['notes']})
+    assert res.status_code == 400
+    assert res.get_json() == {'success': False, 'error': 'Cannot send receipt to yourself'}
+
+    missing = str(uuid.uuid4())
+    for route in ('/api/receipts/claim', '/api/receipts/reject'):
+        res = client.post(route, headers=headers, json={'receipt_id': missing})
+        assert res.status_code == 404
+        assert res.get_json() == {'success': False, 'error': 'Receipt not found'}
+
+
+def test_connection_and_graph_rpcs(client, make_user):
+    _, my_email, headers = make_user('me@lums.edu.pk')
+    res = client.post('/api/connections/request', headers=headers, json={'email': 'nobody@lums.edu.pk'})
+    assert res.status_code == 404
+    assert 'success' not in res.get_json()
+    res = client.post('/api/connections/request', headers=headers, json={'email': my_email})
+    assert res.status_code == 400
+
+    friend, friend_email, _ = make_user('friend@lums.edu.pk')
+    res = client.post('/api/connections/request', headers=headers, json={'email': friend_email})
+    assert res.status_code == 200
+    assert client.get('/api/graph/ego', headers=headers).status_code == 200
@@ -0,0 +1,126 @@
+import hashlib
+import os
+import threading
+import time
+
+from applog import get_logger
+from utils.redis_backend import get_redis, key as redis_key
+
+log = get_logger('coalesce')
+
+
+def _enabled():
+    return os.environ.get('SINGLE_FLIGHT', 'on').lower() not in ('0', 'off', 'false')
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Request coalescing: concurrent do() calls with the same key share one execution of fn.
+    The first caller (the leader) runs fn; the others wait for its result or exception.
+    Nothing is cached once the call finishes; pair it with a cache for that.
+
+    With REDIS_URL set and `encode`/`decode` given, leaders of different workers coordinate
+    too: one takes a short Redis lock and publishes its encoded result for `shared_ttl`
+    seconds, the others wait for that result instead of running fn. Any Redis failure falls
+    back to running fn locally.
+
+    Followers give up waiting after `wait_timeout` seconds and run fn themselves.
+    """
+
+    def __init__(self, name, wait_timeout=10.0, shared_ttl=5.0):
+        self.name = name
+        self.wait_timeout = wait_timeout
+        self.shared_ttl = shared_ttl
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.shared_hits = 0
+
+    def do(self, key, fn, encode=None, decode=None, ttl=None):
+        """fn()'s result, shared with concurrent callers of the same key. `ttl` overrides shared_ttl."""
+        if not _enabled():
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            if call.done.wait(self.wait_timeout):
+                if call.error is not None:
+                    raise call.error
+                return call.value
+            return fn()
+
+        try:
+            call.value = self._lead(key, fn, encode, decode, self.shared_ttl if ttl is None else ttl)
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _lead(self, key, fn, encode, decode, ttl):
+        client = get_redis() if encode is not None else None
+        if client is None:
+            return fn()
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        value_key, lock_key = redis_key('sf', self.name, digest), redis_key('sf', self.name, digest, 'lock')
+        try:
+            shared = client.get(value_key)
+            if shared is not None:
+                self.shared_hits += 1
+                return decode(shared)
+            if not client.set(lock_key, '1', nx=True, px=int(self.wait_timeout * 1000)):
+                deadline = time.monotonic() + self.wait_timeout
+                while time.monotonic() < deadline:
+                    time.sleep(0.02)
+                    shared = client.get(value_key)
+                    if shared is not None:
+                        self.shared_hits += 1
+                        return decode(shared)
+                    if not client.exists(lock_key):
+                        break  # the other worker failed; compute here
+                return fn()
+        except Exception as e:
+            log.warning('Shared coalescing unavailable', extra={'flight': self.name, 'error': str(e)})
+            return fn()
+
+        try:
+            value = fn()
+            try:
+                client.set(value_key, encode(value), px=max(int(ttl * 1000), 1))
+            except Exception as e:
+                log.warning('Could not publish coalesced result', extra={'flight': self.name, 'error': str(e)})
+            return value
+        finally:
+            try:
+                client.delete(lock_key)
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'followers': self.followers,
+                'shared_hits': self.shared_hits,
+            }
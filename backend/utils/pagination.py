@@ -0,0 +1,70 @@
+import base64
+import json
+from datetime import datetime, timezone
+
+# Keyset (cursor) pagination over (sort_column, id).
+# Cursors are opaque to clients: urlsafe base64 of [sort_value, id] from the last row served.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(sort_value, row_id):
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns (sort_value, row_id). Raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return sort_value, row_id
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Clamps a ?limit= query param into [1, maximum]. Raises ValueError if it is not an integer."""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, maximum))
+
+
+def keyset_filter(sort_column, sort_value, row_id, desc=True):
+    """PostgREST `or` filter selecting rows strictly after (sort_value, row_id) in the page order."""
+    op = 'lt' if desc else 'gt'
+    return f'{sort_column}.{op}."{sort_value}",and({sort_column}.eq."{sort_value}",id.{op}.{row_id})'
+
+
+def keyset_page(query, sort_column, cursor=None, limit=DEFAULT_PAGE_SIZE, desc=True):
+    """
+    Runs one page of a select query ordered by (sort_column, id).
+    Fetches limit + 1 rows to learn whether another page exists, without a count query.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        query = query.or_(keyset_filter(sort_column, sort_value, row_id, desc))
+    rows = query.order(sort_column, desc=desc).order('id', desc=desc).limit(limit + 1).execute().data or []
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor(last[sort_column], last['id'])
+
+
+def rewind(stamp, skew):
+    """
+    An upstream ISO timestamp moved back by `skew` (a timedelta). updated_at-style columns are
+    NOW() at transaction start, so a row can commit after a later-stamped one was read; an
+    incremental reader re-reads from rewind(watermark, skew) to pick it up (re-applying rows
+    must be idempotent).
+    """
+    moment = datetime.fromisoformat(stamp)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - skew).isoformat()
@@ -0,0 +1,153 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from applog import get_logger
+from utils.redis_backend import get_redis, key as redis_key
+
+log = get_logger('ratelimit')
+
+# Per-user token buckets for write endpoints, and for exports, which page through a whole
+# account. A bucket holds up to `capacity` tokens and refills at `capacity / period` tokens
+# per second; a request spends `cost` tokens (1, or the recipient count for batches) and is
+# refused with 429 when the bucket cannot cover it.
+# Limits are "capacity/period_seconds" and can be overridden per endpoint, e.g.
+# RATE_LIMIT_RECEIPTS_CREATE=60/60. RATE_LIMITS=off disables limiting altogether.
+DEFAULT_LIMITS = {
+    'receipts_create': '30/60',
+    'receipts_batch': '1000/3600',
+    'receipts_claim': '60/60',
+    'connections_request': '20/60',
+    'export': '10/3600',
+}
+
+# KEYS[1] bucket; ARGV capacity, refill per second, cost. Uses the server clock so workers
+# on different hosts agree. Returns {allowed (0/1), seconds until `cost` tokens are available}.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(wait)}
+"""
+
+
+def enabled():
+    return os.environ.get('RATE_LIMITS', 'on').lower() not in ('0', 'off', 'false')
+
+
+def parse_limit(spec):
+    """'30/60' -> (capacity 30, refill 0.5 tokens per second)."""
+    capacity, _, period = spec.partition('/')
+    capacity, period = float(capacity), float(period or 1)
+    if capacity <= 0 or period <= 0:
+        raise ValueError(f'invalid rate limit {spec!r}')
+    return capacity, capacity / period
+
+
+class RateLimiter:
+    """
+    One endpoint's buckets. acquire() returns (allowed, retry_after_seconds).
+    Buckets live in Redis when REDIS_URL is configured (shared by all workers) and in a
+    bounded in-process LRU otherwise; a Redis error fails open to the in-process buckets.
+    """
+
+    def __init__(self, name, spec=None, max_keys=None):
+        self.name = name
+        spec = spec or os.environ.get(f'RATE_LIMIT_{name.upper()}') or DEFAULT_LIMITS[name]
+        self.capacity, self.rate = parse_limit(spec)
+        self.max_keys = max_keys or int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000))
+        self._buckets = OrderedDict()  # subject -> (tokens, updated_at)
+        self._lock = threading.Lock()
+        self._script = None
+        self.allowed = 0
+        self.limited = 0
+
+    def acquire(self, subject, cost=1):
+        cost = min(cost, self.capacity)  # an oversized request waits for a full bucket rather than never passing
+        allowed, retry_after = self._acquire_shared(subject, cost)
+        if allowed is None:
+            allowed, retry_after = self._acquire_local(subject, cost)
+        with self._lock:
+            if allowed:
+                self.allowed += 1
+            else:
+                self.limited += 1
+        return allowed, retry_after
+
+    def _acquire_local(self, subject, cost):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(subject, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[subject] = (tokens, now)
+            # Evicted buckets are the least recently used ones, which have (nearly) refilled anyway.
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / self.rate
+
+    def _acquire_shared(self, subject, cost):
+        client = get_redis()
+        if client is None:
+            return None, None
+        try:
+            if self._script is None:
+                self._script = client.register_script(TOKEN_BUCKET_LUA)
+            allowed, wait = self._script(keys=[redis_key('rl', self.name, subject)], args=[self.capacity, self.rate, cost])
+            return bool(int(allowed)), float(wait)
+        except Exception as e:
+            log.warning('Shared rate limit unavailable', extra={'limiter': self.name, 'error': str(e)})
+            return None, None
+
+    def stats(self):
+        with self._lock:
+            return {'capacity': self.capacity, 'per_second': round(self.rate, 4), 'allowed': self.allowed,
+                    'limited': self.limited, 'local_buckets': len(self._buckets)}
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name):
+    """The process-wide limiter for `name` (created on first use, after .env is loaded)."""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limiter = _limiters[name] = RateLimiter(name)
+    return limiter
+
+
+def check(name, subject, cost=1):
+    """(allowed, Retry-After seconds as an int) for one request; always allowed when RATE_LIMITS=off."""
+    if not enabled():
+        return True, 0
+    allowed, wait = get_limiter(name).acquire(subject, cost)
+    return allowed, 0 if allowed else max(1, math.ceil(wait))
+
+
+def stats():
+    with _limiters_lock:
+        return {name: limiter.stats() for name, limiter in _limiters.items()}
@@ -0,0 +1,69 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import jwt
+
+# Offline verification for /api/receipts/<id>/verify.
+# - content_hash: sha256 over the canonical JSON of the public receipt projection
+#   (keys sorted, no whitespace, UTF-8), so anyone holding the JSON can recompute it.
+# - signature: compact JWS (EdDSA / Ed25519) over {"rid": <receipt id>, "sha256": <hex>},
+#   checkable against the JWK from /api/receipts/signing-key. Ed25519 signatures are
+#   deterministic, so every worker produces byte-identical responses (and ETags).
+# RECEIPT_SIGNING_KEY holds a PEM Ed25519 private key (literal "\n" sequences are accepted,
+# for single-line env vars). Without it, responses carry the hash but no signature.
+
+_key = None
+_key_lock = threading.Lock()
+
+
+def canonical_json(data):
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def content_hash(data):
+    return hashlib.sha256(canonical_json(data)).hexdigest()
+
+
+def _signing_key():
+    """(private key, kid) or None. Loaded once; read lazily because .env is loaded after import."""
+    global _key
+    if _key is None:
+        with _key_lock:
+            if _key is None:
+                pem = os.environ.get('RECEIPT_SIGNING_KEY')
+                if not pem:
+                    return None
+                from cryptography.hazmat.primitives import serialization
+                private_key = serialization.load_pem_private_key(pem.replace('\\n', '\n').encode(), password=None)
+                raw = private_key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+                _key = (private_key, hashlib.sha256(raw).hexdigest()[:16])
+    return _key
+
+
+def sign(receipt_id, digest):
+    """Compact JWS over the receipt id and content hash, or None when no key is configured."""
+    key = _signing_key()
+    if key is None:
+        return None
+    private_key, kid = key
+    return jwt.encode({'rid': receipt_id, 'sha256': digest}, private_key, algorithm='EdDSA', headers={'kid': kid})
+
+
+def public_jwk():
+    """Public half of the signing key as a JWK (RFC 8037), or None when signing is off."""
+    key = _signing_key()
+    if key is None:
+        return None
+    from cryptography.hazmat.primitives import serialization
+    private_key, kid = key
+    raw = private_key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    return {
+        'kty': 'OKP',
+        'crv': 'Ed25519',
+        'alg': 'EdDSA',
+        'use': 'sig',
+        'kid': kid,
+        'x': base64.urlsafe_b64encode(raw).decode().rstrip('='),
+    }
@@ -0,0 +1,42 @@
+import os
+import threading
+
+from applog import get_logger
+
+# Optional shared state for multi-worker deployments (request coalescing, rate limits).
+# Set REDIS_URL (any Redis-compatible server: Redis, Valkey, KeyDB, ...) and install
+# requirements-redis.txt. Without it, or if the client is missing, callers keep their state
+# in-process, which is exact for a single worker and per-worker otherwise.
+
+log = get_logger('redis')
+
+_client = None
+_resolved = False
+_lock = threading.Lock()
+
+
+def get_redis():
+    """The shared Redis client, or None when REDIS_URL is unset or the redis package is missing."""
+    global _client, _resolved
+    if _resolved:
+        return _client
+    with _lock:
+        if not _resolved:
+            url = os.environ.get('REDIS_URL')
+            if url:
+                try:
+                    import redis
+                    _client = redis.Redis.from_url(
+                        url,
+                        socket_timeout=float(os.environ.get('REDIS_TIMEOUT', 0.5)),
+                        socket_connect_timeout=float(os.environ.get('REDIS_TIMEOUT', 0.5)),
+                        health_check_interval=30,
+                    )
+                except ImportError:
+                    log.warning('REDIS_URL is set but the redis package is not installed; using in-process state')
+            _resolved = True
+    return _client
+
+
+def key(*parts):
+    return 'pledge:' + ':'.join(str(p) for p in parts)
@@ -1,38 +1,223 @@
+import csv
+import json
+import os
 import re
+import sys
+import threading
+import time
+from functools import lru_cache
 
-def infer_student_identity(email: str):
-    """
-    Infers student identity from email address.
-    Currently only supports LUMS (@lums.edu.pk).
-    Rules:
-    - Handle: 24100001 -> '24' is the Graduation Year.
-    - Batch: 2000 + year (e.g., 2024)
-    """
-    email = email.lower().strip()
-    
-    # 1. LUMS Check
-    if email.endswith("@lums.edu.pk"):
-        handle = email.split("@")[0]
-        # Match exactly 2 digits at the start of handle
-        # e.g., 24100123 -> Graduation Year 2024
-        match = re.search(r'^(\d{2})', handle)
-        if match:
-            year_short = int(match.group(1))
-            batch_year = 2000 + year_short
-            return {
-                "institution_id": "LUMS",
-                "batch_year": batch_year,
-                "roll_number": handle,
-                "campus_code": "LUMS-MAIN"
-            }
+# Institution registry: which email domains belong to which institution and how a student's
+# handle encodes roll number, batch year and campus. Entries come from institutions.json
+# (INSTITUTIONS_SOURCE=file, the default; INSTITUTIONS_FILE overrides the path) or from the
+# `institutions` table (INSTITUTIONS_SOURCE=db, institutions.sql), reloaded every INSTITUTIONS_TTL seconds.
+#
+# Entry format (same keys as the table columns):
+#   id                  "LUMS"
+#   domains             ["lums.edu.pk"]
+#   include_subdomains  true to accept e.g. lhr.nu.edu.pk under nu.edu.pk
+#   roll_patterns       regexes tried in order against the handle (the part before '@');
+#                       named groups: roll (defaults to the whole handle), year, campus
+#   batch_year          {"group": "year", "base": 2000, "offset": 0}; 2-digit years are added to base
+#   campus_codes        {"lhr": "NU-LHR"}: keyed by the `campus` group, else by the subdomain label
+#   default_campus      "LUMS-MAIN"
+
+DEFAULT_INSTITUTIONS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'institutions.json')
+REJECTION = 'This network is exclusively for verified students of supported institutions.'
+
+
+class Institution:
+    __slots__ = ('id', 'name', 'domains', 'include_subdomains', 'roll_patterns',
+                 'year_group', 'year_base', 'year_offset', 'campus_codes', 'default_campus')
+
+    def __init__(self, entry):
+        self.id = entry['id']
+        self.name = entry.get('name') or self.id
+        self.domains = [d.lower().strip().lstrip('@') for d in entry.get('domains') or []]
+        self.include_subdomains = bool(entry.get('include_subdomains'))
+        # Compiled once per registry load, never per request.
+        self.roll_patterns = [re.compile(p) for p in entry.get('roll_patterns') or []]
+        rule = entry.get('batch_year') or {}
+        self.year_group = rule.get('group', 'year')
+        self.year_base = int(rule.get('base', 2000))
+        self.year_offset = int(rule.get('offset', 0))
+        self.campus_codes = {str(k).lower(): v for k, v in (entry.get('campus_codes') or {}).items()}
+        self.default_campus = entry.get('default_campus')
+
+    def identify(self, handle, subdomain):
+        """Identity dict for a handle at this institution; `subdomain` is the label(s) left of the matched domain."""
+        groups = {}
+        for pattern in self.roll_patterns:
+            match = pattern.match(handle)
+            if match:
+                groups = match.groupdict()
+                break
+
+        batch_year = None
+        year = groups.get(self.year_group)
+        if year and year.isdigit():
+            batch_year = int(year) + (self.year_base if len(year) <= 2 else 0) + self.year_offset
+
+        campus_key = (groups.get('campus') or subdomain or '').lower()
+        return {
+            'institution_id': self.id,
+            'batch_year': batch_year,
+            'roll_number': groups.get('roll') or handle,
+            'campus_code': self.campus_codes.get(campus_key, self.default_campus),
+        }
+
+
+class InstitutionResolver:
+    """
+    Maps email domains to institutions through a suffix trie over reversed domain labels
+    (pk -> edu -> lums), so a lookup costs one dict step per label however many institutions
+    are registered. Domain lookups are memoized (INSTITUTIONS_MEMO_SIZE); handles are not.
+    """
+
+    def __init__(self, institutions, memo_size=None):
+        self.institutions = {}
+        self._trie = {}
+        for entry in institutions:
+            inst = entry if isinstance(entry, Institution) else Institution(entry)
+            self.institutions[inst.id] = inst
+            for domain in inst.domains:
+                node = self._trie
+                for label in reversed(domain.split('.')):
+                    node = node.setdefault(label, {})
+                node[None] = inst  # None never collides with a label
+        if memo_size is None:
+            memo_size = int(os.environ.get('INSTITUTIONS_MEMO_SIZE', 4096))
+        self.lookup = lru_cache(maxsize=memo_size)(self._lookup)
+
+    def _lookup(self, domain):
+        """(institution, subdomain) for the longest registered suffix of `domain`, or None."""
+        labels = domain.split('.')
+        node = self._trie
+        found = None
+        for depth, label in enumerate(reversed(labels), 1):
+            node = node.get(label)
+            if node is None:
+                break
+            inst = node.get(None)
+            if inst is not None and (depth == len(labels) or inst.include_subdomains):
+                found = (inst, '.'.join(labels[:len(labels) - depth]))
+        return found
+
+    def resolve(self, email):
+        """Identity dict for a student email. Raises ValueError if no institution accepts it."""
+        handle, _, domain = (email or '').lower().strip().rpartition('@')
+        if not handle or not domain:
+            raise ValueError('Invalid email address.')
+        found = self.lookup(domain)
+        if found is None:
+            raise ValueError(REJECTION)
+        inst, subdomain = found
+        return inst.identify(handle, subdomain)
+
+    def classify(self, email):
+        """Non-raising resolve for bulk use: (identity, None) or (None, error)."""
+        try:
+            return self.resolve(email), None
+        except ValueError as e:
+            return None, str(e)
+
+
+def load_institutions_file(path=None):
+    with open(path or os.environ.get('INSTITUTIONS_FILE') or DEFAULT_INSTITUTIONS_FILE) as f:
+        return json.load(f)
+
+
+def load_institutions_db(client):
+    return client.table('institutions').select('*').eq('active', True).execute().data or []
+
+
+_resolver = None
+_resolver_expires = 0.0
+_resolver_lock = threading.Lock()
+
+
+def get_resolver(client_factory=None):
+    """
+    Returns the current resolver, rebuilding it at most every INSTITUTIONS_TTL seconds.
+    client_factory is only called (for a PostgREST client) when INSTITUTIONS_SOURCE=db needs a reload.
+    If the table cannot be read, the previous registry keeps serving.
+    """
+    global _resolver, _resolver_expires
+    if _resolver is not None and time.monotonic() < _resolver_expires:
+        return _resolver
+    with _resolver_lock:
+        if _resolver is not None and time.monotonic() < _resolver_expires:
+            return _resolver
+        source = os.environ.get('INSTITUTIONS_SOURCE', 'file').lower()
+        if source == 'db' and client_factory is not None:
+            try:
+                _resolver = InstitutionResolver(load_institutions_db(client_factory()))
+            except Exception:
+                if _resolver is None:
+                    raise
         else:
-            # Fallback if handle doesn't start with digits (unlikely for students)
-            return {
-                "institution_id": "LUMS",
-                "batch_year": None,
-                "roll_number": handle,
-                "campus_code": "LUMS-MAIN"
-            }
-
-    # 2. Reject Others
-    raise ValueError("This network is exclusively for verified LUMS students.")
+            _resolver = InstitutionResolver(load_institutions_file())
+        # Settings are read here, not at import, because app.py loads .env after importing this module.
+        _resolver_expires = time.monotonic() + float(os.environ.get('INSTITUTIONS_TTL', 300))
+        return _resolver
+
+
+def infer_student_identity(email: str, client_factory=None):
+    """
+    Infers student identity from email address, e.g. 24100001@lums.edu.pk ->
+    {'institution_id': 'LUMS', 'batch_year': 2024, 'roll_number': '24100001', 'campus_code': 'LUMS-MAIN'}.
+    Raises ValueError for emails outside the registered institutions.
+    """
+    return get_resolver(client_factory).resolve(email)
+
+
+def classify_csv(source, dest, column='email', resolver=None):
+    """
+    Streams a CSV of emails through the resolver, appending institution_id, campus_code,
+    batch_year, roll_number and error columns. Returns (rows, matched).
+    """
+    resolver = resolver or InstitutionResolver(load_institutions_file())
+    reader = csv.DictReader(source)
+    if column not in (reader.fieldnames or []):
+        raise ValueError(f'CSV has no {column!r} column')
+    fields = ['institution_id', 'campus_code', 'batch_year', 'roll_number', 'error']
+    writer = csv.DictWriter(dest, fieldnames=reader.fieldnames + [f for f in fields if f not in reader.fieldnames])
+    writer.writeheader()
+    rows = matched = 0
+    for row in reader:
+        identity, error = resolver.classify(row[column])
+        row.update(identity or {})
+        row['error'] = error or ''
+        writer.writerow(row)
+        rows += 1
+        matched += identity is not None
+    return rows, matched
+
+
+def main(argv=None):
+    """Bulk mode:  cd backend && python -m utils.student_identity emails.csv [--column email] [--output out.csv]"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Classify a CSV of emails by institution.')
+    parser.add_argument('csv', help="input CSV with a header row ('-' for stdin)")
+    parser.add_argument('--column', default='email')
+    parser.add_argument('--output', help='output CSV (default: stdout)')
+    parser.add_argument('--institutions', help='institutions JSON (default: INSTITUTIONS_FILE or institutions.json)')
+    args = parser.parse_args(argv)
+
+    resolver = InstitutionResolver(load_institutions_file(args.institutions))
+    started = time.perf_counter()
+    source = sys.stdin if args.csv == '-' else open(args.csv, newline='')
+    dest = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        rows, matched = classify_csv(source, dest, args.column, resolver)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if dest is not sys.stdout:
+            dest.close()
+    elapsed = time.perf_counter() - started
+    print(f'{rows} rows, {matched} matched, {rows - matched} rejected in {elapsed:.2f}s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+-- Per-user change queue behind GET /api/events (server-sent events, see backend/events.py).
+-- Every receipt, connection and message change appends one row per affected user. The backend
+-- reads a user's rows after the last id it delivered (one index range scan), so connected
+-- clients receive small deltas instead of re-running /api/bootstrap. Ids come from a sequence,
+-- so a slow transaction can commit a lower id after a higher one was read; the reader re-reads
+-- a short settle window to pick those up. Rows are short-lived: prune_change_events() trims them.
+
+CREATE TABLE IF NOT EXISTS change_events (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,             -- 'receipt' | 'connection' | 'message'
+    op TEXT NOT NULL,               -- 'INSERT' | 'UPDATE' | 'DELETE'
+    row_id UUID NOT NULL,
+    data JSONB,                     -- the row after the change; NULL for deletes
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- WHERE user_id = $1 AND id > $2 ORDER BY id
+CREATE INDEX IF NOT EXISTS idx_change_events_user_id ON change_events (user_id, id);
+CREATE INDEX IF NOT EXISTS idx_change_events_created ON change_events (created_at);
+
+ALTER TABLE change_events ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Users can read their own change events" ON change_events;
+CREATE POLICY "Users can read their own change events" ON change_events
+FOR SELECT USING (auth.uid() = user_id);
+
+-- One trigger function for the three tables; the affected users are both ends of the row
+-- (plus a receipt's previous recipient when it is re-linked).
+CREATE OR REPLACE FUNCTION record_change_event()
+RETURNS TRIGGER AS $$
+DECLARE
+    payload JSONB := CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE to_jsonb(NEW) END;
+    row_data JSONB := CASE WHEN TG_OP = 'DELETE' THEN to_jsonb(OLD) ELSE to_jsonb(NEW) END;
+    event_kind TEXT;
+    users UUID[];
+BEGIN
+    -- Touches that only bump updated_at are not worth a push.
+    IF TG_OP = 'UPDATE' AND (to_jsonb(OLD) - 'updated_at') = (payload - 'updated_at') THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_TABLE_NAME = 'receipts' THEN
+        event_kind := 'receipt';
+        users := ARRAY[(row_data->>'from_user_id')::UUID, (row_data->>'to_user_id')::UUID];
+        IF TG_OP = 'UPDATE' THEN
+            users := users || (to_jsonb(OLD)->>'to_user_id')::UUID;
+        END IF;
+    ELSIF TG_TABLE_NAME = 'connections' THEN
+        event_kind := 'connection';
+        users := ARRAY[(row_data->>'low_id')::UUID, (row_data->>'high_id')::UUID];
+    ELSE
+        event_kind := 'message';
+        users := ARRAY[(row_data->>'sender_id')::UUID, (row_data->>'recipient_id')::UUID];
+    END IF;
+
+    INSERT INTO change_events (user_id, kind, op, row_id, data)
+    SELECT DISTINCT u, event_kind, TG_OP, (row_data->>'id')::UUID, payload
+    FROM unnest(users) AS u
+    WHERE u IS NOT NULL;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS on_receipt_change_event ON receipts;
+CREATE TRIGGER on_receipt_change_event
+AFTER INSERT OR UPDATE OR DELETE ON receipts
+FOR EACH ROW EXECUTE FUNCTION record_change_event();
+
+DROP TRIGGER IF EXISTS on_connection_change_event ON connections;
+CREATE TRIGGER on_connection_change_event
+AFTER INSERT OR UPDATE OR DELETE ON connections
+FOR EACH ROW EXECUTE FUNCTION record_change_event();
+
+DROP TRIGGER IF EXISTS on_message_change_event ON messages;
+CREATE TRIGGER on_message_change_event
+AFTER INSERT OR UPDATE OR DELETE ON messages
+FOR EACH ROW EXECUTE FUNCTION record_change_event();
+
+-- Retention. Clients that were away longer than this catch up through /api/bootstrap?since=.
+-- Schedule it, e.g. with pg_cron:
+--   SELECT cron.schedule('prune-change-events', '*/15 * * * *', 'SELECT prune_change_events()');
+CREATE OR REPLACE FUNCTION prune_change_events(p_keep INTERVAL DEFAULT INTERVAL '1 day')
+RETURNS INTEGER AS $$
+DECLARE
+    removed INTEGER;
+BEGIN
+    DELETE FROM change_events WHERE created_at < NOW() - p_keep;
+    GET DIAGNOSTICS removed = ROW_COUNT;
+    RETURN removed;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+REVOKE EXECUTE ON FUNCTION prune_change_events(INTERVAL) FROM PUBLIC, anon, authenticated;
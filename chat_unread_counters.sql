@@ -0,0 +1,152 @@
+-- Keyset-paged chat threads and O(1) unread badges.
+-- Requires chat_setup.sql; replaces the bodies of mark_thread_read / get_unread_counts from
+-- chat_notifications.sql (same signatures, so existing callers keep working).
+
+-- 1. Thread pages (GET /api/messages/<other_id>):
+--    (sender = me AND recipient = other) OR (sender = other AND recipient = me)
+--    ORDER BY created_at DESC, id DESC
+-- Both branches are an equality on the pair plus the page order, i.e. one index range scan each.
+CREATE INDEX IF NOT EXISTS idx_messages_pair_created ON messages (recipient_id, sender_id, created_at DESC, id DESC);
+-- Superseded: recipient-only lookups use the prefix of the index above, and the pair index
+-- (sender_id, recipient_id) is covered by it with the columns swapped.
+DROP INDEX IF EXISTS idx_messages_recipient;
+DROP INDEX IF EXISTS idx_messages_thread;
+
+-- mark_thread_read touches only the unread rows of one thread.
+CREATE INDEX IF NOT EXISTS idx_messages_unread ON messages (recipient_id, sender_id) WHERE read_at IS NULL;
+
+-- 2. Unread counters: one row per (recipient, sender), so badges are a primary-key read
+--    instead of a GROUP BY over messages.
+CREATE TABLE IF NOT EXISTS unread_counters (
+    user_id UUID REFERENCES auth.users(id) NOT NULL,    -- recipient
+    sender_id UUID REFERENCES auth.users(id) NOT NULL,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (user_id, sender_id)
+);
+
+ALTER TABLE unread_counters ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Users can view their own unread counters" ON unread_counters;
+CREATE POLICY "Users can view their own unread counters" ON unread_counters
+FOR SELECT USING (auth.uid() = user_id);
+
+-- Statement-level triggers: the rows a statement changed are aggregated per thread first, so
+-- marking k messages read is one counter write, not k.
+CREATE OR REPLACE FUNCTION unread_counters_after_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO unread_counters AS c (user_id, sender_id, unread_count)
+    SELECT recipient_id, sender_id, COUNT(*) FROM new_rows
+    WHERE read_at IS NULL
+    GROUP BY recipient_id, sender_id
+    ON CONFLICT (user_id, sender_id) DO UPDATE
+    SET unread_count = c.unread_count + EXCLUDED.unread_count, updated_at = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION unread_counters_after_update()
+RETURNS TRIGGER AS $$
+BEGIN
+    WITH delta AS (
+        SELECT recipient_id, sender_id, SUM(d)::INTEGER AS d
+        FROM (
+            SELECT recipient_id, sender_id, -1 AS d FROM old_rows WHERE read_at IS NULL
+            UNION ALL
+            SELECT recipient_id, sender_id, 1 AS d FROM new_rows WHERE read_at IS NULL
+        ) changes
+        GROUP BY recipient_id, sender_id
+        HAVING SUM(d) <> 0
+    ),
+    decremented AS (
+        UPDATE unread_counters c
+        SET unread_count = GREATEST(c.unread_count + delta.d, 0), updated_at = NOW()
+        FROM delta
+        WHERE delta.d < 0 AND c.user_id = delta.recipient_id AND c.sender_id = delta.sender_id
+    )
+    INSERT INTO unread_counters AS c (user_id, sender_id, unread_count)
+    SELECT recipient_id, sender_id, d FROM delta WHERE d > 0
+    ON CONFLICT (user_id, sender_id) DO UPDATE
+    SET unread_count = c.unread_count + EXCLUDED.unread_count, updated_at = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION unread_counters_after_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE unread_counters c
+    SET unread_count = GREATEST(c.unread_count - gone.n, 0), updated_at = NOW()
+    FROM (
+        SELECT recipient_id, sender_id, COUNT(*)::INTEGER AS n FROM old_rows
+        WHERE read_at IS NULL
+        GROUP BY recipient_id, sender_id
+    ) gone
+    WHERE c.user_id = gone.recipient_id AND c.sender_id = gone.sender_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS on_message_insert_unread ON messages;
+CREATE TRIGGER on_message_insert_unread
+AFTER INSERT ON messages
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION unread_counters_after_insert();
+
+DROP TRIGGER IF EXISTS on_message_update_unread ON messages;
+CREATE TRIGGER on_message_update_unread
+AFTER UPDATE ON messages
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION unread_counters_after_update();
+
+DROP TRIGGER IF EXISTS on_message_delete_unread ON messages;
+CREATE TRIGGER on_message_delete_unread
+AFTER DELETE ON messages
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION unread_counters_after_delete();
+
+-- 3. RPCs
+
+-- Called when the user opens a thread. Reopening an already-read thread (the common case)
+-- is a primary-key probe; otherwise only the unread rows are updated and the trigger
+-- zeroes the counter in one write.
+CREATE OR REPLACE FUNCTION mark_thread_read(other_user_id UUID)
+RETURNS VOID AS $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM unread_counters
+        WHERE user_id = auth.uid() AND sender_id = other_user_id AND unread_count > 0
+    ) THEN
+        RETURN;
+    END IF;
+
+    UPDATE messages
+    SET read_at = NOW()
+    WHERE recipient_id = auth.uid()
+      AND sender_id = other_user_id
+      AND read_at IS NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Sidebar badges: reads the caller's counter rows (primary-key prefix) instead of grouping messages.
+CREATE OR REPLACE FUNCTION get_unread_counts()
+RETURNS TABLE (sender_id UUID, count BIGINT) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT c.sender_id, c.unread_count::BIGINT
+    FROM unread_counters c
+    WHERE c.user_id = auth.uid()
+      AND c.unread_count > 0;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- 4. Initial population (safe to re-run; run while chat traffic is quiet, since messages
+--    inserted between the two statements are counted by the trigger and then overwritten).
+UPDATE unread_counters SET unread_count = 0, updated_at = NOW() WHERE unread_count <> 0;
+
+INSERT INTO unread_counters (user_id, sender_id, unread_count)
+SELECT recipient_id, sender_id, COUNT(*) FROM messages
+WHERE read_at IS NULL
+GROUP BY recipient_id, sender_id
+ON CONFLICT (user_id, sender_id) DO UPDATE
+SET unread_count = EXCLUDED.unread_count, updated_at = NOW();
@@ -0,0 +1,106 @@
+-- Case-insensitive email lookups and a single round-trip connection request.
+--
+-- 1. Emails are stored normalized (lower + trim), so equality matches regardless of how an
+--    address was typed, and lower(email) = $1 lookups are served by a functional index
+--    instead of scanning every profile the way ILIKE does.
+-- 2. request_connection_rpc replaces the three calls in /api/connections/request (profile
+--    lookup by email, existing-edge check, insert) with one.
+
+-- 1. Normalized emails
+
+CREATE OR REPLACE FUNCTION normalize_profile_email()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.email := lower(trim(NEW.email));
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS normalize_profile_email ON public_profiles;
+CREATE TRIGGER normalize_profile_email
+BEFORE INSERT OR UPDATE OF email ON public_profiles
+FOR EACH ROW EXECUTE FUNCTION normalize_profile_email();
+
+CREATE OR REPLACE FUNCTION normalize_recipient_email()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.recipient_email := lower(trim(NEW.recipient_email));
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS normalize_recipient_email ON receipts;
+CREATE TRIGGER normalize_recipient_email
+BEFORE INSERT OR UPDATE OF recipient_email ON receipts
+FOR EACH ROW EXECUTE FUNCTION normalize_recipient_email();
+
+-- Backfill rows written before the triggers (only the ones that change).
+UPDATE public_profiles SET email = lower(trim(email)) WHERE email <> lower(trim(email));
+UPDATE receipts SET recipient_email = lower(trim(recipient_email)) WHERE recipient_email <> lower(trim(recipient_email));
+
+-- Serves create_receipt_rpc and request_connection_rpc (WHERE lower(email) = ...).
+-- Not UNIQUE: existing duplicates would fail the migration. Check with
+--   SELECT lower(email), COUNT(*) FROM public_profiles GROUP BY 1 HAVING COUNT(*) > 1;
+-- before tightening it.
+CREATE INDEX IF NOT EXISTS idx_public_profiles_email_lower ON public_profiles (lower(email));
+ANALYZE public_profiles;
+
+-- 2. RPC: request a connection by email in one call.
+-- Returns {"state": ..., "connection": <row>}:
+--   requested         the request was created now
+--   connected         already connected
+--   pending_outgoing  the caller already asked
+--   pending_incoming  the other user already asked the caller
+-- Errors (mapped to HTTP statuses in app.py):
+--   P0002 no profile with that email   -> 404
+--   22023 the email is the caller's    -> 400
+-- Runs as the caller (SECURITY INVOKER): the connections insert policy still applies.
+-- Concurrent requests for the same pair are settled by the unique (low_id, high_id) edge:
+-- the loser reports the winner's row instead of failing.
+
+CREATE OR REPLACE FUNCTION request_connection_rpc(p_email TEXT)
+RETURNS JSONB AS $$
+DECLARE
+    me UUID := auth.uid();
+    target UUID;
+    c connections;
+    edge_state TEXT;
+BEGIN
+    IF me IS NULL THEN
+        RAISE EXCEPTION 'Not authenticated' USING ERRCODE = '42501';
+    END IF;
+
+    SELECT user_id INTO target
+    FROM public_profiles
+    WHERE lower(email) = lower(trim(p_email))
+    LIMIT 1;
+
+    IF target IS NULL THEN
+        RAISE EXCEPTION 'User not found. They must sign up for Pledge first.' USING ERRCODE = 'P0002';
+    END IF;
+    IF target = me THEN
+        RAISE EXCEPTION 'Cannot connect to self' USING ERRCODE = '22023';
+    END IF;
+
+    INSERT INTO connections (low_id, high_id, requested_by, accepted)
+    VALUES (LEAST(me, target), GREATEST(me, target), me, FALSE)
+    ON CONFLICT (low_id, high_id) DO NOTHING
+    RETURNING * INTO c;
+
+    IF FOUND THEN
+        edge_state := 'requested';
+    ELSE
+        SELECT * INTO c FROM connections
+        WHERE low_id = LEAST(me, target) AND high_id = GREATEST(me, target);
+        edge_state := CASE
+            WHEN c.accepted THEN 'connected'
+            WHEN c.requested_by = me THEN 'pending_outgoing'
+            ELSE 'pending_incoming'
+        END;
+    END IF;
+
+    RETURN jsonb_build_object('state', edge_state, 'connection', to_jsonb(c));
+END;
+$$ LANGUAGE plpgsql SET search_path = public;
+
+GRANT EXECUTE ON FUNCTION request_connection_rpc(TEXT) TO authenticated;
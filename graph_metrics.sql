@@ -0,0 +1,204 @@
+-- Server-side social graph: ego networks and per-user graph metrics.
+-- Requires sync_cursors.sql (updated_at, sync_tombstones).
+--
+-- 1. connections.receipt_weight: accepted receipts on each edge, kept by trigger.
+-- 2. user_graph_metrics: degree, weighted degree and trust score (weighted PageRank), written
+--    by the batch engine (backend/graph_engine.py) with the service role. The engine re-reads
+--    only connections whose updated_at moved (a receipt_weight change touches the edge) plus
+--    connection tombstones, and writes only the rows whose metrics changed noticeably.
+-- 3. get_ego_network(depth): the caller's k-hop neighborhood of accepted connections.
+-- 4. get_graph_metrics(user): one user's metrics plus mutual connections with the caller.
+
+-- 1. Edge weights
+
+ALTER TABLE connections ADD COLUMN IF NOT EXISTS receipt_weight INT NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_receipts_connection_accepted ON receipts (connection_id) WHERE status = 'ACCEPTED';
+
+CREATE OR REPLACE FUNCTION refresh_connection_weight(p_connection_id UUID)
+RETURNS VOID AS $$
+    UPDATE connections c
+    SET receipt_weight = w.n
+    FROM (SELECT COUNT(*)::INT AS n FROM receipts WHERE connection_id = p_connection_id AND status = 'ACCEPTED') w
+    WHERE c.id = p_connection_id AND c.receipt_weight <> w.n;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION sync_connection_weight()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Only changes that can move an accepted receipt on or off an edge.
+    IF TG_OP = 'UPDATE' AND NEW.status IS NOT DISTINCT FROM OLD.status
+       AND NEW.connection_id IS NOT DISTINCT FROM OLD.connection_id THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.connection_id IS NOT NULL AND OLD.status = 'ACCEPTED' THEN
+        PERFORM refresh_connection_weight(OLD.connection_id);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.connection_id IS NOT NULL AND NEW.status = 'ACCEPTED' THEN
+        PERFORM refresh_connection_weight(NEW.connection_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS trg_connection_weight ON receipts;
+CREATE TRIGGER trg_connection_weight
+AFTER INSERT OR UPDATE OF status, connection_id OR DELETE ON receipts
+FOR EACH ROW EXECUTE FUNCTION sync_connection_weight();
+
+UPDATE connections c
+SET receipt_weight = w.n
+FROM (SELECT connection_id, COUNT(*)::INT AS n FROM receipts
+      WHERE status = 'ACCEPTED' AND connection_id IS NOT NULL GROUP BY connection_id) w
+WHERE c.id = w.connection_id AND c.receipt_weight <> w.n;
+
+-- The engine's delta scan: connections changed since its watermark, in (updated_at, id) order.
+CREATE INDEX IF NOT EXISTS idx_connections_updated_id ON connections (updated_at, id);
+
+-- 2. Stored metrics
+
+CREATE TABLE IF NOT EXISTS user_graph_metrics (
+    user_id UUID PRIMARY KEY REFERENCES auth.users(id) ON DELETE CASCADE,
+    degree INT NOT NULL DEFAULT 0,              -- accepted connections
+    weighted_degree INT NOT NULL DEFAULT 0,     -- accepted receipts across those connections
+    trust_score DOUBLE PRECISION NOT NULL DEFAULT 0,  -- PageRank scaled so the average user scores 1.0
+    computed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Ranks are counted at read time (get_graph_metrics) rather than stored: one edge change
+-- shifts many ranks, and storing them would turn every incremental pass into a full rewrite.
+CREATE INDEX IF NOT EXISTS idx_user_graph_metrics_trust ON user_graph_metrics (trust_score DESC);
+
+ALTER TABLE user_graph_metrics ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Graph metrics viewable by authenticated users" ON user_graph_metrics;
+CREATE POLICY "Graph metrics viewable by authenticated users" ON user_graph_metrics
+FOR SELECT TO authenticated USING (TRUE);
+-- No write policies: only the service role (graph engine) writes.
+
+-- 3. Ego network
+-- Breadth-first over accepted connections from the caller, `p_depth` hops (1..3). Each level
+-- keeps its highest trust scores first when the node budget (`p_max_nodes`) runs out.
+-- Returns {"nodes": [...], "edges": [...], "truncated": bool}. Nodes carry their hop count
+-- and stored metrics; beyond the first hop, profiles in ghost mode show institution only.
+-- SECURITY DEFINER: RLS only shows a user their own edges, and this walks friends of friends.
+
+CREATE OR REPLACE FUNCTION get_ego_network(p_depth INT DEFAULT 2, p_max_nodes INT DEFAULT 500)
+RETURNS JSONB AS $$
+DECLARE
+    me UUID := auth.uid();
+    max_depth INT := LEAST(GREATEST(COALESCE(p_depth, 2), 1), 3);
+    budget INT := LEAST(GREATEST(COALESCE(p_max_nodes, 500), 1), 2000);
+    visited UUID[];
+    frontier UUID[];
+    next_level UUID[];
+    hops JSONB := '{}'::JSONB;
+    truncated BOOLEAN := FALSE;
+    d INT;
+BEGIN
+    IF me IS NULL THEN
+        RAISE EXCEPTION 'Not authenticated' USING ERRCODE = '42501';
+    END IF;
+
+    visited := ARRAY[me];
+    frontier := ARRAY[me];
+    hops := jsonb_build_object(me::TEXT, 0);
+
+    FOR d IN 1..max_depth LOOP
+        SELECT array_agg(n ORDER BY score DESC NULLS LAST, n) INTO next_level
+        FROM (
+            SELECT DISTINCT nb.n, m.trust_score AS score
+            FROM (
+                SELECT high_id AS n FROM connections WHERE accepted AND low_id = ANY (frontier)
+                UNION
+                SELECT low_id FROM connections WHERE accepted AND high_id = ANY (frontier)
+            ) nb
+            LEFT JOIN user_graph_metrics m ON m.user_id = nb.n
+            WHERE nb.n <> ALL (visited)
+        ) candidates;
+
+        EXIT WHEN next_level IS NULL;
+        IF cardinality(visited) + cardinality(next_level) > budget THEN
+            next_level := next_level[1:budget - cardinality(visited)];
+            truncated := TRUE;
+        END IF;
+        EXIT WHEN cardinality(next_level) = 0;
+
+        hops := hops || (SELECT jsonb_object_agg(n::TEXT, d) FROM unnest(next_level) n);
+        visited := visited || next_level;
+        frontier := next_level;
+        EXIT WHEN truncated;
+    END LOOP;
+
+    RETURN jsonb_build_object(
+        'nodes', (
+            SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                'id', v.id,
+                'depth', (hops ->> v.id::TEXT)::INT,
+                'first_name', CASE WHEN (hops ->> v.id::TEXT)::INT > 1 AND COALESCE(p.ghost_mode, FALSE) THEN NULL ELSE p.first_name END,
+                'last_name', CASE WHEN (hops ->> v.id::TEXT)::INT > 1 AND COALESCE(p.ghost_mode, FALSE) THEN NULL ELSE p.last_name END,
+                'institution', p.institution,
+                'degree', COALESCE(m.degree, 0),
+                'weighted_degree', COALESCE(m.weighted_degree, 0),
+                'trust_score', COALESCE(m.trust_score, 0)
+            )), '[]'::JSONB)
+            FROM unnest(visited) AS v(id)
+            LEFT JOIN public_profiles p ON p.user_id = v.id
+            LEFT JOIN user_graph_metrics m ON m.user_id = v.id
+        ),
+        'edges', (
+            SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                'source', c.low_id, 'target', c.high_id, 'weight', c.receipt_weight
+            )), '[]'::JSONB)
+            FROM connections c
+            WHERE c.accepted AND c.low_id = ANY (visited) AND c.high_id = ANY (visited)
+        ),
+        'truncated', truncated
+    );
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER SET search_path = public;
+
+GRANT EXECUTE ON FUNCTION get_ego_network(INT, INT) TO authenticated;
+
+-- 4. One user's metrics plus mutual connections with the caller.
+-- Errors: P0002 unknown user -> 404.
+
+CREATE OR REPLACE FUNCTION get_graph_metrics(p_user_id UUID)
+RETURNS JSONB AS $$
+DECLARE
+    me UUID := auth.uid();
+    result JSONB;
+BEGIN
+    IF me IS NULL THEN
+        RAISE EXCEPTION 'Not authenticated' USING ERRCODE = '42501';
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM public_profiles WHERE user_id = p_user_id) THEN
+        RAISE EXCEPTION 'User not found' USING ERRCODE = 'P0002';
+    END IF;
+
+    SELECT jsonb_build_object(
+        'user_id', p_user_id,
+        'degree', COALESCE(m.degree, 0),
+        'weighted_degree', COALESCE(m.weighted_degree, 0),
+        'trust_score', COALESCE(m.trust_score, 0),
+        'trust_rank', CASE WHEN COALESCE(m.degree, 0) > 0 THEN (
+            SELECT COUNT(*) + 1 FROM user_graph_metrics o WHERE o.trust_score > m.trust_score
+        ) END,
+        'computed_at', m.computed_at,
+        'mutual_connections', CASE WHEN p_user_id = me THEN NULL ELSE (
+            SELECT COUNT(*) FROM (
+                SELECT CASE WHEN low_id = me THEN high_id ELSE low_id END AS n
+                FROM connections WHERE accepted AND (low_id = me OR high_id = me)
+                INTERSECT
+                SELECT CASE WHEN low_id = p_user_id THEN high_id ELSE low_id END
+                FROM connections WHERE accepted AND (low_id = p_user_id OR high_id = p_user_id)
+            ) mutual
+        ) END
+    ) INTO result
+    FROM (SELECT 1) one
+    LEFT JOIN user_graph_metrics m ON m.user_id = p_user_id;
+
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER SET search_path = public;
+
+GRANT EXECUTE ON FUNCTION get_graph_metrics(UUID) TO authenticated;
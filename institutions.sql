@@ -0,0 +1,26 @@
+-- Table: institutions
+-- Registry read by utils/student_identity.py when INSTITUTIONS_SOURCE=db (the default is
+-- backend/institutions.json, same fields). Onboarding a university is a row, not a code change.
+-- The backend caches the whole registry for INSTITUTIONS_TTL seconds, so no lookup indexes are needed.
+
+CREATE TABLE IF NOT EXISTS institutions (
+    id TEXT PRIMARY KEY,                               -- matches public_profiles.institution_id
+    name TEXT NOT NULL,
+    domains TEXT[] NOT NULL,                           -- lower-case email domains, e.g. {lums.edu.pk}
+    include_subdomains BOOLEAN NOT NULL DEFAULT FALSE, -- accept e.g. lhr.nu.edu.pk under nu.edu.pk
+    roll_patterns TEXT[] NOT NULL DEFAULT '{}',        -- Python regexes; named groups roll, year, campus
+    batch_year JSONB NOT NULL DEFAULT '{"group": "year", "base": 2000, "offset": 0}',
+    campus_codes JSONB NOT NULL DEFAULT '{}',          -- campus group / subdomain label -> campus code
+    default_campus TEXT,
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE institutions ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Institutions are public" ON institutions;
+CREATE POLICY "Institutions are public" ON institutions FOR SELECT USING (true);
+
+INSERT INTO institutions (id, name, domains, roll_patterns, default_campus)
+VALUES ('LUMS', 'Lahore University of Management Sciences', '{lums.edu.pk}', ARRAY['^(?P<year>\d{2})'], 'LUMS-MAIN')
+ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,66 @@
+-- Leaderboard: indexed top-N reads, windowed (weekly / semester) and per-institution boards.
+
+-- 1. Indexes for `order(...).limit(50)` on the all-time board and for the cache version probe
+CREATE INDEX IF NOT EXISTS idx_leaderboard_given ON leaderboard_stats (given_count DESC) WHERE given_count > 0;
+CREATE INDEX IF NOT EXISTS idx_leaderboard_received ON leaderboard_stats (received_count DESC) WHERE received_count > 0;
+CREATE INDEX IF NOT EXISTS idx_leaderboard_last_updated ON leaderboard_stats (last_updated DESC);
+
+-- 2. Stamp accepted_at when a receipt becomes ACCEPTED (the claim path only sets status),
+--    so time windows can be computed from when a receipt was accepted.
+CREATE OR REPLACE FUNCTION stamp_receipt_accepted_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.status = 'ACCEPTED' AND NEW.accepted_at IS NULL AND
+       (TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'ACCEPTED') THEN
+        NEW.accepted_at := NOW();
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_stamp_receipt_accepted_at ON receipts;
+CREATE TRIGGER trg_stamp_receipt_accepted_at
+BEFORE INSERT OR UPDATE OF status ON receipts
+FOR EACH ROW EXECUTE FUNCTION stamp_receipt_accepted_at();
+
+CREATE INDEX IF NOT EXISTS idx_receipts_accepted_at ON receipts (accepted_at DESC) WHERE status = 'ACCEPTED';
+
+-- 3. RPC: Top-N givers and receivers since `p_since` (NULL = all time), optionally for one institution.
+--    Returns at most p_limit rows per board, profile fields included.
+CREATE OR REPLACE FUNCTION get_leaderboard_window(
+    p_since TIMESTAMPTZ DEFAULT NULL,
+    p_institution TEXT DEFAULT NULL,
+    p_limit INTEGER DEFAULT 50
+)
+RETURNS TABLE (board TEXT, user_id UUID, first_name TEXT, last_name TEXT, institution TEXT, count BIGINT) AS $$
+    WITH events AS (
+        SELECT 'givers'::TEXT AS board, r.from_user_id AS user_id
+        FROM receipts r
+        WHERE r.status = 'ACCEPTED'
+          AND (p_since IS NULL OR COALESCE(r.accepted_at, r.created_at) >= p_since)
+        UNION ALL
+        SELECT 'receivers'::TEXT, r.to_user_id
+        FROM receipts r
+        WHERE r.status = 'ACCEPTED'
+          AND r.to_user_id IS NOT NULL
+          AND (p_since IS NULL OR COALESCE(r.accepted_at, r.created_at) >= p_since)
+    ),
+    totals AS (
+        SELECT e.board, e.user_id, COUNT(*) AS count
+        FROM events e
+        GROUP BY e.board, e.user_id
+    ),
+    ranked AS (
+        SELECT t.board, t.user_id, p.first_name, p.last_name, p.institution, t.count,
+               ROW_NUMBER() OVER (PARTITION BY t.board ORDER BY t.count DESC, t.user_id) AS rank
+        FROM totals t
+        JOIN public_profiles p ON p.user_id = t.user_id
+        WHERE p_institution IS NULL OR p.institution_id = p_institution
+    )
+    SELECT board, user_id, first_name, last_name, institution, count
+    FROM ranked
+    WHERE rank <= p_limit
+    ORDER BY board, count DESC;
+$$ LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public;
+
+GRANT EXECUTE ON FUNCTION get_leaderboard_window(TIMESTAMPTZ, TEXT, INTEGER) TO authenticated;
@@ -0,0 +1,21 @@
+-- Keyset pagination for GET /api/receipts and GET /api/connections (?limit=&cursor=&updated_since=).
+-- Each branch of the per-user OR filter gets an index matching the page order, so a page
+-- costs an index range scan of `limit` rows regardless of how many rows the account has.
+-- Requires sync_cursors.sql (updated_at columns).
+
+-- Newest first: ORDER BY created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_receipts_from_created ON receipts (from_user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_receipts_to_created ON receipts (to_user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_receipts_email_created ON receipts (recipient_email, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_connections_low_created ON connections (low_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_connections_high_created ON connections (high_id, created_at DESC, id DESC);
+
+-- Delta mode: ORDER BY updated_at, id (replaces the two-column indexes from sync_cursors.sql)
+DROP INDEX IF EXISTS idx_receipts_from_updated;
+DROP INDEX IF EXISTS idx_receipts_to_updated;
+DROP INDEX IF EXISTS idx_connections_low_updated;
+DROP INDEX IF EXISTS idx_connections_high_updated;
+CREATE INDEX IF NOT EXISTS idx_receipts_from_updated_id ON receipts (from_user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_receipts_to_updated_id ON receipts (to_user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_connections_low_updated_id ON connections (low_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_connections_high_updated_id ON connections (high_id, updated_at, id);
@@ -1,5 +1,6 @@
 import { supabase } from './supabaseClient';
 import { RealtimeChannel } from '@supabase/supabase-js';
+import { API_BASE_URL } from '../constants';
 
 export interface ChatMessage {
     id: string;
@@ -13,26 +14,32 @@ export interface ChatMessage {
     proof_data?: any; // Joined receipt data
 }
 
+export interface MessagePage {
+    messages: ChatMessage[];   // oldest first, ready to render
+    nextCursor: string | null; // pass back to load earlier messages
+}
+
+async function authHeaders(): Promise<Record<string, string>> {
+    const { data: { session } } = await supabase.auth.getSession();
+    if (!session) throw new Error('Not authenticated');
+    return { 'Authorization': `Bearer ${session.access_token}` };
+}
+
 export const chatService = {
     /**
-     * Fetch message history between current user and another user.
+     * Fetch one page of the thread with another user, newest page first.
+     * Receipt data is joined for proof messages.
      */
-    async fetchMessages(otherUserId: string): Promise<ChatMessage[]> {
-        const { data: { user } } = await supabase.auth.getUser();
-        if (!user) throw new Error('Not authenticated');
-
-        // We fetch messages and optionally join receipt data if it exists
-        const { data, error } = await supabase
-            .from('messages')
-            .select(`
-                *,
-                proof_data:receipts(*)
-            `)
-            .or(`and(sender_id.eq.${user.id},recipient_id.eq.${otherUserId}),and(sender_id.eq.${otherUserId},recipient_id.eq.${user.id})`)
-            .order('created_at', { ascending: true });
+    async fetchMessages(otherUserId: string, cursor?: string): Promise<MessagePage> {
+        const params = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const res = await fetch(`${API_BASE_URL}/api/messages/${otherUserId}${params}`, {
+            headers: await authHeaders()
+        });
+        const json = await res.json();
+        if (!res.ok) throw new Error(json.error || 'Failed to load messages');
 
-        if (error) throw error;
-        return data as ChatMessage[];
+        // The API pages newest first; the thread renders oldest first.
+        return { messages: (json.data as ChatMessage[]).reverse(), nextCursor: json.next_cursor };
     },
 
     /**
@@ -136,21 +143,23 @@ export const chatService = {
      * Mark a conversation thread as read.
      */
     async markThreadRead(otherUserId: string): Promise<void> {
-        await supabase.rpc('mark_thread_read', { other_user_id: otherUserId });
+        await fetch(`${API_BASE_URL}/api/messages/${otherUserId}/read`, {
+            method: 'POST',
+            headers: await authHeaders()
+        });
     },
 
     /**
      * Get unread message counts for all senders.
      */
     async getUnreadCounts(): Promise<{ [senderId: string]: number }> {
-        const { data, error } = await supabase.rpc('get_unread_counts');
-        if (error || !data) return {};
-
-        // Convert array [{sender_id, count}] to map {sender_id: count}
-        const counts: { [key: string]: number } = {};
-        data.forEach((row: any) => {
-            counts[row.sender_id] = row.count;
-        });
-        return counts;
+        try {
+            const res = await fetch(`${API_BASE_URL}/api/messages/unread`, { headers: await authHeaders() });
+            if (!res.ok) return {};
+            const json = await res.json();
+            return json.unread_counts || {};
+        } catch {
+            return {};
+        }
     }
 };
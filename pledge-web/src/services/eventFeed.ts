@@ -0,0 +1,97 @@
+import { API_BASE_URL } from '../constants';
+
+// Client for GET /api/events, the per-user change feed (server-sent events).
+// EventSource cannot send an Authorization header, so the stream is read with fetch.
+// The feed is only served by the ASGI backend; elsewhere it answers 404 and the store
+// keeps its Supabase realtime subscriptions instead.
+
+export interface ChangeEvent {
+    id: number;
+    kind: 'receipt' | 'connection' | 'message';
+    op: 'INSERT' | 'UPDATE' | 'DELETE';
+    row_id: string;
+    data: any; // the row after the change; null for deletes
+    created_at: string;
+}
+
+export type FeedStatus = 'connecting' | 'live' | 'unavailable';
+
+interface FeedHandlers {
+    onStatus: (status: FeedStatus) => void;
+    onReady: () => void;                   // (re)connected: changes made while away must be re-synced
+    onChange: (event: ChangeEvent) => void;
+}
+
+const MAX_BACKOFF_MS = 30000;
+
+/**
+ * Keeps a change stream open until the returned function is called, reconnecting with
+ * backoff. `getToken` is called for every connection so refreshed JWTs are picked up.
+ */
+export function openEventFeed(getToken: () => Promise<string | null>, handlers: FeedHandlers): () => void {
+    const abort = new AbortController();
+    let retryMs = 3000;
+    let failures = 0;
+
+    const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
+
+    const handleBlock = (block: string) => {
+        let event = 'message';
+        let data = '';
+        for (const line of block.split('\n')) {
+            if (line.startsWith('event: ')) event = line.slice(7);
+            else if (line.startsWith('data: ')) data += line.slice(6);
+            else if (line.startsWith('retry: ')) retryMs = Number(line.slice(7)) || retryMs;
+        }
+        if (event === 'ready') {
+            failures = 0;
+            handlers.onStatus('live');
+            handlers.onReady();
+        } else if (event === 'change') {
+            handlers.onChange(JSON.parse(data));
+        }
+        // 'reset' / 'reconnect' end the stream; the loop below opens a new one.
+    };
+
+    const run = async () => {
+        while (!abort.signal.aborted) {
+            handlers.onStatus('connecting');
+            try {
+                const token = await getToken();
+                if (!token) return;
+                const res = await fetch(`${API_BASE_URL}/api/events`, {
+                    headers: { 'Authorization': `Bearer ${token}`, 'Accept': 'text/event-stream' },
+                    signal: abort.signal
+                });
+                if (res.status === 404 || res.status === 405) {
+                    handlers.onStatus('unavailable');
+                    return;
+                }
+                if (!res.ok || !res.body) throw new Error(`Event feed responded ${res.status}`);
+
+                const reader = res.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    let end;
+                    while ((end = buffer.indexOf('\n\n')) >= 0) {
+                        handleBlock(buffer.slice(0, end));
+                        buffer = buffer.slice(end + 2);
+                    }
+                }
+            } catch (err) {
+                if (abort.signal.aborted) return;
+                failures += 1;
+                console.warn('[EventFeed] stream error:', err);
+            }
+            if (abort.signal.aborted) return;
+            await sleep(failures ? Math.min(retryMs * 2 ** (failures - 1), MAX_BACKOFF_MS) : 0);
+        }
+    };
+
+    run();
+    return () => abort.abort();
+}
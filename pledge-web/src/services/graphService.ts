@@ -0,0 +1,83 @@
+import { supabase } from './supabaseClient';
+import { API_BASE_URL } from '../constants';
+
+export interface EgoNode {
+    id: string;
+    depth: number;                    // 0 = the current user
+    first_name: string | null;        // null beyond the first hop for users in ghost mode
+    last_name: string | null;
+    institution: string | null;
+    degree: number;
+    weighted_degree: number;
+    trust_score: number;              // 1.0 = average
+    mutual_connections: number | null;
+}
+
+export interface EgoEdge {
+    source: string;
+    target: string;
+    weight: number;                   // accepted receipts on the connection
+}
+
+export interface EgoNetwork {
+    depth: number;
+    nodes: EgoNode[];
+    edges: EgoEdge[];
+    truncated: boolean;
+}
+
+export interface GraphMetrics {
+    user_id: string;
+    degree: number;
+    weighted_degree: number;
+    trust_score: number;
+    trust_rank: number | null;
+    computed_at: string | null;
+    mutual_connections: number | null;
+}
+
+async function authHeaders(): Promise<Record<string, string>> {
+    const { data: { session } } = await supabase.auth.getSession();
+    if (!session) throw new Error('Not authenticated');
+    return { 'Authorization': `Bearer ${session.access_token}` };
+}
+
+// Last response per depth; revalidated with If-None-Match so an unchanged network is a 304.
+const egoCache = new Map<number, { etag: string; network: EgoNetwork }>();
+
+export const graphService = {
+    /**
+     * The current user's neighbourhood of accepted connections, `depth` hops out (1-3),
+     * computed by the backend in one query.
+     */
+    async fetchEgoNetwork(depth = 2): Promise<EgoNetwork> {
+        const headers = await authHeaders();
+        const cached = egoCache.get(depth);
+        if (cached) headers['If-None-Match'] = cached.etag;
+
+        const res = await fetch(`${API_BASE_URL}/api/graph/ego?depth=${depth}`, { headers });
+        if (res.status === 304 && cached) return cached.network;
+        const json = await res.json();
+        if (!res.ok) throw new Error(json.error || 'Failed to load network');
+
+        const network: EgoNetwork = { depth: json.depth, nodes: json.nodes, edges: json.edges, truncated: json.truncated };
+        const etag = res.headers.get('ETag');
+        if (etag) egoCache.set(depth, { etag, network });
+        return network;
+    },
+
+    /**
+     * Stored graph metrics for a user (default: the current user), with mutual connections.
+     */
+    async fetchMetrics(userId?: string): Promise<GraphMetrics> {
+        const params = userId ? `?user_id=${encodeURIComponent(userId)}` : '';
+        const res = await fetch(`${API_BASE_URL}/api/graph/metrics${params}`, { headers: await authHeaders() });
+        const json = await res.json();
+        if (!res.ok) throw new Error(json.error || 'Failed to load graph metrics');
+        return json.metrics;
+    },
+
+    clearCache() {
+        egoCache.clear();
+    }
+};
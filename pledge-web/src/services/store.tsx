@@ -4,6 +4,8 @@ import { ReceiptStatus } from '../types';
 import { INITIAL_USERS, API_BASE_URL } from '../constants'; // Fallback
 import { supabase } from './supabaseClient';
 import { chatService } from './chatService';
+import { openEventFeed } from './eventFeed';
+import type { ChangeEvent, FeedStatus } from './eventFeed';
 
 
 
@@ -46,56 +48,54 @@ export const StoreProvider: React.FC<{ children: React.ReactNode }> = ({ childre
 
     const lastFetchRef = React.useRef<number>(0);
 
-    const fetchReceipts = async (userId: string, email: string) => {
-        const { data: receiptsData, error: receiptsError } = await supabase
-            .from('receipts')
-            .select('*')
-            .or(`from_user_id.eq.${userId},recipient_email.eq.${email}`)
-            .order('created_at', { ascending: false });
-
-        if (receiptsError) console.error("Error fetching receipts:", receiptsError);
-
-        const mappedReceipts: Receipt[] = (receiptsData || []).map((r: any) => ({
-            id: r.id,
-            from_user_id: r.from_user_id,
-            to_user_id: r.to_user_id,
-            recipient_email: r.recipient_email,
-            connection_id: r.connection_id,
-            tags: r.tags || [],
-            description: r.description,
-            is_public: r.is_public,
-            status: r.status as ReceiptStatus,
-            created_at: r.created_at,
-            accepted_at: r.accepted_at,
-            accepted_by_user_id: r.accepted_by_user_id
-        }));
-        setReceipts(mappedReceipts);
-        return mappedReceipts;
+    // Cursor returned by /api/bootstrap; later refreshes only pull rows changed after it.
+    const syncCursorRef = React.useRef<string | null>(null);
+
+    // Change feed (/api/events). While it is live, changes arrive as deltas and mutations
+    // do not refetch; when the backend does not serve it, Supabase realtime is used instead.
+    const [feedStatus, setFeedStatus] = useState<FeedStatus>('connecting');
+    const feedLiveRef = useRef(false);
+
+    const mapReceipt = (r: any): Receipt => ({
+        id: r.id,
+        from_user_id: r.from_user_id,
+        to_user_id: r.to_user_id,
+        recipient_email: r.recipient_email,
+        connection_id: r.connection_id,
+        tags: r.tags || [],
+        description: r.description,
+        is_public: r.is_public,
+        status: r.status as ReceiptStatus,
+        created_at: r.created_at,
+        accepted_at: r.accepted_at,
+        accepted_by_user_id: r.accepted_by_user_id
+    });
+
+    const mapProfile = (p: any): User => ({
+        id: p.user_id,
+        email: p.email,
+        first_name: p.first_name,
+        last_name: p.last_name,
+        institution: p.institution,
+        institution_id: p.institution_id,
+        campus_code: p.campus_code,
+        batch_year: p.batch_year,
+        roll_number: p.roll_number,
+        major: p.major,
+        handle: p.first_name,
+        maskedName: `${p.first_name} ${p.last_name || ''}`.trim()
+    });
+
+    const mergeById = <T extends { id: string }>(prev: T[], incoming: T[], deleted: Set<string>): T[] => {
+        const byId = new Map(prev.filter(item => !deleted.has(item.id)).map(item => [item.id, item] as [string, T]));
+        incoming.forEach(item => byId.set(item.id, item));
+        return Array.from(byId.values());
     };
 
-    const fetchConnections = async () => {
-        const token = (await supabase.auth.getSession()).data.session?.access_token;
-        if (!token) return [];
-        
-        try {
-            const connRes = await fetch(`${API_BASE_URL}/api/connections`, {
-                headers: { 'Authorization': `Bearer ${token}` }
-            });
-            const connJson = await connRes.json();
-            if (connJson.success) {
-                setConnections(connJson.data);
-                return connJson.data;
-            }
-        } catch (e) {
-            console.error("Error fetching connections", e);
-        }
-        return [];
-    };
-
-    const fetchData = async (options: { silent?: boolean; force?: boolean } = {}) => {
+    const fetchData = async (options: { silent?: boolean; force?: boolean; immediate?: boolean } = {}) => {
         const now = Date.now();
-        // Debounce: If called within 2 seconds, skip unless forced
-        if (!options.force && (now - lastFetchRef.current < 2000)) {
+        // Debounce: If called within 2 seconds, skip unless forced (or an immediate delta catch-up)
+        if (!options.force && !options.immediate && (now - lastFetchRef.current < 2000)) {
             return;
         }
         lastFetchRef.current = now;
@@ -104,23 +104,34 @@ export const StoreProvider: React.FC<{ children: React.ReactNode }> = ({ childre
             if (!options.silent) {
                 setLoading(true);
             }
-            const { data: { user: authUser } } = await supabase.auth.getUser();
-            if (!authUser) {
+            const { data: { session } } = await supabase.auth.getSession();
+            const authUser = session?.user;
+            if (!session || !authUser) {
                 setLoading(false);
                 setReceipts([]);
                 setConnections([]);
                 setCurrentUser(null);
                 setUsers([]);
+                syncCursorRef.current = null;
                 return;
             }
 
-            // 1. Fetch My Profile
-            const { data: myProfile } = await supabase
-                .from('public_profiles')
-                .select('*')
-                .eq('user_id', authUser.id)
-                .maybeSingle();
+            // One round-trip: profile, receipts, connections, related profiles and unread counts.
+            // After the first load only changes since the cursor are fetched (unless forced).
+            const since = options.force ? null : syncCursorRef.current;
+            const url = since
+                ? `${API_BASE_URL}/api/bootstrap?since=${encodeURIComponent(since)}`
+                : `${API_BASE_URL}/api/bootstrap`;
+            const res = await fetch(url, {
+                headers: { 'Authorization': `Bearer ${session.access_token}` }
+            });
+            const json = await res.json();
+            if (!res.ok || !json.success) {
+                throw new Error(json.error || 'Failed to load data');
+            }
 
+            // 1. My Profile
+            const myProfile = json.me;
             if (myProfile) {
                 setCurrentUser({
                     id: myProfile.user_id,
@@ -153,55 +164,31 @@ export const StoreProvider: React.FC<{ children: React.ReactNode }> = ({ childre
                 });
             }
 
-            // 2. Fetch Receipts & Connections
-            const myEmail = authUser.email?.toLowerCase() || '';
-            const [receiptsResults, connectionsResults] = await Promise.all([
-                fetchReceipts(authUser.id, myEmail),
-                fetchConnections()
-            ]);
-
-            // 4. Fetch Related Profiles (Optimization: only fetch new ones?)
-            // For simplicity, we keep the existing logic but using the results
-            const relatedIds = new Set<string>();
-            relatedIds.add(authUser.id);
-            connectionsResults.forEach((c: any) => {
-                relatedIds.add(c.low_id);
-                relatedIds.add(c.high_id);
-            });
-            receiptsResults.forEach((r: any) => {
-                relatedIds.add(r.from_user_id);
-                if (r.to_user_id) relatedIds.add(r.to_user_id);
-            });
+            // 2. Receipts, Connections & Related Profiles
+            const incomingReceipts: Receipt[] = (json.receipts || []).map(mapReceipt);
+            const incomingConnections: Connection[] = json.connections || [];
+            const incomingUsers: User[] = Object.values(json.profiles || {}).map(mapProfile);
+
+            if (json.delta) {
+                const deletedReceipts = new Set<string>(json.deleted?.receipts || []);
+                const deletedConnections = new Set<string>(json.deleted?.connections || []);
+                setReceipts(prev => mergeById(prev, incomingReceipts, deletedReceipts)
+                    .sort((a, b) => (b.created_at || '').localeCompare(a.created_at || '')));
+                setConnections(prev => mergeById(prev, incomingConnections, deletedConnections));
+                setUsers(prev => mergeById(prev, incomingUsers, new Set<string>()));
+            } else {
+                setReceipts(incomingReceipts);
+                setConnections(incomingConnections);
+                setUsers(incomingUsers);
+            }
+            syncCursorRef.current = json.cursor;
 
-            if (relatedIds.size > 0) {
-                const { data: profiles, error: profilesError } = await supabase
-                    .from('public_profiles')
-                    .select('*')
-                    .in('user_id', Array.from(relatedIds));
-
-                if (profilesError) console.error("Error fetching profiles:", profilesError);
-
-                if (profiles) {
-                    const allUsers = profiles.map((p: any) => ({
-                        id: p.user_id,
-                        email: p.email,
-                        first_name: p.first_name,
-                        last_name: p.last_name,
-                        institution: p.institution,
-                        institution_id: p.institution_id,
-                        campus_code: p.campus_code,
-                        batch_year: p.batch_year,
-                        roll_number: p.roll_number,
-                        major: p.major,
-                        handle: p.first_name,
-                        maskedName: `${p.first_name} ${p.last_name || ''}`.trim()
-                    }));
-                    setUsers(allUsers);
-                }
+            // 3. Unread Counts
+            const counts: { [key: string]: number } = json.unread_counts || {};
+            if (activeConversationIdRef.current) {
+                counts[activeConversationIdRef.current] = 0;
             }
-            
-            // 5. Fetch Unread Counts
-            refreshUnreadCounts();
+            setUnreadCounts(counts);
 
         } catch (err) {
             console.error("fetchData error:", err);
@@ -235,11 +222,78 @@ export const StoreProvider: React.FC<{ children: React.ReactNode }> = ({ childre
         }));
     }, []);
 
-    // Centralized Realtime Subscription
+    const currentUserRef = useRef(currentUser);
+    const usersRef = useRef(users);
     useEffect(() => {
-        let channel: any;
+        currentUserRef.current = currentUser;
+        usersRef.current = users;
+    }, [currentUser, users]);
+
+    // Mutations only need a refetch when no change feed will deliver the result.
+    const refreshUnlessLive = async () => {
+        if (!feedLiveRef.current) await fetchData();
+    };
 
+    const applyChange = (event: ChangeEvent) => {
+        const me = currentUserRef.current;
+        if (event.kind === 'receipt') {
+            if (event.op === 'DELETE') {
+                setReceipts(prev => prev.filter(r => r.id !== event.row_id));
+                return;
+            }
+            const receipt = mapReceipt(event.data);
+            const involved = receipt.from_user_id === me?.id || receipt.to_user_id === me?.id;
+            setReceipts(prev => (involved
+                ? mergeById(prev, [receipt], new Set<string>())
+                : prev.filter(r => r.id !== receipt.id)) // re-linked to someone else
+                .sort((a, b) => (b.created_at || '').localeCompare(a.created_at || '')));
+            // A receipt from someone new needs their profile: pull it with a delta sync.
+            const other = receipt.from_user_id === me?.id ? receipt.to_user_id : receipt.from_user_id;
+            if (other && !usersRef.current.some(u => u.id === other)) fetchData({ silent: true, immediate: true });
+        } else if (event.kind === 'connection') {
+            if (event.op === 'DELETE') {
+                setConnections(prev => prev.filter(c => c.id !== event.row_id));
+                return;
+            }
+            const connection = event.data as Connection;
+            setConnections(prev => mergeById(prev, [connection], new Set<string>()));
+            const other = connection.low_id === me?.id ? connection.high_id : connection.low_id;
+            if (other && !usersRef.current.some(u => u.id === other)) fetchData({ silent: true, immediate: true });
+        } else if (event.kind === 'message') {
+            const msg = event.data;
+            if (event.op === 'INSERT' && msg?.recipient_id === me?.id && msg.sender_id !== activeConversationIdRef.current) {
+                setUnreadCounts(prev => ({ ...prev, [msg.sender_id]: (prev[msg.sender_id] || 0) + 1 }));
+            } else if (event.op !== 'INSERT') {
+                refreshUnreadCounts();
+            }
+        }
+    };
+
+    useEffect(() => {
         if (!currentUser) return;
+        const close = openEventFeed(
+            async () => (await supabase.auth.getSession()).data.session?.access_token || null,
+            {
+                onStatus: status => {
+                    feedLiveRef.current = status === 'live';
+                    setFeedStatus(status);
+                },
+                // Whatever changed while the stream was down is pulled as one delta.
+                onReady: () => { fetchData({ silent: true, immediate: true }); },
+                onChange: event => applyChange(event)
+            }
+        );
+        return () => {
+            feedLiveRef.current = false;
+            close();
+        };
+    }, [currentUser?.id]);
+
+    // Realtime fallback, used only when the backend does not serve /api/events
+    useEffect(() => {
+        let channel: any;
+
+        if (!currentUser || feedStatus !== 'unavailable') return;
 
         // Subscribe globally to Messages
         channel = chatService.subscribeToMessages((msg, eventType) => {
@@ -341,7 +395,7 @@ export const StoreProvider: React.FC<{ children: React.ReactNode }> = ({ childre
              if (receiptsChannel) supabase.removeChannel(receiptsChannel);
              if (connectionsChannel) supabase.removeChannel(connectionsChannel);
         };
-    }, [currentUser, refreshUnreadCounts]); // Stable dependencies
+    }, [currentUser, refreshUnreadCounts, feedStatus]); // Stable dependencies
 
     useEffect(() => {
         // Initial fetch
@@ -391,7 +445,7 @@ export const StoreProvider: React.FC<{ children: React.ReactNode }> = ({ childre
                 return { success: false, message: json.error || "Failed to create receipt" };
             }
 
-            await fetchData();
+            await refreshUnlessLive();
             return { success: true, message: "Receipt created!", receipt: json.receipt };
 
         } catch (err: any) {
@@ -421,7 +475,7 @@ export const StoreProvider: React.FC<{ children: React.ReactNode }> = ({ childre
                 return { success: false, message: json.error || "Failed to claim receipt" };
             }
 
-            await fetchData();
+            await refreshUnlessLive();
             return { success: true, message: "Receipt accepted!" };
 
         } catch (err: any) {
@@ -450,7 +504,7 @@ export const StoreProvider: React.FC<{ children: React.ReactNode }> = ({ childre
                  return { success: false, message: json.error || "Failed to send request" };
             }
             
-            fetchData();
+            refreshUnlessLive();
             return { success: true, message: "Request sent!" };
         } catch (err: any) {
             console.error(err);
@@ -517,7 +571,7 @@ export const StoreProvider: React.FC<{ children: React.ReactNode }> = ({ childre
                 throw new Error(json.error || "Failed to remove");
             }
             
-            await fetchData();
+            await refreshUnlessLive();
             return { success: true, message: "Connection removed" };
         } catch (err: any) {
             console.error("removeConnection error:", err);
@@ -540,7 +594,11 @@ export const StoreProvider: React.FC<{ children: React.ReactNode }> = ({ childre
                 .eq('id', receiptId);
 
             if (error) throw error;
-            await fetchData();
+            if (feedLiveRef.current) {
+                setReceipts(prev => prev.map(r => r.id === receiptId ? { ...r, status: ReceiptStatus.REJECTED } : r));
+            } else {
+                await fetchData();
+            }
             return { success: true, message: "Receipt rejected" };
         } catch (err: any) {
             console.error("rejectReceipt error:", err);
@@ -563,7 +621,11 @@ export const StoreProvider: React.FC<{ children: React.ReactNode }> = ({ childre
                 .eq('id', receiptId);
 
             if (error) throw error;
-            await fetchData();
+            if (feedLiveRef.current) {
+                setReceipts(prev => prev.filter(r => r.id !== receiptId));
+            } else {
+                await fetchData();
+            }
             return { success: true, message: "Receipt deleted" };
         } catch (err: any) {
             console.error("deleteReceipt error:", err);
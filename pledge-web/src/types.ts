@@ -60,6 +60,9 @@ export interface GraphNode {
     };
     isMe?: boolean;
     connectedAt?: string;
+    depth?: number;           // hops from the current user (ego network); 1 when absent
+    mutualConnections?: number;
+    trustScore?: number;      // PageRank-based, 1.0 = average (user_graph_metrics)
 }
 
 export interface GraphLink {
@@ -1,19 +1,33 @@
-import { useMemo, useState, useCallback, useRef } from 'react';
+import { useMemo, useState, useCallback, useRef, useEffect } from 'react';
 import { Layout } from '../../app/Layout';
 import { GraphCanvas } from '../../components/GraphCanvas';
 import type { GraphCanvasRef } from '../../components/GraphCanvas';
 import { Drawer } from '../../components/Drawer';
 import { useStore } from '../../services/store';
+import { graphService } from '../../services/graphService';
+import type { EgoNetwork, EgoNode } from '../../services/graphService';
 import type { GraphPayload, GraphNode, GraphLink } from '../../types';
 
 import { Link } from 'react-router-dom';
-import { Plus, Focus, ArrowUpRight, ArrowDownLeft } from 'lucide-react';
+import { Plus, Focus, ArrowUpRight, ArrowDownLeft, Network } from 'lucide-react';
 
 export function HomePage() {
     const { connections, users, currentUser, receipts } = useStore();
     const [selectedItem, setSelectedItem] = useState<{ type: 'NODE' | 'EDGE', node?: GraphNode, edge?: GraphLink } | null>(null);
     const [filter, setFilter] = useState<'ALL' | 'GAVE' | 'RECEIVED'>('ALL');
     const graphRef = useRef<GraphCanvasRef>(null);
+    // Second-degree view: friends of friends from the server-side ego network.
+    const [extended, setExtended] = useState(false);
+    const [ego, setEgo] = useState<EgoNetwork | null>(null);
+
+    useEffect(() => {
+        if (!extended || !currentUser) return;
+        let cancelled = false;
+        graphService.fetchEgoNetwork(2)
+            .then(network => { if (!cancelled) setEgo(network); })
+            .catch(err => console.error('Failed to load extended network', err));
+        return () => { cancelled = true; };
+    }, [extended, currentUser, connections]);
 
     const graphData: GraphPayload = useMemo(() => {
         const nodes: GraphNode[] = [];
@@ -102,8 +116,49 @@ export function HomePage() {
             });
         });
 
+        // 5. Second hop: their connections (and the links among them), anchored to visible first-hop nodes.
+        if (extended && ego) {
+            const present = new Set(nodes.map(n => n.id));
+            const outer = new Map<string, EgoNode>(ego.nodes.filter(n => n.depth === 2).map(n => [n.id, n]));
+            const reachable = new Set<string>();
+            ego.edges.forEach(e => {
+                if (present.has(e.source) && outer.has(e.target)) reachable.add(e.target);
+                if (present.has(e.target) && outer.has(e.source)) reachable.add(e.source);
+            });
+            reachable.forEach(id => {
+                const n = outer.get(id)!;
+                const name = [n.first_name, n.last_name].filter(Boolean).join(' ');
+                nodes.push({
+                    id,
+                    label: name || n.institution || 'Member',
+                    strength: Math.min(n.weighted_degree, 10),
+                    statusMix: { verified: n.weighted_degree, pending: 0, unclear: 0, rejected: 0 },
+                    lastInteraction: '',
+                    topTags: [],
+                    depth: 2,
+                    mutualConnections: n.mutual_connections ?? 0,
+                    trustScore: n.trust_score
+                });
+                present.add(id);
+            });
+            ego.edges.forEach(e => {
+                if (e.source === currentUser.id || e.target === currentUser.id) return;
+                if (!present.has(e.source) || !present.has(e.target) || !(reachable.has(e.source) || reachable.has(e.target))) return;
+                links.push({
+                    source: e.source,
+                    target: e.target,
+                    verifiedCount: e.weight,
+                    pendingCount: 0,
+                    unclearCount: 0,
+                    sentCount: 0,
+                    receivedCount: 0,
+                    strength: 0.5
+                });
+            });
+        }
+
         return { nodes, links };
-    }, [connections, users, currentUser, receipts, filter]);
+    }, [connections, users, currentUser, receipts, filter, extended, ego]);
 
     const handleNodeClick = useCallback((node: GraphNode) => setSelectedItem({ type: 'NODE', node }), []);
     const handleEdgeClick = useCallback((edge: GraphLink) => setSelectedItem({ type: 'EDGE', edge }), []);
@@ -184,6 +239,15 @@ export function HomePage() {
                         </button>
                     </div>
 
+                    {/* Second-degree toggle */}
+                    <button
+                        onClick={() => setExtended(v => !v)}
+                        className={`p-3.5 backdrop-blur-xl border border-border/50 rounded-2xl shadow-xl ring-1 ring-border/50 transition-all hover:scale-110 active:scale-95 ${extended ? 'bg-slate-900 text-white dark:bg-white dark:text-slate-950' : 'bg-white/90 dark:bg-slate-950/80 text-slate-900 dark:text-white hover:bg-slate-50 dark:hover:bg-slate-900'}`}
+                        title={extended ? 'Hide friends of friends' : 'Show friends of friends'}
+                    >
+                        <Network size={20} strokeWidth={2.5} />
+                    </button>
+
                     {/* Center Button */}
                     <button 
                         onClick={() => graphRef.current?.centerOnUser()}
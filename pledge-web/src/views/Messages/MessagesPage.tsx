@@ -61,6 +61,8 @@ export const MessagesPage: React.FC = () => {
     const [messages, setMessages] = useState<ChatMessage[]>([]);
     const [inputText, setInputText] = useState('');
     const [loadingMessages, setLoadingMessages] = useState(false);
+    const [olderCursor, setOlderCursor] = useState<string | null>(null);
+    const [loadingOlder, setLoadingOlder] = useState(false);
     const [search, setSearch] = useState('');
 
     const [showProofPicker, setShowProofPicker] = useState(false);
@@ -127,6 +129,7 @@ export const MessagesPage: React.FC = () => {
     useEffect(() => {
         if (!selectedConnectionId || !myId) {
             setMessages([]);
+            setOlderCursor(null);
             return;
         }
 
@@ -134,8 +137,9 @@ export const MessagesPage: React.FC = () => {
         if (!connection) return;
 
         setLoadingMessages(true);
-        chatService.fetchMessages(connection.otherId).then(msgs => {
-            setMessages(msgs);
+        chatService.fetchMessages(connection.otherId).then(page => {
+            setMessages(page.messages);
+            setOlderCursor(page.nextCursor);
             setLoadingMessages(false);
             scrollToBottom();
         })
@@ -188,6 +192,21 @@ export const MessagesPage: React.FC = () => {
         };
     }, [selectedConnectionId, myId, activeConnections]); 
 
+    const loadOlderMessages = async () => {
+        const connection = activeConnections.find(c => c.id === selectedConnectionId);
+        if (!connection || !olderCursor || loadingOlder) return;
+        setLoadingOlder(true);
+        try {
+            const page = await chatService.fetchMessages(connection.otherId, olderCursor);
+            setMessages(prev => [...page.messages.filter(m => !prev.some(p => p.id === m.id)), ...prev]);
+            setOlderCursor(page.nextCursor);
+        } catch (err) {
+            console.error(err);
+        } finally {
+            setLoadingOlder(false);
+        }
+    };
+
     const scrollToBottom = () => {
         setTimeout(() => {
             messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -289,14 +308,27 @@ export const MessagesPage: React.FC = () => {
                                         <p className="text-xs">Say hello to start the conversation!</p>
                                     </div>
                                 ) : (
-                                    messages.map((msg, i) => (
+                                    <>
+                                    {olderCursor && (
+                                        <div className="flex justify-center">
+                                            <button
+                                                onClick={loadOlderMessages}
+                                                disabled={loadingOlder}
+                                                className="text-[10px] font-bold uppercase tracking-wider text-muted hover:text-foreground transition-colors disabled:opacity-50"
+                                            >
+                                                {loadingOlder ? 'Loading...' : 'Load earlier messages'}
+                                            </button>
+                                        </div>
+                                    )}
+                                    {messages.map((msg, i) => (
                                         <MessageBubble 
                                             key={msg.id || i}
                                             msg={msg}
                                             isMe={msg.sender_id === myId}
                                             setViewingProofId={setViewingProofId}
                                         />
-                                    ))
+                                    ))}
+                                    </>
                                 )}
                                 <div ref={messagesEndRef} />
                             </div>
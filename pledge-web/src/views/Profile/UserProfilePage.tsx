@@ -8,12 +8,13 @@ import type { Receipt } from '../../types';
 import { useStore } from '../../services/store';
 import { downloadAsCSV } from '../../utils/exportUtils';
 import { generateCARStatement } from '../../services/aiService';
+import { API_BASE_URL } from '../../constants';
 
 type ViewMode = 'PORTFOLIO' | 'CV';
 
 export const UserProfilePage: React.FC = () => {
     const { userId } = useParams();
-    const { currentUser } = useStore();
+    const { currentUser, receipts } = useStore();
     const [rows, setRows] = useState<Receipt[]>([]);
     const [loading, setLoading] = useState(true);
     const [viewMode, setViewMode] = useState<ViewMode>('PORTFOLIO');
@@ -38,69 +39,71 @@ export const UserProfilePage: React.FC = () => {
         created_at: string;
     } | null>(null);
     const [lastInteraction, setLastInteraction] = useState<string | null>(null);
+    const [stats, setStats] = useState<{ count: number; topTags: string[] }>({ count: 0, topTags: [] });
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     const isOwner = currentUser?.id === userId;
 
+    // Public receipts carry no private fields (no emails, no description); fill the Receipt shape the
+    // views expect. Owners see their own descriptions from the receipts they can already read.
+    const ownDescription = (id: string) => (isOwner ? receipts.find(r => r.id === id)?.description ?? null : null);
+    const toReceipt = (d: any): Receipt => ({
+        id: d.id,
+        from_user_id: d.from_user_id,
+        to_user_id: d.to_user_id,
+        tags: d.tags || [],
+        description: ownDescription(d.id),
+        is_public: true,
+        status: ReceiptStatus.ACCEPTED,
+        created_at: d.created_at,
+        accepted_at: d.accepted_at,
+        recipient_email: '',
+        accepted_by_user_id: d.to_user_id,
+        connection_id: null
+    });
+
+    async function fetchProfile(cursor?: string) {
+        const { data: { session } } = await supabase.auth.getSession();
+        const params = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const res = await fetch(`${API_BASE_URL}/api/users/${userId}/profile${params}`, {
+            headers: { 'Authorization': `Bearer ${session?.access_token}` }
+        });
+        if (!res.ok) return null;
+        return res.json();
+    }
+
     useEffect(() => {
         if (!userId) return;
 
         (async () => {
-            const { data } = await supabase
-                .from('receipts')
-                .select('*')
-                .eq('to_user_id', userId) // These are receipts RECEIVED by the user
-                .eq('status', ReceiptStatus.ACCEPTED)
-                .is('is_public', true)
-                .order('created_at', { ascending: false });
-
-            // Fetch User Profile
-            const { data: profile } = await supabase
-                .from('public_profiles')
-                .select('*')
-                .eq('user_id', userId)
-                .maybeSingle();
-            
-            if (profile) {
-                setUserProfile(profile);
-            }
-
-            // Calculate Last Interaction (if viewing someone else)
-            if (currentUser && currentUser.id !== userId) {
-                // Find latest receipt exchanged
-                const { data: interaction } = await supabase
-                    .from('receipts')
-                    .select('created_at')
-                    .or(`and(from_user_id.eq.${currentUser.id},to_user_id.eq.${userId}),and(from_user_id.eq.${userId},to_user_id.eq.${currentUser.id})`)
-                    .order('created_at', { ascending: false })
-                    .limit(1)
-                    .maybeSingle();
-                
-                if (interaction) {
-                    setLastInteraction(interaction.created_at);
-                }
-            }
-
-            if (data) {
-                const mapped: Receipt[] = data.map((d: any) => ({
-                    id: d.id,
-                    from_user_id: d.from_user_id,
-                    to_user_id: d.to_user_id,
-                    tags: d.tags || [],
-                    description: d.description,
-                    is_public: d.is_public,
-                    status: d.status as ReceiptStatus,
-                    created_at: d.created_at,
-                    accepted_at: d.accepted_at,
-                    recipient_email: d.recipient_email,
-                    accepted_by_user_id: d.accepted_by_user_id,
-                    connection_id: d.connection_id
-                }));
-                setRows(mapped);
+            // Profile, stats, first receipts page and last interaction in one round trip.
+            const body = await fetchProfile();
+            if (body) {
+                setUserProfile(body.profile);
+                setStats({
+                    count: body.stats.public_received_count,
+                    topTags: body.stats.top_tags.map((t: { tag: string }) => t.tag)
+                });
+                setRows(body.receipts.map(toReceipt));
+                setNextCursor(body.next_cursor);
+                setLastInteraction(body.last_interaction);
             }
             setLoading(false);
         })();
     }, [userId]);
 
+    const loadMore = async () => {
+        if (!nextCursor || loadingMore) return;
+        setLoadingMore(true);
+        const body = await fetchProfile(nextCursor);
+        if (body) {
+            setRows(prev => [...prev, ...body.receipts.map(toReceipt)]);
+            setNextCursor(body.next_cursor);
+        }
+        setLoadingMore(false);
+    };
+
     const handleExportCSV = () => {
         downloadAsCSV(rows, `pledge_portfolio_${userId}.csv`);
     };
@@ -134,17 +137,9 @@ export const UserProfilePage: React.FC = () => {
         </Layout>
     );
 
-    const receivedCount = rows.length;
-    const allTags = rows.flatMap(r => r.tags || []);
-    const tagCounts = allTags.reduce((acc, tag) => {
-        acc[tag] = (acc[tag] || 0) + 1;
-        return acc;
-    }, {} as Record<string, number>);
-
-    const topTags = Object.entries(tagCounts)
-        .sort((a, b) => b[1] - a[1])
-        .slice(0, 6)
-        .map(([tag]) => tag);
+    // Totals cover every public receipt, not just the pages loaded so far.
+    const receivedCount = stats.count;
+    const topTags = stats.topTags;
 
     return (
         <Layout>
@@ -290,6 +285,15 @@ export const UserProfilePage: React.FC = () => {
                                         ) )
                                     )}
                                 </div>
+                                {nextCursor && (
+                                    <button
+                                        onClick={loadMore}
+                                        disabled={loadingMore}
+                                        className="w-full py-3 text-sm font-bold text-muted hover:text-foreground border border-border rounded-xl transition-colors disabled:opacity-50"
+                                    >
+                                        {loadingMore ? 'Loading...' : 'Show more'}
+                                    </button>
+                                )}
                             </section>
                         ) : (
                             <section className="bg-surface rounded-2xl border border-border shadow-sm p-10 space-y-8 relative overflow-hidden">
@@ -3,6 +3,7 @@ import { useParams, Link } from 'react-router-dom';
 import { supabase } from '../../services/supabaseClient';
 import { Layout } from '../../app/Layout';
 import { useStore } from '../../services/store';
+import { API_BASE_URL } from '../../constants';
 import { ReceiptStatus } from '../../types';
 import { CheckCircle2, XCircle, ArrowLeft, Clock } from 'lucide-react';
 
@@ -19,11 +20,44 @@ export const VerifyReceiptPage: React.FC = () => {
     const [acting, setActing] = useState(false);
     const [error, setError] = useState('');
 
+    // Accepted public receipts come from the cached public endpoint (shared links, no session needed).
+    async function loadVerified(): Promise<Receipt | null> {
+        try {
+            const res = await fetch(`${API_BASE_URL}/api/receipts/${id}/verify`);
+            if (!res.ok) return null;
+            const { receipt: data } = await res.json();
+            return {
+                id: data.id,
+                from_user_id: data.issuer_id,
+                to_user_id: data.recipient_id,
+                tags: data.tags || [],
+                description: null,
+                is_public: true,
+                status: ReceiptStatus.ACCEPTED,
+                created_at: data.created_at,
+                accepted_at: data.accepted_at,
+                // The public projection carries no emails; show who it was issued to instead.
+                recipient_email: data.recipient_name || data.recipient_institution || 'Verified recipient',
+                accepted_by_user_id: data.recipient_id,
+                connection_id: null
+            };
+        } catch {
+            return null;
+        }
+    }
+
     async function load() {
         if (!id) return;
         setLoading(true);
         setError('');
 
+        const verified = await loadVerified();
+        if (verified) {
+            setReceipt(verified);
+            setLoading(false);
+            return;
+        }
+
         const { data, error } = await supabase
             .from('receipts')
             .select('*')
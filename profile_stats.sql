@@ -0,0 +1,119 @@
+-- Public profile support for GET /api/users/<id>/profile.
+-- 1. public_receipts: the publicly visible projection of receipts (ACCEPTED + is_public, no emails,
+--    no description; the same fields verify_receipt in receipt_verification.sql exposes).
+-- 2. profile_receipt_stats: per-user totals and tag histogram over those receipts, maintained
+--    incrementally by a trigger (like leaderboard_stats) so a profile view never scans receipts.
+
+-- 1. Public receipts view
+-- Runs with the owner's rights (not security_invoker), so it bypasses the receipts RLS policy,
+-- which only lets sender and recipient read a row. The WHERE clause and column list are the
+-- whole of what it exposes. The description is a note between sender and recipient and stays
+-- out, as in verify_receipt. DROP first: CREATE OR REPLACE cannot remove a column from a view.
+DROP VIEW IF EXISTS public_receipts;
+CREATE VIEW public_receipts AS
+SELECT id, from_user_id, to_user_id, tags, created_at, accepted_at
+FROM receipts
+WHERE status = 'ACCEPTED' AND is_public;
+
+GRANT SELECT ON public_receipts TO anon, authenticated;
+
+-- One index range scan per page: WHERE to_user_id = $1 ORDER BY created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_receipts_public_to_created ON receipts (to_user_id, created_at DESC, id DESC)
+WHERE status = 'ACCEPTED' AND is_public;
+
+-- 2. Aggregates
+CREATE TABLE IF NOT EXISTS profile_receipt_stats (
+    user_id UUID PRIMARY KEY REFERENCES auth.users(id),
+    public_received_count INTEGER NOT NULL DEFAULT 0,
+    tag_counts JSONB NOT NULL DEFAULT '{}',   -- tag -> number of public accepted receipts carrying it
+    last_updated TIMESTAMPTZ DEFAULT NOW()
+);
+
+ALTER TABLE profile_receipt_stats ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Profile stats viewable by everyone" ON profile_receipt_stats;
+CREATE POLICY "Profile stats viewable by everyone" ON profile_receipt_stats FOR SELECT USING (true);
+
+-- Adds p_delta (+1 / -1) to a user's total and to each of the receipt's tags; zero counts are dropped.
+CREATE OR REPLACE FUNCTION bump_profile_receipt_stats(p_user UUID, p_tags TEXT[], p_delta INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO profile_receipt_stats (user_id) VALUES (p_user)
+    ON CONFLICT (user_id) DO NOTHING;
+
+    UPDATE profile_receipt_stats s
+    SET public_received_count = GREATEST(s.public_received_count + p_delta, 0),
+        tag_counts = (
+            SELECT COALESCE(jsonb_object_agg(tag, n) FILTER (WHERE n > 0), '{}'::jsonb)
+            FROM (
+                SELECT tag, SUM(n)::INTEGER AS n
+                FROM (
+                    SELECT key AS tag, value::INTEGER AS n FROM jsonb_each_text(s.tag_counts)
+                    UNION ALL
+                    SELECT t, p_delta FROM unnest(COALESCE(p_tags, '{}')) AS t
+                ) parts
+                GROUP BY tag
+            ) merged
+        ),
+        last_updated = NOW()
+    WHERE s.user_id = p_user;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION update_profile_receipt_stats()
+RETURNS TRIGGER AS $$
+DECLARE
+    old_counts BOOLEAN := FALSE;
+    new_counts BOOLEAN := FALSE;
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        old_counts := OLD.status = 'ACCEPTED' AND COALESCE(OLD.is_public, FALSE) AND OLD.to_user_id IS NOT NULL;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        new_counts := NEW.status = 'ACCEPTED' AND COALESCE(NEW.is_public, FALSE) AND NEW.to_user_id IS NOT NULL;
+    END IF;
+
+    -- Most updates (e.g. touching updated_at) change nothing the aggregate depends on.
+    IF TG_OP = 'UPDATE' AND old_counts = new_counts
+       AND (NOT new_counts OR (OLD.to_user_id = NEW.to_user_id AND OLD.tags IS NOT DISTINCT FROM NEW.tags)) THEN
+        RETURN NULL;
+    END IF;
+
+    IF old_counts THEN
+        PERFORM bump_profile_receipt_stats(OLD.to_user_id, OLD.tags, -1);
+    END IF;
+    IF new_counts THEN
+        PERFORM bump_profile_receipt_stats(NEW.to_user_id, NEW.tags, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS on_receipt_change_profile_stats ON receipts;
+CREATE TRIGGER on_receipt_change_profile_stats
+AFTER INSERT OR UPDATE OR DELETE ON receipts
+FOR EACH ROW EXECUTE FUNCTION update_profile_receipt_stats();
+
+-- 3. Initial population (safe to re-run)
+WITH counted AS (
+    SELECT to_user_id, tags FROM receipts
+    WHERE status = 'ACCEPTED' AND is_public AND to_user_id IS NOT NULL
+),
+totals AS (
+    SELECT to_user_id, COUNT(*) AS n FROM counted GROUP BY to_user_id
+),
+histograms AS (
+    SELECT to_user_id, jsonb_object_agg(tag, n) AS tag_counts
+    FROM (
+        SELECT to_user_id, t AS tag, COUNT(*)::INTEGER AS n
+        FROM counted, unnest(tags) AS t
+        GROUP BY to_user_id, t
+    ) per_tag
+    GROUP BY to_user_id
+)
+INSERT INTO profile_receipt_stats (user_id, public_received_count, tag_counts, last_updated)
+SELECT totals.to_user_id, totals.n, COALESCE(histograms.tag_counts, '{}'), NOW()
+FROM totals LEFT JOIN histograms USING (to_user_id)
+ON CONFLICT (user_id) DO UPDATE SET
+    public_received_count = EXCLUDED.public_received_count,
+    tag_counts = EXCLUDED.tag_counts,
+    last_updated = NOW();
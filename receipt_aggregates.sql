@@ -0,0 +1,249 @@
+-- Statement-level triggers for leaderboard_stats and institution_relationships, plus a bulk
+-- reconciliation function. Replaces the row-level triggers from leaderboard_optimization.sql,
+-- institution_aggregation.sql and fix_institution_rls.sql (same function names).
+--
+-- 1. Triggers: the ACCEPTED rows a statement added or removed are aggregated into one delta per
+--    counter row, then written in a single upsert. A bulk claim or recovery touching k receipts
+--    is one write per affected user / institution pair instead of k, and the institution side
+--    joins public_profiles once per statement instead of two lookups per row.
+-- 2. reconcile_receipt_aggregates(apply): recomputes both tables from receipts and reports drift
+--    (backend/reconcile.py).
+
+-- 1. Triggers
+
+-- Transition tables only exist for the events that have them, so each is read in its own
+-- branch. An UPDATE that leaves a receipt ACCEPTED between the same users adds and removes it
+-- in the same delta, which cancels out.
+CREATE OR REPLACE FUNCTION update_leaderboard_stats()
+RETURNS TRIGGER AS $$
+DECLARE
+    added receipts[] := '{}';
+    removed receipts[] := '{}';
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        SELECT COALESCE(array_agg(n), '{}') INTO added FROM new_rows n WHERE n.status = 'ACCEPTED';
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        SELECT COALESCE(array_agg(o), '{}') INTO removed FROM old_rows o WHERE o.status = 'ACCEPTED';
+    END IF;
+    IF cardinality(added) = 0 AND cardinality(removed) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    WITH delta AS (
+        SELECT user_id, SUM(given)::INTEGER AS given, SUM(received)::INTEGER AS received
+        FROM (
+            SELECT a.from_user_id AS user_id, 1 AS given, 0 AS received FROM unnest(added) a
+            UNION ALL
+            SELECT a.to_user_id, 0, 1 FROM unnest(added) a WHERE a.to_user_id IS NOT NULL
+            UNION ALL
+            SELECT r.from_user_id, -1, 0 FROM unnest(removed) r
+            UNION ALL
+            SELECT r.to_user_id, 0, -1 FROM unnest(removed) r WHERE r.to_user_id IS NOT NULL
+        ) changes
+        GROUP BY user_id
+        HAVING SUM(given) <> 0 OR SUM(received) <> 0
+    )
+    INSERT INTO leaderboard_stats AS s (user_id, given_count, received_count, last_updated)
+    SELECT user_id, GREATEST(given, 0), GREATEST(received, 0), NOW() FROM delta
+    ORDER BY user_id  -- same lock order in every statement, so concurrent batches cannot deadlock
+    ON CONFLICT (user_id) DO UPDATE
+    SET given_count = GREATEST(s.given_count + (SELECT d.given FROM delta d WHERE d.user_id = s.user_id), 0),
+        received_count = GREATEST(s.received_count + (SELECT d.received FROM delta d WHERE d.user_id = s.user_id), 0),
+        last_updated = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION update_institution_stats()
+RETURNS TRIGGER AS $$
+DECLARE
+    added receipts[] := '{}';
+    removed receipts[] := '{}';
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        SELECT COALESCE(array_agg(n), '{}') INTO added FROM new_rows n
+        WHERE n.status = 'ACCEPTED' AND n.to_user_id IS NOT NULL;
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        SELECT COALESCE(array_agg(o), '{}') INTO removed FROM old_rows o
+        WHERE o.status = 'ACCEPTED' AND o.to_user_id IS NOT NULL;
+    END IF;
+    IF cardinality(added) = 0 AND cardinality(removed) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    WITH delta AS (
+        SELECT sender.institution AS from_institution, receiver.institution AS to_institution,
+               SUM(c.d)::INTEGER AS d
+        FROM (
+            SELECT a.from_user_id, a.to_user_id, 1 AS d FROM unnest(added) a
+            UNION ALL
+            SELECT r.from_user_id, r.to_user_id, -1 FROM unnest(removed) r
+        ) c
+        JOIN public_profiles sender ON sender.user_id = c.from_user_id
+        JOIN public_profiles receiver ON receiver.user_id = c.to_user_id
+        WHERE sender.institution <> '' AND receiver.institution <> ''
+        GROUP BY sender.institution, receiver.institution
+        HAVING SUM(c.d) <> 0
+    )
+    INSERT INTO institution_relationships AS s (from_institution, to_institution, exchange_count, last_updated)
+    SELECT from_institution, to_institution, GREATEST(d, 0), NOW() FROM delta
+    ORDER BY from_institution, to_institution
+    ON CONFLICT (from_institution, to_institution) DO UPDATE
+    SET exchange_count = GREATEST(s.exchange_count + (
+            SELECT x.d FROM delta x WHERE x.from_institution = s.from_institution AND x.to_institution = s.to_institution
+        ), 0),
+        last_updated = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS on_receipt_change_leaderboard ON receipts;
+DROP TRIGGER IF EXISTS on_receipt_insert_leaderboard ON receipts;
+CREATE TRIGGER on_receipt_insert_leaderboard
+AFTER INSERT ON receipts
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_leaderboard_stats();
+
+DROP TRIGGER IF EXISTS on_receipt_update_leaderboard ON receipts;
+CREATE TRIGGER on_receipt_update_leaderboard
+AFTER UPDATE ON receipts
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_leaderboard_stats();
+
+DROP TRIGGER IF EXISTS on_receipt_delete_leaderboard ON receipts;
+CREATE TRIGGER on_receipt_delete_leaderboard
+AFTER DELETE ON receipts
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_leaderboard_stats();
+
+DROP TRIGGER IF EXISTS trg_update_institution_stats ON receipts;
+DROP TRIGGER IF EXISTS on_receipt_insert_institution_stats ON receipts;
+CREATE TRIGGER on_receipt_insert_institution_stats
+AFTER INSERT ON receipts
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_institution_stats();
+
+DROP TRIGGER IF EXISTS on_receipt_update_institution_stats ON receipts;
+CREATE TRIGGER on_receipt_update_institution_stats
+AFTER UPDATE ON receipts
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_institution_stats();
+
+DROP TRIGGER IF EXISTS on_receipt_delete_institution_stats ON receipts;
+CREATE TRIGGER on_receipt_delete_institution_stats
+AFTER DELETE ON receipts
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION update_institution_stats();
+
+-- 2. Reconciliation
+-- Recomputes both tables from receipts and returns a drift report:
+--   {leaderboard: {checked, drifted, missing, negative, count_drift, sample},
+--    institutions: {...same keys...}, applied}
+-- sample lists up to 20 drifted rows (stored vs expected), largest drift first.
+-- p_apply => writes the expected values to the drifted rows. It locks both tables against trigger
+-- writes first, so receipts changed concurrently are counted exactly once; receipt writes wait
+-- for it. Without p_apply nothing is locked, and rows mid-update may show as drift.
+-- Service role only: cd backend && python -m reconcile [--apply]
+
+CREATE OR REPLACE FUNCTION reconcile_receipt_aggregates(p_apply BOOLEAN DEFAULT FALSE)
+RETURNS JSONB AS $$
+DECLARE
+    leaderboard JSONB;
+    institutions JSONB;
+BEGIN
+    IF p_apply THEN
+        LOCK TABLE leaderboard_stats, institution_relationships IN SHARE ROW EXCLUSIVE MODE;
+    END IF;
+
+    CREATE TEMP TABLE leaderboard_drift ON COMMIT DROP AS
+    WITH given AS (
+        SELECT from_user_id AS user_id, COUNT(*)::INTEGER AS n FROM receipts
+        WHERE status = 'ACCEPTED' GROUP BY from_user_id
+    ),
+    received AS (
+        SELECT to_user_id AS user_id, COUNT(*)::INTEGER AS n FROM receipts
+        WHERE status = 'ACCEPTED' AND to_user_id IS NOT NULL GROUP BY to_user_id
+    ),
+    expected AS (
+        SELECT COALESCE(g.user_id, r.user_id) AS user_id, COALESCE(g.n, 0) AS given, COALESCE(r.n, 0) AS received
+        FROM given g FULL JOIN received r ON r.user_id = g.user_id
+    )
+    SELECT COALESCE(e.user_id, s.user_id) AS user_id,
+           s.given_count AS stored_given, s.received_count AS stored_received,
+           COALESCE(e.given, 0) AS given, COALESCE(e.received, 0) AS received,
+           s.user_id IS NULL AS missing
+    FROM expected e
+    FULL JOIN leaderboard_stats s ON s.user_id = e.user_id
+    WHERE s.given_count IS DISTINCT FROM COALESCE(e.given, 0)
+       OR s.received_count IS DISTINCT FROM COALESCE(e.received, 0);
+
+    CREATE TEMP TABLE institution_drift ON COMMIT DROP AS
+    WITH expected AS (
+        SELECT sender.institution AS from_institution, receiver.institution AS to_institution,
+               COUNT(*)::INTEGER AS exchange_count
+        FROM receipts r
+        JOIN public_profiles sender ON sender.user_id = r.from_user_id
+        JOIN public_profiles receiver ON receiver.user_id = r.to_user_id
+        WHERE r.status = 'ACCEPTED' AND sender.institution <> '' AND receiver.institution <> ''
+        GROUP BY sender.institution, receiver.institution
+    )
+    SELECT COALESCE(e.from_institution, s.from_institution) AS from_institution,
+           COALESCE(e.to_institution, s.to_institution) AS to_institution,
+           s.exchange_count AS stored_count, COALESCE(e.exchange_count, 0) AS exchange_count,
+           s.from_institution IS NULL AS missing
+    FROM expected e
+    FULL JOIN institution_relationships s
+      ON s.from_institution = e.from_institution AND s.to_institution = e.to_institution
+    WHERE s.exchange_count IS DISTINCT FROM COALESCE(e.exchange_count, 0);
+
+    SELECT jsonb_build_object(
+        'checked', (SELECT COUNT(*) FROM leaderboard_stats) + (SELECT COUNT(*) FROM leaderboard_drift WHERE missing),
+        'drifted', COUNT(*),
+        'missing', COUNT(*) FILTER (WHERE missing),
+        'negative', COUNT(*) FILTER (WHERE stored_given < 0 OR stored_received < 0),
+        'count_drift', COALESCE(SUM(ABS(COALESCE(stored_given, 0) - given) + ABS(COALESCE(stored_received, 0) - received)), 0),
+        'sample', (
+            SELECT COALESCE(jsonb_agg(to_jsonb(x) - 'missing'), '[]'::JSONB) FROM (
+                SELECT * FROM leaderboard_drift
+                ORDER BY ABS(COALESCE(stored_given, 0) - given) + ABS(COALESCE(stored_received, 0) - received) DESC, user_id
+                LIMIT 20
+            ) x
+        )
+    ) INTO leaderboard
+    FROM leaderboard_drift;
+
+    SELECT jsonb_build_object(
+        'checked', (SELECT COUNT(*) FROM institution_relationships) + (SELECT COUNT(*) FROM institution_drift WHERE missing),
+        'drifted', COUNT(*),
+        'missing', COUNT(*) FILTER (WHERE missing),
+        'negative', COUNT(*) FILTER (WHERE stored_count < 0),
+        'count_drift', COALESCE(SUM(ABS(COALESCE(stored_count, 0) - exchange_count)), 0),
+        'sample', (
+            SELECT COALESCE(jsonb_agg(to_jsonb(x) - 'missing'), '[]'::JSONB) FROM (
+                SELECT * FROM institution_drift
+                ORDER BY ABS(COALESCE(stored_count, 0) - exchange_count) DESC, from_institution, to_institution
+                LIMIT 20
+            ) x
+        )
+    ) INTO institutions
+    FROM institution_drift;
+
+    IF p_apply THEN
+        INSERT INTO leaderboard_stats AS s (user_id, given_count, received_count, last_updated)
+        SELECT user_id, given, received, NOW() FROM leaderboard_drift
+        ON CONFLICT (user_id) DO UPDATE
+        SET given_count = EXCLUDED.given_count, received_count = EXCLUDED.received_count, last_updated = NOW();
+
+        INSERT INTO institution_relationships AS s (from_institution, to_institution, exchange_count, last_updated)
+        SELECT from_institution, to_institution, exchange_count, NOW() FROM institution_drift
+        ON CONFLICT (from_institution, to_institution) DO UPDATE
+        SET exchange_count = EXCLUDED.exchange_count, last_updated = NOW();
+    END IF;
+
+    RETURN jsonb_build_object('leaderboard', leaderboard, 'institutions', institutions, 'applied', p_apply);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+REVOKE EXECUTE ON FUNCTION reconcile_receipt_aggregates(BOOLEAN) FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,93 @@
+-- RPCs: Claim or reject a receipt in a single round-trip
+-- Replaces the read-then-write sequences in /api/receipts/claim and /api/receipts/reject.
+-- The receipt row is locked (FOR UPDATE) while it is checked, so a concurrent claim/reject
+-- cannot slip in between the authorization check and the write. Both return the final row.
+--
+-- SECURITY DEFINER because late binding updates receipts whose to_user_id is still NULL,
+-- which the recipient cannot update under RLS. Every write is scoped to auth.uid().
+--
+-- Errors (mapped to HTTP statuses in app.py):
+--   P0002 receipt not found                       -> 404
+--   42501 caller is not the recipient             -> 403
+--   22023 receipt already ACCEPTED / REJECTED     -> 400
+
+CREATE OR REPLACE FUNCTION claim_receipt_rpc(p_receipt_id UUID)
+RETURNS receipts AS $$
+DECLARE
+    me UUID := auth.uid();
+    my_email TEXT := lower(auth.jwt() ->> 'email');
+    r receipts;
+    is_email_match BOOLEAN;
+    conn_id UUID;
+    result receipts;
+BEGIN
+    IF me IS NULL THEN
+        RAISE EXCEPTION 'Not authenticated' USING ERRCODE = '42501';
+    END IF;
+
+    SELECT * INTO r FROM receipts WHERE id = p_receipt_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Receipt not found' USING ERRCODE = 'P0002';
+    END IF;
+
+    -- Assigned recipient, or unassigned and addressed to my email (late binding)
+    is_email_match := r.to_user_id IS NULL AND lower(r.recipient_email) = my_email;
+    IF r.to_user_id IS DISTINCT FROM me AND NOT is_email_match THEN
+        RAISE EXCEPTION 'Not authorized to claim this receipt' USING ERRCODE = '42501';
+    END IF;
+
+    IF NOT is_email_match AND r.status IN ('ACCEPTED', 'REJECTED') THEN
+        RAISE EXCEPTION 'Receipt already %', r.status USING ERRCODE = '22023';
+    END IF;
+
+    -- Claiming implies an accepted connection with the sender
+    conn_id := r.connection_id;
+    IF is_email_match OR conn_id IS NULL THEN
+        INSERT INTO connections (low_id, high_id, requested_by, accepted, accepted_at)
+        VALUES (LEAST(me, r.from_user_id), GREATEST(me, r.from_user_id), me, TRUE, NOW())
+        ON CONFLICT (low_id, high_id) DO UPDATE
+            SET accepted = TRUE,
+                accepted_at = COALESCE(connections.accepted_at, NOW())
+        RETURNING id INTO conn_id;
+    END IF;
+
+    UPDATE receipts
+    SET to_user_id = me,
+        connection_id = conn_id,
+        status = 'ACCEPTED'
+    WHERE id = p_receipt_id
+    RETURNING * INTO result;
+
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION reject_receipt_rpc(p_receipt_id UUID)
+RETURNS receipts AS $$
+DECLARE
+    me UUID := auth.uid();
+    result receipts;
+BEGIN
+    IF me IS NULL THEN
+        RAISE EXCEPTION 'Not authenticated' USING ERRCODE = '42501';
+    END IF;
+
+    UPDATE receipts
+    SET status = 'REJECTED'
+    WHERE id = p_receipt_id AND to_user_id = me
+    RETURNING * INTO result;
+
+    IF NOT FOUND THEN
+        PERFORM 1 FROM receipts WHERE id = p_receipt_id;
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'Receipt not found' USING ERRCODE = 'P0002';
+        END IF;
+        RAISE EXCEPTION 'Not authorized to reject this receipt' USING ERRCODE = '42501';
+    END IF;
+
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+GRANT EXECUTE ON FUNCTION claim_receipt_rpc(UUID) TO authenticated;
+GRANT EXECUTE ON FUNCTION reject_receipt_rpc(UUID) TO authenticated;
@@ -0,0 +1,55 @@
+-- RPC: Link receipts that were sent to the caller's email before they signed up.
+-- Set-based replacement for the per-sender loop that used to live in /api/onboarding:
+--   1. one INSERT ... ON CONFLICT over every distinct sender, returning the connection ids
+--   2. one UPDATE joining the orphaned receipts to those connections
+-- Idempotent: once linked, receipts have to_user_id set and are not matched again.
+-- SECURITY DEFINER because orphaned receipts (to_user_id IS NULL) are not updatable by the
+-- recipient under RLS; the function only ever touches rows addressed to the caller's own email.
+
+CREATE OR REPLACE FUNCTION recover_orphan_receipts()
+RETURNS INTEGER AS $$
+DECLARE
+    me UUID := auth.uid();
+    my_email TEXT := lower(auth.jwt() ->> 'email');
+    linked INTEGER;
+BEGIN
+    IF me IS NULL OR my_email IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    WITH senders AS (
+        SELECT DISTINCT from_user_id AS sender_id
+        FROM receipts
+        WHERE lower(recipient_email) = my_email
+          AND to_user_id IS NULL
+          AND from_user_id <> me
+    ),
+    edges AS (
+        INSERT INTO connections (low_id, high_id, requested_by, accepted, accepted_at)
+        SELECT LEAST(me, sender_id), GREATEST(me, sender_id), me, TRUE, NOW()
+        FROM senders
+        -- Existing edges are left as they are; the no-op update only makes RETURNING yield their id.
+        ON CONFLICT (low_id, high_id) DO UPDATE SET low_id = EXCLUDED.low_id
+        RETURNING id, low_id, high_id
+    )
+    UPDATE receipts r
+    SET to_user_id = me,
+        connection_id = e.id,
+        status = 'AWAITING_ACCEPTANCE'
+    FROM edges e
+    WHERE lower(r.recipient_email) = my_email
+      AND r.to_user_id IS NULL
+      AND e.low_id = LEAST(me, r.from_user_id)
+      AND e.high_id = GREATEST(me, r.from_user_id);
+
+    GET DIAGNOSTICS linked = ROW_COUNT;
+    RETURN linked;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+GRANT EXECUTE ON FUNCTION recover_orphan_receipts() TO authenticated;
+
+-- Supports the lower(recipient_email) lookups above and in the receipts RLS policy.
+CREATE INDEX IF NOT EXISTS idx_receipts_orphans_by_email
+    ON receipts (lower(recipient_email))
+    WHERE to_user_id IS NULL;
@@ -0,0 +1,65 @@
+-- RPC: Create a receipt in a single round-trip
+-- Resolves the recipient by email, decides the status from the connection state
+-- and inserts the row, all inside one transaction.
+-- Runs as the caller (SECURITY INVOKER) so the existing RLS insert policy still applies.
+--
+-- Status rules (same as the multi-call path in app.py):
+--   recipient has no profile          -> AWAITING_SIGNUP
+--   profile, no accepted connection   -> AWAITING_CONNECTION
+--   profile and accepted connection   -> AWAITING_ACCEPTANCE (connection_id set)
+
+CREATE OR REPLACE FUNCTION create_receipt_rpc(
+    p_recipient_email TEXT,
+    p_tags TEXT[] DEFAULT '{}',
+    p_description TEXT DEFAULT '',
+    p_is_public BOOLEAN DEFAULT FALSE
+)
+RETURNS receipts AS $$
+DECLARE
+    sender_id UUID := auth.uid();
+    recipient_id UUID;
+    conn_id UUID;
+    conn_accepted BOOLEAN;
+    new_status receipt_status := 'AWAITING_SIGNUP';
+    result receipts;
+BEGIN
+    IF sender_id IS NULL THEN
+        RAISE EXCEPTION 'Not authenticated' USING ERRCODE = '42501';
+    END IF;
+
+    -- 1. Resolve recipient
+    SELECT user_id INTO recipient_id
+    FROM public_profiles
+    WHERE lower(email) = lower(trim(p_recipient_email))
+    LIMIT 1;
+
+    IF recipient_id IS NOT NULL THEN
+        IF recipient_id = sender_id THEN
+            RAISE EXCEPTION 'Cannot send receipt to yourself' USING ERRCODE = '22023';
+        END IF;
+
+        -- 2. Check connection (edges are stored ordered: low_id < high_id)
+        SELECT id, accepted INTO conn_id, conn_accepted
+        FROM connections
+        WHERE low_id = LEAST(sender_id, recipient_id)
+          AND high_id = GREATEST(sender_id, recipient_id);
+
+        IF conn_accepted THEN
+            new_status := 'AWAITING_ACCEPTANCE';
+        ELSE
+            new_status := 'AWAITING_CONNECTION';
+            conn_id := NULL;
+        END IF;
+    END IF;
+
+    -- 3. Insert
+    INSERT INTO receipts (from_user_id, to_user_id, recipient_email, tags, description, is_public, status, connection_id)
+    VALUES (sender_id, recipient_id, p_recipient_email, COALESCE(p_tags, '{}'), COALESCE(p_description, ''),
+            COALESCE(p_is_public, FALSE), new_status, conn_id)
+    RETURNING * INTO result;
+
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql;
+
+GRANT EXECUTE ON FUNCTION create_receipt_rpc(TEXT, TEXT[], TEXT, BOOLEAN) TO authenticated;
@@ -0,0 +1,41 @@
+-- RPC: Public receipt verification (GET /api/receipts/<id>/verify)
+-- Verification links are opened by people without an account (recruiters, CV readers), so this
+-- runs as SECURITY DEFINER and is granted to anon. It only ever returns a receipt that is both
+-- ACCEPTED and public, and only the fields a verifier needs: no emails, no description (a note
+-- between sender and recipient; public_receipts in profile_stats.sql leaves it out too).
+-- Profiles in ghost mode are shown by institution only.
+-- Returns zero rows when the receipt does not exist or is not publicly verifiable (-> 404).
+
+CREATE OR REPLACE FUNCTION verify_receipt(p_receipt_id UUID)
+RETURNS TABLE (
+    id UUID,
+    tags TEXT[],
+    created_at TIMESTAMPTZ,
+    accepted_at TIMESTAMPTZ,
+    issuer_id UUID,
+    issuer_name TEXT,
+    issuer_institution TEXT,
+    recipient_id UUID,
+    recipient_name TEXT,
+    recipient_institution TEXT
+) AS $$
+    SELECT
+        r.id,
+        COALESCE(r.tags, '{}'),
+        r.created_at,
+        r.accepted_at,
+        r.from_user_id,
+        CASE WHEN COALESCE(fp.ghost_mode, FALSE) THEN NULL ELSE NULLIF(TRIM(CONCAT_WS(' ', fp.first_name, fp.last_name)), '') END,
+        fp.institution,
+        r.to_user_id,
+        CASE WHEN COALESCE(tp.ghost_mode, FALSE) THEN NULL ELSE NULLIF(TRIM(CONCAT_WS(' ', tp.first_name, tp.last_name)), '') END,
+        tp.institution
+    FROM receipts r
+    LEFT JOIN public_profiles fp ON fp.user_id = r.from_user_id
+    LEFT JOIN public_profiles tp ON tp.user_id = r.to_user_id
+    WHERE r.id = p_receipt_id
+      AND r.status = 'ACCEPTED'
+      AND r.is_public;
+$$ LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public;
+
+GRANT EXECUTE ON FUNCTION verify_receipt(UUID) TO anon, authenticated;
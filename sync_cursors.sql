@@ -0,0 +1,72 @@
+-- Delta sync support for /api/bootstrap?since=... (and later paginated list endpoints).
+-- Every synced table gets a maintained updated_at; deletes leave a tombstone so clients can drop rows.
+
+-- 1. updated_at columns + trigger
+ALTER TABLE receipts ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+UPDATE receipts SET updated_at = COALESCE(accepted_at, created_at) WHERE updated_at IS NULL;
+
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_touch_receipts ON receipts;
+CREATE TRIGGER trg_touch_receipts BEFORE UPDATE ON receipts
+FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_touch_connections ON connections;
+CREATE TRIGGER trg_touch_connections BEFORE UPDATE ON connections
+FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_touch_profiles ON public_profiles;
+CREATE TRIGGER trg_touch_profiles BEFORE UPDATE ON public_profiles
+FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_receipts_from_updated ON receipts (from_user_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_receipts_to_updated ON receipts (to_user_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_connections_low_updated ON connections (low_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_connections_high_updated ON connections (high_id, updated_at);
+
+-- 2. Tombstones for deleted rows
+CREATE TABLE IF NOT EXISTS sync_tombstones (
+    id BIGSERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    row_id UUID NOT NULL,
+    user_ids UUID[] NOT NULL,
+    deleted_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_users ON sync_tombstones USING GIN (user_ids);
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_deleted_at ON sync_tombstones (deleted_at);
+
+ALTER TABLE sync_tombstones ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Tombstones viewable by affected users" ON sync_tombstones
+FOR SELECT USING (auth.uid() = ANY (user_ids));
+
+CREATE OR REPLACE FUNCTION record_sync_tombstone()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'connections' THEN
+        INSERT INTO sync_tombstones (table_name, row_id, user_ids)
+        VALUES ('connections', OLD.id, ARRAY[OLD.low_id, OLD.high_id]);
+    ELSIF TG_TABLE_NAME = 'receipts' THEN
+        INSERT INTO sync_tombstones (table_name, row_id, user_ids)
+        VALUES ('receipts', OLD.id, ARRAY_REMOVE(ARRAY[OLD.from_user_id, OLD.to_user_id], NULL));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS trg_tombstone_connections ON connections;
+CREATE TRIGGER trg_tombstone_connections AFTER DELETE ON connections
+FOR EACH ROW EXECUTE FUNCTION record_sync_tombstone();
+
+DROP TRIGGER IF EXISTS trg_tombstone_receipts ON receipts;
+CREATE TRIGGER trg_tombstone_receipts AFTER DELETE ON receipts
+FOR EACH ROW EXECUTE FUNCTION record_sync_tombstone();
+
+-- Tombstones only need to outlive the longest client refresh gap; prune periodically, e.g.:
+-- DELETE FROM sync_tombstones WHERE deleted_at < NOW() - INTERVAL '30 days';
@@ -0,0 +1,116 @@
+-- People search over public_profiles: name index, filter indexes and search_users().
+-- Requires student_identity_migration.sql (batch_year, major, societies, ghost_mode).
+--
+-- 1. search_name: lower-cased "first last", kept by Postgres as a generated column,
+--    with a trigram index (substring and fuzzy matches) and a prefix index.
+-- 2. Filter indexes: institution + batch year, major, societies.
+-- 3. search_users(...): one page of matches ranked by connection proximity.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- 1. Name index
+
+ALTER TABLE public_profiles
+ADD COLUMN IF NOT EXISTS search_name TEXT
+GENERATED ALWAYS AS (lower(trim(COALESCE(first_name, '') || ' ' || COALESCE(last_name, '')))) STORED;
+
+-- Trigram GIN serves `LIKE '%ali%'` and the word-similarity operator (`'alii' <% search_name`).
+CREATE INDEX IF NOT EXISTS idx_public_profiles_search_name_trgm
+ON public_profiles USING GIN (search_name gin_trgm_ops);
+
+-- Plain btree for "starts with" (`LIKE 'ali%'`), which the planner prefers for short prefixes.
+CREATE INDEX IF NOT EXISTS idx_public_profiles_search_name_prefix
+ON public_profiles (search_name text_pattern_ops);
+
+-- 2. Filter indexes
+
+CREATE INDEX IF NOT EXISTS idx_public_profiles_institution_batch ON public_profiles (institution_id, batch_year);
+CREATE INDEX IF NOT EXISTS idx_public_profiles_major_lower ON public_profiles (lower(major));
+-- societies is a JSON array of names; jsonb_path_ops serves `societies @> '["Debating"]'`.
+CREATE INDEX IF NOT EXISTS idx_public_profiles_societies ON public_profiles USING GIN (societies jsonb_path_ops);
+
+-- 3. RPC: search_users
+-- Every filter is optional (the API requires a query of 2+ characters or at least one filter).
+-- Ranking, best first:
+--   proximity 1 = accepted connection, 2 = friend of a connection, 3 = same institution, 4 = anyone else;
+--   then score (name match quality, 0-1, rounded so it survives a JSON cursor); then user_id.
+-- Keyset pagination: pass the last row's (proximity, score, user_id) as p_after_*.
+-- Ghost-mode profiles are only found by their accepted connections. The caller is never returned.
+-- SECURITY DEFINER: friends of friends need connections the caller cannot see under RLS;
+-- only the public profile columns leave the function.
+
+CREATE OR REPLACE FUNCTION search_users(
+    p_query TEXT DEFAULT NULL,
+    p_institution_id TEXT DEFAULT NULL,
+    p_batch_year INTEGER DEFAULT NULL,
+    p_major TEXT DEFAULT NULL,
+    p_society TEXT DEFAULT NULL,
+    p_after_proximity INTEGER DEFAULT NULL,
+    p_after_score NUMERIC DEFAULT NULL,
+    p_after_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 20
+)
+RETURNS TABLE (
+    user_id UUID, first_name TEXT, last_name TEXT, institution TEXT, institution_id TEXT,
+    batch_year INTEGER, major TEXT, societies JSONB, proximity INTEGER, score NUMERIC
+) AS $$
+DECLARE
+    me UUID := auth.uid();
+    q TEXT := NULLIF(lower(trim(p_query)), '');
+    q_like TEXT;
+BEGIN
+    IF me IS NULL THEN
+        RAISE EXCEPTION 'Not authenticated' USING ERRCODE = '42501';
+    END IF;
+    IF q IS NOT NULL THEN
+        q_like := '%' || replace(replace(replace(q, '\', '\\'), '%', '\%'), '_', '\_') || '%';
+    END IF;
+
+    RETURN QUERY
+    WITH my_institution AS (
+        SELECT p.institution_id FROM public_profiles p WHERE p.user_id = me
+    ),
+    friends AS (
+        SELECT CASE WHEN c.low_id = me THEN c.high_id ELSE c.low_id END AS id
+        FROM connections c
+        WHERE c.accepted AND (c.low_id = me OR c.high_id = me)
+    ),
+    second_hop AS (
+        SELECT DISTINCT CASE WHEN c.low_id = f.id THEN c.high_id ELSE c.low_id END AS id
+        FROM friends f
+        JOIN connections c ON c.accepted AND (c.low_id = f.id OR c.high_id = f.id)
+    ),
+    matches AS (
+        SELECT p.*,
+               CASE
+                   WHEN p.user_id IN (SELECT id FROM friends) THEN 1
+                   WHEN p.user_id IN (SELECT id FROM second_hop) THEN 2
+                   WHEN p.institution_id = (SELECT mi.institution_id FROM my_institution mi) THEN 3
+                   ELSE 4
+               END AS rank_proximity,
+               CASE WHEN q IS NULL THEN 0::NUMERIC
+                    ELSE round(GREATEST(
+                        CASE WHEN p.search_name LIKE q || '%' THEN 1.0 ELSE 0.0 END,
+                        word_similarity(q, p.search_name)
+                    )::NUMERIC, 4)
+               END AS rank_score
+        FROM public_profiles p
+        WHERE p.user_id <> me
+          AND (q IS NULL OR p.search_name LIKE q_like OR q <% p.search_name)
+          AND (p_institution_id IS NULL OR p.institution_id = p_institution_id)
+          AND (p_batch_year IS NULL OR p.batch_year = p_batch_year)
+          AND (p_major IS NULL OR lower(p.major) = lower(trim(p_major)))
+          AND (p_society IS NULL OR p.societies @> jsonb_build_array(trim(p_society)))
+    )
+    SELECT m.user_id, m.first_name, m.last_name, m.institution, m.institution_id,
+           m.batch_year, m.major, m.societies, m.rank_proximity, m.rank_score
+    FROM matches m
+    WHERE (NOT COALESCE(m.ghost_mode, FALSE) OR m.rank_proximity = 1)
+      AND (p_after_id IS NULL
+           OR (m.rank_proximity, -m.rank_score, m.user_id) > (p_after_proximity, -p_after_score, p_after_id))
+    ORDER BY m.rank_proximity, m.rank_score DESC, m.user_id
+    LIMIT LEAST(GREATEST(COALESCE(p_limit, 20), 1), 101);
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER SET search_path = public;
+
+GRANT EXECUTE ON FUNCTION search_users(TEXT, TEXT, INTEGER, TEXT, TEXT, INTEGER, NUMERIC, UUID, INTEGER) TO authenticated;